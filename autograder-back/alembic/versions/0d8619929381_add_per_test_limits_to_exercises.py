@@ -0,0 +1,31 @@
+"""Add per-test timeout and cpu limit to exercises
+
+Revision ID: 0d8619929381
+Revises: 8d4552d82674
+Create Date: 2026-10-17 06:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d8619929381'
+down_revision: Union[str, None] = '8d4552d82674'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('exercises', sa.Column('test_timeout_seconds', sa.Integer(), nullable=True))
+    op.add_column(
+        'exercises',
+        sa.Column('cpu_limit', sa.Integer(), nullable=False, server_default='1'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('exercises', 'cpu_limit')
+    op.drop_column('exercises', 'test_timeout_seconds')
@@ -0,0 +1,34 @@
+"""Add resource telemetry to submissions and test results
+
+Revision ID: 5e7b1c2a9f40
+Revises: 0d8619929381
+Create Date: 2026-10-17 07:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7b1c2a9f40'
+down_revision: Union[str, None] = '0d8619929381'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('submissions', sa.Column('wall_time_ms', sa.Integer(), nullable=True))
+    op.add_column('submissions', sa.Column('cpu_time_ms', sa.Integer(), nullable=True))
+    op.add_column('submissions', sa.Column('peak_memory_kb', sa.Integer(), nullable=True))
+    op.add_column('submissions', sa.Column('exit_reason', sa.String(length=32), nullable=True))
+    op.add_column('test_results', sa.Column('duration_ms', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('test_results', 'duration_ms')
+    op.drop_column('submissions', 'exit_reason')
+    op.drop_column('submissions', 'peak_memory_kb')
+    op.drop_column('submissions', 'cpu_time_ms')
+    op.drop_column('submissions', 'wall_time_ms')
@@ -0,0 +1,30 @@
+"""Add static precheck settings to exercises
+
+Revision ID: 8c3d2f6a1b57
+Revises: 5e7b1c2a9f40
+Create Date: 2026-10-17 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3d2f6a1b57'
+down_revision: Union[str, None] = '5e7b1c2a9f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('exercises', sa.Column('precheck_enabled', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('exercises', sa.Column('banned_modules', sa.String(length=500), nullable=True))
+    op.add_column('exercises', sa.Column('max_code_kb', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('exercises', 'max_code_kb')
+    op.drop_column('exercises', 'banned_modules')
+    op.drop_column('exercises', 'precheck_enabled')
@@ -0,0 +1,29 @@
+"""Add max_output_kb to exercises
+
+Revision ID: 8d4552d82674
+Revises: a150efcc0aae
+Create Date: 2026-10-17 05:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4552d82674'
+down_revision: Union[str, None] = 'a150efcc0aae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'exercises',
+        sa.Column('max_output_kb', sa.Integer(), nullable=False, server_default='1024'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('exercises', 'max_output_kb')
@@ -0,0 +1,29 @@
+"""Add cache key to LLM evaluations
+
+Revision ID: 9d4e7a2b3c68
+Revises: 8c3d2f6a1b57
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e7a2b3c68'
+down_revision: Union[str, None] = '8c3d2f6a1b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing evaluations were cached by content hash alone; they are kept but not reused
+    op.add_column('llm_evaluations', sa.Column('cache_key', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_llm_evaluations_cache_key'), 'llm_evaluations', ['cache_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_llm_evaluations_cache_key'), table_name='llm_evaluations')
+    op.drop_column('llm_evaluations', 'cache_key')
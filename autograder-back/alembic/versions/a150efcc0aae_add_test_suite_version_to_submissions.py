@@ -0,0 +1,33 @@
+"""Add test_suite_version to submissions
+
+Revision ID: a150efcc0aae
+Revises: g2b3c4d5e6f7
+Create Date: 2026-10-17 04:25:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a150efcc0aae'
+down_revision: Union[str, None] = 'g2b3c4d5e6f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('submissions', sa.Column('test_suite_version', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ix_submissions_content_hash_suite_version',
+        'submissions',
+        ['content_hash', 'test_suite_version'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_submissions_content_hash_suite_version', table_name='submissions')
+    op.drop_column('submissions', 'test_suite_version')
@@ -2,9 +2,26 @@ import os
 from celery import Celery
 from celery.schedules import crontab
 
+from app.services.sandbox_executor import sandbox_worker_concurrency
+
 # Redis URL for broker and result backend
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Queues by workload, each consumed by its own worker unit
+# (systemd/autograder-worker*.service) with its own pool, concurrency,
+# prefetch and time limits, so batch work never delays interactive grading:
+#   sandbox    execute_submission, regrade    thread pool sized from the sandbox executor, which caps running sandboxes
+#   llm        LLM grading                    prefork, short time limits, retries back off on 429
+#   sync       Hotmart syncs and onboarding   one process, hour-long time limits
+#   lifecycle  Hotmart webhook events         prefork, short time limits (same unit as celery/whatsapp_rt)
+SANDBOX_QUEUE = "sandbox"
+LLM_QUEUE = "llm"
+SYNC_QUEUE = "sync"
+LIFECYCLE_QUEUE = "lifecycle"
+
+# Priority lanes inside each queue (0 is drained first); see app/services/priority.py
+PRIORITY_STEPS = [0, 3, 6, 9]
+
 # Create Celery app
 celery_app = Celery(
     "autograder",
@@ -24,8 +41,26 @@ celery_app.conf.update(
     task_time_limit=600,  # 10 minutes max for any task
     task_soft_time_limit=540,  # Warning at 9 minutes
     worker_prefetch_multiplier=1,  # Process one task at a time per worker
+    # Only the sandbox worker runs without --concurrency; size it from its executor
+    worker_concurrency=sandbox_worker_concurrency(),
     worker_max_tasks_per_child=100,  # Restart worker after 100 tasks to prevent memory leaks
+    broker_transport_options={
+        "priority_steps": PRIORITY_STEPS,
+        "queue_order_strategy": "priority",
+    },
     task_routes={
+        "app.tasks.execute_submission": {"queue": SANDBOX_QUEUE},
+        "app.tasks.regrade_exercise": {"queue": SANDBOX_QUEUE},
+        "app.tasks.regrade_chunk": {"queue": SANDBOX_QUEUE},
+        "app.tasks.reap_sandbox_containers": {"queue": SANDBOX_QUEUE},
+        "app.tasks.llm_evaluate_submission": {"queue": LLM_QUEUE},
+        "app.tasks.grade_llm_first": {"queue": LLM_QUEUE},
+        "sync_hotmart_students": {"queue": SYNC_QUEUE},
+        "sync_student_course_status": {"queue": SYNC_QUEUE},
+        "sync_hotmart_buyers": {"queue": SYNC_QUEUE},
+        "sync_students_full": {"queue": SYNC_QUEUE},
+        "onboard_historical_buyers": {"queue": SYNC_QUEUE},
+        "app.tasks.process_hotmart_event": {"queue": LIFECYCLE_QUEUE},
         "app.tasks.send_bulk_messages": {"queue": "whatsapp_bulk"},
         "app.tasks.execute_side_effect": {"queue": "whatsapp_rt"},
     },
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Literal
+from typing import Dict, Literal, Tuple
 from pathlib import Path
 
 
@@ -45,6 +45,25 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     anthropic_api_key: str = ""
     llm_provider: Literal["openai", "anthropic"] = "openai"
+    # Per-process LLM clients: connections kept alive between calls, resolved
+    # API key cached (and dropped on every process when the admin changes it)
+    llm_key_cache_seconds: int = 300
+    llm_http2: bool = True  # only where the h2 package is installed
+    llm_max_connections: int = 20
+    llm_keepalive_seconds: int = 120
+    # Shared RPM/TPM token buckets per provider and model (see
+    # app/services/llm_rate_limit.py). Limits are keyed "provider:model" or
+    # "provider", e.g. {"anthropic": [50, 40000]}; the providers' rate-limit
+    # headers override them once seen
+    llm_rate_limit_enabled: bool = True
+    llm_rate_limits: Dict[str, Tuple[int, int]] = {}
+    llm_default_rpm: int = 50
+    llm_default_tpm: int = 40000
+    llm_rate_limit_headroom: float = 0.9  # fraction of each limit actually used
+    llm_rate_limit_max_wait_seconds: float = 60  # then the task retries later
+    # Rubric grading answers through the provider's structured output / tool
+    # use, held to a schema built from the rubric (see app/services/rubric_stats.py)
+    llm_structured_output: bool = True
 
     # Sandbox
     docker_image_sandbox: str = "autograder-sandbox:latest"
@@ -52,6 +71,83 @@ class Settings(BaseSettings):
     sandbox_memory_limit_mb: int = 512
     sandbox_cpu_limit: int = 1
 
+    # Where the harness runs: "docker" (sandbox image) or "subprocess"
+    # (jailed child process; see app/services/sandbox_backends.py)
+    sandbox_backend: Literal["docker", "subprocess"] = "docker"
+    sandbox_subprocess_python: str = ""  # interpreter for student code; empty = the worker's base Python
+    sandbox_subprocess_hidden_paths: str = "/home,/root,/opt,/srv,/run,/var/lib,/var/log,/mnt,/media"
+    sandbox_cgroup_root: str = ""  # delegated cgroup v2 directory for per-run limits; empty = rlimits only
+
+    # Sandbox warm pool (per worker process; 0 disables pooling)
+    sandbox_pool_size: int = 2
+    sandbox_pool_max_reuse: int = 50
+    sandbox_pool_health_check: bool = True
+    # Mount the whole datasets tree in pooled containers, so exercises with
+    # datasets run warm too; any submission can then read every exercise's
+    # datasets. Off: those exercises run in one-shot containers.
+    sandbox_pool_share_datasets: bool = False
+
+    # Fork-server sandbox runtime (requires the pool)
+    sandbox_zygote_enabled: bool = False
+    sandbox_zygote_preload: str = "numpy,pandas"  # comma-separated modules
+
+    # Sandbox executor: resources sandboxes may reserve per worker process, and
+    # a cap on how many run at once (0 = host RAM minus reserved / every core /
+    # one job per core; see app/services/sandbox_executor.py)
+    sandbox_executor_concurrency: int = 0
+    sandbox_executor_memory_mb: int = 0
+    sandbox_executor_cpus: float = 0
+    sandbox_executor_reserved_mb: int = 1024  # RAM left for the OS and workers
+    sandbox_executor_backfill_seconds: int = 30  # then smaller jobs stop overtaking the head of the queue
+
+    # Reaper of sandbox containers left behind by dead workers (see app/services/sandbox_reaper.py)
+    sandbox_reaper_enabled: bool = True
+    sandbox_reaper_interval_seconds: int = 300
+    sandbox_reaper_grace_seconds: int = 120
+
+    # Write memory-mappable .npy copies of CSV/XLSX datasets on upload
+    dataset_convert_on_upload: bool = True
+
+    # Reuse test results for identical (content_hash, test suite version) pairs
+    test_result_cache_enabled: bool = True
+
+    # Reuse LLM evaluations of identical content, exercise, criteria, model and
+    # prompt version (see app/services/llm_eval_cache.py)
+    llm_eval_cache_enabled: bool = True
+    llm_eval_cache_ttl_seconds: int = 7 * 24 * 3600  # Redis tier; the database keeps them for good
+
+    # Start the LLM evaluation of test-first submissions alongside the sandbox
+    # run instead of after it; whichever finishes last combines the scores
+    llm_speculative_enabled: bool = True
+
+    # Coalesce concurrent runs of identical code (see app/services/singleflight.py)
+    singleflight_enabled: bool = True
+    singleflight_lease_seconds: int = 660  # outlives task_time_limit, so only a dead leader's lease expires
+    singleflight_retry_seconds: int = 5  # followers are retried this often instead of holding a worker slot
+
+    # Static precheck of code submissions (per-exercise settings add to these)
+    precheck_max_code_kb: int = 256
+    precheck_banned_modules: str = ""  # comma-separated, banned in every exercise
+
+    # Bulk regrade: distinct codes per fan-out task
+    regrade_chunk_size: int = 25
+
+    # Priority lanes for grading tasks (see app/services/priority.py)
+    priority_enabled: bool = True
+    priority_deadline_window_minutes: int = 60
+    priority_rate_window_minutes: int = 10
+    priority_rate_threshold: int = 5  # submissions per window before a student drops a lane
+
+    # Admission control on POST /submissions (see app/services/admission.py)
+    admission_enabled: bool = True
+    admission_max_wait_seconds: int = 600  # refuse code submissions past this estimated sandbox wait
+    admission_sandbox_slots: int = 16  # used until a sandbox executor has published its capacity
+    admission_default_run_seconds: float = 5.0  # wait estimate before any run was timed
+    admission_student_per_minute: float = 6.0
+    admission_student_burst: int = 10
+    admission_class_per_minute: float = 120.0
+    admission_class_burst: int = 200
+
     # File Uploads
     max_exercise_file_size_mb: int = 10
     max_submission_file_size_mb: int = 10
@@ -18,6 +18,7 @@ from .submission import (
     LLMEvaluation,
     Grade,
     SubmissionStatus,
+    ExitReason,
     RubricScore,
 )
 from .product import Product, ProductAccessRule, AccessRuleType
@@ -52,6 +53,7 @@ __all__ = [
     "LLMEvaluation",
     "Grade",
     "SubmissionStatus",
+    "ExitReason",
     "RubricScore",
     "Product",
     "ProductAccessRule",
@@ -40,6 +40,14 @@ class Exercise(Base):
     max_submissions = Column(Integer, nullable=True)  # null = unlimited
     timeout_seconds = Column(Integer, default=30, nullable=False)
     memory_limit_mb = Column(Integer, default=512, nullable=False)
+    max_output_kb = Column(Integer, default=1024, nullable=False)  # stdout+stderr budget per run
+    test_timeout_seconds = Column(Integer, nullable=True)  # per-test limit; set = run each test in its own process
+    cpu_limit = Column(Integer, default=1, nullable=False)  # >1 runs tests in parallel
+
+    # Static precheck before the sandbox (see app/services/precheck.py)
+    precheck_enabled = Column(Boolean, default=False, nullable=False)
+    banned_modules = Column(String(500), nullable=True)  # Comma-separated module names
+    max_code_kb = Column(Integer, nullable=True)  # null = settings.precheck_max_code_kb
 
     # Grading configuration (test-first mode)
     has_tests = Column(Boolean, default=True, nullable=False)
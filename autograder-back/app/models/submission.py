@@ -14,11 +14,21 @@ class SubmissionStatus(str, enum.Enum):
     FAILED = "failed"
 
 
+class ExitReason(str, enum.Enum):
+    """How the sandbox run of a submission ended"""
+    COMPLETED = "completed"
+    TIMEOUT = "timeout"
+    OUTPUT_LIMIT = "output_limit"
+    ERROR = "error"  # harness reported no results (load error, crash)
+    CACHED = "cached"  # results reused, no sandbox run
+
+
 class Submission(Base):
     """Student code submission"""
     __tablename__ = "submissions"
     __table_args__ = (
         Index('ix_submissions_exercise_student_submitted', 'exercise_id', 'student_id', 'submitted_at'),
+        Index('ix_submissions_content_hash_suite_version', 'content_hash', 'test_suite_version'),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -29,6 +39,13 @@ class Submission(Base):
     status = Column(Enum(SubmissionStatus), nullable=False, default=SubmissionStatus.QUEUED)
     submitted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     error_message = Column(Text, nullable=True)
+    test_suite_version = Column(String(64), nullable=True)  # Hash of the test suite it ran against
+
+    # Sandbox resource telemetry (NULL until executed, or when results were cached)
+    wall_time_ms = Column(Integer, nullable=True)
+    cpu_time_ms = Column(Integer, nullable=True)
+    peak_memory_kb = Column(Integer, nullable=True)
+    exit_reason = Column(String(32), nullable=True)  # ExitReason value
 
     # File upload fields (NULL for code submissions)
     file_path = Column(String(500), nullable=True)
@@ -56,6 +73,7 @@ class TestResult(Base):
     message = Column(Text, nullable=True)  # Error message or details
     stdout = Column(Text, nullable=True)
     stderr = Column(Text, nullable=True)
+    duration_ms = Column(Integer, nullable=True)  # Wall time of this test inside the sandbox
 
     # Relationships
     submission = relationship("Submission", back_populates="test_results")
@@ -67,7 +85,9 @@ class LLMEvaluation(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     submission_id = Column(Integer, ForeignKey("submissions.id"), nullable=False, unique=True, index=True)
-    content_hash = Column(String(64), nullable=False, index=True)  # For cache lookups
+    content_hash = Column(String(64), nullable=False, index=True)
+    # Reuse key (see app/services/llm_eval_cache.py); null = never reused
+    cache_key = Column(String(64), nullable=True, index=True)
     feedback = Column(Text, nullable=False)
     score = Column(Float, nullable=False)  # 0-100
     cached = Column(Boolean, default=False, nullable=False)  # Was this from cache?
@@ -0,0 +1,28 @@
+"""Admin-only endpoints for observing sandbox execution."""
+from typing import List
+
+from fastapi import APIRouter, Depends
+
+from app.auth.dependencies import require_role
+from app.models.user import User, UserRole
+from app.schemas.sandbox import SandboxExecutorStatsResponse, SandboxReaperHostStats
+from app.services.sandbox_executor import get_executor_stats
+from app.services.sandbox_reaper import get_reaper_stats
+
+router = APIRouter(prefix="/admin/sandbox", tags=["admin-sandbox"])
+
+
+@router.get("/executor", response_model=SandboxExecutorStatsResponse)
+def get_executor(
+    current_user: User = Depends(require_role(UserRole.ADMIN)),
+):
+    """Sandbox capacity, queued and running jobs across live workers."""
+    return SandboxExecutorStatsResponse(**get_executor_stats())
+
+
+@router.get("/reaper", response_model=List[SandboxReaperHostStats])
+def get_reaper(
+    current_user: User = Depends(require_role(UserRole.ADMIN)),
+):
+    """Orphaned sandbox containers found and removed, per host: last run and totals."""
+    return [SandboxReaperHostStats(**host) for host in get_reaper_stats()]
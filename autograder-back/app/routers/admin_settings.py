@@ -12,6 +12,7 @@ from app.schemas.system_settings import (
     mask_token,
 )
 from app.services.encryption import encrypt_value, decrypt_value
+from app.services.llm_clients import invalidate_llm_clients
 
 router = APIRouter(prefix="/admin/settings", tags=["admin-settings"])
 
@@ -58,6 +59,8 @@ def update_settings(
     row.updated_by = current_user.id
     db.commit()
     db.refresh(row)
+    if payload.openai_api_key is not None or payload.anthropic_api_key is not None:
+        invalidate_llm_clients()
 
     openai_decrypted = decrypt_value(row.openai_api_key_encrypted or "")
     anthropic_decrypted = decrypt_value(row.anthropic_api_key_encrypted or "")
@@ -1,9 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_
 from typing import List, Optional
 import os
-import hashlib
 from pathlib import Path
 
 from app.database import get_db
@@ -18,14 +17,27 @@ from app.schemas.exercises import (
     TestCaseCreate,
     TestCaseResponse,
     DatasetUploadResponse,
+    TestCacheStatsResponse,
+    LLMCacheStatsResponse,
+    LLMCacheInvalidateResponse,
+    RubricGradingStatsResponse,
+    ExerciseTelemetryResponse,
+    RegradeRequest,
+    RegradeJobResponse,
 )
+from app.celery_app import celery_app
+from app.services.datasets import convert_dataset, exercise_datasets_dir, safe_filename
+from app.services import llm_eval_cache
+from app.services.priority import BULK
+from app.services.regrade import get_job, running_job, start_job
+from app.services.rubric_stats import get_rubric_stats
+from app.services.telemetry import exercise_telemetry
+from app.services.test_result_cache import compute_suite_version, get_cache_stats
 from app.config import settings
 
 router = APIRouter(prefix="/exercises", tags=["exercises"])
 
 # File storage configuration
-DATASETS_DIR = Path(settings.base_dir) / "datasets"
-DATASETS_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 
@@ -47,6 +59,12 @@ def create_exercise(
         max_submissions=exercise_data.max_submissions,
         timeout_seconds=exercise_data.timeout_seconds,
         memory_limit_mb=exercise_data.memory_limit_mb,
+        max_output_kb=exercise_data.max_output_kb,
+        test_timeout_seconds=exercise_data.test_timeout_seconds,
+        cpu_limit=exercise_data.cpu_limit,
+        precheck_enabled=exercise_data.precheck_enabled,
+        banned_modules=exercise_data.banned_modules,
+        max_code_kb=exercise_data.max_code_kb,
         has_tests=exercise_data.has_tests,
         llm_grading_enabled=exercise_data.llm_grading_enabled,
         test_weight=exercise_data.test_weight,
@@ -285,27 +303,32 @@ async def upload_dataset(
             detail=f"File size exceeds {MAX_FILE_SIZE / (1024 * 1024):.0f}MB limit"
         )
 
-    # Generate unique filename using hash
-    file_hash = hashlib.sha256(content).hexdigest()[:16]
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"exercise_{exercise_id}_{file_hash}{file_extension}"
+    # Keep the original name: student code opens it as /data/<filename>
+    try:
+        filename = safe_filename(file.filename)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
 
     # Create exercise directory
-    exercise_dir = DATASETS_DIR / f"exercise_{exercise_id}"
+    exercise_dir = exercise_datasets_dir(exercise_id)
     exercise_dir.mkdir(exist_ok=True)
 
-    # Save file
-    file_path = exercise_dir / unique_filename
+    # Save file (re-uploading the same name replaces the dataset)
+    file_path = exercise_dir / filename
     with open(file_path, "wb") as f:
         f.write(content)
 
+    # Memory-mappable copy for CSV/XLSX
+    converted = convert_dataset(file_path) if settings.dataset_convert_on_upload else []
+
     # Generate URL (in production, this would be S3 URL or similar)
-    file_url = f"/datasets/exercise_{exercise_id}/{unique_filename}"
+    file_url = f"/datasets/exercise_{exercise_id}/{filename}"
 
     return DatasetUploadResponse(
-        filename=unique_filename,
+        filename=filename,
         file_url=file_url,
-        size_bytes=file_size
+        size_bytes=file_size,
+        converted_files=[p.name for p in converted],
     )
 
 
@@ -329,3 +352,178 @@ def toggle_publish(
     db.refresh(exercise)
 
     return exercise
+
+
+@router.get("/{exercise_id}/test-cache", response_model=TestCacheStatsResponse)
+def get_test_cache_stats(
+    exercise_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """Test-result cache hit ratio for an exercise (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view this exercise")
+
+    test_cases = db.query(TestCase).filter(TestCase.exercise_id == exercise_id).all()
+    exercise_stats = get_cache_stats(exercise_id)
+    global_stats = get_cache_stats()
+
+    return TestCacheStatsResponse(
+        exercise_id=exercise_id,
+        suite_version=compute_suite_version(exercise, test_cases),
+        hits=exercise_stats["hits"],
+        misses=exercise_stats["misses"],
+        hit_ratio=exercise_stats["hit_ratio"],
+        global_hits=global_stats["hits"],
+        global_misses=global_stats["misses"],
+        global_hit_ratio=global_stats["hit_ratio"],
+    )
+
+
+@router.get("/{exercise_id}/llm-cache", response_model=LLMCacheStatsResponse)
+def get_llm_cache_stats(
+    exercise_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """LLM evaluation cache hit ratio for an exercise (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view this exercise")
+
+    exercise_stats = llm_eval_cache.get_cache_stats(exercise_id)
+    global_stats = llm_eval_cache.get_cache_stats()
+
+    return LLMCacheStatsResponse(
+        exercise_id=exercise_id,
+        **exercise_stats,
+        global_hits=global_stats["hits"],
+        global_misses=global_stats["misses"],
+        global_hit_ratio=global_stats["hit_ratio"],
+    )
+
+
+@router.delete("/{exercise_id}/llm-cache", response_model=LLMCacheInvalidateResponse)
+def invalidate_llm_cache(
+    exercise_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """Stop reusing the exercise's LLM evaluations; the next submissions are evaluated afresh (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to edit this exercise")
+
+    invalidated = llm_eval_cache.invalidate_exercise(db, exercise_id)
+    db.commit()
+
+    return LLMCacheInvalidateResponse(exercise_id=exercise_id, invalidated=invalidated)
+
+
+@router.get("/{exercise_id}/rubric-grading", response_model=RubricGradingStatsResponse)
+def get_rubric_grading_stats(
+    exercise_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """How often rubric grading fell back to a corrective LLM call (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view this exercise")
+
+    global_stats = get_rubric_stats()
+
+    return RubricGradingStatsResponse(
+        exercise_id=exercise_id,
+        **get_rubric_stats(exercise_id),
+        global_structured_fallback_ratio=global_stats["structured_fallback_ratio"],
+        global_text_fallback_ratio=global_stats["text_fallback_ratio"],
+    )
+
+
+@router.get("/{exercise_id}/telemetry", response_model=ExerciseTelemetryResponse)
+def get_exercise_telemetry(
+    exercise_id: int,
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """Sandbox resource usage percentiles over recent submissions (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view this exercise")
+
+    return ExerciseTelemetryResponse(
+        exercise_id=exercise_id,
+        timeout_seconds=exercise.timeout_seconds,
+        memory_limit_mb=exercise.memory_limit_mb,
+        **exercise_telemetry(db, exercise_id, limit=limit),
+    )
+
+
+@router.post("/{exercise_id}/regrade", response_model=RegradeJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def regrade_exercise(
+    exercise_id: int,
+    body: RegradeRequest = RegradeRequest(),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """Re-score existing submissions against the current test cases (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to regrade this exercise")
+
+    if exercise.grading_mode == GradingMode.LLM_FIRST or not exercise.has_tests:
+        raise HTTPException(status_code=400, detail="Only exercises graded by test cases can be regraded")
+
+    job_id = start_job(exercise_id, body.scope)
+    if job_id is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"A regrade of this exercise is already running (job {running_job(exercise_id)})",
+        )
+
+    celery_app.send_task('app.tasks.regrade_exercise', args=[job_id, exercise_id, body.scope], priority=BULK)
+
+    return get_job(job_id)
+
+
+@router.get("/{exercise_id}/regrade/{job_id}", response_model=RegradeJobResponse)
+def get_regrade_status(
+    exercise_id: int,
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role([UserRole.PROFESSOR, UserRole.ADMIN]))
+):
+    """Progress of a bulk regrade (professor only)"""
+    exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+
+    if exercise.created_by != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to view this exercise")
+
+    job = get_job(job_id)
+    if job is None or job["exercise_id"] != exercise_id:
+        raise HTTPException(status_code=404, detail="Regrade job not found or expired")
+
+    return job
@@ -217,6 +217,7 @@ def update_grade(
 
         if llm_eval:
             llm_eval.feedback = llm_feedback
+            llm_eval.cache_key = None  # edited for this student; not for reuse
         else:
             # Create new LLM evaluation record
             llm_eval = LLMEvaluation(
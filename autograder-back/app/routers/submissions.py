@@ -9,7 +9,7 @@ from datetime import datetime, timezone
 from app.database import get_db
 from app.auth.dependencies import get_current_user
 from app.models.user import User, UserRole
-from app.models.exercise import Exercise, ExerciseList, ExerciseListItem, SubmissionType, GradingMode
+from app.models.exercise import Exercise, ExerciseList, ExerciseListItem, SubmissionType, GradingMode, TestCase
 from app.models.class_models import ClassEnrollment
 from app.models.submission import Submission, SubmissionStatus, RubricScore
 from app.schemas.submissions import (
@@ -23,6 +23,9 @@ from app.schemas.submissions import (
     RubricScoreResponse,
 )
 from app.celery_app import celery_app
+from app.services.admission import admit_submission
+from app.services.precheck import precheck_submission
+from app.services.priority import submission_priority
 from app.config import settings
 
 router = APIRouter(prefix="/submissions", tags=["submissions"])
@@ -114,6 +117,29 @@ def check_deadline(db: Session, exercise_id: int, student_id: int) -> Optional[f
     return min(penalty, 100.0)
 
 
+def admit_or_reject(db: Session, exercise: Exercise, student_id: int) -> int:
+    """
+    Admission control for a valid submission about to be queued.
+    Returns its priority lane, or raises 429 when grading is saturated or
+    the student/class is over its rate limit.
+    """
+    priority = submission_priority(db, exercise.id, student_id)
+    rejection = admit_submission(
+        db, exercise.id, student_id, priority,
+        sandboxed=exercise.grading_mode != GradingMode.LLM_FIRST,
+    )
+    if rejection:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=rejection.reason,
+            headers={
+                "Retry-After": str(rejection.retry_after),
+                "X-Estimated-Wait": str(rejection.estimated_wait),
+            },
+        )
+    return priority
+
+
 @router.post("", response_model=SubmissionResponse, status_code=status.HTTP_201_CREATED)
 async def create_submission(
     exercise_id: int = Form(...),
@@ -182,6 +208,7 @@ async def create_submission(
 
         content_hash = hashlib.sha256(file_content).hexdigest()
         content_type = EXTENSION_TO_CONTENT_TYPE.get(ext, "application/octet-stream")
+        priority = admit_or_reject(db, exercise, current_user.id)
 
         # Create submission first to get ID
         submission = Submission(
@@ -236,7 +263,18 @@ async def create_submission(
                 detail=syntax_error
             )
 
+        # Static precheck: reject code that cannot pass before it reaches a sandbox.
+        # The query only runs if the exercise has prechecks enabled.
+        test_cases = db.query(TestCase).filter(TestCase.exercise_id == exercise_id)
+        precheck_error = precheck_submission(code, exercise, test_cases)
+        if precheck_error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=precheck_error
+            )
+
         content_hash = calculate_code_hash(code)
+        priority = admit_or_reject(db, exercise, current_user.id)
 
         submission = Submission(
             exercise_id=exercise_id,
@@ -249,19 +287,31 @@ async def create_submission(
         db.commit()
         db.refresh(submission)
 
-    # Dispatch to correct Celery task based on grading_mode
+    # Dispatch to correct Celery task based on grading_mode, in the
+    # priority lane of its deadline and the student's submission rate
     if exercise.grading_mode == GradingMode.LLM_FIRST:
         celery_app.send_task(
             'app.tasks.grade_llm_first',
             args=[submission.id],
-            kwargs={'late_penalty': late_penalty or 0.0}
+            kwargs={'late_penalty': late_penalty or 0.0},
+            priority=priority,
         )
     else:
+        # The LLM evaluation does not need the test results: start it now
+        # rather than after the sandbox run
+        speculative = settings.llm_speculative_enabled and exercise.llm_grading_enabled
         celery_app.send_task(
             'app.tasks.execute_submission',
             args=[submission.id],
-            kwargs={'late_penalty': late_penalty or 0.0}
+            kwargs={'late_penalty': late_penalty or 0.0, 'llm_dispatched': speculative},
+            priority=priority,
         )
+        if speculative:
+            celery_app.send_task(
+                'app.tasks.llm_evaluate_submission',
+                args=[submission.id],
+                priority=priority,
+            )
 
     return submission
 
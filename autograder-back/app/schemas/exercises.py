@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
+from typing import Dict, Optional, List, Literal
 from enum import Enum
 
 
@@ -53,6 +53,14 @@ class ExerciseCreate(BaseModel):
     max_submissions: Optional[int] = Field(None, ge=1)
     timeout_seconds: int = Field(30, ge=1, le=300)
     memory_limit_mb: int = Field(512, ge=128, le=2048)
+    max_output_kb: int = Field(1024, ge=16, le=10240)
+    test_timeout_seconds: Optional[int] = Field(None, ge=1, le=300)
+    cpu_limit: int = Field(1, ge=1, le=4)
+
+    # Static precheck
+    precheck_enabled: bool = False
+    banned_modules: Optional[str] = None  # Comma-separated module names
+    max_code_kb: Optional[int] = Field(None, ge=1, le=1024)
 
     # Grading configuration (test-first)
     has_tests: bool = True
@@ -112,6 +120,14 @@ class ExerciseUpdate(BaseModel):
     max_submissions: Optional[int] = Field(None, ge=1)
     timeout_seconds: Optional[int] = Field(None, ge=1, le=300)
     memory_limit_mb: Optional[int] = Field(None, ge=128, le=2048)
+    max_output_kb: Optional[int] = Field(None, ge=16, le=10240)
+    test_timeout_seconds: Optional[int] = Field(None, ge=1, le=300)
+    cpu_limit: Optional[int] = Field(None, ge=1, le=4)
+
+    # Static precheck
+    precheck_enabled: Optional[bool] = None
+    banned_modules: Optional[str] = None
+    max_code_kb: Optional[int] = Field(None, ge=1, le=1024)
 
     # Grading configuration
     has_tests: Optional[bool] = None
@@ -144,6 +160,14 @@ class ExerciseResponse(BaseModel):
     max_submissions: Optional[int]
     timeout_seconds: int
     memory_limit_mb: int
+    max_output_kb: int
+    test_timeout_seconds: Optional[int]
+    cpu_limit: int
+
+    # Static precheck
+    precheck_enabled: bool
+    banned_modules: Optional[str]
+    max_code_kb: Optional[int]
 
     # Grading configuration
     has_tests: bool
@@ -198,3 +222,101 @@ class DatasetUploadResponse(BaseModel):
     filename: str
     file_url: str
     size_bytes: int
+    converted_files: List[str] = []  # memory-mappable .npy copies written next to it
+
+
+class PercentileSummary(BaseModel):
+    """Distribution of one sandbox metric over recent submissions"""
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+
+
+class TestDurationSummary(PercentileSummary):
+    test_name: str
+
+
+class ExerciseTelemetryResponse(BaseModel):
+    """Schema for resource usage percentiles of an exercise"""
+    exercise_id: int
+    timeout_seconds: int
+    memory_limit_mb: int
+    submissions: int
+    exit_reasons: Dict[str, int]
+    wall_time_ms: PercentileSummary
+    cpu_time_ms: PercentileSummary
+    peak_memory_kb: PercentileSummary
+    tests: List[TestDurationSummary] = []
+
+
+class TestCacheStatsResponse(BaseModel):
+    """Schema for test-result cache statistics of an exercise"""
+    exercise_id: int
+    suite_version: str
+    hits: int
+    misses: int
+    hit_ratio: float
+    global_hits: int
+    global_misses: int
+    global_hit_ratio: float
+
+
+class LLMCacheStatsResponse(BaseModel):
+    """Schema for LLM evaluation cache statistics of an exercise"""
+    exercise_id: int
+    hits: int
+    redis_hits: int
+    db_hits: int
+    misses: int
+    hit_ratio: float
+    global_hits: int
+    global_misses: int
+    global_hit_ratio: float
+
+
+class LLMCacheInvalidateResponse(BaseModel):
+    """Schema for the result of dropping an exercise's cached LLM evaluations"""
+    exercise_id: int
+    invalidated: int
+
+
+class RubricGradingStatsResponse(BaseModel):
+    """Schema for how often rubric grading needed a corrective LLM call, per answer mode"""
+    exercise_id: int
+    structured_gradings: int
+    structured_fallbacks: int
+    structured_failures: int
+    structured_fallback_ratio: float
+    text_gradings: int
+    text_fallbacks: int
+    text_failures: int
+    text_fallback_ratio: float
+    global_structured_fallback_ratio: float
+    global_text_fallback_ratio: float
+
+
+class RegradeRequest(BaseModel):
+    """Schema for starting a bulk regrade of an exercise"""
+    scope: Literal["latest", "all"] = "latest"  # each student's latest submission, or every one
+
+
+class RegradeJobResponse(BaseModel):
+    """Schema for the progress of a bulk regrade"""
+    job_id: str
+    exercise_id: int
+    scope: str
+    status: str  # queued, running, completed, failed
+    total: int = 0  # submissions selected
+    distinct: int = 0  # distinct codes among them
+    chunks: int = 0
+    chunks_done: int = 0
+    regraded: int = 0
+    failed: int = 0
+    executed: int = 0  # distinct codes run in the sandbox
+    reused: int = 0  # distinct codes copied from the test-result cache
+    error: Optional[str] = None
+    created_at: Optional[int] = None
+    finished_at: Optional[int] = None
@@ -0,0 +1,43 @@
+"""Schemas for sandbox operations endpoints."""
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class SandboxWorkerStats(BaseModel):
+    worker: str
+    capacity: int
+    queued: int
+    running: int
+    completed: int
+    failed: int
+    memory_mb: int = 0
+    memory_reserved_mb: int = 0
+    cpus: float = 0
+    cpus_reserved: float = 0
+    memory_utilization: float = 0
+    cpu_utilization: float = 0
+
+
+class SandboxReaperHostStats(BaseModel):
+    host: str
+    last_run_at: Optional[int] = None
+    last_scanned: int = 0
+    last_leaked: int = 0
+    last_reaped: int = 0
+    last_failed: int = 0
+    total_leaked: int = 0
+    total_reaped: int = 0
+    total_failed: int = 0
+
+
+class SandboxExecutorStatsResponse(BaseModel):
+    capacity: int
+    queued: int
+    running: int
+    memory_mb: int = 0
+    memory_reserved_mb: int = 0
+    cpus: float = 0
+    cpus_reserved: float = 0
+    memory_utilization: float = 0
+    cpu_utilization: float = 0
+    workers: List[SandboxWorkerStats] = []
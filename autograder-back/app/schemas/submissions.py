@@ -58,6 +58,7 @@ class TestResultResponse(BaseModel):
     message: Optional[str] = None
     stdout: Optional[str] = None
     stderr: Optional[str] = None
+    duration_ms: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,207 @@
+"""
+Admission control for new submissions.
+
+``create_submission`` used to enqueue whatever the backlog, so during a rush
+students got a 201 and then waited many minutes for a grade. Before a
+submission is created the API now asks:
+
+1. Is grading saturated? The estimated wait of a code submission is the
+   number of sandbox tasks queued in its priority lane or ahead of it,
+   times the recent average run time, divided by the sandbox slots: the
+   capacity the live sandbox executors advertise in their heartbeats. Past
+   ``admission_max_wait_seconds`` the submission is refused. A deadline
+   submission only counts the deadline lane, so it is the last to be
+   turned away.
+2. Is the student, or their class, submitting faster than its token bucket
+   allows? Both buckets live in Redis and are debited together, atomically.
+
+A refusal is a 429 with ``Retry-After`` and the estimated wait, so the
+client can back off instead of piling onto the queue. When Redis or the
+broker cannot be reached, submissions are admitted.
+"""
+import logging
+import math
+import time
+from typing import NamedTuple, Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from app.celery_app import PRIORITY_STEPS, SANDBOX_QUEUE, celery_app
+from app.config import settings
+from app.models.class_models import ClassEnrollment
+from app.models.exercise import ExerciseList, ExerciseListItem
+from app.redis_client import get_redis_client
+from app.services.sandbox_executor import HEARTBEAT_SECONDS, get_executor_stats
+
+logger = logging.getLogger(__name__)
+
+_BUCKET_PREFIX = "admission:bucket:"
+_RUN_SECONDS_KEY = "admission:run_seconds"
+
+# Weight of the newest run in the moving average of sandbox run time
+_RUN_SECONDS_ALPHA = 0.1
+
+# Capacity of the live sandbox executors, re-read once per heartbeat period
+_slots = {"capacity": 0, "expires": 0.0}
+
+# Debit one token from every bucket in KEYS, or none if any is empty.
+# ARGV: now, then rate (tokens/s) and burst for each key.
+# Returns 0 when admitted, else milliseconds until all buckets have a token.
+_TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) / rate * 1000))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 60)
+end
+return 0
+"""
+
+
+# Fold ARGV[1] (seconds) into the moving average at KEYS[1], starting from
+# ARGV[3] when there is none yet; ARGV[2] is the weight of the new run.
+_RECORD_RUN = """
+local average = tonumber(redis.call('GET', KEYS[1])) or tonumber(ARGV[3])
+average = average + tonumber(ARGV[2]) * (tonumber(ARGV[1]) - average)
+redis.call('SET', KEYS[1], string.format('%.3f', average))
+return tostring(average)
+"""
+
+
+class Rejection(NamedTuple):
+    """Why a submission was refused and when to try again."""
+    reason: str
+    retry_after: int  # seconds
+    estimated_wait: int  # seconds of sandbox backlog ahead of the submission
+
+
+def student_class_id(db: Session, exercise_id: int, student_id: int) -> Optional[int]:
+    """Class through which the student has the exercise, if any."""
+    row = (
+        db.query(ExerciseList.class_id)
+        .join(ExerciseListItem, ExerciseListItem.list_id == ExerciseList.id)
+        .join(ClassEnrollment, ClassEnrollment.class_id == ExerciseList.class_id)
+        .filter(ExerciseListItem.exercise_id == exercise_id, ClassEnrollment.student_id == student_id)
+        .first()
+    )
+    return row[0] if row else None
+
+
+# ---------------------------------------------------------------------------
+# Backlog
+# ---------------------------------------------------------------------------
+
+def queue_depth(queue: str, priority: int) -> int:
+    """Messages waiting in `queue` in lanes at or ahead of `priority`."""
+    with celery_app.pool.acquire(block=True) as conn:
+        conn.ensure_connection(max_retries=1, interval_start=0, interval_step=0)  # fail fast, admit
+        channel = conn.default_channel
+        pipe = channel.client.pipeline()
+        for step in PRIORITY_STEPS:
+            if step <= priority:
+                pipe.llen(f"{queue}{channel.sep}{step}" if step else queue)
+        return sum(pipe.execute())
+
+
+def average_run_seconds() -> float:
+    value = get_redis_client().get(_RUN_SECONDS_KEY)
+    return float(value) if value else settings.admission_default_run_seconds
+
+
+def record_run_seconds(seconds: float) -> None:
+    """Fold a finished sandbox run into the moving average used for wait estimates."""
+    try:
+        # One script, so concurrent workers do not overwrite each other's update
+        get_redis_client().eval(
+            _RECORD_RUN, 1, _RUN_SECONDS_KEY, seconds, _RUN_SECONDS_ALPHA, settings.admission_default_run_seconds
+        )
+    except redis.RedisError:
+        logger.debug("Could not record sandbox run time", exc_info=True)
+
+
+def sandbox_slots() -> int:
+    """
+    Sandboxes that can run at once: the summed capacity of the executors
+    with a live heartbeat, or ``admission_sandbox_slots`` while none has one.
+    """
+    now = time.monotonic()
+    if now >= _slots["expires"]:
+        _slots["capacity"] = get_executor_stats()["capacity"]
+        _slots["expires"] = now + HEARTBEAT_SECONDS
+    return max(1, _slots["capacity"] or settings.admission_sandbox_slots)
+
+
+def estimated_wait(priority: int) -> int:
+    """Seconds a sandbox task queued now in `priority` would wait for a slot."""
+    return math.ceil(queue_depth(SANDBOX_QUEUE, priority) * average_run_seconds() / sandbox_slots())
+
+
+# ---------------------------------------------------------------------------
+# Rate limits
+# ---------------------------------------------------------------------------
+
+def take_tokens(student_id: int, class_id: Optional[int]) -> int:
+    """Debit the student's and the class's buckets; 0 when admitted, else seconds to wait."""
+    keys = [f"{_BUCKET_PREFIX}student:{student_id}"]
+    args = [time.time(), settings.admission_student_per_minute / 60, settings.admission_student_burst]
+    if class_id is not None:
+        keys.append(f"{_BUCKET_PREFIX}class:{class_id}")
+        args += [settings.admission_class_per_minute / 60, settings.admission_class_burst]
+    wait_ms = get_redis_client().eval(_TAKE_TOKENS, len(keys), *keys, *args)
+    return math.ceil(int(wait_ms) / 1000)
+
+
+def admit_submission(
+    db: Session, exercise_id: int, student_id: int, priority: int, sandboxed: bool = True
+) -> Optional[Rejection]:
+    """
+    Decide whether a new submission may be queued.
+    Returns None to admit it, or a Rejection for a 429.
+    """
+    if not settings.admission_enabled:
+        return None
+
+    wait = 0
+    if sandboxed:
+        try:
+            wait = estimated_wait(priority)
+        except Exception:
+            logger.warning("Could not read sandbox queue depth; admitting", exc_info=True)
+        if wait > settings.admission_max_wait_seconds:
+            return Rejection(
+                reason=f"Grading is saturated (about {wait // 60 + 1} min of work queued)",
+                retry_after=max(1, wait - settings.admission_max_wait_seconds),
+                estimated_wait=wait,
+            )
+
+    try:
+        retry_after = take_tokens(student_id, student_class_id(db, exercise_id, student_id))
+    except redis.RedisError:
+        logger.warning("Could not check submission rate limits; admitting", exc_info=True)
+        return None
+    if retry_after:
+        return Rejection(
+            reason="Too many submissions; please wait before submitting again",
+            retry_after=retry_after,
+            estimated_wait=wait,
+        )
+    return None
@@ -0,0 +1,166 @@
+"""
+Exercise datasets: storage layout, sandbox mounting and upload-time conversion.
+
+Uploaded files live under DATASETS_DIR/exercise_<id>/ with their original
+names. Sandbox containers see them read-only under DATASETS_MOUNT through
+bind mounts (nothing is copied per run): a one-shot container mounts just
+its exercise's directory, a pooled one the whole tree or nothing (see
+sandbox_pool). The harness links the exercise's directory to /data, so
+student code opens datasets as /data/<file>; the subprocess backend only
+offers /tmp/data/<file>.
+
+CSV and XLSX uploads can additionally be converted to a NumPy structured
+array (<stem>.npy, one field per column). Student code can memory-map it
+with ``np.load(path, mmap_mode="r")`` (or wrap it in ``pd.DataFrame``)
+instead of parsing text on every run.
+"""
+import csv
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DATASETS_DIR = Path(settings.base_dir) / "datasets"
+DATASETS_DIR.mkdir(exist_ok=True)
+DATASETS_MOUNT = "/datasets"
+
+CONVERTIBLE_EXTENSIONS = {".csv", ".xlsx"}
+
+
+def exercise_datasets_dir(exercise_id: int) -> Path:
+    return DATASETS_DIR / f"exercise_{exercise_id}"
+
+
+def sandbox_data_dir(exercise_id: int) -> Optional[str]:
+    """Container path of the exercise's datasets, or None if it has none."""
+    host_dir = exercise_datasets_dir(exercise_id)
+    if not host_dir.is_dir() or not any(host_dir.iterdir()):
+        return None
+    return f"{DATASETS_MOUNT}/{host_dir.name}"
+
+
+def dataset_fingerprint(exercise_id: int) -> List[list]:
+    """(name, size, mtime) of every dataset file; changes whenever one is replaced."""
+    host_dir = exercise_datasets_dir(exercise_id)
+    if not host_dir.is_dir():
+        return []
+    return [
+        [entry.name, stat.st_size, stat.st_mtime_ns]
+        for entry in sorted(host_dir.iterdir())
+        for stat in [entry.stat()]
+    ]
+
+
+def safe_filename(filename: str) -> str:
+    """Reduce an uploaded filename to a plain basename students can type."""
+    name = Path(filename or "").name
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._")
+    if not name:
+        raise ValueError("Invalid filename")
+    return name
+
+
+def convert_dataset(path: Path) -> List[Path]:
+    """
+    Write memory-mappable .npy copies of a CSV/XLSX dataset next to it.
+
+    Returns the files written. XLSX workbooks get one file per sheet when
+    they have more than one. Conversion is best effort: on any failure
+    (including numpy not being installed) the original upload is kept and
+    nothing is written.
+    """
+    suffix = path.suffix.lower()
+    if suffix not in CONVERTIBLE_EXTENSIONS:
+        return []
+
+    try:
+        import numpy as np
+
+        if suffix == ".csv":
+            tables = {path.stem: _read_csv(path)}
+        else:
+            tables = _read_xlsx(path)
+
+        written = []
+        for stem, rows in tables.items():
+            if len(rows) < 2:
+                continue
+            target = path.with_name(f"{stem}.npy")
+            np.save(target, _to_structured_array(np, rows[0], rows[1:]), allow_pickle=False)
+            written.append(target)
+        return written
+    except Exception as e:
+        logger.warning("Dataset conversion failed for %s: %s", path.name, e)
+        return []
+
+
+def _read_csv(path: Path) -> List[list]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [row for row in csv.reader(f) if row]
+
+
+def _read_xlsx(path: Path) -> dict:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for sheet_name in wb.sheetnames:
+            rows = [
+                list(row)
+                for row in wb[sheet_name].iter_rows(values_only=True)
+                if any(cell is not None for cell in row)
+            ]
+            stem = path.stem if len(wb.sheetnames) == 1 else f"{path.stem}_{safe_filename(sheet_name)}"
+            sheets[stem] = rows
+        return sheets
+    finally:
+        wb.close()
+
+
+def _to_structured_array(np, header: list, rows: List[list]):
+    """Infer int64 / float64 / fixed-width unicode per column."""
+    names = []
+    for i, cell in enumerate(header):
+        name = str(cell).strip() if cell is not None else ""
+        name = name or f"col{i}"
+        while name in names:
+            name += "_"
+        names.append(name)
+
+    width = len(names)
+    columns = [[row[i] if i < len(row) else None for row in rows] for i in range(width)]
+
+    fields = []
+    converted = []
+    for name, values in zip(names, columns):
+        dtype, data = _infer_column(values)
+        fields.append((name, dtype))
+        converted.append(data)
+
+    array = np.empty(len(rows), dtype=fields)
+    for name, data in zip(names, converted):
+        array[name] = data
+    return array
+
+
+def _infer_column(values: list):
+    texts = ["" if v is None else str(v).strip() for v in values]
+    present = [t for t in texts if t != ""]
+
+    if present and len(present) == len(texts):
+        try:
+            return "i8", [int(t) for t in texts]
+        except ValueError:
+            pass
+    if present:
+        try:
+            return "f8", [float(t) if t != "" else float("nan") for t in texts]
+        except ValueError:
+            pass
+    longest = max((len(t) for t in texts), default=1)
+    return f"U{max(longest, 1)}", texts
@@ -0,0 +1,147 @@
+"""
+Long-lived LLM API clients, one per provider and key in each process.
+
+Building an ``anthropic.Anthropic`` or ``openai.OpenAI`` client per call threw
+its connection pool away, so every grading paid a new TCP and TLS handshake,
+and resolving the key (``get_llm_api_key``) cost a SystemSettings query and a
+Fernet decrypt. ``get_llm_client`` keeps instead:
+
+- one client per provider and API key, whose connections stay open for
+  ``llm_keepalive_seconds`` between calls (HTTP/2 where ``h2`` is installed)
+- the resolved key, for up to ``llm_key_cache_seconds``
+
+When an admin changes a key, ``invalidate_llm_clients`` empties this
+process's cache and bumps a generation counter in Redis; every other process
+sees the new generation on its next call and resolves the key again. Without
+Redis, a changed key is picked up when the cached one expires.
+
+Every response is also handed to ``llm_rate_limit.observe_response``, which
+tunes the shared rate limits to the provider's rate-limit headers.
+"""
+import functools
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Literal, NamedTuple, Optional, Tuple
+
+import anthropic
+import httpx
+import openai
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.redis_client import get_redis_client
+from app.services.llm_rate_limit import observe_response
+from app.services.settings import get_llm_api_key
+
+logger = logging.getLogger(__name__)
+
+Provider = Literal["openai", "anthropic"]
+
+_GENERATION_KEY = "llm_clients:generation"
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class _CachedKey(NamedTuple):
+    value: str
+    generation: Optional[int]  # None if Redis could not be read
+    expires_at: float  # time.monotonic()
+
+
+_lock = threading.Lock()
+_pid = os.getpid()
+_keys: Dict[str, _CachedKey] = {}
+_clients: Dict[Tuple[str, str], Any] = {}
+
+
+def _check_fork() -> None:
+    """A forked worker must not share its parent's connections. Call with `_lock` held."""
+    global _pid
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        _keys.clear()
+        _clients.clear()
+
+
+def _generation() -> Optional[int]:
+    try:
+        return int(get_redis_client().get(_GENERATION_KEY) or 0)
+    except Exception:
+        logger.debug("Could not read the LLM key generation", exc_info=True)
+        return None
+
+
+def cached_api_key(provider: Provider, db: Optional[Session]) -> str:
+    """
+    `get_llm_api_key`, reused until it expires or a key is changed.
+    Without a session only the environment is consulted, as before.
+    """
+    if db is None:
+        return settings.openai_api_key if provider == "openai" else settings.anthropic_api_key
+
+    generation = _generation()
+    now = time.monotonic()
+    with _lock:
+        _check_fork()
+        cached = _keys.get(provider)
+        if (
+            cached is not None
+            and now < cached.expires_at
+            and (generation is None or generation == cached.generation)
+        ):
+            return cached.value
+
+    value = get_llm_api_key(provider, db)
+    with _lock:
+        _keys[provider] = _CachedKey(value, generation, now + settings.llm_key_cache_seconds)
+    return value
+
+
+def _build_client(provider: Provider, api_key: str):
+    sdk = anthropic if provider == "anthropic" else openai
+    http_client = sdk.DefaultHttpxClient(
+        http2=settings.llm_http2 and _HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_connections,
+            keepalive_expiry=settings.llm_keepalive_seconds,
+        ),
+        event_hooks={"response": [functools.partial(observe_response, provider)]},
+    )
+    if provider == "anthropic":
+        return anthropic.Anthropic(api_key=api_key, http_client=http_client)
+    return openai.OpenAI(api_key=api_key, http_client=http_client)
+
+
+def get_llm_client(provider: Provider, db: Optional[Session] = None):
+    """This process's client for `provider`, authenticated with its current key."""
+    api_key = cached_api_key(provider, db)
+    fingerprint = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    with _lock:
+        _check_fork()
+        client = _clients.get((provider, fingerprint))
+        if client is None:
+            # The client of a replaced key is dropped, not closed: calls in
+            # flight on it finish normally
+            for stale in [k for k in _clients if k[0] == provider]:
+                del _clients[stale]
+            client = _clients[(provider, fingerprint)] = _build_client(provider, api_key)
+    return client
+
+
+def invalidate_llm_clients() -> None:
+    """Forget resolved keys and clients here and, through Redis, in every other process."""
+    with _lock:
+        _keys.clear()
+        _clients.clear()
+    try:
+        get_redis_client().incr(_GENERATION_KEY)
+    except Exception:
+        logger.warning(
+            "Could not announce the LLM key change; other processes pick it up within %ds",
+            settings.llm_key_cache_seconds,
+        )
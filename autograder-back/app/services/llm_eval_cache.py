@@ -0,0 +1,181 @@
+"""
+Cache of LLM evaluations.
+
+An evaluation is fully determined by:
+- the submitted content (``Submission.content_hash``)
+- the exercise
+- what the prompt tells the model (criteria, or rubric dimensions, plus the
+  exercise text)
+- the model
+- the prompt template's version
+
+These are hashed into ``LLMEvaluation.cache_key``. Editing the criteria or
+rubric, switching provider or model, or bumping a template version therefore
+changes the key, and old evaluations stop matching on their own. Identical
+code submitted to another exercise never matches either.
+
+Lookups try Redis first, where an entry keeps the feedback, the score and the
+per-dimension rubric scores for ``llm_eval_cache_ttl_seconds``. On a Redis
+miss they fall back to the database and refill Redis. ``invalidate_exercise``
+drops an exercise's entries from both tiers, so the next submission of the
+same code is evaluated afresh.
+
+Hits per tier and misses are counted in Redis, overall and per exercise.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.exercise import Exercise, RubricDimension
+from app.models.submission import LLMEvaluation, RubricScore, Submission
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_ENTRY_PREFIX = "llm_eval_cache:entry:"
+_EXERCISE_PREFIX = "llm_eval_cache:exercise:"
+_STATS_KEY = "llm_eval_cache:stats"
+
+
+class CachedEvaluation(NamedTuple):
+    feedback: str
+    score: float
+    # (dimension_id, score, feedback) of each rubric dimension; empty for llm_evaluate_submission
+    rubric_scores: List[Tuple[int, float, Optional[str]]]
+
+
+def code_criteria(exercise: Exercise) -> Dict[str, Any]:
+    """What `create_llm_prompt` tells the model about the exercise."""
+    return {
+        "title": exercise.title,
+        "description": exercise.description,
+        "criteria": exercise.llm_grading_criteria,
+    }
+
+
+def rubric_criteria(exercise: Exercise, rubric_dimensions: List[RubricDimension]) -> Dict[str, Any]:
+    """What `create_rubric_prompt` tells the model, plus the dimension ids scores are stored under."""
+    return {
+        "title": exercise.title,
+        "description": exercise.description,
+        "rubric": [[d.id, d.name, d.weight, d.description] for d in rubric_dimensions],
+    }
+
+
+def compute_cache_key(
+    content_hash: str, exercise_id: int, criteria: Dict[str, Any], model: str, prompt_version: int
+) -> str:
+    """SHA256 over everything that determines an evaluation."""
+    criteria_hash = hashlib.sha256(
+        json.dumps(criteria, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+    payload = [content_hash, exercise_id, criteria_hash, model, prompt_version]
+    return hashlib.sha256(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def find_cached_evaluation(
+    db: Session, cache_key: str, exercise_id: int, exclude_submission_id: Optional[int] = None
+) -> Optional[CachedEvaluation]:
+    """The evaluation stored under `cache_key`, from Redis or the database, if any."""
+    try:
+        raw = get_redis_client().get(_ENTRY_PREFIX + cache_key)
+    except Exception as e:
+        logger.warning("llm_eval_cache: Redis lookup failed: %s", e)
+        raw = None
+    if raw:
+        entry = json.loads(raw)
+        _record_lookup(exercise_id, "redis")
+        return CachedEvaluation(entry["feedback"], entry["score"], [tuple(s) for s in entry["rubric_scores"]])
+
+    query = db.query(LLMEvaluation).filter(LLMEvaluation.cache_key == cache_key)
+    if exclude_submission_id is not None:
+        query = query.filter(LLMEvaluation.submission_id != exclude_submission_id)
+    row = query.order_by(LLMEvaluation.id.desc()).first()
+    if row is None:
+        _record_lookup(exercise_id, None)
+        return None
+
+    scores = db.query(RubricScore).filter(RubricScore.submission_id == row.submission_id).all()
+    cached = CachedEvaluation(row.feedback, row.score, [(s.dimension_id, s.score, s.feedback) for s in scores])
+    store_evaluation(exercise_id, cache_key, cached)
+    _record_lookup(exercise_id, "db")
+    return cached
+
+
+def store_evaluation(exercise_id: int, cache_key: str, evaluation: CachedEvaluation) -> None:
+    """Put an evaluation in the Redis tier (the database row is the caller's)."""
+    try:
+        pipe = get_redis_client().pipeline()
+        pipe.set(
+            _ENTRY_PREFIX + cache_key,
+            json.dumps(evaluation._asdict()),
+            ex=settings.llm_eval_cache_ttl_seconds,
+        )
+        pipe.sadd(_EXERCISE_PREFIX + str(exercise_id), cache_key)
+        pipe.expire(_EXERCISE_PREFIX + str(exercise_id), settings.llm_eval_cache_ttl_seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("llm_eval_cache: failed to store entry: %s", e)
+
+
+def invalidate_exercise(db: Session, exercise_id: int) -> int:
+    """
+    Drop every cached evaluation of the exercise. Stored evaluations keep their
+    feedback but are no longer reused. Returns how many rows were detached.
+    The caller commits.
+    """
+    detached = (
+        db.query(LLMEvaluation)
+        .filter(
+            LLMEvaluation.cache_key.isnot(None),
+            LLMEvaluation.submission_id.in_(
+                db.query(Submission.id).filter(Submission.exercise_id == exercise_id)
+            ),
+        )
+        .update({LLMEvaluation.cache_key: None}, synchronize_session=False)
+    )
+    try:
+        redis = get_redis_client()
+        index = _EXERCISE_PREFIX + str(exercise_id)
+        keys = [_ENTRY_PREFIX + key for key in redis.smembers(index)]
+        redis.delete(index, *keys)
+    except Exception as e:
+        # Entries left in Redis expire with their TTL
+        logger.warning("llm_eval_cache: failed to drop Redis entries of exercise %s: %s", exercise_id, e)
+    return detached
+
+
+def _record_lookup(exercise_id: int, tier: Optional[str]) -> None:
+    """Count a lookup: a hit in `tier` ("redis" or "db"), or a miss. Never fails the caller."""
+    outcome = f"hits_{tier}" if tier else "misses"
+    try:
+        pipe = get_redis_client().pipeline()
+        pipe.hincrby(_STATS_KEY, outcome, 1)
+        pipe.hincrby(_STATS_KEY, f"{outcome}:{exercise_id}", 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("llm_eval_cache: failed to record %s: %s", outcome, e)
+
+
+def get_cache_stats(exercise_id: Optional[int] = None) -> Dict[str, float]:
+    """Return hits (and per tier), misses and hit_ratio, overall or for one exercise."""
+    suffix = f":{exercise_id}" if exercise_id is not None else ""
+    redis_hits, db_hits, misses = (
+        int(value or 0)
+        for value in get_redis_client().hmget(
+            _STATS_KEY, f"hits_redis{suffix}", f"hits_db{suffix}", f"misses{suffix}"
+        )
+    )
+    hits = redis_hits + db_hits
+    total = hits + misses
+    return {
+        "hits": hits,
+        "redis_hits": redis_hits,
+        "db_hits": db_hits,
+        "misses": misses,
+        "hit_ratio": (hits / total) if total else 0.0,
+    }
@@ -0,0 +1,274 @@
+"""
+Rate limiting of LLM API calls, shared by every worker through Redis.
+
+Providers limit requests per minute (RPM) and tokens per minute (TPM) for
+each model. Without coordination a burst of submissions exceeds them, every
+worker gets a 429 and backs off for minutes at once. Instead, each call
+takes from two token buckets per (provider, model) before it goes out: one
+request, and an estimate of its tokens (``estimate_tokens``: prompt size
+plus the output budget). Both refill continuously at ``llm_rate_limit_headroom``
+of the limit, so throughput stays just under it. A call that does not fit
+sleeps until it does, up to ``llm_rate_limit_max_wait_seconds``, then
+raises ``LLMRateLimitExceeded`` for the Celery task to retry later.
+
+Limits start from ``llm_rate_limits`` (or the defaults) and then follow the
+providers' rate-limit headers, which the clients of ``llm_clients`` report
+through ``observe_response``:
+
+- the advertised limits replace the configured ones
+- the remaining requests and tokens cap the buckets, so calls made with the
+  same key outside this pool are accounted for
+- a 429 empties the buckets until its ``retry-after`` has passed
+
+Both buckets live in one Redis hash, updated by Lua scripts that use the
+Redis clock. Without Redis, calls go out unthrottled.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Optional, Tuple
+
+import httpx
+import redis
+
+from app.config import settings
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_BUCKET_PREFIX = "llm_rate:"
+_BUCKET_TTL_SECONDS = 3600
+
+# Rough sizes for estimate_tokens
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 1600
+
+# Penalty of a 429 that carries no retry-after
+DEFAULT_RETRY_AFTER_SECONDS = 5.0
+
+# (requests limit, tokens limit, requests remaining, tokens remaining)
+_HEADERS = {
+    "anthropic": (
+        "anthropic-ratelimit-requests-limit",
+        "anthropic-ratelimit-tokens-limit",
+        "anthropic-ratelimit-requests-remaining",
+        "anthropic-ratelimit-tokens-remaining",
+    ),
+    "openai": (
+        "x-ratelimit-limit-requests",
+        "x-ratelimit-limit-tokens",
+        "x-ratelimit-remaining-requests",
+        "x-ratelimit-remaining-tokens",
+    ),
+}
+
+# Both buckets, refilled up to the Redis clock. ARGV[1], ARGV[2]: configured
+# RPM and TPM, used until the headers have told the real ones. A `ts` in the
+# future is a 429 penalty: nothing refills before it.
+_REFILL = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts', 'rpm', 'tpm')
+local rpm = tonumber(state[4]) or tonumber(ARGV[1])
+local tpm = tonumber(state[5]) or tonumber(ARGV[2])
+local ts = tonumber(state[3]) or now
+local elapsed = math.max(0, now - ts)
+local requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60)
+local tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+"""
+
+# ARGV[3]: tokens of the call. Takes one request and the tokens, or returns
+# how many seconds until both are there.
+_ACQUIRE_SCRIPT = _REFILL + """
+local cost = math.min(tonumber(ARGV[3]), tpm)
+local wait = math.max(0, ts - now)
+if requests < 1 then wait = math.max(wait, (1 - requests) * 60 / rpm) end
+if tokens < cost then wait = math.max(wait, (cost - tokens) * 60 / tpm) end
+if wait > 0 then return tostring(wait) end
+redis.call('HSET', KEYS[1], 'requests', requests - 1, 'tokens', tokens - cost, 'ts', now)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return '0'
+"""
+
+# ARGV[3..6]: advertised RPM and TPM (with headroom), requests and tokens
+# remaining; ARGV[7]: 429 penalty in seconds; ARGV[8]: TTL. '' = not given.
+_OBSERVE_SCRIPT = _REFILL + """
+local learned_rpm, learned_tpm = tonumber(ARGV[3]), tonumber(ARGV[4])
+if learned_rpm then rpm = learned_rpm; redis.call('HSET', KEYS[1], 'rpm', rpm) end
+if learned_tpm then tpm = learned_tpm; redis.call('HSET', KEYS[1], 'tpm', tpm) end
+requests = math.min(requests, rpm, tonumber(ARGV[5]) or rpm)
+tokens = math.min(tokens, tpm, tonumber(ARGV[6]) or tpm)
+ts = math.max(ts, now)
+local penalty = tonumber(ARGV[7])
+if penalty then
+    requests, tokens, ts = 0, 0, math.max(ts, now + penalty)
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'ts', ts)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[8]))
+return 1
+"""
+
+# (provider, model) of the call in progress on this thread, for observe_response
+_current: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar(
+    "llm_rate_limit_call", default=None
+)
+
+
+class LLMRateLimitExceeded(Exception):
+    """The call would have waited longer than allowed for its rate limit."""
+
+    def __init__(self, provider: str, model: str, retry_after: float):
+        super().__init__(f"{provider}:{model} rate limit: retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+
+
+def estimate_tokens(prompt: Any, max_output_tokens: int, images: int = 0) -> int:
+    """
+    Tokens a call counts against TPM: its text at ~CHARS_PER_TOKEN characters
+    per token, IMAGE_TOKENS per image block, plus the output budget (which
+    providers reserve up front).
+    """
+    chars = 0
+    pending = [prompt]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, str):
+            chars += len(item)
+        elif isinstance(item, dict):
+            if item.get("type") in ("image", "image_url"):
+                images += 1
+            else:
+                pending.extend(value for key, value in item.items() if key != "type")
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+    return chars // CHARS_PER_TOKEN + 1 + images * IMAGE_TOKENS + max_output_tokens
+
+
+def configured_limits(provider: str, model: str) -> Tuple[int, int]:
+    """RPM and TPM to aim for until the provider's headers say otherwise."""
+    rpm, tpm = settings.llm_rate_limits.get(
+        f"{provider}:{model}",
+        settings.llm_rate_limits.get(provider, (settings.llm_default_rpm, settings.llm_default_tpm)),
+    )
+    return _with_headroom(rpm), _with_headroom(tpm)
+
+
+def _with_headroom(limit: float) -> int:
+    return max(1, int(limit * settings.llm_rate_limit_headroom))
+
+
+def _bucket(provider: str, model: str) -> str:
+    return f"{_BUCKET_PREFIX}{provider}:{model}"
+
+
+def acquire(provider: str, model: str, tokens: int, max_wait_seconds: Optional[float] = None) -> float:
+    """
+    Take one request and `tokens` tokens of the (provider, model) limits,
+    sleeping until they are available. Returns the seconds waited.
+
+    Raises LLMRateLimitExceeded, without taking anything, when that would
+    take more than `max_wait_seconds` (default llm_rate_limit_max_wait_seconds).
+    """
+    if not settings.llm_rate_limit_enabled:
+        return 0.0
+    if max_wait_seconds is None:
+        max_wait_seconds = settings.llm_rate_limit_max_wait_seconds
+    rpm, tpm = configured_limits(provider, model)
+    started = time.monotonic()
+    slept = False
+    while True:
+        try:
+            wait = float(get_redis_client().eval(
+                _ACQUIRE_SCRIPT, 1, _bucket(provider, model), rpm, tpm, tokens, _BUCKET_TTL_SECONDS
+            ))
+        except redis.RedisError as e:
+            logger.warning("llm_rate_limit: Redis unavailable, calling %s:%s unthrottled: %s", provider, model, e)
+            return time.monotonic() - started
+        waited = time.monotonic() - started
+        if wait <= 0:
+            if slept:
+                logger.info("llm_rate_limit: waited %.1fs for %s:%s", waited, provider, model)
+            return waited
+        if waited + wait > max_wait_seconds:
+            raise LLMRateLimitExceeded(provider, model, wait)
+        # Jitter keeps workers woken together from retrying in lockstep
+        time.sleep(wait + random.uniform(0, 0.05))
+        slept = True
+
+
+@contextmanager
+def rate_limited(provider: str, model: str, tokens: int):
+    """
+    `acquire`, then attribute the responses received inside the block to
+    (provider, model) so their rate-limit headers adjust its buckets.
+    """
+    acquire(provider, model, tokens)
+    token = _current.set((provider, model))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _header_number(headers: httpx.Headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers: httpx.Headers) -> Optional[float]:
+    """The `retry-after-ms` or `retry-after` of a response, in seconds."""
+    ms = _header_number(headers, "retry-after-ms")
+    if ms is not None:
+        return ms / 1000
+    return _header_number(headers, "retry-after")
+
+
+def observe_response(provider: str, response: httpx.Response) -> None:
+    """
+    httpx response hook of the LLM clients: adjust the buckets of the call in
+    progress to the limits and remaining quota the provider reports.
+    """
+    current = _current.get()
+    if current is None or current[0] != provider or not settings.llm_rate_limit_enabled:
+        return
+    limit_requests, limit_tokens, left_requests, left_tokens = (
+        _header_number(response.headers, name) for name in _HEADERS[provider]
+    )
+    penalty = None
+    if response.status_code == 429:
+        penalty = retry_after_seconds(response.headers) or DEFAULT_RETRY_AFTER_SECONDS
+        logger.warning("llm_rate_limit: %s:%s answered 429, pausing %.1fs", provider, current[1], penalty)
+    elif limit_requests is None and limit_tokens is None and left_requests is None and left_tokens is None:
+        return
+
+    def arg(value: Optional[float]) -> Any:
+        return "" if value is None else value
+
+    rpm, tpm = configured_limits(*current)
+    try:
+        get_redis_client().eval(
+            _OBSERVE_SCRIPT, 1, _bucket(*current), rpm, tpm,
+            arg(None if limit_requests is None else _with_headroom(limit_requests)),
+            arg(None if limit_tokens is None else _with_headroom(limit_tokens)),
+            arg(left_requests), arg(left_tokens), arg(penalty), _BUCKET_TTL_SECONDS,
+        )
+    except redis.RedisError as e:
+        logger.debug("llm_rate_limit: failed to record the limits of %s:%s: %s", provider, current[1], e)
+
+
+def retry_delay(exc: Exception, default: float) -> float:
+    """Countdown before a Celery retry of a call that was rate limited."""
+    if isinstance(exc, LLMRateLimitExceeded):
+        return exc.retry_after
+    response = getattr(exc, "response", None)
+    if isinstance(response, httpx.Response):
+        retry_after = retry_after_seconds(response.headers)
+        if retry_after is not None:
+            return retry_after
+    return default
@@ -4,10 +4,10 @@ import logging
 import re
 from typing import List
 
-import anthropic
 from sqlalchemy.orm import Session
 
-from app.services.settings import get_llm_api_key
+from app.services.llm_clients import get_llm_client
+from app.services.llm_rate_limit import estimate_tokens, rate_limited
 
 logger = logging.getLogger(__name__)
 
@@ -33,8 +33,7 @@ def _extract_placeholders(template: str) -> set:
 
 def _call_haiku(template: str, num_variations: int, db: Session) -> List[str]:
     """Call Anthropic Haiku to generate variations. Returns raw parsed list."""
-    api_key = get_llm_api_key("anthropic", db)
-    client = anthropic.Anthropic(api_key=api_key)
+    client = get_llm_client("anthropic", db)
 
     user_message = (
         f"Gere exatamente {num_variations} variações da seguinte mensagem:\n\n"
@@ -47,12 +46,14 @@ def _call_haiku(template: str, num_variations: int, db: Session) -> List[str]:
     estimated_tokens = max(2048, len(template) * num_variations * 2)
     estimated_tokens = min(estimated_tokens, 16384)
 
-    response = client.messages.create(
-        model=HAIKU_MODEL,
-        max_tokens=estimated_tokens,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": user_message}],
-    )
+    tokens = estimate_tokens([SYSTEM_PROMPT, user_message], estimated_tokens)
+    with rate_limited("anthropic", HAIKU_MODEL, tokens):
+        response = client.messages.create(
+            model=HAIKU_MODEL,
+            max_tokens=estimated_tokens,
+            system=SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": user_message}],
+        )
 
     if response.stop_reason == "max_tokens":
         raise ValueError(
@@ -0,0 +1,187 @@
+"""
+Static precheck of code submissions, before any sandbox is spent on them.
+
+``validate_python_syntax`` only proves the code parses. Code that never
+defines the function the tests call, or that imports a module the exercise
+forbids, still cost a full sandbox run that fails every test. The precheck
+inspects the AST in the API and rejects such submissions with a precise
+message:
+
+1. size: at most ``Exercise.max_code_kb`` (``precheck_max_code_kb`` by default)
+2. syntax
+3. banned modules: ``import``/``from ... import`` of a module listed in
+   ``Exercise.banned_modules`` (or a submodule of one), plus literal
+   ``__import__("x")`` / ``importlib.import_module("x")`` calls
+4. required names: every free name in the ``TestCase.input_data``
+   expressions that is not a builtin must be bound at module level
+
+The precheck is off until a professor turns it on for an exercise
+(``Exercise.precheck_enabled``), so existing exercises keep accepting what
+they accepted before.
+
+It is a fast-fail filter, not a security boundary: the sandbox still
+contains whatever gets through. Checks err on the side of letting code run;
+when the module namespace cannot be known statically (``from x import *``,
+``globals()``, ``exec``) the required-name check is skipped.
+"""
+import ast
+import builtins
+from typing import Iterable, List, Optional, Set
+
+from app.config import settings
+from app.models.exercise import Exercise, TestCase
+
+# Names the harness's namespace has before the student's module runs
+_PROVIDED = frozenset(dir(builtins)) | {"__file__"}
+
+# Calls that can add module-level names the AST does not show
+_DYNAMIC_NAMESPACE = frozenset({"globals", "exec", "setattr", "vars", "__import__"})
+
+
+def parse_module_list(value: Optional[str]) -> List[str]:
+    """Comma-separated module names (as stored on the exercise) as a list."""
+    return [m.strip() for m in (value or "").split(",") if m.strip()]
+
+
+def required_names(test_cases: Iterable[TestCase]) -> Set[str]:
+    """Free, non-builtin names the test expressions look up in the student's namespace."""
+    names: Set[str] = set()
+    for tc in test_cases:
+        try:
+            tree = ast.parse(tc.input_data, mode="eval")
+        except SyntaxError:
+            continue  # the harness reports it as a failing test
+        loaded = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+        names |= loaded - _bound_in_expression(tree) - _PROVIDED
+    return names
+
+
+def _bound_in_expression(tree: ast.AST) -> Set[str]:
+    """Names the expression binds itself: comprehension targets, lambda args, walrus."""
+    bound: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.comprehension):
+            bound |= {n.id for n in ast.walk(node.target) if isinstance(n, ast.Name)}
+        elif isinstance(node, ast.Lambda):
+            args = node.args
+            for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+                if arg is not None:
+                    bound.add(arg.arg)
+        elif isinstance(node, ast.NamedExpr):
+            bound.add(node.target.id)
+    return bound
+
+
+def defined_names(tree: ast.Module) -> Optional[Set[str]]:
+    """
+    Names bound at module level, or None if they cannot be known statically.
+
+    Walks the top-level statements and the blocks nested in them (if, try,
+    for, with...), but not function or class bodies, except for their
+    `global` declarations.
+    """
+    names: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return None
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in _DYNAMIC_NAMESPACE
+        ):
+            return None
+        if isinstance(node, ast.Global):
+            names.update(node.names)
+
+    def visit(statements):
+        for node in statements:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.add(node.name)
+                continue
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    names.add(alias.asname or alias.name.split(".")[0])
+                continue
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+                    names.add(child.id)
+                elif isinstance(child, ast.ExceptHandler) and child.name:
+                    names.add(child.name)
+                elif isinstance(child, ast.MatchAs) and child.name:
+                    names.add(child.name)
+            for field in ("body", "orelse", "finalbody"):
+                visit(getattr(node, field, []))
+            for handler in getattr(node, "handlers", []):
+                visit(handler.body)
+            for case in getattr(node, "cases", []):
+                visit(case.body)
+
+    visit(tree.body)
+    return names
+
+
+def find_banned_import(tree: ast.Module, banned: List[str]) -> Optional[str]:
+    """Error message for the first import of a banned module, or None."""
+    if not banned:
+        return None
+
+    def is_banned(module: str) -> Optional[str]:
+        for name in banned:
+            if module == name or module.startswith(name + "."):
+                return name
+        return None
+
+    for node in ast.walk(tree):
+        modules: List[str] = []
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+        elif isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant):
+            func = node.func
+            is_import_call = (
+                (isinstance(func, ast.Name) and func.id == "__import__")
+                or (isinstance(func, ast.Attribute) and func.attr == "import_module")
+            )
+            if is_import_call and isinstance(node.args[0].value, str):
+                modules = [node.args[0].value]
+        for module in modules:
+            name = is_banned(module)
+            if name:
+                return f"Line {node.lineno}: importing '{name}' is not allowed in this exercise"
+    return None
+
+
+def precheck_submission(code: str, exercise: Exercise, test_cases: Iterable[TestCase]) -> Optional[str]:
+    """
+    Run the exercise's prechecks on `code`, if it has them enabled.
+    Returns the first error message, or None if the code may run.
+
+    `test_cases` is only iterated when prechecks run, so it may be a query.
+    """
+    if not exercise.precheck_enabled:
+        return None
+
+    max_kb = exercise.max_code_kb or settings.precheck_max_code_kb
+    size = len(code.encode("utf-8"))
+    if size > max_kb * 1024:
+        return f"Code is {size / 1024:.0f} KB; this exercise accepts at most {max_kb} KB"
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return f"Syntax error at line {e.lineno}: {e.msg}"
+
+    banned = parse_module_list(exercise.banned_modules) + parse_module_list(settings.precheck_banned_modules)
+    error = find_banned_import(tree, banned)
+    if error:
+        return error
+
+    required = required_names(test_cases)
+    if required:
+        defined = defined_names(tree)
+        if defined is not None:
+            missing = sorted(required - defined)
+            if missing:
+                return f"The tests use {', '.join(missing)}, which your code does not define"
+    return None
@@ -0,0 +1,77 @@
+"""
+Priority of grading tasks on the sandbox and llm queues.
+
+Celery on Redis keeps one list per priority lane and workers drain the
+lowest-numbered non-empty lane first (``queue_order_strategy="priority"``
+in app/celery_app.py). A submission's lane depends on:
+
+1. the deadline: an interactive submission to a list closing within
+   ``priority_deadline_window_minutes`` jumps to ``DEADLINE``
+2. who is waiting: interactive submissions go ahead of regrades, which
+   always ride ``BULK``
+3. the student's recent rate: more than ``priority_rate_threshold``
+   submissions in ``priority_rate_window_minutes`` drops them one lane, so
+   a student hammering the submit button does not starve the class
+
+The sandbox executor admits runs by the same lanes
+(app/services/sandbox_executor.py), so a run does not wait behind
+lower-lane runs that reached the worker first. Lanes only order work that
+is already queued; nothing is dropped.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.celery_app import PRIORITY_STEPS
+from app.config import settings
+from app.models.class_models import ClassEnrollment
+from app.models.exercise import ExerciseList, ExerciseListItem
+from app.models.submission import Submission
+
+# Lanes, highest priority first
+DEADLINE, INTERACTIVE, THROTTLED, BULK = PRIORITY_STEPS
+
+
+def next_deadline(db: Session, exercise_id: int, student_id: int, now: Optional[int] = None) -> Optional[int]:
+    """Earliest `closes_at` still ahead among the student's lists that contain the exercise."""
+    now = int(time.time()) if now is None else now
+    return (
+        db.query(func.min(ExerciseList.closes_at))
+        .join(ExerciseListItem, ExerciseListItem.list_id == ExerciseList.id)
+        .join(ClassEnrollment, ClassEnrollment.class_id == ExerciseList.class_id)
+        .filter(
+            ExerciseListItem.exercise_id == exercise_id,
+            ClassEnrollment.student_id == student_id,
+            ExerciseList.closes_at > now,
+        )
+        .scalar()
+    )
+
+
+def recent_submission_count(db: Session, student_id: int) -> int:
+    """Submissions the student made in the last `priority_rate_window_minutes`."""
+    since = datetime.now(timezone.utc) - timedelta(minutes=settings.priority_rate_window_minutes)
+    return (
+        db.query(func.count(Submission.id))
+        .filter(Submission.student_id == student_id, Submission.submitted_at >= since)
+        .scalar()
+    ) or 0
+
+
+def submission_priority(db: Session, exercise_id: int, student_id: int, now: Optional[int] = None) -> int:
+    """Lane of an interactive submission."""
+    if not settings.priority_enabled:
+        return INTERACTIVE
+    now = int(time.time()) if now is None else now
+
+    lane = INTERACTIVE
+    closes_at = next_deadline(db, exercise_id, student_id, now)
+    if closes_at is not None and closes_at - now <= settings.priority_deadline_window_minutes * 60:
+        lane = DEADLINE
+
+    if recent_submission_count(db, student_id) > settings.priority_rate_threshold:
+        lane = PRIORITY_STEPS[PRIORITY_STEPS.index(lane) + 1]
+    return lane
@@ -0,0 +1,153 @@
+"""
+Bulk regrade of an exercise after its test suite changes.
+
+Fixing a test case used to leave existing grades stale until every student
+resubmitted. A regrade job re-scores the exercise's latest (or every)
+submission without queueing one task per submission:
+
+1. ``regrade_exercise`` selects the submissions and groups them by
+   ``content_hash``, so each distinct code runs once however many students
+   share it.
+2. The groups are split into chunks of ``regrade_chunk_size`` and fanned
+   out as ``regrade_chunk`` tasks. A chunk hands all its runs to the sandbox
+   executor at once and lets it decide how many go in parallel.
+3. Each submission gets its new TestResult rows and Grade in one
+   transaction, as if it had just been executed against the new suite.
+
+Progress lives in a Redis hash per job; a per-exercise lock keeps two
+regrades of the same exercise from overlapping.
+"""
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.submission import Submission, SubmissionStatus
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_JOB_PREFIX = "regrade:job:"
+_LOCK_PREFIX = "regrade:lock:"
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+SCOPES = ("latest", "all")
+
+# Counters summed over the job's chunks
+_COUNTERS = ("chunks_done", "regraded", "failed", "executed", "reused")
+
+
+def select_submissions(db: Session, exercise_id: int, scope: str = "latest") -> List[Submission]:
+    """
+    Code submissions of the exercise that already finished running.
+
+    `latest` keeps each student's most recent one; `all` takes every one.
+    Queued and running submissions are left alone: they will run against
+    the current suite anyway.
+    """
+    finished = [
+        Submission.exercise_id == exercise_id,
+        Submission.code.isnot(None),
+        Submission.status.in_([SubmissionStatus.COMPLETED, SubmissionStatus.FAILED]),
+    ]
+    query = db.query(Submission).filter(*finished)
+    if scope == "latest":
+        latest_ids = (
+            db.query(func.max(Submission.id))
+            .filter(*finished)
+            .group_by(Submission.student_id)
+        )
+        query = query.filter(Submission.id.in_(latest_ids))
+    return query.order_by(Submission.id).all()
+
+
+def group_by_content(submissions: List[Submission]) -> List[Tuple[str, List[int]]]:
+    """[(content_hash, [submission ids])], in order of first appearance."""
+    groups: "OrderedDict[str, List[int]]" = OrderedDict()
+    for submission in submissions:
+        groups.setdefault(submission.content_hash, []).append(submission.id)
+    return list(groups.items())
+
+
+def chunked(groups: List[Tuple[str, List[int]]], size: int) -> List[List[Tuple[str, List[int]]]]:
+    size = max(1, size)
+    return [groups[i:i + size] for i in range(0, len(groups), size)]
+
+
+# ---------------------------------------------------------------------------
+# Job progress (Redis)
+# ---------------------------------------------------------------------------
+
+def start_job(exercise_id: int, scope: str) -> Optional[str]:
+    """Register a new job, or return None if the exercise is already being regraded."""
+    redis = get_redis_client()
+    job_id = uuid.uuid4().hex
+    if not redis.set(_LOCK_PREFIX + str(exercise_id), job_id, nx=True, ex=JOB_TTL_SECONDS):
+        return None
+    redis.hset(_JOB_PREFIX + job_id, mapping={
+        "job_id": job_id,
+        "exercise_id": exercise_id,
+        "scope": scope,
+        "status": "queued",
+        "created_at": int(time.time()),
+    })
+    redis.expire(_JOB_PREFIX + job_id, JOB_TTL_SECONDS)
+    return job_id
+
+
+def running_job(exercise_id: int) -> Optional[str]:
+    """Id of the exercise's regrade in progress, if any."""
+    return get_redis_client().get(_LOCK_PREFIX + str(exercise_id))
+
+
+def update_job(job_id: str, **fields: Any) -> None:
+    get_redis_client().hset(_JOB_PREFIX + job_id, mapping={k: str(v) for k, v in fields.items()})
+
+
+def record_chunk(job_id: str, regraded: int, failed: int, executed: int, reused: int) -> bool:
+    """Add a finished chunk's counts; True when it was the job's last chunk."""
+    redis = get_redis_client()
+    key = _JOB_PREFIX + job_id
+    pipe = redis.pipeline()
+    pipe.hincrby(key, "chunks_done", 1)
+    pipe.hincrby(key, "regraded", regraded)
+    pipe.hincrby(key, "failed", failed)
+    pipe.hincrby(key, "executed", executed)
+    pipe.hincrby(key, "reused", reused)
+    pipe.hget(key, "chunks")
+    chunks_done, *_, chunks = pipe.execute()
+    return chunks is not None and chunks_done >= int(chunks)
+
+
+def finish_job(job_id: str, exercise_id: int, status: str, error: Optional[str] = None) -> None:
+    """Mark the job completed or failed and free the exercise for the next regrade."""
+    redis = get_redis_client()
+    fields = {"status": status, "finished_at": int(time.time())}
+    if error:
+        fields["error"] = error
+    update_job(job_id, **fields)
+    if redis.get(_LOCK_PREFIX + str(exercise_id)) == job_id:
+        redis.delete(_LOCK_PREFIX + str(exercise_id))
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """The job's progress, or None if unknown or expired."""
+    raw = get_redis_client().hgetall(_JOB_PREFIX + job_id)
+    if not raw:
+        return None
+    job: Dict[str, Any] = {
+        "job_id": raw.get("job_id", job_id),
+        "exercise_id": int(raw.get("exercise_id", 0)),
+        "scope": raw.get("scope", "latest"),
+        "status": raw.get("status", "queued"),
+        "error": raw.get("error"),
+    }
+    for field in ("total", "distinct", "chunks") + _COUNTERS:
+        job[field] = int(raw.get(field, 0))
+    for field in ("created_at", "finished_at"):
+        job[field] = int(raw[field]) if raw.get(field) else None
+    return job
@@ -0,0 +1,61 @@
+"""
+How rubric grading (grade_llm_first) gets a usable answer from the LLM.
+
+With ``llm_structured_output`` the model answers through the provider's
+structured output (OpenAI ``json_schema``) or a forced tool call (Anthropic),
+against a schema built from the exercise's rubric dimensions. Otherwise it
+answers in free text that ``parse_rubric_response`` has to dig the JSON out
+of.
+
+Either way, an answer that does not parse, or that leaves out a dimension,
+costs a second full LLM call with a corrective message. Each grading is
+counted in Redis, per mode and overall and per exercise, as one of:
+
+- ``first_try``: the first answer was used
+- ``fallback``: it took the corrective call
+- ``failed``: the corrective answer was unusable too
+"""
+import logging
+from typing import Dict, Optional
+
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_STATS_KEY = "rubric_grading:stats"
+
+MODES = ("structured", "text")
+OUTCOMES = ("first_try", "fallback", "failed")
+
+
+def record_outcome(exercise_id: int, mode: str, outcome: str) -> None:
+    """Count one grading of `mode` that ended in `outcome`. Never fails the caller."""
+    field = f"{mode}:{outcome}"
+    try:
+        pipe = get_redis_client().pipeline()
+        pipe.hincrby(_STATS_KEY, field, 1)
+        pipe.hincrby(_STATS_KEY, f"{field}:{exercise_id}", 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("rubric_stats: failed to record %s: %s", field, e)
+
+
+def get_rubric_stats(exercise_id: Optional[int] = None) -> Dict[str, float]:
+    """
+    Per mode: gradings, how many fell back to the corrective call (failed
+    ones included), how many failed, and fallback_ratio. Overall or for one
+    exercise.
+    """
+    suffix = f":{exercise_id}" if exercise_id is not None else ""
+    fields = [f"{mode}:{outcome}{suffix}" for mode in MODES for outcome in OUTCOMES]
+    counts = dict(zip(fields, (int(v or 0) for v in get_redis_client().hmget(_STATS_KEY, *fields))))
+
+    stats: Dict[str, float] = {}
+    for mode in MODES:
+        first_try, fallback, failed = (counts[f"{mode}:{outcome}{suffix}"] for outcome in OUTCOMES)
+        gradings = first_try + fallback + failed
+        stats[f"{mode}_gradings"] = gradings
+        stats[f"{mode}_fallbacks"] = fallback + failed
+        stats[f"{mode}_failures"] = failed
+        stats[f"{mode}_fallback_ratio"] = ((fallback + failed) / gradings) if gradings else 0.0
+    return stats
@@ -0,0 +1,366 @@
+"""
+Sandbox backends: where the test harness of a submission actually runs.
+
+``execute_submission`` prepares the harness inputs and hands the run to a
+backend chosen per deployment with ``settings.sandbox_backend``:
+
+- ``docker`` (default): the sandbox image, either in a warm container from
+  the per-process pool or in a one-shot container when pooling is off (or
+  the exercise has datasets the pool does not mount, see sandbox_pool).
+- ``subprocess``: the harness as a plain child process of the worker, jailed
+  by sandbox_runtime/jail.py (Linux namespaces without network, read-only
+  filesystems, private /tmp, seccomp, rlimits and, when
+  ``sandbox_cgroup_root`` points at a delegated cgroup v2 directory,
+  per-run memory/CPU/pids limits). No daemon round-trips and no
+  image, so it starts in tens of milliseconds, but student code only gets
+  the host interpreter and its stdlib: meant for simple pure-Python
+  exercises. Datasets are not at /data there (see SubprocessBackend).
+
+Every backend streams the harness output through ``read_capped`` and raises
+SandboxTimeout / SandboxOutputLimitExceeded like the pool does. A sandbox
+that could not be set up raises SandboxSetupError, which execute_submission
+retries like any other infrastructure failure instead of charging it to the
+submission.
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import docker
+
+from app.config import settings
+from app.models.exercise import Exercise
+from app.services.datasets import DATASETS_MOUNT, exercise_datasets_dir, sandbox_data_dir
+from app.services.sandbox_pool import (
+    SUBMISSION_LABEL,
+    TIMEOUT_LABEL,
+    SandboxOutputLimitExceeded,
+    SandboxPool,
+    SandboxTimeout,
+    WORKSPACE_MOUNT,
+    read_capped,
+    sandbox_labels,
+)
+
+logger = logging.getLogger(__name__)
+
+# Entry point of the harness inside the sandbox image
+HARNESS_ENTRYPOINT = "/opt/autograder/run_harness.py"
+
+SANDBOX_RUNTIME_DIR = Path(__file__).resolve().parents[2] / "sandbox_runtime"
+JAIL_SCRIPT = SANDBOX_RUNTIME_DIR / "jail.py"
+# Where jail.py mounts the exercise's datasets; the harness links /tmp/data to
+# it, but there is no /data (see SubprocessBackend)
+JAIL_DATA_DIR = "/tmp/.autograder/data"
+
+PIDS_LIMIT = 256
+TMPFS_BYTES = 50 * 1024 * 1024
+
+
+class SandboxSetupError(Exception):
+    """Raised when the sandbox failed before the student's code could run."""
+
+
+def output_budget(exercise: Exercise) -> int:
+    """Bytes of stdout+stderr a run of this exercise may produce."""
+    return exercise.max_output_kb * 1024
+
+
+class SandboxBackend(ABC):
+    """Runs the harness for one submission."""
+
+    name: str = ""
+
+    @abstractmethod
+    def sandbox_data_dir(self, exercise_id: int) -> Optional[str]:
+        """Path of the exercise's datasets as the harness sees it, or None."""
+
+    @abstractmethod
+    def run_harness(
+        self,
+        exercise: Exercise,
+        write_inputs: Callable[[Path], None],
+        on_line=None,
+        submission_id: Optional[int] = None,
+    ) -> Tuple[int, str]:
+        """
+        Write the inputs with `write_inputs(workspace)` and run the harness
+        (for `submission_id`, when known, which labels the container).
+
+        Output is capped at the exercise's budget and passed line by line to
+        `on_line`. Returns (exit_code, logs). Raises SandboxTimeout or
+        SandboxOutputLimitExceeded.
+        """
+
+
+class DockerBackend(SandboxBackend):
+    """The sandbox image, in a pooled container when `pool` is given."""
+
+    name = "docker"
+
+    def __init__(self, docker_client, pool: Optional[SandboxPool] = None):
+        self.client = docker_client
+        self.pool = pool
+
+    def sandbox_data_dir(self, exercise_id: int) -> Optional[str]:
+        return sandbox_data_dir(exercise_id)
+
+    def run_harness(self, exercise, write_inputs, on_line=None, submission_id=None):
+        # Pooled containers only see an exercise's datasets when they all share the tree
+        if self.pool is not None and (self.pool.share_datasets or self.sandbox_data_dir(exercise.id) is None):
+            return self._run_pooled(exercise, write_inputs, on_line)
+        return self._run_one_shot(exercise, write_inputs, on_line, submission_id)
+
+    def _run_pooled(self, exercise, write_inputs, on_line):
+        slot = self.pool.acquire(exercise.memory_limit_mb, exercise.cpu_limit)
+        healthy = False
+        try:
+            write_inputs(slot.workspace)
+            exit_code, output = self.pool.execute(
+                slot, HARNESS_ENTRYPOINT, exercise.timeout_seconds,
+                output_budget(exercise), on_line,
+            )
+            healthy = True
+            return exit_code, output.decode("utf-8", errors="replace")
+        except (SandboxTimeout, SandboxOutputLimitExceeded):
+            # The reset kills whatever the run left behind; a container killed
+            # for its output is flagged on the slot and replaced regardless
+            healthy = True
+            raise
+        finally:
+            self.pool.release(slot, healthy=healthy)
+
+    def _run_one_shot(self, exercise, write_inputs, on_line, submission_id=None):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Write harness inputs; the sandbox user must be able to read them
+            workspace = Path(tmpdir)
+            workspace.chmod(0o755)
+            write_inputs(workspace)
+
+            # Datasets are shared read-only, never copied
+            volumes = {str(workspace.absolute()): {'bind': WORKSPACE_MOUNT, 'mode': 'ro'}}
+            data_dir = exercise_datasets_dir(exercise.id)
+            if data_dir.is_dir():
+                volumes[str(data_dir.absolute())] = {'bind': f"{DATASETS_MOUNT}/{data_dir.name}", 'mode': 'ro'}
+
+            # Create and run container
+            container = self.client.containers.run(
+                settings.docker_image_sandbox,
+                command=["python", HARNESS_ENTRYPOINT],
+                working_dir="/tmp",
+                detach=True,
+                network_mode="none",
+                mem_limit=f"{exercise.memory_limit_mb}m",
+                cpu_period=100000,
+                cpu_quota=100000 * exercise.cpu_limit,
+                read_only=True,
+                user="nobody",
+                cap_drop=["ALL"],  # Drop all capabilities
+                security_opt=["no-new-privileges"],
+                pids_limit=PIDS_LIMIT,  # Prevent fork bombs
+                tmpfs={"/tmp": "size=50m,mode=1777"},
+                volumes=volumes,
+                labels=sandbox_labels({
+                    SUBMISSION_LABEL: submission_id,
+                    TIMEOUT_LABEL: exercise.timeout_seconds,
+                }),
+            )
+
+            # Kill the container when the time limit is hit; that also ends the log stream
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                try:
+                    container.kill()
+                except docker.errors.APIError:
+                    pass  # exited on its own in the meantime
+
+            watchdog = threading.Timer(exercise.timeout_seconds, on_timeout)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                stream = container.logs(stdout=True, stderr=True, stream=True, follow=True)
+                try:
+                    output = read_capped(stream, output_budget(exercise), on_line)
+                except SandboxOutputLimitExceeded:
+                    container.kill()
+                    raise
+
+                result = container.wait(timeout=30)
+                if timed_out.is_set():
+                    raise SandboxTimeout(f"Execution exceeded {exercise.timeout_seconds}s")
+                return result["StatusCode"], output.decode("utf-8", errors="replace")
+
+            finally:
+                watchdog.cancel()
+                # Always destroy container
+                container.remove(force=True)
+
+
+class SubprocessBackend(SandboxBackend):
+    """
+    The harness as a jailed child process of the worker (Linux only).
+
+    The jail shares the host's root filesystem, read-only, and cannot add a
+    /data entry to it, so datasets are only reachable as /tmp/data/<file>
+    (and under JAIL_DATA_DIR). Exercises that open /data/<file> need the
+    docker backend.
+    """
+
+    name = "subprocess"
+
+    def __init__(
+        self,
+        python: Optional[str] = None,
+        hidden_paths: Optional[List[str]] = None,
+        cgroup_root: Optional[str] = None,
+    ):
+        default_python = os.path.realpath(getattr(sys, "_base_executable", sys.executable))
+        self.python = python or settings.sandbox_subprocess_python or default_python
+        if hidden_paths is None:
+            hidden_paths = [p.strip() for p in settings.sandbox_subprocess_hidden_paths.split(",") if p.strip()]
+        self.hidden_paths = hidden_paths
+        self.cgroup_root = settings.sandbox_cgroup_root if cgroup_root is None else cgroup_root
+
+    def sandbox_data_dir(self, exercise_id: int) -> Optional[str]:
+        return JAIL_DATA_DIR if sandbox_data_dir(exercise_id) else None
+
+    def run_harness(self, exercise, write_inputs, on_line=None, submission_id=None):
+        with tempfile.TemporaryDirectory(prefix="autograder-run-") as tmpdir:
+            workspace = Path(tmpdir)
+            workspace.chmod(0o755)
+            write_inputs(workspace)
+
+            cgroup = self._create_cgroup(exercise)
+            data_dir = exercise_datasets_dir(exercise.id)
+            spec = {
+                "python": self.python,
+                "runtime": str(SANDBOX_RUNTIME_DIR),
+                "workspace": str(workspace),
+                "data": str(data_dir) if data_dir.is_dir() else None,
+                "memory_bytes": exercise.memory_limit_mb * 1024 * 1024,
+                "tmpfs_bytes": TMPFS_BYTES,
+                "max_file_bytes": TMPFS_BYTES,
+                "max_processes": PIDS_LIMIT,
+                "cgroup": str(cgroup) if cgroup else None,
+                "hidden": self.hidden_paths,
+            }
+            try:
+                return self._run(exercise, spec, cgroup, on_line)
+            finally:
+                if cgroup:
+                    self._remove_cgroup(cgroup)
+
+    def _run(self, exercise, spec, cgroup, on_line):
+        # The jail reports setup failures on this pipe, out of the student's reach
+        status_read, status_write = os.pipe()
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, "-E", "-s", str(JAIL_SCRIPT), json.dumps({**spec, "status_fd": status_write})],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                env={"PATH": "/usr/local/bin:/usr/bin:/bin"},
+                pass_fds=(status_write,),
+            )
+        except BaseException:
+            os.close(status_read)
+            raise
+        finally:
+            os.close(status_write)
+        status = os.fdopen(status_read, "rb")
+
+        def kill():
+            # The jailed child dies with the jail (PDEATHSIG), and with it the
+            # whole PID namespace; the group and cgroup kills are belt and braces
+            for action in (
+                proc.kill,
+                lambda: os.killpg(proc.pid, signal.SIGKILL),
+                lambda: cgroup and (cgroup / "cgroup.kill").write_text("1"),
+            ):
+                try:
+                    action()
+                except OSError:
+                    pass
+
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            kill()
+
+        watchdog = threading.Timer(exercise.timeout_seconds, on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            stream = iter(lambda: proc.stdout.read1(65536), b"")
+            try:
+                output = read_capped(stream, output_budget(exercise), on_line)
+            except SandboxOutputLimitExceeded:
+                kill()
+                raise
+            exit_code = proc.wait(timeout=30)
+            setup_error = status.read().decode("utf-8", errors="replace")
+            if setup_error:
+                raise SandboxSetupError(f"Sandbox setup failed: {setup_error}")
+            if timed_out.is_set():
+                raise SandboxTimeout(f"Execution exceeded {exercise.timeout_seconds}s")
+            return exit_code, output.decode("utf-8", errors="replace")
+        finally:
+            watchdog.cancel()
+            if proc.poll() is None:
+                kill()
+                proc.wait()
+            proc.stdout.close()
+            status.close()
+
+    def _create_cgroup(self, exercise: Exercise) -> Optional[Path]:
+        """A cgroup v2 directory with this run's limits, if a root is configured."""
+        if not self.cgroup_root:
+            return None
+        path = Path(self.cgroup_root) / f"run-{uuid.uuid4().hex[:12]}"
+        path.mkdir()
+        limits = {
+            "memory.max": str(exercise.memory_limit_mb * 1024 * 1024),
+            "memory.swap.max": "0",
+            "cpu.max": f"{100000 * exercise.cpu_limit} 100000",
+            "pids.max": str(PIDS_LIMIT),
+        }
+        try:
+            for name, value in limits.items():
+                try:
+                    (path / name).write_text(value)
+                except FileNotFoundError:
+                    if name != "memory.swap.max":  # absent without swap accounting
+                        raise
+        except OSError:
+            self._remove_cgroup(path)
+            raise
+        return path
+
+    def _remove_cgroup(self, path: Path) -> None:
+        try:
+            (path / "cgroup.kill").write_text("1")
+        except OSError:
+            pass
+        for _ in range(50):
+            try:
+                path.rmdir()
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.01)  # killed processes take a moment to leave
+        logger.warning("Could not remove sandbox cgroup %s", path)
@@ -0,0 +1,372 @@
+"""
+Per-host sandbox executor.
+
+A prefork Celery worker ties one process to every running sandbox: the task
+blocks on the container until it exits, so host parallelism ends up being the
+worker's ``--concurrency`` rather than what the machine can take. The executor
+decouples the two. Each worker process runs one asyncio event loop on a
+background thread; jobs submitted from ``execute_submission`` wait there
+until they are admitted, and only then get a thread to drive their container
+(the Docker SDK is blocking). A thread-pool Celery worker can therefore
+accept many submissions in a single process while the executor, not the
+process count, decides how many sandboxes run.
+
+Admission packs jobs against the host's resource budget rather than a slot
+count. Each job reserves what its container is limited to
+(``Exercise.memory_limit_mb`` and ``cpu_limit`` cores) and starts once both
+fit in what is left, so many small exercises run side by side while a heavy
+one waits for room. Jobs carry the priority lane their task was delivered
+from (app/services/priority.py) and are admitted lane by lane, lowest
+number first, and first come, first served within a lane: a deadline
+submission that arrives behind a regrade's burst of bulk runs still starts
+at the next free slot. A job may start ahead of one that does not fit yet,
+until the head of the queue has waited
+``sandbox_executor_backfill_seconds``, after which nothing overtakes it. A
+job larger than the whole budget runs alone.
+
+The budget is per worker process, which is the host's budget with one
+thread-pool sandbox worker per host (systemd/autograder-worker-sandbox.service).
+That worker leaves ``--concurrency`` unset, so Celery sizes its thread pool
+from the executor (``sandbox_worker_concurrency``), and admission control
+reads the capacity of every live executor from the heartbeats below.
+
+Queue, running and reserved counts are kept in process and published to
+Redis as a short-lived heartbeat, so the API can report them for every worker.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Set
+
+from app.config import settings
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_STATS_PREFIX = "sandbox_executor:"
+HEARTBEAT_SECONDS = 5
+_STATS_TTL_SECONDS = 3 * HEARTBEAT_SECONDS
+
+
+def worker_id() -> str:
+    """Identity of this worker process, as published in its heartbeat and container labels."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def host_memory_mb() -> int:
+    """Physical memory of the host, in MB (0 if the platform cannot tell)."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+class SandboxResources(NamedTuple):
+    """Memory and cores a job reserves while it runs, or a worker's budget of them."""
+    memory_mb: int = 0
+    cpus: float = 0
+
+
+def host_budget(
+    cpu_count: Optional[int] = None,
+    memory_mb: Optional[int] = None,
+    reserved_mb: Optional[int] = None,
+) -> SandboxResources:
+    """
+    Resources sandboxes may reserve on this host: `sandbox_executor_memory_mb`
+    and `sandbox_executor_cpus` when set, else RAM minus what the OS and
+    workers keep, and every core.
+    """
+    cpus = settings.sandbox_executor_cpus or cpu_count or os.cpu_count() or 1
+    memory = settings.sandbox_executor_memory_mb
+    if not memory:
+        memory_mb = host_memory_mb() if memory_mb is None else memory_mb
+        reserved_mb = settings.sandbox_executor_reserved_mb if reserved_mb is None else reserved_mb
+        memory = max(0, memory_mb - reserved_mb)
+    return SandboxResources(memory_mb=memory, cpus=cpus)
+
+
+class _Pending:
+    """A job waiting for its reservation to fit."""
+
+    __slots__ = ("resources", "priority", "admitted", "since")
+
+    def __init__(self, resources: SandboxResources, priority: int, admitted: asyncio.Future):
+        self.resources = resources
+        self.priority = priority
+        self.admitted = admitted
+        self.since = time.monotonic()
+
+
+class SandboxExecutor:
+    """
+    Runs blocking sandbox jobs from an event loop: at most `capacity` at a
+    time and, when a `budget` is given, only as many as fit in its memory
+    and cores.
+    """
+
+    def __init__(self, capacity: int, publish: bool = True, budget: Optional[SandboxResources] = None):
+        self.capacity = capacity
+        self.budget = budget
+        self.worker_id = worker_id()
+        self._publish = publish
+        self._counters = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        self._reserved = SandboxResources()
+        self._lock = threading.Lock()
+        self._threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=capacity, thread_name_prefix="sandbox"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._pending: Deque[_Pending] = deque()
+        self._started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="sandbox-executor", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+
+    # -- public API ----------------------------------------------------------
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        resources: Optional[SandboxResources] = None,
+        priority: Optional[int] = None,
+        **kwargs,
+    ) -> concurrent.futures.Future:
+        """
+        Queue `fn(*args, **kwargs)` in lane `priority` (lower goes first, as
+        in the broker; None is lane 0), reserving `resources` while it runs;
+        the returned future resolves to its result.
+        """
+        with self._lock:
+            self._counters["queued"] += 1
+        job = functools.partial(fn, *args, **kwargs)
+        return asyncio.run_coroutine_threadsafe(
+            self._run_job(job, resources or SandboxResources(), priority or 0), self._loop
+        )
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Submit and wait: the calling thread blocks until the job finishes."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            budget = self.budget or SandboxResources()
+            return {
+                "worker": self.worker_id,
+                "capacity": self.capacity,
+                **self._counters,
+                "memory_mb": budget.memory_mb,
+                "memory_reserved_mb": self._reserved.memory_mb,
+                "cpus": budget.cpus,
+                "cpus_reserved": self._reserved.cpus,
+            }
+
+    def shutdown(self) -> None:
+        """Stop the event loop once running jobs finish."""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=30)
+        self._threads.shutdown(wait=True)
+        if self._publish:
+            try:
+                get_redis_client().delete(_STATS_PREFIX + self.worker_id)
+            except Exception:
+                pass
+
+    # -- event loop ----------------------------------------------------------
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        if self._publish:
+            self._loop.create_task(self._heartbeat())
+        self._loop.call_soon(self._started.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _run_job(self, job: Callable[[], Any], resources: SandboxResources, priority: int) -> Any:
+        pending = _Pending(resources, priority, self._loop.create_future())
+        self._pending.append(pending)
+        self._admit()
+        try:
+            await pending.admitted
+        except BaseException:
+            if pending in self._pending:
+                self._pending.remove(pending)
+                with self._lock:
+                    self._counters["queued"] -= 1
+            else:
+                self._release(resources, "failed")
+            raise
+
+        outcome = "failed"
+        try:
+            result = await self._loop.run_in_executor(self._threads, job)
+            outcome = "completed"
+            return result
+        finally:
+            self._release(resources, outcome)
+
+    def _fits(self, resources: SandboxResources) -> bool:
+        running = self._counters["running"]
+        if running >= self.capacity:
+            return False
+        if self.budget is None or running == 0:
+            return True  # a job bigger than the whole budget still runs, alone
+        return (
+            self._reserved.memory_mb + resources.memory_mb <= self.budget.memory_mb
+            and self._reserved.cpus + resources.cpus <= self.budget.cpus
+        )
+
+    def _admit(self) -> None:
+        """Start every pending job that fits, by lane then arrival (loop thread only)."""
+        backfill = time.monotonic() - settings.sandbox_executor_backfill_seconds
+        queue = sorted(self._pending, key=lambda pending: pending.priority)  # stable: arrival order within a lane
+        for pending in queue:
+            if pending.admitted.done():  # cancelled while waiting
+                continue
+            if not self._fits(pending.resources):
+                if pending.since <= backfill and pending is queue[0]:
+                    break  # the head has waited long enough: let room build up for it
+                continue
+            self._pending.remove(pending)
+            with self._lock:
+                self._counters["queued"] -= 1
+                self._counters["running"] += 1
+                self._reserved = SandboxResources(
+                    self._reserved.memory_mb + pending.resources.memory_mb,
+                    self._reserved.cpus + pending.resources.cpus,
+                )
+            pending.admitted.set_result(None)
+
+    def _release(self, resources: SandboxResources, outcome: str) -> None:
+        with self._lock:
+            self._counters["running"] -= 1
+            self._counters[outcome] += 1
+            self._reserved = SandboxResources(
+                self._reserved.memory_mb - resources.memory_mb,
+                self._reserved.cpus - resources.cpus,
+            )
+        self._admit()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            stats = self.stats()
+            stats["updated_at"] = int(time.time())
+            try:
+                await self._loop.run_in_executor(None, self._write_stats, stats)
+            except Exception as e:
+                logger.debug("sandbox executor: failed to publish stats: %s", e)
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    def _write_stats(self, stats: Dict[str, Any]) -> None:
+        redis = get_redis_client()
+        key = _STATS_PREFIX + self.worker_id
+        pipe = redis.pipeline()
+        pipe.hset(key, mapping={k: str(v) for k, v in stats.items()})
+        pipe.expire(key, _STATS_TTL_SECONDS)
+        pipe.execute()
+
+
+def live_workers() -> Set[str]:
+    """Ids of the worker processes whose heartbeat has not expired."""
+    redis = get_redis_client()
+    return {key[len(_STATS_PREFIX):] for key in redis.scan_iter(match=_STATS_PREFIX + "*")}
+
+
+def _utilization(reserved: float, budget: float) -> float:
+    return round(reserved / budget, 3) if budget else 0.0
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Capacity, queued and running counts and reserved resources summed over every live worker."""
+    redis = get_redis_client()
+    workers: List[Dict[str, Any]] = []
+    for key in redis.scan_iter(match=_STATS_PREFIX + "*"):
+        raw = redis.hgetall(key)
+        if not raw:
+            continue
+        worker = {
+            "worker": raw.get("worker", key[len(_STATS_PREFIX):]),
+            **{
+                field: int(raw.get(field, 0))
+                for field in ("capacity", "queued", "running", "completed", "failed",
+                              "memory_mb", "memory_reserved_mb")
+            },
+            **{field: float(raw.get(field, 0)) for field in ("cpus", "cpus_reserved")},
+        }
+        worker["memory_utilization"] = _utilization(worker["memory_reserved_mb"], worker["memory_mb"])
+        worker["cpu_utilization"] = _utilization(worker["cpus_reserved"], worker["cpus"])
+        workers.append(worker)
+    workers.sort(key=lambda w: w["worker"])
+    totals = {
+        field: sum(w[field] for w in workers)
+        for field in ("capacity", "queued", "running", "memory_mb", "memory_reserved_mb",
+                      "cpus", "cpus_reserved")
+    }
+    return {
+        **totals,
+        "memory_utilization": _utilization(totals["memory_reserved_mb"], totals["memory_mb"]),
+        "cpu_utilization": _utilization(totals["cpus_reserved"], totals["cpus"]),
+        "workers": workers,
+    }
+
+
+def executor_capacity(budget: Optional[SandboxResources] = None) -> int:
+    """How many sandboxes an executor with `budget` (default: this host's) runs at once."""
+    budget = budget or host_budget()
+    # Every sandbox takes at least one core, so the cores bound the job count
+    return settings.sandbox_executor_concurrency or max(1, int(budget.cpus))
+
+
+def sandbox_worker_concurrency() -> int:
+    """
+    Celery threads for the sandbox worker: the executor's capacity plus as
+    many again preparing or saving a run, so the executor always has the
+    next job at hand while the rest of the backlog stays in the broker's
+    priority lanes.
+    """
+    return 2 * executor_capacity()
+
+
+# ---------------------------------------------------------------------------
+# Module-level singleton (one per worker process)
+# ---------------------------------------------------------------------------
+
+_executor: Optional[SandboxExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_sandbox_executor() -> SandboxExecutor:
+    """Get or create this process's executor."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            budget = host_budget()
+            capacity = executor_capacity(budget)
+            _executor = SandboxExecutor(capacity, budget=budget)
+            logger.info(
+                "Sandbox executor started: up to %d jobs within %d MB and %g cores",
+                capacity, budget.memory_mb, budget.cpus,
+            )
+        return _executor
+
+
+def shutdown_sandbox_executor() -> None:
+    """Stop this process's executor (worker shutdown)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
@@ -0,0 +1,493 @@
+"""
+Warm container pool for sandbox execution.
+
+Creating and removing a container per submission costs more than most student
+code takes to run. The pool keeps a few pre-created, network-less, read-only
+containers idling on ``sleep infinity`` in each worker process. A submission
+execs its harness inside one of them; afterwards the container is reset
+(leftover processes killed, /tmp wiped) and handed to the next submission, or
+replaced once it reaches ``sandbox_pool_max_reuse`` runs or fails its health
+check.
+
+Every slot owns a host directory bind-mounted read-only at /workspace, so the
+worker writes the harness on the host side and the container never needs a
+writable root filesystem.
+
+Mounts are fixed when a container is created, before anyone knows which
+exercise it will serve, so a pooled container cannot get just one
+exercise's datasets. With ``sandbox_pool_share_datasets`` it gets the whole
+datasets tree and any submission can read every exercise's datasets;
+without it (the default) it gets none, and DockerBackend runs exercises
+that have datasets in one-shot containers instead.
+
+In zygote mode (``sandbox_zygote_enabled``) the container's PID 1 is the
+fork-server from sandbox_runtime/zygote.py instead of ``sleep``: it keeps the
+interpreter and the ``sandbox_zygote_preload`` modules imported and forks an
+unprivileged child per run, so submissions skip interpreter startup too.
+
+Output is streamed out of the container and capped: once a run writes more
+than its byte budget the reader stops, the run is killed and
+SandboxOutputLimitExceeded is raised, so a student printing in a loop cannot
+push more than the budget into worker memory.
+"""
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.services.datasets import DATASETS_DIR, DATASETS_MOUNT
+from app.services.sandbox_executor import worker_id
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_MOUNT = "/workspace"
+POOL_LABEL = "autograder.pool"
+
+# Labels on every sandbox container, so the reaper (app/services/sandbox_reaper.py)
+# can tell whose it is and how long it may live
+SANDBOX_LABEL = "autograder.sandbox"
+WORKER_LABEL = "autograder.worker"
+STARTED_LABEL = "autograder.started_at"
+SUBMISSION_LABEL = "autograder.submission_id"
+TIMEOUT_LABEL = "autograder.timeout_seconds"
+ZYGOTE_PATH = "/opt/autograder/zygote.py"
+
+# Exit status of coreutils `timeout` when the time limit is hit. Student code
+# can exit with it too, so it only counts once the limit has really passed.
+TIMEOUT_EXIT_CODE = 124
+# How long past the in-container `timeout` the worker waits before killing
+# the container itself: a run that escapes `timeout`'s process group (setsid
+# and fork) and keeps the exec stream open would otherwise hold the worker
+WATCHDOG_GRACE_SECONDS = 2
+# Line the zygote client writes to its own stderr when the supervisor killed
+# the run (sandbox_runtime/zygote.py); student output never reaches that stream
+ZYGOTE_STATUS_PREFIX = b"zygote-status: "
+
+# Kill everything the sandbox user left running and wipe the tmpfs before the
+# next submission. Runs as nobody: PID 1 is either `sleep` (ignores SIGKILL
+# from inside its namespace) or the root-owned zygote, so it survives.
+_RESET_COMMAND = [
+    "sh", "-c",
+    "kill -9 -1 2>/dev/null; rm -rf /tmp/* /tmp/.[!.]* 2>/dev/null; true",
+]
+
+
+class SandboxTimeout(Exception):
+    """Raised when a pooled execution exceeds its time limit."""
+
+
+class SandboxOutputLimitExceeded(Exception):
+    """Raised when a sandbox run writes more than its output budget."""
+
+
+def read_capped(
+    stream: Iterable[bytes],
+    max_bytes: int,
+    on_line: Optional[Callable[[bytes], None]] = None,
+) -> bytes:
+    """
+    Join the chunks of a Docker output stream, holding at most `max_bytes`.
+
+    Stops consuming as soon as the budget is crossed and raises
+    SandboxOutputLimitExceeded; the caller is responsible for killing the run.
+    If `on_line` is given it is called with every complete line as soon as it
+    arrives, so results survive a run that is later killed.
+    """
+    chunks = []
+    size = 0
+    partial = b""
+    try:
+        for chunk in stream:
+            size += len(chunk)
+            if size > max_bytes:
+                raise SandboxOutputLimitExceeded(f"Output exceeded {max_bytes} bytes")
+            chunks.append(chunk)
+            if on_line is not None:
+                *lines, partial = (partial + chunk).split(b"\n")
+                for line in lines:
+                    on_line(line)
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return b"".join(chunks)
+
+
+def sandbox_labels(extra: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Labels for a container created now by this worker process, plus `extra`."""
+    labels = {SANDBOX_LABEL: "1", WORKER_LABEL: worker_id(), STARTED_LABEL: str(int(time.time()))}
+    labels.update({key: str(value) for key, value in (extra or {}).items() if value is not None})
+    return labels
+
+
+def _stdout_of(stream: Iterable[Tuple[Optional[bytes], Optional[bytes]]], stderr: List[bytes]) -> Iterator[bytes]:
+    """Stdout chunks of a demultiplexed exec stream; stderr chunks go to `stderr`."""
+    try:
+        for out, err in stream:
+            if err:
+                stderr.append(err)
+            if out:
+                yield out
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+@dataclass
+class PooledContainer:
+    """A warm container plus the host workspace mounted into it."""
+    container: Any
+    workspace: Path
+    memory_limit_mb: int
+    cpus: int = 1
+    uses: int = 0
+    overflow: bool = False
+    killed: bool = False
+
+
+class SandboxPool:
+    """Per-process pool of warm sandbox containers."""
+
+    def __init__(
+        self,
+        docker_client,
+        size: int,
+        max_reuse: int,
+        health_check: bool = True,
+        image: Optional[str] = None,
+        memory_limit_mb: Optional[int] = None,
+        zygote: bool = False,
+        preload: str = "",
+        share_datasets: bool = False,
+    ):
+        self.client = docker_client
+        self.size = size
+        self.max_reuse = max_reuse
+        self.health_check = health_check
+        self.image = image or settings.docker_image_sandbox
+        self.default_memory_limit_mb = memory_limit_mb or settings.sandbox_memory_limit_mb
+        self.zygote = zygote
+        self.preload = preload
+        self.share_datasets = share_datasets
+
+        self._idle: List[PooledContainer] = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counters = {"created": 0, "reused": 0, "replaced": 0, "overflow": 0}
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def warm(self) -> None:
+        """Create containers until the pool holds `size` idle or busy slots."""
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + self._busy >= self.size:
+                    return
+            slot = self._create(self.default_memory_limit_mb)
+            with self._lock:
+                self._idle.append(slot)
+
+    def shutdown(self) -> None:
+        """Remove every idle container. Busy ones are removed on release."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for slot in idle:
+            self._destroy(slot)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "busy": self._busy,
+                **self._counters,
+            }
+
+    # -- hot path ------------------------------------------------------------
+
+    def acquire(self, memory_limit_mb: int, cpus: int = 1) -> PooledContainer:
+        """
+        Hand out a warm container sized for `memory_limit_mb` and `cpus` cores.
+
+        Falls back to creating an overflow container (discarded on release)
+        when every slot is busy.
+        """
+        with self._lock:
+            slot = self._idle.pop() if self._idle else None
+            overflow = slot is None and self._busy >= self.size
+            self._busy += 1
+
+        try:
+            if slot is None:
+                slot = self._create(memory_limit_mb, cpus)
+                slot.overflow = overflow
+                if overflow:
+                    self._count("overflow")
+            else:
+                if slot.memory_limit_mb != memory_limit_mb:
+                    limit = f"{memory_limit_mb}m"
+                    slot.container.update(mem_limit=limit, memswap_limit=limit)
+                    slot.memory_limit_mb = memory_limit_mb
+                if slot.cpus != cpus:
+                    slot.container.update(cpu_quota=100000 * cpus)
+                    slot.cpus = cpus
+        except Exception:
+            with self._lock:
+                self._busy -= 1
+            if slot is not None:
+                self._destroy(slot)
+            raise
+
+        return slot
+
+    def execute(
+        self,
+        slot: PooledContainer,
+        script: str,
+        timeout_seconds: int,
+        max_output_bytes: int,
+        on_line: Optional[Callable[[bytes], None]] = None,
+    ) -> tuple[int, bytes]:
+        """
+        Run the Python `script` inside the slot's container under a wall-clock limit.
+
+        Output is streamed and capped at `max_output_bytes`; complete lines are
+        passed to `on_line` as they arrive. A run still going
+        WATCHDOG_GRACE_SECONDS after the in-container `timeout` should have
+        ended it has its container killed. Returns (exit_code, combined
+        stdout/stderr). Raises SandboxTimeout or SandboxOutputLimitExceeded.
+        """
+        slot.uses += 1
+        if self.zygote:
+            # The zygote enforces both limits itself; the outer `timeout` only
+            # covers a wedged supervisor.
+            outer_timeout = timeout_seconds + 5
+            command = [
+                "timeout", "-k", "1", str(outer_timeout),
+                "python", "-S", ZYGOTE_PATH, "run",
+                "--timeout", str(timeout_seconds),
+                "--max-output", str(max_output_bytes),
+                script,
+            ]
+            options = {"user": "0"}
+        else:
+            outer_timeout = timeout_seconds
+            command = ["timeout", "-k", "1", str(outer_timeout), "python", script]
+            options = {"workdir": "/tmp"}
+
+        api = self.client.api
+        exec_id = api.exec_create(slot.container.id, command, **options)["Id"]
+        started = time.monotonic()
+
+        # Kill the container if the exec outlives `timeout`; that ends the stream
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self._kill(slot)
+
+        watchdog = threading.Timer(outer_timeout + WATCHDOG_GRACE_SECONDS, on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+        client_stderr: List[bytes] = []
+        try:
+            stream = api.exec_start(exec_id, stream=True, demux=self.zygote)
+            if self.zygote:
+                stream = _stdout_of(stream, client_stderr)
+            try:
+                output = read_capped(stream, max_output_bytes, on_line)
+            except SandboxOutputLimitExceeded:
+                # Still printing: take the whole container down rather than
+                # letting it fill the pipe; it is replaced on release.
+                self._kill(slot)
+                raise
+        finally:
+            watchdog.cancel()
+        if timed_out.is_set():
+            raise SandboxTimeout(f"Execution exceeded {timeout_seconds}s")
+
+        exit_code = api.exec_inspect(exec_id)["ExitCode"]
+        status = None
+        for line in b"".join(client_stderr).splitlines(keepends=True):
+            if line.startswith(ZYGOTE_STATUS_PREFIX):
+                status = line[len(ZYGOTE_STATUS_PREFIX):].strip().decode()
+            else:
+                output += line
+        ran_out_of_time = exit_code == TIMEOUT_EXIT_CODE and time.monotonic() - started >= timeout_seconds
+        if status == "timeout" or ran_out_of_time:
+            raise SandboxTimeout(f"Execution exceeded {timeout_seconds}s")
+        if status == "output_limit":
+            raise SandboxOutputLimitExceeded(f"Output exceeded {max_output_bytes} bytes")
+        return exit_code, output
+
+    def release(self, slot: PooledContainer, healthy: bool = True) -> None:
+        """Reset the container and return it to the pool, or replace it."""
+        for entry in slot.workspace.iterdir():
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+        if healthy and not slot.killed:
+            healthy = self._reset(slot)
+        else:
+            healthy = False
+
+        with self._lock:
+            self._busy -= 1
+            keep = (
+                healthy
+                and not slot.overflow
+                and not self._closed
+                and slot.uses < self.max_reuse
+                and len(self._idle) + self._busy < self.size
+            )
+            if keep:
+                self._idle.append(slot)
+                self._counters["reused"] += 1
+
+        if keep:
+            return
+
+        self._destroy(slot)
+        if not slot.overflow:
+            self._count("replaced")
+            # Refill off the hot path so the caller can go on writing results
+            threading.Thread(target=self._replenish, daemon=True).start()
+
+    # -- internals -----------------------------------------------------------
+
+    def _reset(self, slot: PooledContainer) -> bool:
+        try:
+            slot.container.exec_run(_RESET_COMMAND, user="nobody")
+            if not self.health_check:
+                return True
+            slot.container.reload()
+            return slot.container.status == "running"
+        except Exception as e:
+            logger.warning("Sandbox pool: health check failed for %s: %s", slot.container.id, e)
+            return False
+
+    def _kill(self, slot: PooledContainer) -> None:
+        """Kill the slot's container; it is replaced on release."""
+        slot.killed = True
+        try:
+            slot.container.kill()
+        except Exception as e:
+            logger.warning("Sandbox pool: failed to kill %s: %s", slot.container.id, e)
+
+    def _replenish(self) -> None:
+        try:
+            self.warm()
+        except Exception as e:
+            logger.error("Sandbox pool: failed to replenish: %s", e)
+
+    def _create(self, memory_limit_mb: int, cpus: int = 1) -> PooledContainer:
+        workspace = Path(tempfile.mkdtemp(prefix="autograder-pool-"))
+        workspace.chmod(0o755)
+        limit = f"{memory_limit_mb}m"
+        volumes = {str(workspace): {"bind": WORKSPACE_MOUNT, "mode": "ro"}}
+        if self.share_datasets:
+            # Every exercise's datasets; the harness links the run's directory to /data
+            volumes[str(DATASETS_DIR)] = {"bind": DATASETS_MOUNT, "mode": "ro"}
+        try:
+            container = self.client.containers.run(
+                self.image,
+                detach=True,
+                network_mode="none",
+                mem_limit=limit,
+                memswap_limit=limit,
+                cpu_period=100000,
+                cpu_quota=100000 * cpus,
+                read_only=True,
+                security_opt=["no-new-privileges"],
+                pids_limit=256,
+                volumes=volumes,
+                labels=sandbox_labels({POOL_LABEL: 1}),
+                **self._runtime_options(),
+            )
+        except Exception:
+            shutil.rmtree(workspace, ignore_errors=True)
+            raise
+        self._count("created")
+        return PooledContainer(
+            container=container, workspace=workspace, memory_limit_mb=memory_limit_mb, cpus=cpus
+        )
+
+    def _runtime_options(self) -> Dict[str, Any]:
+        if not self.zygote:
+            return {
+                "command": ["sleep", "infinity"],
+                "user": "nobody",
+                "cap_drop": ["ALL"],
+                "tmpfs": {"/tmp": "size=50m,mode=1777"},
+            }
+        # The supervisor runs as root only to fork children that drop to
+        # nobody; it keeps just the capabilities needed for that.
+        return {
+            "command": ["python", ZYGOTE_PATH, "serve"],
+            "user": "0",
+            "cap_drop": ["ALL"],
+            "cap_add": ["SETUID", "SETGID", "KILL"],
+            "tmpfs": {
+                "/tmp": "size=50m,mode=1777",
+                "/run/zygote": "size=1m,mode=0700",
+            },
+            "environment": {
+                "ZYGOTE_PRELOAD": self.preload,
+                # Forking after numpy import is only safe with single-threaded BLAS
+                "OPENBLAS_NUM_THREADS": "1",
+                "OMP_NUM_THREADS": "1",
+                "MKL_NUM_THREADS": "1",
+            },
+        }
+
+    def _destroy(self, slot: PooledContainer) -> None:
+        try:
+            slot.container.remove(force=True)
+        except Exception as e:
+            logger.warning("Sandbox pool: failed to remove container: %s", e)
+        shutil.rmtree(slot.workspace, ignore_errors=True)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counters[key] += 1
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool(docker_client) -> SandboxPool:
+    """Get or create this process's pool, warming it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                docker_client,
+                size=settings.sandbox_pool_size,
+                max_reuse=settings.sandbox_pool_max_reuse,
+                health_check=settings.sandbox_pool_health_check,
+                zygote=settings.sandbox_zygote_enabled,
+                preload=settings.sandbox_zygote_preload,
+                share_datasets=settings.sandbox_pool_share_datasets,
+            )
+            _pool.warm()
+        return _pool
+
+
+def shutdown_sandbox_pool() -> None:
+    """Remove this process's warm containers (worker shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
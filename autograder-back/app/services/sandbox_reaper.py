@@ -0,0 +1,140 @@
+"""
+Reaper for sandbox containers their worker left behind.
+
+A one-shot container is removed in the ``finally`` of the run that created
+it, and a pooled one when its worker shuts down. A worker killed at the
+Celery time limit, OOM-killed or restarted mid-run does neither, and the
+container keeps its memory reservation and pids until someone notices.
+
+Every sandbox container carries labels (see ``sandbox_labels`` in
+app/services/sandbox_pool.py): the worker process that created it, when, and
+for one-shot runs the submission and the exercise timeout. The reaper runs
+in each sandbox worker every ``sandbox_reaper_interval_seconds`` against
+that host's Docker daemon and removes:
+
+- one-shot containers older than their timeout plus
+  ``sandbox_reaper_grace_seconds``
+- any container whose worker's executor heartbeat has expired, once it is
+  older than the grace period (so a worker that is just starting is not
+  mistaken for a dead one)
+
+Containers of the reaping process itself are left alone. When Redis cannot
+be reached, worker liveness is unknown and only the age rule applies.
+
+Each host's last run and running totals are kept in Redis for
+``GET /admin/sandbox/reaper``.
+"""
+import logging
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+from app.redis_client import get_redis_client
+from app.services.sandbox_executor import live_workers, worker_id
+from app.services.sandbox_pool import (
+    POOL_LABEL,
+    SANDBOX_LABEL,
+    STARTED_LABEL,
+    SUBMISSION_LABEL,
+    TIMEOUT_LABEL,
+    WORKER_LABEL,
+)
+
+logger = logging.getLogger(__name__)
+
+_STATS_PREFIX = "sandbox_reaper:"
+
+_COUNTERS = ("scanned", "leaked", "reaped", "failed")
+
+
+def is_orphaned(labels: Dict[str, str], now: int, workers: Optional[Set[str]]) -> bool:
+    """
+    Whether a sandbox container with these labels outlived its run.
+    `workers` is the set of live worker ids, or None if unknown.
+    """
+    owner = labels.get(WORKER_LABEL)
+    if owner == worker_id():
+        return False
+    age = now - int(labels.get(STARTED_LABEL) or 0)
+    grace = settings.sandbox_reaper_grace_seconds
+    if age <= grace:
+        return False
+    if workers is not None and owner not in workers:
+        return True
+    if POOL_LABEL in labels:
+        return False  # idles between runs for as long as its worker lives
+    timeout = int(labels.get(TIMEOUT_LABEL) or settings.sandbox_timeout_seconds)
+    return age > timeout + grace
+
+
+def reap_containers(docker_client, now: Optional[int] = None) -> Dict[str, Any]:
+    """Remove this host's orphaned sandbox containers; returns the counts."""
+    now = int(time.time()) if now is None else now
+    try:
+        workers: Optional[Set[str]] = live_workers()
+    except Exception as e:
+        logger.warning("Sandbox reaper: worker heartbeats unavailable (%s); reaping by age only", e)
+        workers = None
+
+    counts = dict.fromkeys(_COUNTERS, 0)
+    reaped: List[Dict[str, Any]] = []
+    for container in docker_client.containers.list(all=True, filters={"label": SANDBOX_LABEL}):
+        counts["scanned"] += 1
+        labels = container.labels or {}
+        if not is_orphaned(labels, now, workers):
+            continue
+        counts["leaked"] += 1
+        try:
+            container.remove(force=True)
+        except Exception as e:
+            counts["failed"] += 1
+            logger.warning("Sandbox reaper: failed to remove %s: %s", container.short_id, e)
+            continue
+        counts["reaped"] += 1
+        reaped.append({
+            "container": container.short_id,
+            "worker": labels.get(WORKER_LABEL),
+            "submission_id": labels.get(SUBMISSION_LABEL),
+            "age_seconds": now - int(labels.get(STARTED_LABEL) or 0),
+        })
+
+    if reaped:
+        logger.warning("Sandbox reaper: removed %d orphaned container(s): %s", len(reaped), reaped)
+    _record(counts, now)
+    return {**counts, "containers": reaped}
+
+
+def _record(counts: Dict[str, int], now: int) -> None:
+    """Publish this host's last run and add it to the running totals."""
+    key = _STATS_PREFIX + socket.gethostname()
+    try:
+        pipe = get_redis_client().pipeline()
+        pipe.hset(key, mapping={
+            "host": socket.gethostname(),
+            "last_run_at": now,
+            **{f"last_{field}": value for field, value in counts.items()},
+        })
+        for field in ("leaked", "reaped", "failed"):
+            pipe.hincrby(key, f"total_{field}", counts[field])
+        pipe.execute()
+    except Exception as e:
+        logger.debug("Sandbox reaper: failed to publish stats: %s", e)
+
+
+def get_reaper_stats() -> List[Dict[str, Any]]:
+    """Last run and totals of every host's reaper."""
+    redis = get_redis_client()
+    hosts = []
+    for key in redis.scan_iter(match=_STATS_PREFIX + "*"):
+        raw = redis.hgetall(key)
+        if not raw:
+            continue
+        host = {"host": raw.get("host", key[len(_STATS_PREFIX):])}
+        host["last_run_at"] = int(raw["last_run_at"]) if raw.get("last_run_at") else None
+        for field in _COUNTERS:
+            host[f"last_{field}"] = int(raw.get(f"last_{field}", 0))
+        for field in ("leaked", "reaped", "failed"):
+            host[f"total_{field}"] = int(raw.get(f"total_{field}", 0))
+        hosts.append(host)
+    return sorted(hosts, key=lambda h: h["host"])
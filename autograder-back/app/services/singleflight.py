@@ -0,0 +1,109 @@
+"""
+In-flight coalescing of identical grading work (singleflight).
+
+When a class shares a solution or a student double-clicks submit, several
+tasks for the same (exercise, content_hash) arrive together. The content
+caches (test_result_cache, LLMEvaluation) only help once one of them has
+finished, so without coordination every copy starts its own container or
+LLM call.
+
+Tasks therefore try to take a Redis lease on the key before doing the
+work. The first one to get it is the leader. The others do not wait on a
+worker slot: they are retried by Celery every ``singleflight_retry_seconds``
+until the lease is free. By then the leader's outcome is in the cache, so
+they copy it instead of redoing the work. A lease expires on its own after
+``singleflight_lease_seconds``, so a crashed leader only delays its
+followers.
+
+The lease is owned by the Celery task id. A redelivered message carries the
+same id. The short-lived "done" marker left on release says the first
+delivery already finished, so the redelivery is a duplicate and must not
+run again. Finding its own id on the lease without that marker means the
+first delivery's worker died mid-run: the redelivery takes the lease over
+and does the work.
+
+Redis being down never blocks grading: the task just runs uncoalesced.
+"""
+import logging
+import uuid
+from typing import Optional
+
+import redis
+
+from app.config import settings
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_LEASE_PREFIX = "singleflight:"
+_DONE_PREFIX = "singleflight:done:"
+
+# Outlives the Redis broker's default visibility timeout (1h), after which
+# an unacknowledged message is redelivered
+DONE_TTL_SECONDS = 2 * 60 * 60
+
+# Outcomes of InFlightLease.try_acquire
+LEADER = "leader"        # holds the lease: do the work
+BUSY = "busy"            # another task holds it: try again later
+DUPLICATE = "duplicate"  # this task id already finished the work
+
+# Delete the lease only if this owner still holds it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class InFlightLease:
+    """Lease on one unit of grading work, e.g. ("execute", "<exercise>:<hash>")."""
+
+    def __init__(self, kind: str, key: str, owner: Optional[str] = None, ttl_seconds: Optional[int] = None):
+        self.name = f"{_LEASE_PREFIX}{kind}:{key}"
+        # Direct calls (tests, scripts) have no task id and are never duplicates
+        self.owner = owner or f"local-{uuid.uuid4().hex}"
+        self.ttl_seconds = ttl_seconds or settings.singleflight_lease_seconds
+        self.held = False
+
+    def try_acquire(self) -> str:
+        """
+        Take the lease if it is free, without waiting.
+
+        Returns LEADER (also when the lease was left under this task id by a
+        delivery that died), BUSY or DUPLICATE.
+        """
+        try:
+            client = get_redis_client()
+            if client.exists(_DONE_PREFIX + self.owner):
+                return DUPLICATE
+            if client.set(self.name, self.owner, nx=True, ex=self.ttl_seconds):
+                self.held = True
+                return LEADER
+            if client.get(self.name) == self.owner:
+                logger.warning("singleflight: taking over %s from a dead delivery of %s", self.name, self.owner)
+                client.expire(self.name, self.ttl_seconds)
+                self.held = True
+                return LEADER
+            return BUSY
+        except redis.RedisError as e:
+            logger.warning("singleflight: Redis unavailable, running %s uncoalesced: %s", self.name, e)
+            return LEADER
+
+    def release(self, done: bool = True) -> None:
+        """
+        Let the next waiting task in.
+
+        `done=False` is for a task about to retry: the retry reuses the task
+        id and must not be mistaken for a redelivery.
+        """
+        if not self.held:
+            return
+        self.held = False
+        try:
+            client = get_redis_client()
+            client.eval(_RELEASE_SCRIPT, 1, self.name, self.owner)
+            if done:
+                client.set(_DONE_PREFIX + self.owner, "1", ex=DONE_TTL_SECONDS)
+        except redis.RedisError as e:
+            logger.warning("singleflight: failed to release %s: %s", self.name, e)
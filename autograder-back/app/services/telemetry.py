@@ -0,0 +1,78 @@
+"""
+Per-exercise sandbox resource telemetry.
+
+Every executed submission stores its wall time, CPU time, peak RSS and exit
+reason, and every TestResult its duration (see execute_submission). This
+module turns the most recent runs of an exercise into percentiles, so limits
+such as ``timeout_seconds`` and ``memory_limit_mb`` can be sized from what
+submissions actually use and expensive exercises stand out.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.models.submission import ExitReason, Submission, TestResult
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile of an already sorted sequence."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(values: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    """count, p50/p90/p95/p99 and max of the non-null values."""
+    present = sorted(v for v in values if v is not None)
+    summary: Dict[str, Optional[float]] = {"count": len(present)}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(present, q)
+    summary["max"] = present[-1] if present else None
+    return summary
+
+
+def exercise_telemetry(db: Session, exercise_id: int, limit: int = 500) -> Dict:
+    """Percentiles over the exercise's `limit` most recent executed submissions."""
+    runs = (
+        db.query(
+            Submission.id,
+            Submission.wall_time_ms,
+            Submission.cpu_time_ms,
+            Submission.peak_memory_kb,
+            Submission.exit_reason,
+        )
+        .filter(Submission.exercise_id == exercise_id, Submission.exit_reason.isnot(None))
+        .order_by(Submission.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+    # Cached submissions carry copies of another run's durations; skip them
+    executed_ids = [run.id for run in runs if run.exit_reason != ExitReason.CACHED.value]
+    durations = defaultdict(list)
+    if executed_ids:
+        rows = (
+            db.query(TestResult.test_name, TestResult.duration_ms)
+            .filter(TestResult.submission_id.in_(executed_ids), TestResult.duration_ms.isnot(None))
+            .all()
+        )
+        for row in rows:
+            durations[row.test_name].append(row.duration_ms)
+
+    return {
+        "submissions": len(runs),
+        "exit_reasons": dict(Counter(run.exit_reason for run in runs)),
+        "wall_time_ms": summarize([run.wall_time_ms for run in runs]),
+        "cpu_time_ms": summarize([run.cpu_time_ms for run in runs]),
+        "peak_memory_kb": summarize([run.peak_memory_kb for run in runs]),
+        "tests": [
+            {"test_name": name, **summarize(values)}
+            for name, values in sorted(durations.items())
+        ],
+    }
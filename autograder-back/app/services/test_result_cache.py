@@ -0,0 +1,89 @@
+"""
+Content-addressed cache of sandbox test results.
+
+A run is fully determined by the submitted code (``Submission.content_hash``)
+and the exercise's test suite (its TestCase rows, limits and dataset
+files). The suite is summarised as a version hash stored on every executed
+submission, so an identical (content_hash, suite version) pair can reuse a
+previous run's TestResult rows and test score without touching Docker.
+Editing a test case, a limit or re-uploading a dataset changes the version,
+so stale entries stop matching on their own.
+
+Hit/miss counters live in Redis, overall and per exercise.
+"""
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.exercise import Exercise, TestCase
+from app.models.submission import Submission, SubmissionStatus
+from app.services.datasets import dataset_fingerprint
+from app.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_STATS_KEY = "test_result_cache:stats"
+
+
+def compute_suite_version(exercise: Exercise, test_cases: List[TestCase]) -> str:
+    """SHA256 over everything that can change the outcome of a sandbox run."""
+    payload = {
+        "timeout_seconds": exercise.timeout_seconds,
+        "memory_limit_mb": exercise.memory_limit_mb,
+        "max_output_kb": exercise.max_output_kb,
+        "test_timeout_seconds": exercise.test_timeout_seconds,
+        "cpu_limit": exercise.cpu_limit,
+        "datasets": dataset_fingerprint(exercise.id),
+        "tests": [
+            [tc.name, tc.input_data, tc.expected_output]
+            for tc in test_cases
+        ],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def find_cached_run(
+    db: Session, content_hash: str, suite_version: str, exclude_submission_id: Optional[int] = None
+) -> Optional[Submission]:
+    """Latest completed submission with the same code and test suite, if any."""
+    query = db.query(Submission).filter(
+        Submission.content_hash == content_hash,
+        Submission.test_suite_version == suite_version,
+        Submission.status == SubmissionStatus.COMPLETED,
+        Submission.error_message.is_(None),  # runs cut short by a timeout are not reusable
+    )
+    if exclude_submission_id is not None:
+        query = query.filter(Submission.id != exclude_submission_id)
+    return query.order_by(Submission.id.desc()).first()
+
+
+def record_lookup(exercise_id: int, hit: bool) -> None:
+    """Count a cache lookup. Never fails the caller if Redis is unavailable."""
+    outcome = "hits" if hit else "misses"
+    try:
+        redis = get_redis_client()
+        pipe = redis.pipeline()
+        pipe.hincrby(_STATS_KEY, outcome, 1)
+        pipe.hincrby(_STATS_KEY, f"{outcome}:{exercise_id}", 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("test_result_cache: failed to record %s: %s", outcome, e)
+
+
+def get_cache_stats(exercise_id: Optional[int] = None) -> Dict[str, float]:
+    """Return hits, misses and hit_ratio, overall or for one exercise."""
+    suffix = f":{exercise_id}" if exercise_id is not None else ""
+    redis = get_redis_client()
+    hits, misses = redis.hmget(_STATS_KEY, f"hits{suffix}", f"misses{suffix}")
+    hits = int(hits or 0)
+    misses = int(misses or 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": (hits / total) if total else 0.0,
+    }
@@ -2,24 +2,64 @@
 Celery tasks for async processing
 
 Tasks:
-- execute_submission: Run student code in Docker sandbox
+- execute_submission: Run student code in the sandbox (Docker or jailed subprocess)
 - process_hotmart_event: Parse webhook and trigger lifecycle transition
 - execute_side_effect: Re-execute a failed side-effect with retry
 - grade_submission: Calculate test scores and trigger LLM grading
 - llm_evaluate: Call LLM API for qualitative feedback
 """
+import functools
 import json
+import logging
 import os
-import tempfile
+import secrets
+import threading
+import time
 import docker
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
+from celery.exceptions import Retry
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 from sqlalchemy.orm import Session
 
-from app.celery_app import celery_app
+from app.celery_app import SANDBOX_QUEUE, celery_app
+from app.config import settings
 from app.database import SessionLocal
-from app.models.submission import Submission, SubmissionStatus, TestResult, Grade
+from app.models.submission import Submission, SubmissionStatus, TestResult, Grade, ExitReason, LLMEvaluation
 from app.models.exercise import Exercise, TestCase
+from app.services.sandbox_backends import DockerBackend, SandboxBackend, SubprocessBackend
+from app.services.sandbox_executor import SandboxResources, get_sandbox_executor, shutdown_sandbox_executor
+from app.services.sandbox_reaper import reap_containers
+from app.services.admission import record_run_seconds
+from app.services.priority import BULK
+from app.services.singleflight import BUSY, DUPLICATE, InFlightLease
+from app.services.test_result_cache import compute_suite_version, find_cached_run, record_lookup
+from app.services.llm_eval_cache import (
+    CachedEvaluation,
+    code_criteria,
+    compute_cache_key,
+    find_cached_evaluation,
+    rubric_criteria,
+    store_evaluation,
+)
+from app.services.grading import calculate_composite_score, calculate_test_score
+from app.services.rubric_stats import record_outcome
+from app.services.llm_rate_limit import LLMRateLimitExceeded, estimate_tokens, rate_limited, retry_delay
+from app.services.regrade import (
+    chunked,
+    finish_job,
+    group_by_content,
+    record_chunk,
+    select_submissions,
+    update_job,
+)
+from app.services.sandbox_pool import (
+    SandboxOutputLimitExceeded,
+    SandboxTimeout,
+    get_sandbox_pool,
+    shutdown_sandbox_pool,
+)
 
 
 MAX_OUTPUT_SIZE = 100 * 1024  # 100KB
@@ -41,6 +81,15 @@ def get_docker_client():
         return docker.DockerClient(base_url=docker_socket)
 
 
+def get_sandbox_backend() -> SandboxBackend:
+    """The sandbox backend selected by `settings.sandbox_backend`."""
+    if settings.sandbox_backend == "subprocess":
+        return SubprocessBackend()
+    docker_client = get_docker_client()
+    pool = get_sandbox_pool(docker_client) if settings.sandbox_pool_size > 0 else None
+    return DockerBackend(docker_client, pool)
+
+
 def truncate_output(text: str, max_size: int = MAX_OUTPUT_SIZE) -> str:
     """Truncate output if it exceeds max size"""
     if len(text) <= max_size:
@@ -49,91 +98,374 @@ def truncate_output(text: str, max_size: int = MAX_OUTPUT_SIZE) -> str:
     return text[:max_size - len(suffix)] + suffix
 
 
-def create_test_harness(test_cases: List[TestCase], student_code: str) -> str:
+# Static harness shipped in the sandbox image (sandbox_runtime/), fed through
+# files in the workspace directory
+
+
+def write_harness_inputs(
+    workspace: Path,
+    test_cases: List[TestCase],
+    student_code: str,
+    test_timeout_seconds: Optional[int] = None,
+    workers: int = 1,
+    test_memory_limit_mb: Optional[int] = None,
+    data_dir: Optional[str] = None,
+    nonce: Optional[str] = None,
+) -> None:
     """
-    Create a Python test harness that imports student code and runs test cases.
-    Returns the harness code as a string.
+    Write the student code, test cases and run options for the sandbox harness.
+
+    Passing a per-test timeout or more than one worker switches the harness to
+    isolated mode: each test runs in its own forked child with its own time
+    and memory limits, up to `workers` at a time. `data_dir` is the container
+    path of the exercise's datasets, exposed to student code as /data.
+    `nonce` tags the harness's output lines (see HarnessResults).
     """
-    harness = """
-import sys
-import json
-import traceback
-from io import StringIO
-
-# Student code is available in 'student_code' module
-student_code = '''
-{student_code}
-'''
-
-# Execute student code in a namespace
-student_namespace = {{}}
-try:
-    exec(student_code, student_namespace)
-except Exception as e:
-    print(json.dumps({{
-        'error': 'Failed to load student code',
-        'message': str(e),
-        'traceback': traceback.format_exc()
-    }}))
-    sys.exit(1)
-
-# Test cases
-test_cases = {test_cases_json}
-
-results = []
-
-for test_case in test_cases:
-    test_name = test_case['name']
-    test_input = test_case['input']
-    expected_output = test_case['expected']
+    (workspace / "submission.py").write_text(student_code, encoding="utf-8")
+
+    with (workspace / "tests.jsonl").open("w", encoding="utf-8") as f:
+        for tc in test_cases:
+            f.write(json.dumps({
+                'name': tc.name,
+                'input': tc.input_data,
+                'expected': tc.expected_output
+            }) + "\n")
+
+    (workspace / "config.json").write_text(json.dumps({
+        "workers": max(1, workers),
+        "test_timeout": test_timeout_seconds or None,
+        "test_memory_bytes": test_memory_limit_mb * 1024 * 1024 if test_memory_limit_mb else None,
+        "data_dir": data_dir,
+        "nonce": nonce,
+    }))
 
-    try:
-        # Capture stdout
-        old_stdout = sys.stdout
-        sys.stdout = captured_output = StringIO()
 
-        # Execute test input in student namespace
+class HarnessResults:
+    """
+    Collects the harness's JSON-lines output while the sandbox is still running.
+
+    `feed` is handed to the executor as its line callback. The harness tags
+    its lines with `nonce`, written to the run's config.json; anything else
+    on the stream (student prints, results forged by the submission) is
+    ignored here, as are tagged lines that are not test results (a load
+    error). The raw log is still available to the caller. The harness's closing telemetry line and
+    the wall time measured by `timed` are kept for the submission's resource
+    telemetry.
+    """
+
+    def __init__(self, test_cases: List[TestCase]):
+        self.test_cases = test_cases
+        self.nonce = secrets.token_hex(16)
+        self.received: Dict[int, Dict[str, Any]] = {}
+        self.telemetry: Dict[str, int] = {}
+        self.wall_time_ms: Optional[int] = None
+
+    def timed(self, run: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call `run(*args, **kwargs)`, recording how long the sandbox took even if it raises."""
+        started = time.monotonic()
         try:
-            result = eval(test_input, student_namespace)
+            return run(*args, **kwargs)
         finally:
-            sys.stdout = old_stdout
+            self.wall_time_ms = int((time.monotonic() - started) * 1000)
 
-        stdout = captured_output.getvalue()
+    def feed(self, line: bytes) -> None:
+        try:
+            result = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(result, dict) or result.pop("nonce", None) != self.nonce:
+            return
+        if isinstance(result.get("telemetry"), dict):
+            self.telemetry = result["telemetry"]
+            return
+        if "passed" not in result:
+            return
+        index = result.get("index")
+        if isinstance(index, int) and 0 <= index < len(self.test_cases):
+            # A test reports once; a second line for it cannot replace the first
+            self.received.setdefault(index, result)
+
+    @property
+    def unfinished(self) -> int:
+        return len(self.test_cases) - len(self.received)
+
+    def complete(self, missing_message: str) -> List[Dict[str, Any]]:
+        """
+        Results in test-case order, failing every test that never reported.
+
+        After a timeout or output-limit kill this is the partial credit, so
+        it only holds lines that carried the run's nonce.
+        """
+        return [
+            self.received.get(index) or {
+                "name": tc.name,
+                "passed": False,
+                "message": missing_message,
+                "stdout": "",
+                "stderr": "",
+            }
+            for index, tc in enumerate(self.test_cases)
+        ]
 
-        # Compare result
-        passed = str(result).strip() == str(expected_output).strip()
 
-        results.append({{
-            'name': test_name,
-            'passed': passed,
-            'message': f'Expected: {{expected_output}}, Got: {{result}}' if not passed else 'Test passed',
-            'stdout': stdout,
-            'stderr': ''
-        }})
-    except Exception as e:
-        results.append({{
-            'name': test_name,
-            'passed': False,
-            'message': str(e),
-            'stdout': '',
-            'stderr': traceback.format_exc()
-        }})
-
-# Print results as JSON
-print(json.dumps(results))
-""".format(
-        student_code=student_code.replace("'''", "\\'\\'\\'"),
-        test_cases_json=json.dumps([
-            {
-                'name': tc.name,
-                'input': tc.input_data,
-                'expected': tc.expected_output
-            }
-            for tc in test_cases
-        ])
+def _record_telemetry(submission: Submission, harness_results: HarnessResults, exit_reason: ExitReason) -> None:
+    """Store how long the run took, what it cost and how it ended on the submission."""
+    submission.wall_time_ms = harness_results.wall_time_ms
+    submission.cpu_time_ms = harness_results.telemetry.get("cpu_time_ms")
+    submission.peak_memory_kb = harness_results.telemetry.get("peak_memory_kb")
+    submission.exit_reason = exit_reason.value
+    if harness_results.wall_time_ms is not None:
+        record_run_seconds(harness_results.wall_time_ms / 1000)
+
+
+def _results_from_rows(test_results: List[TestResult]) -> List[Dict[str, Any]]:
+    """Stored TestResult rows back in the harness's result format."""
+    return [
+        {
+            "name": tr.test_name,
+            "passed": tr.passed,
+            "message": tr.message or "",
+            "stdout": tr.stdout or "",
+            "stderr": tr.stderr or "",
+            "duration_ms": tr.duration_ms,
+        }
+        for tr in test_results
+    ]
+
+
+def _add_test_results(db: Session, submission: Submission, test_results_data: List[Dict[str, Any]]) -> None:
+    for result_data in test_results_data:
+        test_result = TestResult(
+            submission_id=submission.id,
+            test_name=result_data['name'],
+            passed=result_data['passed'],
+            message=truncate_output(result_data.get('message', '')),
+            stdout=truncate_output(result_data.get('stdout', '')),
+            stderr=truncate_output(result_data.get('stderr', '')),
+            duration_ms=result_data.get('duration_ms'),
+        )
+        db.add(test_result)
+
+
+def _save_test_results(
+    db: Session,
+    submission: Submission,
+    exercise: Exercise,
+    test_results_data: List[Dict[str, Any]],
+    late_penalty: float,
+    priority: Optional[int] = None,
+    llm_dispatched: bool = False,
+) -> Dict[str, Any]:
+    """
+    Persist TestResult rows and the Grade and complete the submission.
+
+    With LLM grading enabled, an evaluation that finished first is combined
+    into the Grade here; otherwise LLM grading is chained in the same
+    priority lane, unless it was already dispatched with the submission.
+    """
+    _add_test_results(db, submission, test_results_data)
+
+    # Calculate test score
+    total_tests = len(test_results_data)
+    passed_tests = sum(1 for r in test_results_data if r['passed'])
+    test_score = (passed_tests / total_tests * 100) if total_tests > 0 else 0
+
+    # Create grade record
+    grade = Grade(
+        submission_id=submission.id,
+        test_score=test_score,
+        final_score=test_score,  # Will be updated if LLM grading is enabled
+        late_penalty_applied=late_penalty,
+        published=exercise.auto_publish_grades if hasattr(exercise, 'auto_publish_grades') else False
     )
+    db.add(grade)
+
+    llm_eval = None
+    if exercise.llm_grading_enabled:
+        _lock_submission(db, submission.id)
+        llm_eval = db.query(LLMEvaluation).filter(LLMEvaluation.submission_id == submission.id).first()
+        if llm_eval is not None:
+            _apply_llm_score(grade, exercise, llm_eval.score)
+
+    # Update submission status
+    submission.status = SubmissionStatus.COMPLETED
+    db.commit()
 
-    return harness
+    # Trigger LLM grading if enabled
+    if exercise.llm_grading_enabled and llm_eval is None and not llm_dispatched:
+        llm_evaluate_submission.apply_async(args=[submission.id], priority=priority)
+
+    return {
+        "submission_id": submission.id,
+        "status": "completed",
+        "test_score": test_score,
+        "passed": passed_tests,
+        "total": total_tests
+    }
+
+
+def _lock_submission(db: Session, submission_id: int) -> None:
+    """
+    Lock the submission row until the next commit.
+
+    Test results and the LLM evaluation of a submission are saved by
+    separate tasks, in either order. Each takes this lock before looking
+    for the other's half, so the second to commit always sees the first.
+    """
+    db.query(Submission.id).filter(Submission.id == submission_id).with_for_update().first()
+
+
+def _apply_llm_score(grade: Grade, exercise: Exercise, llm_score: float) -> None:
+    """Record the LLM score and the composite final score on the Grade."""
+    grade.llm_score = llm_score
+    grade.final_score = calculate_composite_score(
+        grade.test_score, llm_score, exercise.test_weight, exercise.llm_weight,
+        grade.late_penalty_applied,
+    )
+
+
+def _coalesce(task, kind: str, key: str, coalesced: int) -> Optional[InFlightLease]:
+    """
+    Take the singleflight lease on (kind, key) for `task`.
+
+    Returns the lease, or None for a redelivery of work already done. While
+    another task holds the lease, `task` is retried later rather than
+    waiting on its worker slot (raises Retry); `coalesced` counts those
+    retries, which do not use up the task's own max_retries. Past
+    `singleflight_lease_seconds` of retries the task runs uncoalesced.
+    """
+    flight = InFlightLease(kind, key, task.request.id)
+    outcome = flight.try_acquire()
+    if outcome == DUPLICATE:
+        return None
+    if outcome == BUSY:
+        if (coalesced + 1) * settings.singleflight_retry_seconds <= settings.singleflight_lease_seconds:
+            raise task.retry(
+                kwargs={**(task.request.kwargs or {}), "coalesced": coalesced + 1},
+                countdown=settings.singleflight_retry_seconds,
+                max_retries=task.request.retries + 1,
+            )
+        logging.getLogger(__name__).warning("singleflight: %s still busy, running uncoalesced", flight.name)
+    return flight
+
+
+def _task_priority(task) -> Optional[int]:
+    """Priority lane the running task was delivered from, to pass on to the tasks it chains."""
+    return (task.request.delivery_info or {}).get("priority")
+
+
+def _submit_harness(
+    harness_results: HarnessResults,
+    exercise: Exercise,
+    code: str,
+    submission_id: Optional[int] = None,
+    priority: Optional[int] = None,
+) -> Future:
+    """
+    Queue a sandbox run of `code` against `harness_results.test_cases`, on
+    behalf of `submission_id`.
+
+    The executor starts the run in the task's priority lane once the
+    exercise's memory and CPU limits fit in what is left of the host's
+    budget, so runs already waiting in a lower lane do not hold it back.
+    The future resolves to
+    (exit_code, logs) or raises SandboxTimeout, SandboxOutputLimitExceeded
+    or a Docker error.
+    """
+    backend = get_sandbox_backend()
+    test_cases = harness_results.test_cases
+
+    # Harness inputs; parallel tests share the container's memory
+    workers = max(1, min(exercise.cpu_limit, len(test_cases)))
+    isolated = bool(exercise.test_timeout_seconds) or workers > 1
+    write_inputs = functools.partial(
+        write_harness_inputs,
+        test_cases=test_cases,
+        student_code=code,
+        test_timeout_seconds=exercise.test_timeout_seconds,
+        workers=workers,
+        test_memory_limit_mb=exercise.memory_limit_mb // workers if isolated else None,
+        data_dir=backend.sandbox_data_dir(exercise.id),
+        nonce=harness_results.nonce,
+    )
+    return get_sandbox_executor().submit(
+        harness_results.timed, backend.run_harness,
+        exercise, write_inputs, harness_results.feed,
+        resources=SandboxResources(memory_mb=exercise.memory_limit_mb, cpus=exercise.cpu_limit),
+        priority=priority,
+        submission_id=submission_id,
+    )
+
+
+# Whether this worker consumes the sandbox queue (set when the worker starts)
+_serves_sandbox = True
+
+
+@worker_init.connect
+def _detect_sandbox_worker(sender=None, **kwargs):
+    """
+    Warm containers only on workers that run sandboxes.
+
+    Thread and solo pools run tasks in the main process, where
+    worker_process_init never fires, so they are warmed here instead.
+    """
+    global _serves_sandbox
+    consume_from = sender.app.amqp.queues.consume_from
+    _serves_sandbox = not consume_from or SANDBOX_QUEUE in consume_from
+
+    pool = sender.pool_cls if isinstance(sender.pool_cls, str) else sender.pool_cls.__module__
+    if "thread" in pool or "solo" in pool:
+        _warm_sandbox_pool()
+
+    if _serves_sandbox and settings.sandbox_backend == "docker" and settings.sandbox_reaper_enabled:
+        _reaper_stop.clear()
+        threading.Thread(target=_reaper_loop, name="sandbox-reaper", daemon=True).start()
+
+
+@worker_process_init.connect
+def _warm_sandbox_pool(**kwargs):
+    """Pre-create warm sandbox containers when a worker process starts."""
+    if not _serves_sandbox or settings.sandbox_backend != "docker" or settings.sandbox_pool_size <= 0:
+        return
+    try:
+        # The executor's heartbeat tells the reaper the warm containers have a live owner
+        get_sandbox_executor()
+        get_sandbox_pool(get_docker_client())
+    except Exception as e:
+        logging.getLogger(__name__).warning("Sandbox pool warm-up failed: %s", e)
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def _drain_sandbox_pool(**kwargs):
+    """Stop the sandbox executor and remove this worker process's warm containers."""
+    _reaper_stop.set()
+    shutdown_sandbox_executor()
+    shutdown_sandbox_pool()
+
+
+# Set to stop the periodic reaper of this worker
+_reaper_stop = threading.Event()
+
+
+def _reaper_loop() -> None:
+    """
+    Reap orphaned sandbox containers of this host every
+    `sandbox_reaper_interval_seconds`. Runs inside each sandbox worker rather
+    than from beat so every host's Docker daemon gets reaped.
+    """
+    while not _reaper_stop.wait(settings.sandbox_reaper_interval_seconds):
+        try:
+            reap_containers(get_docker_client())
+        except Exception as e:
+            logging.getLogger(__name__).warning("Sandbox reaper failed: %s", e)
+
+
+@celery_app.task(name="app.tasks.reap_sandbox_containers")
+def reap_sandbox_containers():
+    """Reap orphaned sandbox containers now, on the host of whichever sandbox worker takes it."""
+    result = reap_containers(get_docker_client())
+    return {field: result[field] for field in ("scanned", "leaked", "reaped", "failed")}
 
 
 @celery_app.task(
@@ -142,15 +474,21 @@ print(json.dumps(results))
     max_retries=3,
     default_retry_delay=60
 )
-def execute_submission(self, submission_id: int, late_penalty: float = 0.0):
+def execute_submission(
+    self, submission_id: int, late_penalty: float = 0.0, llm_dispatched: bool = False, coalesced: int = 0
+):
     """
     Execute student code in sandboxed Docker container.
 
     Args:
         submission_id: ID of submission to execute
         late_penalty: Late penalty percentage to apply (0-100)
+        llm_dispatched: llm_evaluate_submission was queued with the submission
+        coalesced: Retries spent waiting for identical code to finish (see _coalesce)
     """
     db: Session = SessionLocal()
+    flight = None
+    priority = _task_priority(self)
 
     try:
         # Get submission
@@ -158,6 +496,13 @@ def execute_submission(self, submission_id: int, late_penalty: float = 0.0):
         if not submission:
             return {"error": "Submission not found"}
 
+        # Identical code already running: come back once that run is done
+        # and copy it from the cache below; a redelivered message stops here
+        if settings.singleflight_enabled:
+            flight = _coalesce(self, "execute", f"{submission.exercise_id}:{submission.content_hash}", coalesced)
+            if flight is None:
+                return {"submission_id": submission.id, "duplicate": True}
+
         # Update status to running
         submission.status = SubmissionStatus.RUNNING
         db.commit()
@@ -178,146 +523,330 @@ def execute_submission(self, submission_id: int, late_penalty: float = 0.0):
             db.commit()
             return {"error": "No test cases configured"}
 
-        # Create Docker client
-        docker_client = get_docker_client()
+        # Reuse a previous run of identical code against the same test suite
+        submission.test_suite_version = compute_suite_version(exercise, test_cases)
+        if settings.test_result_cache_enabled:
+            cached_run = find_cached_run(
+                db, submission.content_hash, submission.test_suite_version, submission.id
+            )
+            record_lookup(exercise.id, hit=cached_run is not None)
+            if cached_run is not None:
+                submission.exit_reason = ExitReason.CACHED.value
+                result = _save_test_results(
+                    db, submission, exercise, _results_from_rows(cached_run.test_results),
+                    late_penalty, priority, llm_dispatched,
+                )
+                result["cached"] = True
+                return result
 
-        # Create test harness
-        test_harness_code = create_test_harness(test_cases, submission.code)
+        # Results are collected line by line while the harness runs
+        harness_results = HarnessResults(test_cases)
 
-        # Create temporary directory for code
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Write test harness to file
-            harness_path = Path(tmpdir) / "test_harness.py"
-            harness_path.write_text(test_harness_code)
+        try:
+            exit_code, logs = _submit_harness(
+                harness_results, exercise, submission.code, submission.id, priority
+            ).result()
+            logs = truncate_output(logs)
+        except SandboxTimeout:
+            _record_telemetry(submission, harness_results, ExitReason.TIMEOUT)
+            if not harness_results.received:
+                submission.status = SubmissionStatus.FAILED
+                submission.error_message = "Execution timed out"
+                db.commit()
+                return {"error": "Timeout"}
+
+            # Keep what finished; only the tests still running are timed out
+            timed_out = harness_results.unfinished
+            submission.error_message = f"Execution timed out; {timed_out} test(s) did not finish"
+            result = _save_test_results(
+                db, submission, exercise,
+                harness_results.complete("Timed out (submission time limit reached)"),
+                late_penalty,
+                priority,
+                llm_dispatched,
+            )
+            result["timed_out"] = timed_out
+            return result
+        except SandboxOutputLimitExceeded:
+            _record_telemetry(submission, harness_results, ExitReason.OUTPUT_LIMIT)
+            submission.status = SubmissionStatus.FAILED
+            submission.error_message = f"Output limit exceeded ({exercise.max_output_kb} KB)"
+            db.commit()
+            return {"error": "Output limit exceeded"}
+        except docker.errors.ImageNotFound:
+            submission.status = SubmissionStatus.FAILED
+            submission.error_message = "Sandbox image not found. Contact administrator."
+            db.commit()
+            raise
+        except docker.errors.APIError as e:
+            submission.status = SubmissionStatus.FAILED
+            submission.error_message = f"Docker error: {str(e)}"
+            db.commit()
+            raise
 
-            # TODO: Mount datasets if exercise has them (task 9.6)
-            # For now, we'll just mount the test harness
+        if not harness_results.received:
+            # Test harness failed before reporting any result
+            _record_telemetry(submission, harness_results, ExitReason.ERROR)
+            submission.status = SubmissionStatus.FAILED
+            submission.error_message = f"Test execution error: {logs}"
+            db.commit()
+            return {"error": "Test execution failed", "logs": logs}
+
+        _record_telemetry(submission, harness_results, ExitReason.COMPLETED)
+        return _save_test_results(
+            db, submission, exercise,
+            harness_results.complete("Test did not report a result"),
+            late_penalty,
+            priority,
+            llm_dispatched,
+        )
 
-            try:
-                # Create and run container
-                container = docker_client.containers.run(
-                    "autograder-sandbox",
-                    command=["python", "/workspace/test_harness.py"],
-                    detach=True,
-                    network_mode="none",
-                    mem_limit=f"{exercise.memory_limit_mb}m",
-                    cpu_period=100000,
-                    cpu_quota=100000,  # 1 core
-                    read_only=True,
-                    user="nobody",
-                    cap_drop=["ALL"],  # Drop all capabilities
-                    security_opt=["no-new-privileges"],
-                    pids_limit=256,  # Prevent fork bombs
-                    tmpfs={"/tmp": "size=50m,mode=1777"},
-                    volumes={
-                        str(harness_path.absolute()): {
-                            'bind': '/workspace/test_harness.py',
-                            'mode': 'ro'
-                        }
-                    }
-                )
+    except Retry:
+        raise
 
-                # Wait for container with timeout
-                try:
-                    result = container.wait(timeout=exercise.timeout_seconds)
-                    exit_code = result["StatusCode"]
+    except Exception as e:
+        # Retry on infrastructure failures
+        if self.request.retries - coalesced < self.max_retries:
+            if flight:
+                flight.release(done=False)
+            raise self.retry(exc=e, max_retries=self.max_retries + coalesced)
+
+        # Max retries reached
+        submission.status = SubmissionStatus.FAILED
+        submission.error_message = f"Execution failed after {self.max_retries} retries: {str(e)}"
+        db.commit()
+        return {"error": str(e)}
+
+    finally:
+        if flight:
+            flight.release()
+        db.close()
+
+
+@celery_app.task(name="app.tasks.regrade_exercise", bind=True, max_retries=0)
+def regrade_exercise(self, job_id: str, exercise_id: int, scope: str = "latest"):
+    """
+    Re-score an exercise's submissions against its current test suite.
+
+    Selects the submissions, runs each distinct code once and fans the work
+    out in chunks of `regrade_chunk_size` distinct codes (see
+    app/services/regrade.py). Progress is tracked under `job_id`.
+    """
+    db: Session = SessionLocal()
+
+    try:
+        exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+        if not exercise:
+            finish_job(job_id, exercise_id, "failed", error="Exercise not found")
+            return {"error": "Exercise not found"}
+
+        submissions = select_submissions(db, exercise_id, scope)
+        groups = group_by_content(submissions)
+        chunks = chunked(groups, settings.regrade_chunk_size)
+        update_job(job_id, status="running", total=len(submissions), distinct=len(groups), chunks=len(chunks))
+
+        if not chunks:
+            finish_job(job_id, exercise_id, "completed")
+        for chunk in chunks:
+            regrade_chunk.apply_async(args=[job_id, exercise_id, chunk], priority=BULK)
+
+        return {"job_id": job_id, "total": len(submissions), "distinct": len(groups), "chunks": len(chunks)}
 
-                    # Get logs
-                    logs = container.logs(stdout=True, stderr=True).decode("utf-8")
-                    logs = truncate_output(logs)
+    except Exception as e:
+        finish_job(job_id, exercise_id, "failed", error=str(e))
+        return {"error": str(e)}
+
+    finally:
+        db.close()
 
+
+@celery_app.task(name="app.tasks.regrade_chunk", bind=True, max_retries=0)
+def regrade_chunk(self, job_id: str, exercise_id: int, groups: List[List[Any]]):
+    """
+    Regrade one chunk of [content_hash, [submission ids]] groups.
+
+    Every distinct code is handed to the sandbox executor up front, in the
+    bulk lane, so the chunk's runs proceed in parallel up to the host's
+    capacity while a submission arriving later is still admitted ahead of
+    them; a code that already ran against this suite version is copied from
+    the test-result cache instead. The last chunk to finish completes the job.
+    """
+    db: Session = SessionLocal()
+    counts = {"regraded": 0, "failed": 0, "executed": 0, "reused": 0}
+
+    try:
+        exercise = db.query(Exercise).filter(Exercise.id == exercise_id).first()
+        if not exercise:
+            counts["failed"] = sum(len(ids) for _, ids in groups)
+            return {"error": "Exercise not found"}
+
+        test_cases = db.query(TestCase).filter(TestCase.exercise_id == exercise.id).all()
+        suite_version = compute_suite_version(exercise, test_cases)
+
+        runs = []
+        for content_hash, submission_ids in groups:
+            submissions = (
+                db.query(Submission)
+                .filter(Submission.id.in_(submission_ids))
+                .order_by(Submission.id)
+                .all()
+            )
+            if not submissions:
+                continue
+            cached_run = find_cached_run(db, content_hash, suite_version)
+            if cached_run is not None:
+                outcome = {
+                    "results": _results_from_rows(cached_run.test_results),
+                    "error_message": None,
+                    "exit_reason": ExitReason.CACHED,
+                }
+                runs.append((submissions, outcome, None, None))
+                counts["reused"] += 1
+            else:
+                harness_results = HarnessResults(test_cases)
+                run = _submit_harness(
+                    harness_results, exercise, submissions[0].code, submissions[0].id, BULK
+                )
+                runs.append((submissions, None, harness_results, run))
+                counts["executed"] += 1
+
+        for submissions, outcome, harness_results, run in runs:
+            if outcome is None:
+                try:
+                    outcome = _run_outcome(harness_results, run, exercise)
                 except Exception as e:
-                    if "timed out" in str(e).lower() or "timeout" in str(e).lower():
-                        container.kill()
-                        submission.status = SubmissionStatus.FAILED
-                        submission.error_message = "Execution timed out"
-                        db.commit()
-                        return {"error": "Timeout"}
-                    raise
-
-                finally:
-                    # Always destroy container
-                    container.remove(force=True)
-
-                # Parse test results
-                import json
+                    # Infrastructure failure: the group keeps its previous grade
+                    logging.getLogger(__name__).warning(
+                        "Regrade %s: run of submission %d failed: %s", job_id, submissions[0].id, e
+                    )
+                    counts["failed"] += len(submissions)
+                    continue
+
+            # The run belongs to the first submission; the others are copies of it
+            for position, submission in enumerate(submissions):
                 try:
-                    test_results_data = json.loads(logs)
-
-                    # Save test results to database
-                    for result_data in test_results_data:
-                        test_result = TestResult(
-                            submission_id=submission.id,
-                            test_name=result_data['name'],
-                            passed=result_data['passed'],
-                            message=truncate_output(result_data.get('message', '')),
-                            stdout=truncate_output(result_data.get('stdout', '')),
-                            stderr=truncate_output(result_data.get('stderr', ''))
-                        )
-                        db.add(test_result)
-
-                    # Calculate test score
-                    total_tests = len(test_results_data)
-                    passed_tests = sum(1 for r in test_results_data if r['passed'])
-                    test_score = (passed_tests / total_tests * 100) if total_tests > 0 else 0
-
-                    # Create grade record
-                    grade = Grade(
-                        submission_id=submission.id,
-                        test_score=test_score,
-                        final_score=test_score,  # Will be updated if LLM grading is enabled
-                        late_penalty_applied=late_penalty,
-                        published=exercise.auto_publish_grades if hasattr(exercise, 'auto_publish_grades') else False
+                    _apply_regrade(
+                        db, submission, exercise, suite_version, outcome,
+                        harness_results if position == 0 else None,
+                    )
+                    counts["regraded"] += 1
+                except Exception as e:
+                    logging.getLogger(__name__).warning(
+                        "Regrade %s: failed to save submission %d: %s", job_id, submission.id, e
                     )
-                    db.add(grade)
+                    counts["failed"] += 1
 
-                    # Update submission status
-                    submission.status = SubmissionStatus.COMPLETED
-                    db.commit()
+        return {"job_id": job_id, **counts}
 
-                    # Trigger LLM grading if enabled
-                    if exercise.llm_grading_enabled:
-                        llm_evaluate_submission.delay(submission.id)
+    finally:
+        db.close()
+        if record_chunk(job_id, **counts):
+            finish_job(job_id, exercise_id, "completed")
 
-                    return {
-                        "submission_id": submission.id,
-                        "status": "completed",
-                        "test_score": test_score,
-                        "passed": passed_tests,
-                        "total": total_tests
-                    }
 
-                except json.JSONDecodeError:
-                    # Test harness failed to return valid JSON
-                    submission.status = SubmissionStatus.FAILED
-                    submission.error_message = f"Test execution error: {logs}"
-                    db.commit()
-                    return {"error": "Test execution failed", "logs": logs}
+def _run_outcome(harness_results: HarnessResults, run: Future, exercise: Exercise) -> Dict[str, Any]:
+    """
+    Wait for a sandbox run and describe it the way execute_submission records it.
 
-            except docker.errors.ImageNotFound:
-                submission.status = SubmissionStatus.FAILED
-                submission.error_message = "Sandbox image not found. Contact administrator."
-                db.commit()
-                raise
-            except docker.errors.APIError as e:
-                submission.status = SubmissionStatus.FAILED
-                submission.error_message = f"Docker error: {str(e)}"
-                db.commit()
-                raise
+    Returns {"results", "error_message", "exit_reason"}; results is None when
+    the submission fails without test results. Infrastructure errors raise.
+    """
+    try:
+        _, logs = run.result()
+    except SandboxTimeout:
+        if not harness_results.received:
+            return {"results": None, "error_message": "Execution timed out", "exit_reason": ExitReason.TIMEOUT}
+        return {
+            "results": harness_results.complete("Timed out (submission time limit reached)"),
+            "error_message": f"Execution timed out; {harness_results.unfinished} test(s) did not finish",
+            "exit_reason": ExitReason.TIMEOUT,
+        }
+    except SandboxOutputLimitExceeded:
+        return {
+            "results": None,
+            "error_message": f"Output limit exceeded ({exercise.max_output_kb} KB)",
+            "exit_reason": ExitReason.OUTPUT_LIMIT,
+        }
 
-    except Exception as e:
-        # Retry on infrastructure failures
-        if self.request.retries < self.max_retries:
-            raise self.retry(exc=e)
+    if not harness_results.received:
+        return {
+            "results": None,
+            "error_message": f"Test execution error: {truncate_output(logs)}",
+            "exit_reason": ExitReason.ERROR,
+        }
+    return {
+        "results": harness_results.complete("Test did not report a result"),
+        "error_message": None,
+        "exit_reason": ExitReason.COMPLETED,
+    }
+
+
+def _apply_regrade(
+    db: Session,
+    submission: Submission,
+    exercise: Exercise,
+    suite_version: str,
+    outcome: Dict[str, Any],
+    harness_results: Optional[HarnessResults],
+) -> None:
+    """
+    Replace a submission's TestResult rows and Grade in one transaction.
 
-        # Max retries reached
-        submission.status = SubmissionStatus.FAILED
-        submission.error_message = f"Execution failed after {self.max_retries} retries: {str(e)}"
+    `harness_results` is given for the submission whose code actually ran;
+    copies are recorded as cached. The Grade keeps its late penalty, LLM
+    score and publication state; a submission that had no grade (it failed
+    before) gets one without penalty, since none was ever recorded.
+    """
+    try:
+        db.query(TestResult).filter(TestResult.submission_id == submission.id).delete(synchronize_session=False)
+        grade = db.query(Grade).filter(Grade.submission_id == submission.id).first()
+
+        submission.test_suite_version = suite_version
+        submission.error_message = outcome["error_message"]
+        if harness_results is not None:
+            _record_telemetry(submission, harness_results, outcome["exit_reason"])
+        else:
+            submission.wall_time_ms = submission.cpu_time_ms = submission.peak_memory_kb = None
+            submission.exit_reason = ExitReason.CACHED.value
+
+        results = outcome["results"]
+        if results is None:
+            submission.status = SubmissionStatus.FAILED
+            if grade is not None:
+                db.delete(grade)
+            db.commit()
+            return
+
+        _add_test_results(db, submission, results)
+        test_score = calculate_test_score(results)
+        if grade is None:
+            grade = Grade(
+                submission_id=submission.id,
+                late_penalty_applied=0.0,
+                published=exercise.auto_publish_grades,
+            )
+            db.add(grade)
+        grade.test_score = test_score
+        if grade.llm_score is not None:
+            _apply_llm_score(grade, exercise, grade.llm_score)
+        else:
+            grade.final_score = test_score
+        submission.status = SubmissionStatus.COMPLETED
         db.commit()
-        return {"error": str(e)}
+    except Exception:
+        db.rollback()
+        raise
+
+    # Code that never got an LLM evaluation (it failed before) gets one now
+    if exercise.llm_grading_enabled and grade.llm_score is None:
+        llm_evaluate_submission.apply_async(args=[submission.id], priority=BULK)
 
-    finally:
-        db.close()
+
+# Model per provider. Model and prompt version are part of the LLM evaluation
+# cache key (app/services/llm_eval_cache.py): bump the version whenever the
+# prompt template changes, so evaluations made with the old one are not reused.
+LLM_EVAL_MODELS = {"anthropic": "claude-3-5-sonnet-20241022", "openai": "gpt-4"}
+LLM_EVAL_PROMPT_VERSION = 1
 
 
 def create_llm_prompt(exercise: Exercise, code: str) -> str:
@@ -360,23 +889,36 @@ Format your response as JSON:
     return prompt
 
 
+def _combine_llm_score(db: Session, submission: Submission, exercise: Exercise, llm_score: float) -> None:
+    """
+    Update the Grade with the composite score, if the test results are in.
+    Otherwise `_save_test_results` combines them once they are.
+    """
+    _lock_submission(db, submission.id)
+    grade = db.query(Grade).filter(Grade.submission_id == submission.id).first()
+    if grade:
+        _apply_llm_score(grade, exercise, llm_score)
+
+
 @celery_app.task(
     name="app.tasks.llm_evaluate_submission",
     bind=True,
     max_retries=3,
     default_retry_delay=60
 )
-def llm_evaluate_submission(self, submission_id: int):
+def llm_evaluate_submission(self, submission_id: int, coalesced: int = 0):
     """
     Evaluate submission using LLM for qualitative feedback.
 
     Args:
         submission_id: ID of submission to evaluate
+        coalesced: Retries spent waiting for identical code to finish (see _coalesce)
 
     Returns:
         dict with evaluation results
     """
     db: Session = SessionLocal()
+    flight = None
 
     try:
         # Get submission and exercise
@@ -388,33 +930,41 @@ def llm_evaluate_submission(self, submission_id: int):
         if not exercise or not exercise.llm_grading_enabled:
             return {"error": "LLM grading not enabled for this exercise"}
 
+        # One LLM call per identical code in flight; the rest hit the cache
+        if settings.singleflight_enabled:
+            flight = _coalesce(self, "llm", f"{exercise.id}:{submission.content_hash}", coalesced)
+            if flight is None:
+                return {"submission_id": submission.id, "duplicate": True}
+
+        # Already evaluated (a regrade re-queues submissions left without an LLM score)
+        existing = db.query(LLMEvaluation).filter(LLMEvaluation.submission_id == submission.id).first()
+        if existing is not None:
+            _combine_llm_score(db, submission, exercise, existing.score)
+            db.commit()
+            return {"submission_id": submission.id, "cached": existing.cached, "score": existing.score}
+
         # Check cache first
-        from app.models.submission import LLMEvaluation
-        cached_eval = db.query(LLMEvaluation).filter(
-            LLMEvaluation.content_hash == submission.content_hash
-        ).first()
+        cache_key = compute_cache_key(
+            submission.content_hash, exercise.id, code_criteria(exercise),
+            f"{settings.llm_provider}:{LLM_EVAL_MODELS.get(settings.llm_provider)}", LLM_EVAL_PROMPT_VERSION,
+        )
+        cached_eval = (
+            find_cached_evaluation(db, cache_key, exercise.id, submission.id)
+            if settings.llm_eval_cache_enabled else None
+        )
 
         if cached_eval:
             # Use cached evaluation
             new_eval = LLMEvaluation(
                 submission_id=submission.id,
                 content_hash=submission.content_hash,
+                cache_key=cache_key,
                 feedback=cached_eval.feedback,
                 score=cached_eval.score,
                 cached=True
             )
             db.add(new_eval)
-
-            # Update grade with composite score
-            grade = db.query(Grade).filter(Grade.submission_id == submission.id).first()
-            if grade:
-                composite_score = (
-                    exercise.test_weight * (grade.test_score or 0) +
-                    exercise.llm_weight * new_eval.score
-                )
-                grade.llm_score = new_eval.score
-                grade.final_score = max(0, composite_score - grade.late_penalty_applied)
-
+            _combine_llm_score(db, submission, exercise, new_eval.score)
             db.commit()
             return {
                 "submission_id": submission.id,
@@ -423,8 +973,7 @@ def llm_evaluate_submission(self, submission_id: int):
             }
 
         # Call LLM API
-        from app.config import settings
-        from app.services.settings import get_llm_api_key
+        from app.services.llm_clients import get_llm_client
         import anthropic
         import openai
         import json
@@ -433,28 +982,28 @@ def llm_evaluate_submission(self, submission_id: int):
 
         try:
             if settings.llm_provider == "anthropic":
-                api_key = get_llm_api_key("anthropic", db)
-                client = anthropic.Anthropic(api_key=api_key)
-                message = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=1024,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
+                client = get_llm_client("anthropic", db)
+                with rate_limited("anthropic", LLM_EVAL_MODELS["anthropic"], estimate_tokens(prompt, 1024)):
+                    message = client.messages.create(
+                        model=LLM_EVAL_MODELS["anthropic"],
+                        max_tokens=1024,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ]
+                    )
                 response_text = message.content[0].text
 
             elif settings.llm_provider == "openai":
-                api_key = get_llm_api_key("openai", db)
-                client = openai.OpenAI(api_key=api_key)
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a code grading assistant."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3
-                )
+                client = get_llm_client("openai", db)
+                with rate_limited("openai", LLM_EVAL_MODELS["openai"], estimate_tokens(prompt, 1024)):
+                    response = client.chat.completions.create(
+                        model=LLM_EVAL_MODELS["openai"],
+                        messages=[
+                            {"role": "system", "content": "You are a code grading assistant."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.3
+                    )
                 response_text = response.choices[0].message.content
 
             else:
@@ -478,33 +1027,28 @@ def llm_evaluate_submission(self, submission_id: int):
 
                 # Validate score range
                 score = max(0, min(100, score))
+                reusable = True
 
             except (json.JSONDecodeError, KeyError, ValueError) as e:
                 # Fallback: use raw response as feedback with default score
                 feedback = response_text
                 score = 70.0  # Default score if parsing fails
+                reusable = False  # not an evaluation worth handing to the next submission
 
             # Save evaluation
             llm_eval = LLMEvaluation(
                 submission_id=submission.id,
                 content_hash=submission.content_hash,
+                cache_key=cache_key if reusable else None,
                 feedback=feedback,
                 score=score,
                 cached=False
             )
             db.add(llm_eval)
-
-            # Update grade with composite score
-            grade = db.query(Grade).filter(Grade.submission_id == submission.id).first()
-            if grade:
-                composite_score = (
-                    exercise.test_weight * (grade.test_score or 0) +
-                    exercise.llm_weight * score
-                )
-                grade.llm_score = score
-                grade.final_score = max(0, composite_score - grade.late_penalty_applied)
-
+            _combine_llm_score(db, submission, exercise, score)
             db.commit()
+            if reusable and settings.llm_eval_cache_enabled:
+                store_evaluation(exercise.id, cache_key, CachedEvaluation(feedback, score, []))
 
             return {
                 "submission_id": submission.id,
@@ -513,9 +1057,11 @@ def llm_evaluate_submission(self, submission_id: int):
                 "feedback_length": len(feedback)
             }
 
-        except anthropic.RateLimitError as e:
-            # Rate limit hit, retry later
-            raise self.retry(exc=e, countdown=120)
+        except (anthropic.RateLimitError, openai.RateLimitError, LLMRateLimitExceeded) as e:
+            # Rate limit hit, retry once the provider allows it
+            if flight:
+                flight.release(done=False)
+            raise self.retry(exc=e, countdown=retry_delay(e, 120), max_retries=self.max_retries + coalesced)
 
         except (anthropic.APIError, openai.APIError) as e:
             # API error - fallback to tests-only grading
@@ -530,10 +1076,15 @@ def llm_evaluate_submission(self, submission_id: int):
                 "fallback": True
             }
 
+    except Retry:
+        raise
+
     except Exception as e:
         # Retry on unexpected errors
-        if self.request.retries < self.max_retries:
-            raise self.retry(exc=e)
+        if self.request.retries - coalesced < self.max_retries:
+            if flight:
+                flight.release(done=False)
+            raise self.retry(exc=e, max_retries=self.max_retries + coalesced)
 
         # Max retries - fallback to tests-only
         grade = db.query(Grade).filter(Grade.submission_id == submission.id).first()
@@ -544,12 +1095,19 @@ def llm_evaluate_submission(self, submission_id: int):
         return {"error": str(e), "fallback": True}
 
     finally:
+        if flight:
+            flight.release()
         db.close()
 
 
 # ── LLM-first grading pipeline ──────────────────────────────────────────
 
 
+# As LLM_EVAL_MODELS / LLM_EVAL_PROMPT_VERSION, for create_rubric_prompt and _call_llm
+RUBRIC_MODELS = {"anthropic": "claude-sonnet-4-5-20250929", "openai": "gpt-4o"}
+RUBRIC_PROMPT_VERSION = 1
+
+
 def create_rubric_prompt(exercise, rubric_dimensions, content, is_image=False):
     """
     Build prompt for rubric-based LLM evaluation.
@@ -600,6 +1158,39 @@ As dimensões DEVEM ser exatamente: [{dim_names_json}]"""
     return base_prompt + f"\n\n**Submissão do aluno:**\n{content}"
 
 
+# Tool the model is made to call in structured mode (Anthropic)
+RUBRIC_TOOL_NAME = "registrar_avaliacao"
+
+
+def rubric_response_schema(rubric_dimensions):
+    """
+    JSON schema of the answer create_rubric_prompt asks for, for the
+    providers' structured output / tool use. Dimension names are restricted
+    to the exercise's; parse_rubric_response still checks none is missing.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "dimensions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string", "enum": [d.name for d in rubric_dimensions]},
+                        "score": {"type": "number", "description": "Nota de 0 a 100"},
+                        "feedback": {"type": "string"},
+                    },
+                    "required": ["name", "score", "feedback"],
+                    "additionalProperties": False,
+                },
+            },
+            "overall_feedback": {"type": "string"},
+        },
+        "required": ["dimensions", "overall_feedback"],
+        "additionalProperties": False,
+    }
+
+
 def parse_rubric_response(response_text, expected_dimensions):
     """
     Parse and validate LLM rubric response.
@@ -648,7 +1239,7 @@ def parse_rubric_response(response_text, expected_dimensions):
     return result
 
 
-def _call_llm(prompt, image_path=None, db=None):
+def _call_llm(prompt, image_path=None, db=None, schema=None):
     """
     Call configured LLM provider. Returns response text.
 
@@ -656,15 +1247,25 @@ def _call_llm(prompt, image_path=None, db=None):
         prompt: Text prompt or list of content blocks (multimodal)
         image_path: Path to image file for multimodal input (Anthropic)
         db: Database session for resolving API key from system settings
+        schema: JSON schema the answer must follow; the provider enforces it
+            (OpenAI structured output, a forced tool call on Anthropic) and
+            the answer is returned as JSON text
     """
     from app.config import settings
-    from app.services.settings import get_llm_api_key
-    import anthropic
-    import openai
+    from app.services.llm_clients import get_llm_client
 
     if settings.llm_provider == "anthropic":
-        api_key = get_llm_api_key("anthropic", db) if db else settings.anthropic_api_key
-        client = anthropic.Anthropic(api_key=api_key)
+        client = get_llm_client("anthropic", db)
+        structured = {}
+        if schema is not None:
+            structured = {
+                "tools": [{
+                    "name": RUBRIC_TOOL_NAME,
+                    "description": "Registra a avaliação da submissão em cada dimensão da rubrica.",
+                    "input_schema": schema,
+                }],
+                "tool_choice": {"type": "tool", "name": RUBRIC_TOOL_NAME},
+            }
 
         if image_path:
             import base64
@@ -681,22 +1282,28 @@ def _call_llm(prompt, image_path=None, db=None):
             else:
                 messages_content.append({"type": "text", "text": prompt})
 
-            message = client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=2048,
-                messages=[{"role": "user", "content": messages_content}]
-            )
+            with rate_limited("anthropic", RUBRIC_MODELS["anthropic"], estimate_tokens(messages_content, 2048)):
+                message = client.messages.create(
+                    model=RUBRIC_MODELS["anthropic"],
+                    max_tokens=2048,
+                    messages=[{"role": "user", "content": messages_content}],
+                    **structured,
+                )
         else:
-            message = client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=2048,
-                messages=[{"role": "user", "content": prompt if isinstance(prompt, str) else prompt}]
-            )
+            with rate_limited("anthropic", RUBRIC_MODELS["anthropic"], estimate_tokens(prompt, 2048)):
+                message = client.messages.create(
+                    model=RUBRIC_MODELS["anthropic"],
+                    max_tokens=2048,
+                    messages=[{"role": "user", "content": prompt if isinstance(prompt, str) else prompt}],
+                    **structured,
+                )
+        for block in message.content:
+            if block.type == "tool_use":
+                return json.dumps(block.input)
         return message.content[0].text
 
     elif settings.llm_provider == "openai":
-        api_key = get_llm_api_key("openai", db) if db else settings.openai_api_key
-        client = openai.OpenAI(api_key=api_key)
+        client = get_llm_client("openai", db)
 
         messages_content = []
         if image_path:
@@ -721,15 +1328,28 @@ def _call_llm(prompt, image_path=None, db=None):
             else:
                 messages_content = prompt
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a grading assistant."},
-                {"role": "user", "content": messages_content}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content
+        structured = {}
+        if schema is not None:
+            structured = {"response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "rubric_evaluation", "schema": schema, "strict": True},
+            }}
+
+        # No max_tokens here; budget the output like the Anthropic call
+        with rate_limited("openai", RUBRIC_MODELS["openai"], estimate_tokens(messages_content, 2048)):
+            response = client.chat.completions.create(
+                model=RUBRIC_MODELS["openai"],
+                messages=[
+                    {"role": "system", "content": "You are a grading assistant."},
+                    {"role": "user", "content": messages_content}
+                ],
+                temperature=0.3,
+                **structured,
+            )
+        message = response.choices[0].message
+        if getattr(message, "refusal", None):
+            raise ValueError(f"LLM refused to answer: {message.refusal}")
+        return message.content
 
     else:
         raise ValueError("No LLM API key configured")
@@ -782,50 +1402,39 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
             db.commit()
             return {"error": "No rubric dimensions"}
 
-        # Check cache: same content_hash AND same exercise (rubric may differ between exercises)
+        # Same content, exercise, rubric, model and prompt version
+        cache_key = compute_cache_key(
+            submission.content_hash, exercise.id, rubric_criteria(exercise, rubric_dims),
+            f"{settings.llm_provider}:{RUBRIC_MODELS.get(settings.llm_provider)}", RUBRIC_PROMPT_VERSION,
+        )
         cached_eval = (
-            db.query(LLMEvaluation)
-            .join(Submission, LLMEvaluation.submission_id == Submission.id)
-            .filter(
-                LLMEvaluation.content_hash == submission.content_hash,
-                Submission.exercise_id == exercise.id,
-                LLMEvaluation.submission_id != submission.id,
-            )
-            .first()
+            find_cached_evaluation(db, cache_key, exercise.id, submission.id)
+            if settings.llm_eval_cache_enabled else None
         )
 
         if cached_eval:
             # Copy cached rubric scores
-            cached_scores = (
-                db.query(RubricScore)
-                .filter(RubricScore.submission_id == cached_eval.submission_id)
-                .all()
-            )
-
-            for cs in cached_scores:
-                new_score = RubricScore(
+            weights = {d.id: d.weight for d in rubric_dims}
+            final_score = 0.0
+            for dimension_id, score, feedback in cached_eval.rubric_scores:
+                db.add(RubricScore(
                     submission_id=submission.id,
-                    dimension_id=cs.dimension_id,
-                    score=cs.score,
-                    feedback=cs.feedback,
-                )
-                db.add(new_score)
+                    dimension_id=dimension_id,
+                    score=score,
+                    feedback=feedback,
+                ))
+                final_score += score * weights[dimension_id]
 
             new_eval = LLMEvaluation(
                 submission_id=submission.id,
                 content_hash=submission.content_hash,
+                cache_key=cache_key,
                 feedback=cached_eval.feedback,
                 score=cached_eval.score,
                 cached=True,
             )
             db.add(new_eval)
 
-            # Calculate weighted score
-            final_score = sum(
-                cs.score * next(d.weight for d in rubric_dims if d.id == cs.dimension_id)
-                for cs in cached_scores
-            )
-
             grade = Grade(
                 submission_id=submission.id,
                 llm_score=final_score,
@@ -859,7 +1468,10 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
         # Build prompt
         prompt = create_rubric_prompt(exercise, rubric_dims, content, is_image=is_image)
 
-        # Call LLM (with retry on malformed response)
+        # Call LLM (with retry on malformed response); in structured mode the
+        # provider holds the answer to the rubric's schema
+        mode = "structured" if settings.llm_structured_output else "text"
+        schema = rubric_response_schema(rubric_dims) if mode == "structured" else None
         parsed = None
         for attempt in range(2):
             try:
@@ -867,11 +1479,17 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
                     prompt if not is_image else prompt,
                     image_path=image_path if is_image else None,
                     db=db,
+                    schema=schema,
                 )
                 parsed = parse_rubric_response(response_text, rubric_dims)
+                record_outcome(exercise.id, mode, "first_try" if attempt == 0 else "fallback")
                 break
             except (ValueError, _json.JSONDecodeError) as parse_err:
                 if attempt == 0:
+                    logging.getLogger(__name__).warning(
+                        "grade_llm_first: unusable %s answer for submission %s: %s",
+                        mode, submission.id, parse_err,
+                    )
                     # Retry with corrective prompt
                     if isinstance(prompt, list):
                         prompt.append({
@@ -882,6 +1500,7 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
                         prompt += f"\n\nSua resposta anterior não era JSON válido. Erro: {parse_err}. Tente novamente com JSON válido."
                     continue
                 else:
+                    record_outcome(exercise.id, mode, "failed")
                     submission.status = SubmissionStatus.FAILED
                     submission.error_message = f"LLM returned invalid response after retry: {parse_err}"
                     db.commit()
@@ -918,6 +1537,7 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
         llm_eval = LLMEvaluation(
             submission_id=submission.id,
             content_hash=submission.content_hash,
+            cache_key=cache_key,
             feedback=parsed["overall_feedback"],
             score=final_score,
             cached=False,
@@ -936,6 +1556,15 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
 
         submission.status = SubmissionStatus.COMPLETED
         db.commit()
+        if settings.llm_eval_cache_enabled:
+            store_evaluation(exercise.id, cache_key, CachedEvaluation(
+                parsed["overall_feedback"],
+                final_score,
+                [
+                    (dim_by_name[d["name"]].id, d["score"], d["feedback"])
+                    for d in parsed["dimensions"] if d["name"] in dim_by_name
+                ],
+            ))
 
         return {
             "submission_id": submission.id,
@@ -948,8 +1577,8 @@ def grade_llm_first(self, submission_id: int, late_penalty: float = 0.0):
         import anthropic
         import openai
 
-        if isinstance(e, (anthropic.RateLimitError,)):
-            raise self.retry(exc=e, countdown=120)
+        if isinstance(e, (anthropic.RateLimitError, openai.RateLimitError, LLMRateLimitExceeded)):
+            raise self.retry(exc=e, countdown=retry_delay(e, 120))
 
         if isinstance(e, (anthropic.APIError, openai.APIError)):
             if self.request.retries < self.max_retries:
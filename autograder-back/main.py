@@ -5,7 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.routers import auth, users, classes, exercises, exercise_lists, submissions, grades
-from app.routers import webhooks, products, admin_events, messaging, admin_templates, onboarding, admin_settings, admin_students
+from app.routers import webhooks, products, admin_events, messaging, admin_templates, onboarding, admin_settings, admin_students, admin_sandbox
 from app.config import settings
 
 
@@ -58,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Estimated-Wait"],  # 429 backpressure from POST /submissions
 )
 
 # Include routers
@@ -76,6 +77,7 @@ app.include_router(admin_templates.router)
 app.include_router(onboarding.router)
 app.include_router(admin_settings.router)
 app.include_router(admin_students.router)
+app.include_router(admin_sandbox.router)
 
 
 @app.get("/health")
@@ -0,0 +1,292 @@
+"""
+Test harness for the autograder sandbox image.
+
+The worker no longer generates a harness per submission. It writes the inputs
+into the workspace directory mounted at /workspace:
+
+    submission.py   the student's code, unmodified
+    tests.jsonl     one {"name", "input", "expected"} object per line
+    config.json     {"workers", "test_timeout", "test_memory_bytes", "data_dir", "nonce"}
+
+This module is copied into the image and precompiled; run_harness.py is the
+entry point the sandbox executes. The student code is compiled once with its
+real path, so tracebacks carry file names and line numbers, and the tests are
+read line by line instead of being inlined into generated source.
+
+Every finished test is printed right away as one JSON line tagged with its
+index, so a run killed at the time limit still reports what completed.
+Student code shares the harness's stdout, so every line the harness writes
+also carries the run's `nonce` from config.json, and the worker drops lines
+without it: a result printed by the submission (at import time, say, before
+an os._exit) does not count. Output of the module body is captured like
+that of a test and passed on to stderr. The nonce keeps printed results
+out; it is not a boundary against code that sets out to read the harness's
+inputs or memory, which the sandbox cannot hide from the process it runs in.
+Results carry the test's wall time (`duration_ms`); once every test has
+reported, a last {"telemetry": {...}} line gives the CPU time and peak RSS
+of the harness and its test processes.
+Sequential mode evaluates the tests one after another. Isolated mode (a
+per-test timeout or more than one worker) forks one child per test from the
+already-loaded student namespace, applies per-test CPU-time and memory
+rlimits, and keeps up to `workers` children running at once; a child that
+outlives its wall-clock deadline is killed and only that test fails.
+
+When the exercise has datasets, `data_dir` names its read-only directory under
+the /datasets mount. The image links /data to DATA_LINK, which the
+harness points at that directory before loading the student code, so
+datasets are opened as /data/<file>.
+
+This file must only use the stdlib.
+"""
+import json
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import traceback
+from io import StringIO
+
+DEFAULT_WORKSPACE = "/workspace"
+SUBMISSION_FILE = "submission.py"
+TESTS_FILE = "tests.jsonl"
+CONFIG_FILE = "config.json"
+DATA_LINK = os.environ.get("AUTOGRADER_DATA_LINK", "/tmp/data")
+
+# Where protocol lines go and the nonce they carry; set by main before the
+# student code can replace sys.stdout
+_channel = {"out": sys.stdout, "nonce": None}
+
+
+def load_submission(path):
+    """Compile and run the student's module; returns its namespace."""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "submission", "__file__": path}
+    old_stdout = sys.stdout
+    sys.stdout = captured_output = StringIO()
+    try:
+        exec(compile(source, path, "exec"), namespace)
+    finally:
+        sys.stdout = old_stdout
+        sys.stderr.write(captured_output.getvalue())
+    return namespace
+
+
+def link_data(data_dir):
+    """Point DATA_LINK (and so /data) at this run's dataset directory."""
+    if os.path.lexists(DATA_LINK):
+        os.unlink(DATA_LINK)
+    os.symlink(data_dir, DATA_LINK)
+
+
+def read_tests(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def report(message):
+    """Write one line of the result protocol, tagged with the run's nonce."""
+    out = _channel["out"]
+    out.write(json.dumps({**message, "nonce": _channel["nonce"]}) + "\n")
+    out.flush()
+
+
+def emit(index, result):
+    result["index"] = index
+    report(result)
+
+
+def failed_test(test_case, message, duration_ms=None):
+    return {
+        "name": test_case["name"], "passed": False, "message": message,
+        "stdout": "", "stderr": "", "duration_ms": duration_ms,
+    }
+
+
+def _elapsed_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+
+def telemetry():
+    """CPU time and peak RSS of this process plus every reaped child."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return {
+        "cpu_time_ms": int(cpu * 1000),
+        "peak_memory_kb": max(own.ru_maxrss, children.ru_maxrss),  # Linux reports KB
+    }
+
+
+def run_test(test_case, namespace):
+    test_name = test_case["name"]
+    expected_output = test_case["expected"]
+    started = time.monotonic()
+
+    try:
+        # Capture stdout
+        old_stdout = sys.stdout
+        sys.stdout = captured_output = StringIO()
+
+        # Evaluate the test input in the student namespace
+        try:
+            code = compile(test_case["input"], f"<test {test_name}>", "eval")
+            result = eval(code, namespace)
+        finally:
+            sys.stdout = old_stdout
+
+        passed = str(result).strip() == str(expected_output).strip()
+
+        return {
+            "name": test_name,
+            "passed": passed,
+            "message": f"Expected: {expected_output}, Got: {result}" if not passed else "Test passed",
+            "stdout": captured_output.getvalue(),
+            "stderr": "",
+            "duration_ms": _elapsed_ms(started),
+        }
+    except Exception as e:
+        return {
+            "name": test_name,
+            "passed": False,
+            "message": str(e),
+            "stdout": "",
+            "stderr": traceback.format_exc(),
+            "duration_ms": _elapsed_ms(started),
+        }
+
+
+# ── isolated mode ───────────────────────────────────────────────────────
+
+
+def _run_child(test_case, namespace, config, write_fd):
+    code = 1
+    try:
+        if config["test_timeout"]:
+            cpu = int(config["test_timeout"]) + 1
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if config["test_memory_bytes"]:
+            limit = config["test_memory_bytes"]
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+        payload = json.dumps(run_test(test_case, namespace)).encode("utf-8")
+        with os.fdopen(write_fd, "wb") as pipe:
+            pipe.write(payload)
+        code = 0
+    finally:
+        os._exit(code)
+
+
+def _child_result(test_case, payload, status, config, duration_ms):
+    if payload:
+        try:
+            return json.loads(payload)
+        except ValueError:
+            pass
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        if sig == signal.SIGXCPU:
+            return failed_test(test_case, f"Timed out after {config['test_timeout']}s", duration_ms)
+        return failed_test(
+            test_case, f"Test process killed by signal {sig} (memory limit exceeded?)", duration_ms
+        )
+    return failed_test(test_case, f"Test process exited with status {os.WEXITSTATUS(status)}", duration_ms)
+
+
+def run_isolated(tests, namespace, config):
+    pending = enumerate(tests)
+    exhausted = False
+    running = {}  # read fd -> [index, test_case, pid, deadline, chunks, started]
+    timeout = config["test_timeout"]
+
+    while not exhausted or running:
+        while not exhausted and len(running) < config["workers"]:
+            try:
+                index, test_case = next(pending)
+            except StopIteration:
+                exhausted = True
+                break
+            read_fd, write_fd = os.pipe()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                for fd in running:
+                    os.close(fd)
+                _run_child(test_case, namespace, config, write_fd)
+            os.close(write_fd)
+            started = time.monotonic()
+            deadline = started + timeout if timeout else None
+            running[read_fd] = [index, test_case, pid, deadline, [], started]
+
+        if not running:
+            break
+
+        deadlines = [entry[3] for entry in running.values() if entry[3] is not None]
+        wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        ready, _, _ = select.select(list(running), [], [], wait)
+
+        for fd in ready:
+            chunk = os.read(fd, 65536)
+            if chunk:
+                running[fd][4].append(chunk)
+                continue
+            index, test_case, pid, _, chunks, started = running.pop(fd)
+            os.close(fd)
+            _, status = os.waitpid(pid, 0)
+            emit(index, _child_result(test_case, b"".join(chunks), status, config, _elapsed_ms(started)))
+
+        now = time.monotonic()
+        for fd, (index, test_case, pid, deadline, _, started) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                os.close(fd)
+                del running[fd]
+                emit(index, failed_test(test_case, f"Timed out after {timeout}s", _elapsed_ms(started)))
+
+
+# ── entry point ─────────────────────────────────────────────────────────
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    workspace = argv[0] if argv else DEFAULT_WORKSPACE
+
+    with open(os.path.join(workspace, CONFIG_FILE), encoding="utf-8") as f:
+        config = {
+            "workers": 1, "test_timeout": None, "test_memory_bytes": None, "data_dir": None, "nonce": None,
+            **json.load(f),
+        }
+    _channel["out"], _channel["nonce"] = sys.stdout, config["nonce"]
+
+    if config["data_dir"]:
+        link_data(config["data_dir"])
+
+    try:
+        namespace = load_submission(os.path.join(workspace, SUBMISSION_FILE))
+    except Exception as e:
+        report({
+            "error": "Failed to load student code",
+            "message": str(e),
+            "traceback": traceback.format_exc(),
+        })
+        return 1
+
+    tests = read_tests(os.path.join(workspace, TESTS_FILE))
+    if config["test_timeout"] or config["workers"] > 1:
+        run_isolated(tests, namespace, config)
+    else:
+        for index, test_case in enumerate(tests):
+            emit(index, run_test(test_case, namespace))
+
+    report({"telemetry": telemetry()})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
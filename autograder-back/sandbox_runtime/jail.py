@@ -0,0 +1,348 @@
+"""
+Process jail for the subprocess sandbox backend.
+
+    python jail.py '<json spec>'
+
+Sets up isolation in a fresh, single-threaded process and then execs the test
+harness, so the worker never runs setup code between fork and exec:
+
+1. joins the run's cgroup v2 directory when the worker created one
+   (memory.max, cpu.max, pids.max are written by the worker);
+2. unshares mount, network, PID, IPC and UTS namespaces (plus a user
+   namespace when not started as root) -- the network namespace has no
+   interfaces, so there is no network;
+3. forks; the child is PID 1 of the new PID namespace, so when it exits,
+   or is killed because this parent died, every process it left behind
+   goes with it;
+4. remounts every filesystem read-only, hides host paths that may hold
+   secrets or sockets behind empty tmpfs mounts, mounts a private tmpfs on
+   /tmp and a fresh /proc, and bind-mounts the harness runtime, the
+   workspace and the exercise's datasets read-only under JAIL_ROOT;
+5. applies rlimits (memory only without a cgroup), drops to nobody when
+   started as root, sets no_new_privs and installs a seccomp filter that
+   refuses mount, namespace, ptrace, kernel-module, bpf and similar calls;
+6. execs the harness with a minimal environment.
+
+Any setup failure is fatal: the jail prints "jail: <reason>" to stderr and
+exits with SETUP_FAILED_EXIT_CODE rather than running code half-isolated.
+Student code can print the same line and exit with the same status, so the
+reason also goes to the spec's `status_fd` when the worker passes one: a
+pipe that is close-on-exec here, so the harness never holds it and anything
+written to it comes from the jail.
+
+This file must only use the stdlib.
+"""
+import ctypes
+import json
+import os
+import platform
+import resource
+import signal
+import struct
+import sys
+
+SETUP_FAILED_EXIT_CODE = 125
+
+# Paths inside the jail (app/services/sandbox_backends.py relies on these)
+JAIL_ROOT = "/tmp/.autograder"
+RUNTIME_DIR = JAIL_ROOT + "/runtime"
+WORKSPACE_DIR = JAIL_ROOT + "/workspace"
+DATA_DIR = JAIL_ROOT + "/data"
+
+NOBODY = 65534
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUTS = 0x04000000
+CLONE_NEWIPC = 0x08000000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWPID = 0x20000000
+CLONE_NEWNET = 0x40000000
+
+MS_RDONLY = 0x1
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_REMOUNT = 0x20
+MS_NOATIME = 0x400
+MS_NODIRATIME = 0x800
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+MS_RELATIME = 0x200000
+MS_STRICTATIME = 0x1000000
+
+# Flags a bind remount has to keep, or the kernel refuses it in a user namespace
+_LOCKED_FLAGS = {
+    "nosuid": MS_NOSUID, "nodev": MS_NODEV, "noexec": MS_NOEXEC,
+    "noatime": MS_NOATIME, "nodiratime": MS_NODIRATIME, "relatime": MS_RELATIME,
+    "strictatime": MS_STRICTATIME,
+}
+
+PR_SET_PDEATHSIG = 1
+PR_SET_SECCOMP = 22
+PR_SET_NO_NEW_PRIVS = 38
+SECCOMP_MODE_FILTER = 2
+
+SECCOMP_RET_KILL_PROCESS = 0x80000000
+SECCOMP_RET_ERRNO = 0x00050000
+SECCOMP_RET_ALLOW = 0x7FFF0000
+
+# Syscalls refused with EPERM, per architecture
+_DENIED_SYSCALLS = {
+    "x86_64": (0xC000003E, {
+        "ptrace": 101, "pivot_root": 155, "chroot": 161, "acct": 163, "mount": 165,
+        "umount2": 166, "swapon": 167, "swapoff": 168, "reboot": 169, "init_module": 175,
+        "delete_module": 176, "quotactl": 179, "kexec_load": 246, "add_key": 248,
+        "request_key": 249, "keyctl": 250, "unshare": 272, "perf_event_open": 298,
+        "name_to_handle_at": 303, "open_by_handle_at": 304, "setns": 308,
+        "process_vm_readv": 310, "process_vm_writev": 311, "finit_module": 313,
+        "kexec_file_load": 320, "bpf": 321, "userfaultfd": 323, "io_uring_setup": 425,
+        "open_tree": 428, "move_mount": 429, "fsopen": 430, "fsmount": 432, "fspick": 433,
+        "mount_setattr": 442,
+    }),
+    "aarch64": (0xC00000B7, {
+        "umount2": 39, "mount": 40, "pivot_root": 41, "chroot": 51, "quotactl": 60,
+        "acct": 89, "unshare": 97, "kexec_load": 104, "init_module": 105,
+        "delete_module": 106, "ptrace": 117, "reboot": 142, "add_key": 217,
+        "request_key": 218, "keyctl": 219, "swapon": 224, "swapoff": 225,
+        "perf_event_open": 241, "name_to_handle_at": 264, "open_by_handle_at": 265,
+        "setns": 268, "process_vm_readv": 270, "process_vm_writev": 271,
+        "finit_module": 273, "bpf": 280, "userfaultfd": 282, "kexec_file_load": 294,
+        "io_uring_setup": 425, "open_tree": 428, "move_mount": 429, "fsopen": 430,
+        "fsmount": 432, "fspick": 433, "mount_setattr": 442,
+    }),
+}
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+
+
+class JailError(Exception):
+    pass
+
+
+def _check(result, what):
+    if result != 0:
+        err = ctypes.get_errno()
+        raise JailError(f"{what}: {os.strerror(err)}")
+
+
+def _mount(source, target, fstype, flags, data=None):
+    _check(
+        _libc.mount(
+            source.encode() if source else None,
+            target.encode(),
+            fstype.encode() if fstype else None,
+            flags,
+            data.encode() if data else None,
+        ),
+        f"mount {target}",
+    )
+
+
+def _write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+# ── namespaces ──────────────────────────────────────────────────────────
+
+
+def unshare(as_root):
+    flags = CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWPID | CLONE_NEWIPC | CLONE_NEWUTS
+    uid, gid = os.getuid(), os.getgid()
+    if not as_root:
+        flags |= CLONE_NEWUSER
+    _check(_libc.unshare(flags), "unshare")
+    if not as_root:
+        _write("/proc/self/setgroups", "deny")
+        _write("/proc/self/uid_map", f"{uid} {uid} 1")
+        _write("/proc/self/gid_map", f"{gid} {gid} 1")
+
+
+# ── filesystem ──────────────────────────────────────────────────────────
+
+
+def _mounts():
+    """(mount point, locked flags) for every mount, outermost first."""
+    mounts = []
+    with open("/proc/self/mountinfo") as f:
+        for line in f:
+            fields = line.split()
+            point = fields[4].encode().decode("unicode_escape")
+            flags = 0
+            for option in fields[5].split(","):
+                flags |= _LOCKED_FLAGS.get(option, 0)
+            mounts.append((point, flags))
+    return mounts
+
+
+def _remount_readonly():
+    for point, flags in _mounts():
+        try:
+            _mount(None, point, None, MS_REMOUNT | MS_BIND | MS_RDONLY | flags)
+        except JailError as e:
+            if point == "/":
+                raise
+            sys.stderr.write(f"jail: left {point} as is ({e})\n")
+
+
+def _bind_readonly(fd, target):
+    os.makedirs(target, exist_ok=True)
+    _mount(f"/proc/self/fd/{fd}", target, None, MS_BIND | MS_REC)
+    _mount(None, target, None, MS_REMOUNT | MS_BIND | MS_RDONLY | MS_NOSUID | MS_NODEV)
+
+
+def build_filesystem(spec):
+    _mount(None, "/", None, MS_REC | MS_PRIVATE)
+
+    # Grab the host directories before /tmp and the hidden paths cover them
+    sources = {RUNTIME_DIR: spec["runtime"], WORKSPACE_DIR: spec["workspace"]}
+    if spec.get("data"):
+        sources[DATA_DIR] = spec["data"]
+    fds = {target: os.open(path, os.O_PATH | os.O_DIRECTORY) for target, path in sources.items()}
+
+    _remount_readonly()
+
+    for path in spec.get("hidden", []):
+        if os.path.isdir(path) and not os.path.islink(path):
+            _mount("tmpfs", path, "tmpfs", MS_RDONLY | MS_NOSUID | MS_NODEV | MS_NOEXEC, "size=4k,mode=755")
+
+    tmp_flags = MS_NOSUID | MS_NODEV
+    _mount("tmpfs", "/tmp", "tmpfs", tmp_flags, f"size={spec['tmpfs_bytes']},mode=1777")
+    if os.path.isdir("/dev/shm"):
+        _mount("tmpfs", "/dev/shm", "tmpfs", tmp_flags | MS_NOEXEC, "size=16m,mode=1777")
+
+    for target, fd in fds.items():
+        _bind_readonly(fd, target)
+        os.close(fd)
+    os.chmod(JAIL_ROOT, 0o755)
+
+    # This process is PID 1 of the new namespace; the host's /proc would show
+    # the worker's processes (and their environment) otherwise
+    try:
+        _mount("proc", "/proc", "proc", MS_NOSUID | MS_NODEV | MS_NOEXEC)
+    except JailError:
+        _mount("tmpfs", "/proc", "tmpfs", MS_RDONLY | MS_NOSUID | MS_NODEV | MS_NOEXEC, "size=4k")
+
+
+# ── limits and privileges ───────────────────────────────────────────────
+
+
+def apply_limits(spec, as_root):
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (256, 256))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (spec["max_file_bytes"], spec["max_file_bytes"]))
+    if not spec.get("cgroup"):
+        # No cgroup: fall back to per-process limits
+        resource.setrlimit(resource.RLIMIT_DATA, (spec["memory_bytes"], spec["memory_bytes"]))
+        if as_root:
+            # Counted per user, which is nobody for every jailed run
+            resource.setrlimit(resource.RLIMIT_NPROC, (spec["max_processes"], spec["max_processes"]))
+
+
+def drop_privileges(as_root):
+    if as_root:
+        os.setgroups([])
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)
+    # Die with the jail's parent (the worker kills it at the time limit);
+    # set after setuid, which clears it
+    _check(_libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0), "prctl(PDEATHSIG)")
+    _check(_libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "prctl(NO_NEW_PRIVS)")
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.c_void_p)]
+
+
+def _bpf(code, k, jt=0, jf=0):
+    return struct.pack("HBBI", code, jt, jf, k)
+
+
+def install_seccomp():
+    machine = platform.machine()
+    if machine not in _DENIED_SYSCALLS:
+        raise JailError(f"no seccomp policy for {machine}")
+    audit_arch, denied = _DENIED_SYSCALLS[machine]
+
+    ld_abs, jeq, jge, ret = 0x20, 0x15, 0x35, 0x06
+    deny = SECCOMP_RET_ERRNO | 1  # EPERM
+    program = [
+        _bpf(ld_abs, 4),                      # seccomp_data.arch
+        _bpf(jeq, audit_arch, jt=1),
+        _bpf(ret, SECCOMP_RET_KILL_PROCESS),
+        _bpf(ld_abs, 0),                      # seccomp_data.nr
+    ]
+    if machine == "x86_64":
+        # x32 ABI syscall numbers alias the ones below
+        program += [_bpf(jge, 0x40000000, jf=1), _bpf(ret, deny)]
+    for nr in sorted(denied.values()):
+        program += [_bpf(jeq, nr, jf=1), _bpf(ret, deny)]
+    program.append(_bpf(ret, SECCOMP_RET_ALLOW))
+
+    buffer = ctypes.create_string_buffer(b"".join(program))
+    prog = _SockFprog(len(program), ctypes.addressof(buffer))
+    _check(
+        _libc.prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, ctypes.byref(prog), 0, 0),
+        "prctl(SECCOMP)",
+    )
+
+
+# ── entry point ─────────────────────────────────────────────────────────
+
+
+def _child(spec, as_root):
+    build_filesystem(spec)
+    apply_limits(spec, as_root)
+    drop_privileges(as_root)
+    install_seccomp()
+    os.chdir("/tmp")
+    env = {"PATH": "/usr/local/bin:/usr/bin:/bin", "HOME": "/tmp", "LANG": "C.UTF-8"}
+    python = spec["python"]
+    os.execve(python, [python, "-E", "-s", "-B", RUNTIME_DIR + "/run_harness.py", WORKSPACE_DIR], env)
+
+
+def _setup_failed(spec, error):
+    sys.stderr.write(f"jail: {error}\n")
+    sys.stderr.flush()
+    if spec.get("status_fd") is not None:
+        try:
+            os.write(spec["status_fd"], str(error).encode("utf-8", errors="replace"))
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    spec = json.loads(argv[0])
+    as_root = os.getuid() == 0
+    if spec.get("status_fd") is not None:
+        os.set_inheritable(spec["status_fd"], False)  # closed when the harness is exec'd
+
+    try:
+        if spec.get("cgroup"):
+            _write(os.path.join(spec["cgroup"], "cgroup.procs"), str(os.getpid()))
+        unshare(as_root)
+    except (JailError, OSError) as e:
+        _setup_failed(spec, e)
+        return SETUP_FAILED_EXIT_CODE
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _child(spec, as_root)
+        except (JailError, OSError) as e:
+            _setup_failed(spec, e)
+        os._exit(SETUP_FAILED_EXIT_CODE)
+
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+Sandbox entry point for a submission run.
+
+Kept to an import so the harness itself is loaded from the bytecode compiled
+into the image (a script run directly is always recompiled from source).
+"""
+import sys
+
+import harness
+
+sys.exit(harness.main())
@@ -0,0 +1,343 @@
+"""
+Fork-server ("zygote") supervisor for the autograder sandbox image.
+
+serve: runs as PID 1 of a pooled sandbox container. It pre-imports the
+test harness and the modules listed in ZYGOTE_PRELOAD, then listens on a
+root-only Unix socket. For each request it forks a child that drops to the sandbox user, applies
+rlimits, gets its own scratch directory under /tmp and runs the requested
+script with runpy. Student code therefore starts with the interpreter and
+the heavy imports (numpy, pandas, ...) already warm.
+
+run: tiny client invoked through `docker exec`. It sends one request,
+writes the child's output to stdout as the supervisor relays it and exits
+with the child's exit status (124 on timeout, like coreutils `timeout`;
+153, 128 + SIGXFSZ, when the child is killed for writing more than its
+output budget). The output is relayed untouched and as it is produced, so
+the JSON-lines result protocol, including results streamed before a kill,
+is the same as a plain `python run_harness.py` run.
+
+Student code can exit with 124 or 153 itself, so the exit status does not
+say why a run ended. When the supervisor killed the child, the client also
+writes a STATUS_PREFIX line (`timeout` or `output_limit`) to its own
+stderr, which only the client writes to: the child's stdout and stderr
+both reach the client through the socket and go to stdout.
+
+Limits of this design, kept on purpose:
+
+- /tmp is the container's tmpfs, not one per child: a private mount needs
+  CAP_SYS_ADMIN (unshare + mount), which the container does not get. Each
+  child's scratch directory is removed by the supervisor when the child
+  exits, and the pool's reset wipes the rest of /tmp between runs.
+- Every run still starts one `python -S` client through `docker exec`;
+  the socket is root-only inside the container, and reaching it from the
+  worker without exec would mean exposing it on the host.
+
+This file is copied into the sandbox image and must only use the stdlib.
+"""
+import argparse
+import importlib
+import json
+import os
+import pkgutil  # noqa: F401 - imported lazily by runpy.run_path; keep it warm
+import resource
+import runpy
+import select
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+import traceback
+
+SOCKET_PATH = os.environ.get("ZYGOTE_SOCKET", "/run/zygote/zygote.sock")
+SANDBOX_UID = 65534  # nobody
+SANDBOX_GID = 65534  # nogroup
+TIMEOUT_EXIT_CODE = 124
+OUTPUT_LIMIT_EXIT_CODE = 153  # 128 + SIGXFSZ
+# Hard ceiling; each request carries its own (smaller) per-exercise budget
+MAX_OUTPUT_BYTES = int(os.environ.get("ZYGOTE_MAX_OUTPUT_BYTES", str(10 * 1024 * 1024)))
+CONNECT_TIMEOUT_SECONDS = 15
+
+# Client stderr line naming why the supervisor killed the child
+STATUS_PREFIX = "zygote-status: "
+
+# Supervisor -> client frames: kind, payload length, payload. OUTPUT frames
+# carry the child's output as it arrives; one EXIT frame (JSON) ends the run.
+_FRAME = struct.Struct("!cI")
+OUTPUT = b"o"
+EXIT = b"x"
+
+
+# ── supervisor ──────────────────────────────────────────────────────────
+
+
+def _preload(modules):
+    for name in filter(None, (m.strip() for m in modules.split(","))):
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"zygote: could not preload {name}: {e}", file=sys.stderr)
+
+
+def _reap():
+    """Collect orphans re-parented to us (we are PID 1)."""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def _drop_privileges():
+    if os.getuid() != 0:
+        return
+    os.setgroups([])
+    os.setgid(SANDBOX_GID)
+    os.setuid(SANDBOX_UID)
+
+
+def _apply_rlimits(timeout):
+    cpu = int(timeout) + 1
+    limits = {
+        resource.RLIMIT_CPU: (cpu, cpu + 1),
+        resource.RLIMIT_CORE: (0, 0),
+        resource.RLIMIT_NOFILE: (256, 256),
+        resource.RLIMIT_FSIZE: (16 * 1024 * 1024, 16 * 1024 * 1024),
+        # No RLIMIT_NPROC: without a user namespace it counts every process of
+        # uid nobody on the host, across containers, so busy hosts would fail
+        # forks at random. The container's pids_limit bounds process count.
+    }
+    for res, limit in limits.items():
+        resource.setrlimit(res, limit)
+
+
+def _run_child(script, timeout, scratch, write_fd, inherited_fds):
+    """Child side of a fork: isolate, run the script, never return."""
+    code = 1
+    try:
+        for fd in inherited_fds:
+            os.close(fd)
+        os.setsid()
+        os.dup2(write_fd, 1)
+        os.dup2(write_fd, 2)
+        os.close(write_fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+
+        _drop_privileges()
+        _apply_rlimits(timeout)
+
+        os.chdir(scratch)
+        os.environ.update(TMPDIR=scratch, HOME=scratch)
+        sys.argv = [script]
+
+        code = 0
+        try:
+            runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _send_frame(conn, kind, payload):
+    conn.sendall(_FRAME.pack(kind, len(payload)) + payload)
+
+
+def _relay(conn, read_fd, pid, timeout, max_output):
+    """
+    Relay child output to `conn` as it arrives, until EOF, deadline or
+    output budget.
+
+    Returns the reason the relay stopped: None, "timeout", "output_limit"
+    or "disconnected" (the client went away). The child's process group is
+    killed in all but the first case.
+    """
+    size = 0
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _kill_group(pid)
+            return "timeout"
+        ready, _, _ = select.select([read_fd], [], [], remaining)
+        if not ready:
+            continue
+        data = os.read(read_fd, 65536)
+        if not data:
+            return None
+        reason = None
+        if size + len(data) > max_output:
+            _kill_group(pid)
+            data, reason = data[:max_output - size], "output_limit"
+        size += len(data)
+        try:
+            _send_frame(conn, OUTPUT, data)
+        except OSError:
+            _kill_group(pid)
+            return "disconnected"
+        if reason:
+            return reason
+
+
+def _scratch_dir():
+    """A fresh directory under /tmp owned by the sandbox user."""
+    scratch = tempfile.mkdtemp(prefix="run-", dir="/tmp")
+    if os.getuid() == 0:
+        os.chown(scratch, SANDBOX_UID, SANDBOX_GID)
+    return scratch
+
+
+def _handle(conn, request, inherited_fds):
+    """Run one request, relaying its output to `conn`; returns the EXIT frame's payload."""
+    script = request["script"]
+    timeout = float(request.get("timeout", 30))
+    max_output = min(int(request.get("max_output", MAX_OUTPUT_BYTES)), MAX_OUTPUT_BYTES)
+
+    scratch = _scratch_dir()
+    try:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_child(script, timeout, scratch, write_fd, inherited_fds)
+
+        os.close(write_fd)
+        try:
+            reason = _relay(conn, read_fd, pid, timeout, max_output)
+        finally:
+            os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if reason == "timeout":
+        exit_code = TIMEOUT_EXIT_CODE
+    elif reason == "output_limit":
+        exit_code = OUTPUT_LIMIT_EXIT_CODE
+    else:
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code < 0:
+            exit_code = 128 - exit_code  # killed by signal, shell convention
+
+    return {"exit_code": exit_code, "reason": reason}
+
+
+def serve():
+    # The harness sits next to this file (sys.path[0]); keep it warm as well
+    _preload("harness," + os.environ.get("ZYGOTE_PRELOAD", ""))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    os.makedirs(os.path.dirname(SOCKET_PATH), mode=0o700, exist_ok=True)
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    os.chmod(SOCKET_PATH, 0o600)
+    server.listen(8)
+    server.settimeout(5)
+
+    while True:
+        _reap()
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+
+        with conn:
+            conn.settimeout(None)
+            try:
+                try:
+                    request = json.loads(conn.makefile("rb").readline())
+                    response = _handle(conn, request, [server.fileno(), conn.fileno()])
+                except Exception as e:
+                    _send_frame(conn, OUTPUT, f"zygote error: {e}\n".encode("utf-8"))
+                    response = {"exit_code": 1, "reason": None}
+                _send_frame(conn, EXIT, json.dumps(response).encode("utf-8"))
+            except OSError:
+                pass
+
+
+# ── client ──────────────────────────────────────────────────────────────
+
+
+def run(script, timeout, max_output=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    deadline = time.monotonic() + CONNECT_TIMEOUT_SECONDS
+    while True:
+        try:
+            sock.connect(SOCKET_PATH)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            # The supervisor may still be importing its preload set
+            if time.monotonic() > deadline:
+                print("zygote: supervisor not ready", file=sys.stderr)
+                return 1
+            time.sleep(0.05)
+
+    with sock:
+        request = {"script": script, "timeout": timeout}
+        if max_output is not None:
+            request["max_output"] = max_output
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        frames = sock.makefile("rb")
+        out = sys.stdout.buffer
+        while True:
+            header = frames.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                print("zygote: supervisor closed the connection", file=sys.stderr)
+                return 1
+            kind, length = _FRAME.unpack(header)
+            payload = frames.read(length)
+            if kind == EXIT:
+                response = json.loads(payload)
+                if response.get("reason") in ("timeout", "output_limit"):
+                    print(STATUS_PREFIX + response["reason"], file=sys.stderr, flush=True)
+                return response["exit_code"]
+            out.write(payload)
+            out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="zygote")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve")
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--max-output", type=int, default=None)
+    run_parser.add_argument("script")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve()
+        return 0
+    return run(args.script, args.timeout, args.max_output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
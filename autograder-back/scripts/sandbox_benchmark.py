@@ -0,0 +1,647 @@
+"""
+Phase-by-phase benchmark of the sandbox hot path.
+
+Runs a corpus of representative submissions through the real code, and
+times each phase of every run:
+
+- ``execute_submission``: executor, backend, warm pool, harness and the DB
+  writes. Submissions go to a throwaway SQLite database.
+- the legacy ``services/sandbox.py::Sandbox.execute``: one container per test
+  input.
+
+Nothing is mocked. The Docker client, the containers, the backend's helpers
+and the DB session are wrapped in proxies that time the calls going through
+them:
+
+    client_create     docker.from_env() / Sandbox()
+    db_read           queries (SQLite)
+    db_write          flush and commit (SQLite)
+    executor_wait     from submit to the run starting on the sandbox executor
+    write_inputs      submission.py, tests.jsonl, config.json
+    container_create  create (one-shot or pool overflow) / cgroup setup
+    container_start   start
+    container_update  resizing a pooled container's limits
+    exec_create       exec_create (pool)
+    harness_run       the harness's output stream, first byte to EOF
+    exec_inspect      exit code of a pooled exec
+    wait              wait for exit
+    log_fetch         logs fetched after exit (legacy Sandbox)
+    kill              kill on timeout or output limit
+    reset             the pool's reset exec and health check
+    remove            remove / cgroup cleanup
+
+Phase times are exclusive: a phase nested in another is only counted once.
+``other`` is the rest of a run's wall time: Python glue, result parsing,
+telemetry and lock waits. ``total`` is that wall time.
+
+Usage, from autograder-back with the sandbox image built:
+
+    python scripts/sandbox_benchmark.py --runs 20 --output before.json
+    # ... change something ...
+    python scripts/sandbox_benchmark.py --runs 20 --compare before.json
+
+DB times are SQLite's, not Postgres's. Compare them between reports, not
+with production.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.config import settings
+from app.models import Base, Exercise, Submission, SubmissionStatus, TestCase, User, UserRole
+from app.services.telemetry import summarize
+
+PHASES = (
+    "client_create",
+    "db_read",
+    "db_write",
+    "executor_wait",
+    "write_inputs",
+    "container_create",
+    "container_start",
+    "container_update",
+    "exec_create",
+    "harness_run",
+    "exec_inspect",
+    "wait",
+    "log_fetch",
+    "kill",
+    "reset",
+    "remove",
+)
+
+PATHS = ("execute_submission", "sandbox_execute")
+
+REPORT_VERSION = 1
+
+# Representative submissions: name, code, [test input, expected] pairs and Exercise overrides
+DEFAULT_CORPUS: List[Dict[str, Any]] = [
+    {
+        "name": "trivial",
+        "code": "def add(a, b):\n    return a + b\n",
+        "tests": [["add(1, 2)", "3"], ["add(-1, 1)", "0"], ["add(2, 2)", "4"]],
+    },
+    {
+        "name": "cpu_loop",
+        "code": (
+            "def primes(n):\n"
+            "    found = []\n"
+            "    for k in range(2, n):\n"
+            "        if all(k % p for p in found if p * p <= k):\n"
+            "            found.append(k)\n"
+            "    return len(found)\n"
+        ),
+        "tests": [["primes(20000)", "2262"], ["primes(50000)", "5133"]],
+    },
+    {
+        "name": "numpy_pandas",
+        "code": (
+            "import numpy as np\n"
+            "import pandas as pd\n"
+            "def column_mean(values):\n"
+            "    return float(pd.DataFrame({'v': np.array(values)})['v'].mean())\n"
+        ),
+        "tests": [["column_mean([1, 2, 3])", "2.0"], ["column_mean([4, 4])", "4.0"]],
+    },
+    {
+        "name": "chatty",
+        "code": (
+            "def echo(n):\n"
+            "    for i in range(n):\n"
+            "        print('line', i)\n"
+            "    return n\n"
+        ),
+        "tests": [["echo(2000)", "2000"]],
+    },
+    {
+        "name": "failing",
+        "code": "def add(a, b):\n    return a - b\n",
+        "tests": [["add(1, 2)", "3"], ["add(2, 2)", "4"], ["add(0, 0)", "0"], ["add(5, 1)", "6"]],
+    },
+    {
+        "name": "timeout",
+        "code": "def spin():\n    while True:\n        pass\n",
+        "tests": [["spin()", "None"]],
+        "exercise": {"timeout_seconds": 2},
+    },
+]
+
+
+# ---------------------------------------------------------------------------
+# Phase timing
+# ---------------------------------------------------------------------------
+
+class PhaseTimer:
+    """Exclusive seconds per phase of the run being measured."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sample: Optional[Dict[str, float]] = None
+
+    def start(self) -> None:
+        with self._lock:
+            self._sample = {}
+
+    def stop(self) -> Dict[str, float]:
+        with self._lock:
+            sample, self._sample = self._sample or {}, None
+        return sample
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            if self._sample is not None:
+                self._sample[phase] = self._sample.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the block as `name`, minus the phases nested in it on this thread."""
+        if self._sample is None or getattr(self._local, "muted", False):
+            yield
+            return
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.add(name, elapsed - nested)
+
+    @contextmanager
+    def muted(self):
+        """Do not record this thread's phases (background work off the measured path)."""
+        self._local.muted = True
+        try:
+            yield
+        finally:
+            self._local.muted = False
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        """Time the production of each item, not what the consumer does with it."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+class _Proxy:
+    """Forwards everything not overridden to the wrapped object."""
+
+    def __init__(self, target, timer: PhaseTimer):
+        self._target = target
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class TimedContainer(_Proxy):
+    def start(self, *args, **kwargs):
+        with self._timer.phase("container_start"):
+            return self._target.start(*args, **kwargs)
+
+    def wait(self, *args, **kwargs):
+        with self._timer.phase("wait"):
+            return self._target.wait(*args, **kwargs)
+
+    def logs(self, *args, **kwargs):
+        if kwargs.get("stream"):
+            return self._timer.iterate("harness_run", self._target.logs(*args, **kwargs))
+        with self._timer.phase("log_fetch"):
+            return self._target.logs(*args, **kwargs)
+
+    def kill(self, *args, **kwargs):
+        with self._timer.phase("kill"):
+            return self._target.kill(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        with self._timer.phase("remove"):
+            return self._target.remove(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        with self._timer.phase("container_update"):
+            return self._target.update(*args, **kwargs)
+
+    def exec_run(self, *args, **kwargs):
+        with self._timer.phase("reset"):
+            return self._target.exec_run(*args, **kwargs)
+
+    def reload(self, *args, **kwargs):
+        with self._timer.phase("reset"):
+            return self._target.reload(*args, **kwargs)
+
+
+class TimedContainers(_Proxy):
+    def create(self, *args, **kwargs):
+        with self._timer.phase("container_create"):
+            return TimedContainer(self._target.create(*args, **kwargs), self._timer)
+
+    def run(self, image, command=None, **kwargs):
+        """`run(detach=True)`, split into its create and start."""
+        if not kwargs.pop("detach", False):
+            raise ValueError("the benchmark only times detached runs")
+        container = self.create(image, command=command, **kwargs)
+        container.start()
+        return container
+
+    def get(self, *args, **kwargs):
+        return TimedContainer(self._target.get(*args, **kwargs), self._timer)
+
+
+class TimedAPI(_Proxy):
+    def exec_create(self, *args, **kwargs):
+        with self._timer.phase("exec_create"):
+            return self._target.exec_create(*args, **kwargs)
+
+    def exec_start(self, *args, **kwargs):
+        if kwargs.get("stream"):
+            return self._timer.iterate("harness_run", self._target.exec_start(*args, **kwargs))
+        with self._timer.phase("harness_run"):
+            return self._target.exec_start(*args, **kwargs)
+
+    def exec_inspect(self, *args, **kwargs):
+        with self._timer.phase("exec_inspect"):
+            return self._target.exec_inspect(*args, **kwargs)
+
+
+class TimedDockerClient(_Proxy):
+    def __init__(self, target, timer: PhaseTimer):
+        super().__init__(target, timer)
+        self.containers = TimedContainers(target.containers, timer)
+        self.api = TimedAPI(target.api, timer)
+
+
+class TimedExecutor(_Proxy):
+    """Records how long each job waited on the sandbox executor."""
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def run(*args, **kwargs):
+            self._timer.add("executor_wait", time.perf_counter() - submitted)
+            return fn(*args, **kwargs)
+
+        return self._target.submit(run, *args, **kwargs)
+
+
+def timed_session_factory(engine, timer: PhaseTimer) -> sessionmaker:
+    class TimedSession(Session):
+        def execute(self, *args, **kwargs):
+            with timer.phase("db_read"):
+                return super().execute(*args, **kwargs)
+
+        def flush(self, objects=None):
+            with timer.phase("db_write"):
+                super().flush(objects)
+
+        def commit(self):
+            with timer.phase("db_write"):
+                super().commit()
+
+    return sessionmaker(bind=engine, class_=TimedSession, autocommit=False, autoflush=False)
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+def _sample(timer: PhaseTimer, started: float) -> Dict[str, float]:
+    """The run's phases, `other` and `total`, in milliseconds."""
+    total = time.perf_counter() - started
+    phases = timer.stop()
+    sample = {phase: seconds * 1000 for phase, seconds in phases.items()}
+    sample["other"] = max(0.0, (total - sum(phases.values())) * 1000)
+    sample["total"] = total * 1000
+    return sample
+
+
+def _seed_exercise(db: Session, author_id: int, case: Dict[str, Any]) -> Exercise:
+    exercise = Exercise(
+        title=f"benchmark: {case['name']}",
+        description="Sandbox benchmark",
+        created_by=author_id,
+        llm_grading_enabled=False,
+        **case.get("exercise", {}),
+    )
+    db.add(exercise)
+    db.flush()
+    for index, (test_input, expected) in enumerate(case["tests"]):
+        db.add(TestCase(
+            exercise_id=exercise.id, name=f"test_{index}", input_data=test_input, expected_output=expected,
+        ))
+    db.commit()
+    return exercise
+
+
+def bench_execute_submission(
+    corpus: List[Dict[str, Any]],
+    runs: int,
+    warmup: int,
+    timer: PhaseTimer,
+    docker_factory: Callable[[], Any],
+) -> Dict[str, List[Dict[str, float]]]:
+    """Samples of `execute_submission` per corpus case."""
+    from app import tasks
+    from app.services.sandbox_backends import SubprocessBackend
+    from app.services.sandbox_pool import SandboxPool, get_sandbox_pool, shutdown_sandbox_pool
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session_factory = timed_session_factory(engine, timer)
+
+    def get_docker_client():
+        with timer.phase("client_create"):
+            return TimedDockerClient(docker_factory(), timer)
+
+    def replenish(pool):
+        with timer.muted():  # off the hot path
+            original_replenish(pool)
+
+    original_replenish = SandboxPool._replenish
+    real_executor = tasks.get_sandbox_executor
+    samples: Dict[str, List[Dict[str, float]]] = {}
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(tasks, "SessionLocal", session_factory))
+        stack.enter_context(patch.object(tasks, "get_docker_client", get_docker_client))
+        stack.enter_context(patch.object(
+            tasks, "get_sandbox_executor", lambda: TimedExecutor(real_executor(), timer),
+        ))
+        stack.enter_context(patch.object(
+            tasks, "write_harness_inputs", timer.timed("write_inputs", tasks.write_harness_inputs),
+        ))
+        stack.enter_context(patch.object(SandboxPool, "_replenish", replenish))
+        for method, phase in (
+            ("_create_cgroup", "container_create"), ("_run", "harness_run"), ("_remove_cgroup", "remove"),
+        ):
+            stack.enter_context(patch.object(
+                SubprocessBackend, method, timer.timed(phase, getattr(SubprocessBackend, method)),
+            ))
+
+        # A pool left by an earlier caller would hold an untimed client
+        shutdown_sandbox_pool()
+        stack.callback(shutdown_sandbox_pool)
+        if settings.sandbox_backend == "docker" and settings.sandbox_pool_size > 0:
+            get_sandbox_pool(TimedDockerClient(docker_factory(), timer))
+
+        db = session_factory()
+        try:
+            author = User(email="sandbox-benchmark@localhost", password_hash="-", role=UserRole.PROFESSOR)
+            db.add(author)
+            db.commit()
+            for case in corpus:
+                exercise = _seed_exercise(db, author.id, case)
+                content_hash = hashlib.sha256(case["code"].encode("utf-8")).hexdigest()
+                samples[case["name"]] = []
+                for run in range(warmup + runs):
+                    submission = Submission(
+                        exercise_id=exercise.id, student_id=author.id, code=case["code"],
+                        content_hash=content_hash, status=SubmissionStatus.QUEUED,
+                    )
+                    db.add(submission)
+                    db.commit()
+
+                    timer.start()
+                    started = time.perf_counter()
+                    result = tasks.execute_submission.run(submission.id)
+                    sample = _sample(timer, started)
+                    if run >= warmup:
+                        sample["error"] = 1.0 if "error" in result else 0.0
+                        samples[case["name"]].append(sample)
+        finally:
+            db.close()
+            engine.dispose()
+    return samples
+
+
+def bench_sandbox_execute(
+    corpus: List[Dict[str, Any]],
+    runs: int,
+    warmup: int,
+    timer: PhaseTimer,
+    docker_factory: Callable[[], Any],
+) -> Dict[str, List[Dict[str, float]]]:
+    """Samples of the legacy `Sandbox.execute` per corpus case, every test input in turn."""
+    from services.sandbox import Sandbox
+
+    samples: Dict[str, List[Dict[str, float]]] = {}
+    with patch.object(Sandbox, "_get_docker_client", lambda self: docker_factory()):
+        for case in corpus:
+            samples[case["name"]] = []
+            for run in range(warmup + runs):
+                timer.start()
+                started = time.perf_counter()
+                with timer.phase("client_create"):
+                    sandbox = Sandbox()
+                sandbox.client = TimedDockerClient(sandbox.client, timer)
+                errors = 0
+                for test_input, _ in case["tests"]:
+                    result = sandbox.execute(case["code"], test_input)
+                    errors += result.error is not None and result.exit_code < 0
+                sample = _sample(timer, started)
+                if run >= warmup:
+                    sample["error"] = float(errors > 0)
+                    samples[case["name"]].append(sample)
+    return samples
+
+
+# ---------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------
+
+def summarize_samples(samples: List[Dict[str, float]]) -> Dict[str, Any]:
+    """Per-phase mean and percentiles (ms) of a case's samples, and its error count."""
+    phases = {}
+    for phase in PHASES + ("other", "total"):
+        values = [s.get(phase, 0.0) for s in samples]
+        if not any(values) and phase not in ("other", "total"):
+            continue
+        phases[phase] = {**summarize(values), "mean": sum(values) / len(values) if values else None}
+    return {"runs": len(samples), "errors": int(sum(s.get("error", 0) for s in samples)), "phases": phases}
+
+
+def build_report(results: Dict[str, Dict[str, List[Dict[str, float]]]], meta: Dict[str, Any]) -> Dict[str, Any]:
+    """The JSON report: per path, a summary per case and one over all cases (`all`)."""
+    paths = {}
+    for path, cases in results.items():
+        summary = {name: summarize_samples(samples) for name, samples in cases.items()}
+        summary["all"] = summarize_samples([s for samples in cases.values() for s in samples])
+        paths[path] = summary
+    return {"version": REPORT_VERSION, "meta": meta, "paths": paths}
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def format_report(report: Dict[str, Any], case: str = "all") -> str:
+    lines = []
+    for path, cases in report["paths"].items():
+        summary = cases.get(case)
+        if not summary:
+            continue
+        lines.append(f"{path} [{case}] runs={summary['runs']} errors={summary['errors']}")
+        lines.append(f"  {'phase':<17}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+        for phase, stats in summary["phases"].items():
+            lines.append(
+                f"  {phase:<17}{_ms(stats['mean']):>10}{_ms(stats['p50']):>10}"
+                f"{_ms(stats['p95']):>10}{_ms(stats['max']):>10}"
+            )
+    return "\n".join(lines)
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any], stat: str = "p50") -> List[Dict[str, Any]]:
+    """`stat` of every phase present in both reports, with the change in ms and %."""
+    rows = []
+    for path, cases in current["paths"].items():
+        for case, summary in cases.items():
+            before_phases = baseline["paths"].get(path, {}).get(case, {}).get("phases", {})
+            for phase, stats in summary["phases"].items():
+                before = before_phases.get(phase, {}).get(stat)
+                after = stats.get(stat)
+                if before is None or after is None:
+                    continue
+                rows.append({
+                    "path": path,
+                    "case": case,
+                    "phase": phase,
+                    "before": before,
+                    "after": after,
+                    "delta": after - before,
+                    "delta_pct": (after - before) / before * 100 if before else None,
+                })
+    return rows
+
+
+def format_comparison(rows: List[Dict[str, Any]], stat: str = "p50") -> str:
+    lines = [f"{'path':<20}{'case':<14}{'phase':<17}{stat + ' before':>12}{stat + ' after':>12}{'delta':>10}{'%':>8}"]
+    for row in rows:
+        pct = "-" if row["delta_pct"] is None else f"{row['delta_pct']:+.0f}%"
+        lines.append(
+            f"{row['path']:<20}{row['case']:<14}{row['phase']:<17}{_ms(row['before']):>12}"
+            f"{_ms(row['after']):>12}{row['delta']:>+10.1f}{pct:>8}"
+        )
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def run_benchmark(
+    corpus: List[Dict[str, Any]],
+    paths: Iterable[str] = PATHS,
+    runs: int = 10,
+    warmup: int = 1,
+    docker_factory: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Any]:
+    """Benchmark `paths` over `corpus` with the current settings; returns the report."""
+    if docker_factory is None:
+        from app.tasks import get_docker_client as docker_factory
+
+    timer = PhaseTimer()
+    results = {}
+    # Every run must reach the sandbox, and nothing outside this process
+    with patch.object(settings, "test_result_cache_enabled", False), \
+            patch.object(settings, "singleflight_enabled", False):
+        for path in paths:
+            if path == "execute_submission":
+                results[path] = bench_execute_submission(corpus, runs, warmup, timer, docker_factory)
+            elif path == "sandbox_execute":
+                results[path] = bench_sandbox_execute(corpus, runs, warmup, timer, docker_factory)
+            else:
+                raise ValueError(f"Unknown benchmark path: {path}")
+
+    meta = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "backend": settings.sandbox_backend,
+        "pool_size": settings.sandbox_pool_size,
+        "zygote": settings.sandbox_zygote_enabled,
+        "runs": runs,
+        "warmup": warmup,
+        "cases": [case["name"] for case in corpus],
+    }
+    return build_report(results, meta)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--path", choices=PATHS, action="append", help="code path(s) to run (default: both)")
+    parser.add_argument("--runs", type=int, default=10, help="measured runs per case")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs per case first")
+    parser.add_argument("--corpus", help="JSON list of cases shaped like DEFAULT_CORPUS")
+    parser.add_argument("--case", action="append", help="only these corpus cases")
+    parser.add_argument("--backend", choices=("docker", "subprocess"), default=settings.sandbox_backend)
+    parser.add_argument("--pool-size", type=int, default=settings.sandbox_pool_size)
+    parser.add_argument("--zygote", action=argparse.BooleanOptionalAction, default=settings.sandbox_zygote_enabled)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--stat", default="p50", choices=("mean", "p50", "p90", "p95", "p99", "max"))
+    args = parser.parse_args(argv)
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = json.load(f)
+    if args.case:
+        corpus = [case for case in corpus if case["name"] in args.case]
+    paths = args.path or list(PATHS)
+    if args.backend != "docker" and "sandbox_execute" in paths:
+        # Sandbox.execute always runs a container
+        paths.remove("sandbox_execute")
+
+    with patch.object(settings, "sandbox_backend", args.backend), \
+            patch.object(settings, "sandbox_pool_size", args.pool_size), \
+            patch.object(settings, "sandbox_zygote_enabled", args.zygote):
+        report = run_benchmark(corpus, paths, runs=args.runs, warmup=args.warmup)
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.compare} ({baseline['meta'].get('created_at')}):")
+        print(format_comparison(compare_reports(baseline, report, args.stat), args.stat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
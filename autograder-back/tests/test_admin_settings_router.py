@@ -103,6 +103,19 @@ class TestUpdateSettings:
         assert response.status_code == 200
         assert row.openai_api_key_encrypted is None
 
+    @patch("app.routers.admin_settings.invalidate_llm_clients")
+    @patch("app.routers.admin_settings.decrypt_value", return_value="")
+    @patch("app.routers.admin_settings.encrypt_value", return_value="new-encrypted")
+    def test_key_change_invalidates_llm_clients(self, _encrypt, _decrypt, mock_invalidate, client_with_admin):
+        client, mock_db, _ = client_with_admin
+        mock_db.query.return_value.first.return_value = Mock(spec=SystemSettings)
+
+        client.put("/admin/settings", json={})
+        mock_invalidate.assert_not_called()
+
+        client.put("/admin/settings", json={"anthropic_api_key": "sk-ant-new"})
+        mock_invalidate.assert_called_once()
+
     def test_update_forbidden_for_professor(self, client_with_professor):
         client, _, _ = client_with_professor
         response = client.put("/admin/settings", json={"openai_api_key": "sk-test"})
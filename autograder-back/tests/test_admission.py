@@ -0,0 +1,169 @@
+"""Tests for admission control on new submissions."""
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+import redis
+
+from app.models.exercise import Exercise, GradingMode, SubmissionType
+from app.services.admission import (
+    Rejection,
+    admit_submission,
+    estimated_wait,
+    queue_depth,
+    record_run_seconds,
+    sandbox_slots,
+    take_tokens,
+)
+from app.services.priority import BULK, DEADLINE, INTERACTIVE
+
+
+@pytest.fixture
+def limits():
+    with patch("app.services.admission.settings") as mock_settings:
+        mock_settings.admission_enabled = True
+        mock_settings.admission_max_wait_seconds = 600
+        mock_settings.admission_sandbox_slots = 4
+        mock_settings.admission_default_run_seconds = 5.0
+        mock_settings.admission_student_per_minute = 6.0
+        mock_settings.admission_student_burst = 2
+        mock_settings.admission_class_per_minute = 60.0
+        mock_settings.admission_class_burst = 100
+        yield mock_settings
+
+
+class TestQueueDepth:
+    def test_counts_lanes_at_or_ahead_of_the_priority(self):
+        conn = MagicMock()
+        channel = conn.__enter__.return_value.default_channel
+        channel.sep = ":"
+        pipe = channel.client.pipeline.return_value
+        pipe.execute.return_value = [3, 40]
+
+        with patch("app.services.admission.celery_app") as mock_celery:
+            mock_celery.pool.acquire.return_value = conn
+            assert queue_depth("sandbox", INTERACTIVE) == 43
+
+        assert [c.args[0] for c in pipe.llen.call_args_list] == ["sandbox", "sandbox:3"]
+
+    def test_wait_is_backlog_over_slots(self, limits):
+        with patch("app.services.admission.queue_depth", return_value=10), \
+             patch("app.services.admission.average_run_seconds", return_value=6.0), \
+             patch("app.services.admission.sandbox_slots", return_value=4):
+            assert estimated_wait(BULK) == 15  # 10 runs x 6 s over 4 slots
+
+
+    def test_run_time_is_folded_in_by_one_script(self, limits):
+        client = MagicMock()
+        with patch("app.services.admission.get_redis_client", return_value=client):
+            record_run_seconds(12.0)
+
+        client.get.assert_not_called()
+        client.set.assert_not_called()
+        assert client.eval.call_args.args[1:] == (1, "admission:run_seconds", 12.0, 0.1, 5.0)
+
+
+class TestSandboxSlots:
+    @pytest.fixture(autouse=True)
+    def fresh(self):
+        with patch.dict("app.services.admission._slots", {"capacity": 0, "expires": 0.0}):
+            yield
+
+    def test_capacity_comes_from_executor_heartbeats(self, limits):
+        with patch("app.services.admission.get_executor_stats", return_value={"capacity": 12}) as stats:
+            assert sandbox_slots() == 12
+            assert sandbox_slots() == 12
+        stats.assert_called_once()  # cached for a heartbeat period
+
+    def test_falls_back_to_setting_without_live_executors(self, limits):
+        with patch("app.services.admission.get_executor_stats", return_value={"capacity": 0}):
+            assert sandbox_slots() == 4
+
+
+class TestTokenBuckets:
+    def test_student_and_class_buckets_are_debited_together(self, limits):
+        client = MagicMock()
+        client.eval.return_value = 0
+        with patch("app.services.admission.get_redis_client", return_value=client):
+            assert take_tokens(7, 3) == 0
+
+        _, numkeys, *rest = client.eval.call_args.args
+        assert numkeys == 2
+        assert rest[:2] == ["admission:bucket:student:7", "admission:bucket:class:3"]
+        assert rest[3:] == [0.1, 2, 1.0, 100]
+
+    def test_wait_is_rounded_up_to_seconds(self, limits):
+        client = MagicMock()
+        client.eval.return_value = 8500
+        with patch("app.services.admission.get_redis_client", return_value=client):
+            assert take_tokens(7, None) == 9
+        assert client.eval.call_args.args[1] == 1
+
+
+class TestAdmitSubmission:
+    def test_admits_when_idle(self, limits):
+        with patch("app.services.admission.estimated_wait", return_value=30), \
+             patch("app.services.admission.student_class_id", return_value=3), \
+             patch("app.services.admission.take_tokens", return_value=0):
+            assert admit_submission(MagicMock(), 1, 7, INTERACTIVE) is None
+
+    def test_saturated_queue(self, limits):
+        with patch("app.services.admission.estimated_wait", return_value=900), \
+             patch("app.services.admission.take_tokens") as mock_take:
+            rejection = admit_submission(MagicMock(), 1, 7, INTERACTIVE)
+
+        assert rejection.retry_after == 300
+        assert rejection.estimated_wait == 900
+        mock_take.assert_not_called()  # a refused submission spends no tokens
+
+    def test_deadline_lane_only_counts_its_own_backlog(self, limits):
+        with patch("app.services.admission.estimated_wait", side_effect=lambda p: 60 if p == DEADLINE else 900), \
+             patch("app.services.admission.student_class_id", return_value=None), \
+             patch("app.services.admission.take_tokens", return_value=0):
+            assert admit_submission(MagicMock(), 1, 7, DEADLINE) is None
+            assert admit_submission(MagicMock(), 1, 7, INTERACTIVE) is not None
+
+    def test_llm_first_skips_the_sandbox_backlog(self, limits):
+        with patch("app.services.admission.estimated_wait") as mock_wait, \
+             patch("app.services.admission.student_class_id", return_value=None), \
+             patch("app.services.admission.take_tokens", return_value=0):
+            assert admit_submission(MagicMock(), 1, 7, INTERACTIVE, sandboxed=False) is None
+        mock_wait.assert_not_called()
+
+    def test_rate_limited(self, limits):
+        with patch("app.services.admission.estimated_wait", return_value=30), \
+             patch("app.services.admission.student_class_id", return_value=3), \
+             patch("app.services.admission.take_tokens", return_value=12):
+            rejection = admit_submission(MagicMock(), 1, 7, INTERACTIVE)
+        assert rejection.retry_after == 12
+
+    def test_fails_open(self, limits):
+        with patch("app.services.admission.estimated_wait", side_effect=OSError("broker down")), \
+             patch("app.services.admission.student_class_id", return_value=3), \
+             patch("app.services.admission.take_tokens", side_effect=redis.ConnectionError("down")):
+            assert admit_submission(MagicMock(), 1, 7, INTERACTIVE) is None
+
+
+class TestSubmissionEndpoint:
+    def test_returns_429_with_retry_after(self, client_with_student):
+        client, mock_db, _ = client_with_student
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.submission_type = SubmissionType.CODE
+        exercise.grading_mode = GradingMode.TEST_FIRST
+        exercise.max_submissions = None
+        exercise.precheck_enabled = False
+        mock_db.query.return_value.filter.return_value.first.return_value = exercise
+        rejection = Rejection(reason="Grading is saturated", retry_after=120, estimated_wait=720)
+
+        with patch("app.routers.submissions.check_deadline", return_value=None), \
+             patch("app.routers.submissions.submission_priority", return_value=INTERACTIVE), \
+             patch("app.routers.submissions.admit_submission", return_value=rejection), \
+             patch("app.routers.submissions.celery_app") as mock_celery:
+            response = client.post("/submissions", data={"exercise_id": "1", "code": "x = 1\n"})
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "120"
+        assert response.headers["X-Estimated-Wait"] == "720"
+        assert response.json()["detail"] == "Grading is saturated"
+        mock_db.add.assert_not_called()
+        mock_celery.send_task.assert_not_called()
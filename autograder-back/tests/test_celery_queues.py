@@ -0,0 +1,93 @@
+"""Tests for per-workload Celery queue routing."""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.celery_app import celery_app
+
+
+@pytest.mark.parametrize("task_name,queue", [
+    ("app.tasks.execute_submission", "sandbox"),
+    ("app.tasks.regrade_chunk", "sandbox"),
+    ("app.tasks.reap_sandbox_containers", "sandbox"),
+    ("app.tasks.llm_evaluate_submission", "llm"),
+    ("app.tasks.grade_llm_first", "llm"),
+    ("sync_hotmart_buyers", "sync"),
+    ("sync_students_full", "sync"),
+    ("app.tasks.process_hotmart_event", "lifecycle"),
+    ("app.tasks.execute_side_effect", "whatsapp_rt"),
+    ("app.tasks.send_bulk_messages", "whatsapp_bulk"),
+])
+def test_task_routes(task_name, queue):
+    route = celery_app.amqp.router.route({}, task_name)
+    assert route["queue"].name == queue
+
+
+def test_every_task_is_routed_or_default():
+    import app.tasks  # noqa: F401  (registers the tasks)
+
+    routes = celery_app.conf.task_routes
+    unrouted = {name for name in celery_app.tasks if not name.startswith("celery.")} - set(routes)
+    assert unrouted == {"app.tasks.health_check"}
+
+
+def _worker(queues, pool_cls):
+    sender = MagicMock()
+    sender.app.amqp.queues.consume_from = {q: MagicMock() for q in queues} if queues else None
+    sender.pool_cls = pool_cls
+    return sender
+
+
+class TestSandboxWarmUp:
+    def test_only_sandbox_workers_warm_containers(self):
+        from app import tasks
+
+        with patch("app.tasks.get_sandbox_pool") as mock_pool, \
+             patch("app.tasks.get_sandbox_executor"), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_backend = "docker"
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.sandbox_reaper_enabled = False
+            try:
+                tasks._detect_sandbox_worker(sender=_worker(["llm"], "prefork"))
+                tasks._warm_sandbox_pool()
+                mock_pool.assert_not_called()
+
+                tasks._detect_sandbox_worker(sender=_worker(["sandbox"], "prefork"))
+                mock_pool.assert_not_called()  # prefork children warm in worker_process_init
+                tasks._warm_sandbox_pool()
+                mock_pool.assert_called_once()
+            finally:
+                tasks._serves_sandbox = True
+
+    def test_thread_pool_warms_in_main_process(self):
+        from app import tasks
+
+        with patch("app.tasks.get_sandbox_pool") as mock_pool, \
+             patch("app.tasks.get_sandbox_executor"), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_backend = "docker"
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.sandbox_reaper_enabled = False
+            tasks._detect_sandbox_worker(sender=_worker(["sandbox"], "threads"))
+
+        mock_pool.assert_called_once()
+
+
+def test_sandbox_workers_start_the_reaper():
+    from app import tasks
+
+    with patch("app.tasks.threading.Thread") as mock_thread, \
+         patch("app.tasks.settings") as mock_settings:
+        mock_settings.sandbox_backend = "docker"
+        mock_settings.sandbox_reaper_enabled = True
+        try:
+            tasks._detect_sandbox_worker(sender=_worker(["llm"], "prefork"))
+            mock_thread.assert_not_called()
+            tasks._detect_sandbox_worker(sender=_worker(["sandbox"], "prefork"))
+        finally:
+            tasks._serves_sandbox = True
+
+    mock_thread.assert_called_once_with(target=tasks._reaper_loop, name="sandbox-reaper", daemon=True)
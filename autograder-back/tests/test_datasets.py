@@ -0,0 +1,89 @@
+"""Tests for exercise dataset storage and upload-time conversion."""
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from openpyxl import Workbook
+
+from app.services import datasets
+from app.services.datasets import convert_dataset, dataset_fingerprint, safe_filename, sandbox_data_dir
+
+
+@pytest.fixture
+def datasets_dir(tmp_path):
+    with patch.object(datasets, "DATASETS_DIR", tmp_path):
+        yield tmp_path
+
+
+class TestConvertDataset:
+    def test_csv_becomes_memory_mappable_structured_array(self, tmp_path):
+        path = tmp_path / "sales.csv"
+        path.write_text("region,units,price\nnorth,3,1.5\nsouth,4,\n", encoding="utf-8")
+
+        written = convert_dataset(path)
+
+        assert written == [tmp_path / "sales.npy"]
+        array = np.load(written[0], mmap_mode="r")
+        assert isinstance(array, np.memmap)
+        assert array.dtype.names == ("region", "units", "price")
+        assert list(array["region"]) == ["north", "south"]
+        assert array["units"].dtype == np.int64
+        assert array["price"][0] == 1.5
+        assert np.isnan(array["price"][1])
+
+    def test_xlsx_writes_one_file_per_sheet(self, tmp_path):
+        wb = Workbook()
+        wb.active.title = "a"
+        wb.active.append(["x", "y"])
+        wb.active.append([1, 2.5])
+        second = wb.create_sheet("b")
+        second.append(["name"])
+        second.append(["ana"])
+        path = tmp_path / "book.xlsx"
+        wb.save(path)
+
+        written = convert_dataset(path)
+
+        assert sorted(p.name for p in written) == ["book_a.npy", "book_b.npy"]
+        assert np.load(tmp_path / "book_a.npy")["y"][0] == 2.5
+
+    def test_other_formats_are_left_alone(self, tmp_path):
+        path = tmp_path / "notes.txt"
+        path.write_text("hello")
+
+        assert convert_dataset(path) == []
+
+    def test_unreadable_file_is_kept_without_conversion(self, tmp_path):
+        path = tmp_path / "broken.xlsx"
+        path.write_bytes(b"not a workbook")
+
+        assert convert_dataset(path) == []
+        assert path.exists()
+
+
+class TestLayout:
+    def test_safe_filename_strips_paths_and_odd_characters(self):
+        assert safe_filename("../../etc/my data (1).csv") == "my_data_1_.csv"
+
+    def test_safe_filename_rejects_empty_names(self):
+        with pytest.raises(ValueError):
+            safe_filename("..")
+
+    def test_sandbox_data_dir_only_when_files_exist(self, datasets_dir):
+        assert sandbox_data_dir(7) is None
+
+        (datasets_dir / "exercise_7").mkdir()
+        assert sandbox_data_dir(7) is None
+
+        (datasets_dir / "exercise_7" / "d.csv").write_text("a\n1\n")
+        assert sandbox_data_dir(7) == "/datasets/exercise_7"
+
+    def test_fingerprint_changes_when_a_dataset_is_replaced(self, datasets_dir):
+        (datasets_dir / "exercise_7").mkdir()
+        path = datasets_dir / "exercise_7" / "d.csv"
+        path.write_text("a\n1\n")
+        before = dataset_fingerprint(7)
+
+        path.write_text("a\n1\n2\n")
+
+        assert dataset_fingerprint(7) != before
@@ -0,0 +1,547 @@
+"""Tests for the execute_submission Celery task."""
+import json
+from concurrent.futures import Future
+import pytest
+from unittest.mock import Mock, MagicMock, patch
+
+from app.models.submission import Submission, SubmissionStatus, TestResult, Grade
+from app.models.exercise import Exercise, TestCase
+
+
+def _mock_test_case(name, input_data, expected):
+    tc = Mock(spec=TestCase)
+    tc.name = name
+    tc.input_data = input_data
+    tc.expected_output = expected
+    return tc
+
+
+@pytest.fixture
+def submission():
+    s = Mock(spec=Submission)
+    s.id = 1
+    s.exercise_id = 1
+    s.code = "def add(a, b):\n    return a + b"
+    s.content_hash = "abc123"
+    s.status = SubmissionStatus.QUEUED
+    return s
+
+
+@pytest.fixture
+def exercise():
+    e = Mock(spec=Exercise)
+    e.id = 1
+    e.has_tests = True
+    e.llm_grading_enabled = False
+    e.timeout_seconds = 30
+    e.memory_limit_mb = 512
+    e.max_output_kb = 1024
+    e.test_timeout_seconds = None
+    e.cpu_limit = 1
+    return e
+
+
+@pytest.fixture
+def test_cases():
+    return [
+        _mock_test_case("t1", "add(1, 2)", "3"),
+        _mock_test_case("t2", "add(2, 2)", "4"),
+    ]
+
+
+def _setup_db(submission, exercise, test_cases):
+    db = MagicMock()
+
+    def query_side_effect(model):
+        q = MagicMock()
+        q.filter.return_value = q
+        q.first.return_value = None
+        q.all.return_value = []
+        if model is Submission:
+            q.first.return_value = submission
+        elif model is Exercise:
+            q.first.return_value = exercise
+        elif model is TestCase:
+            q.all.return_value = test_cases
+        return q
+
+    db.query.side_effect = query_side_effect
+    return db
+
+
+def _added(db, model):
+    return [c.args[0] for c in db.add.call_args_list if isinstance(c.args[0], model)]
+
+
+NONCE = "5eed"
+
+RESULT_LINES = [
+    json.dumps({"index": 0, "name": "t1", "passed": True, "message": "Test passed", "stdout": "", "stderr": "",
+                "duration_ms": 3, "nonce": NONCE}),
+    json.dumps({"index": 1, "name": "t2", "passed": False, "message": "Expected: 4, Got: 5", "stdout": "",
+                "stderr": "", "duration_ms": 5, "nonce": NONCE}),
+    json.dumps({"telemetry": {"cpu_time_ms": 40, "peak_memory_kb": 20480}, "nonce": NONCE}),
+]
+HARNESS_OUTPUT = "\n".join(RESULT_LINES) + "\n"
+
+
+@pytest.fixture(autouse=True)
+def run_nonce():
+    """The nonce HarnessResults expects on the harness's lines."""
+    with patch("app.tasks.secrets.token_hex", return_value=NONCE):
+        yield NONCE
+
+
+def _streams(lines, exit_code=0, exc=None):
+    """pool.execute side effect that feeds `lines` to the line callback, then returns or raises."""
+    def execute(slot, script, timeout, max_output, on_line=None):
+        for line in lines:
+            on_line(line.encode())
+        if exc is not None:
+            raise exc
+        return exit_code, "".join(line + "\n" for line in lines).encode()
+    return execute
+
+
+class TestExecuteSubmissionPooled:
+    def test_runs_in_warm_container(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        slot = MagicMock()
+        pool.acquire.return_value = slot
+        pool.execute.side_effect = _streams(RESULT_LINES)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["status"] == "completed"
+        assert result["test_score"] == 50.0
+        pool.acquire.assert_called_once_with(512, 1)
+        pool.release.assert_called_once_with(slot, healthy=True)
+        assert pool.execute.call_args.args[1] == "/opt/autograder/run_harness.py"
+        assert len(_added(db, TestResult)) == 2
+        assert _added(db, Grade)[0].test_score == 50.0
+        assert submission.status == SubmissionStatus.COMPLETED
+
+    def test_records_resource_telemetry(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.run(1)
+
+        assert submission.exit_reason == "completed"
+        assert submission.cpu_time_ms == 40
+        assert submission.peak_memory_kb == 20480
+        assert isinstance(submission.wall_time_ms, int)
+        assert [tr.duration_ms for tr in _added(db, TestResult)] == [3, 5]
+
+    def test_sandbox_runs_through_executor(self, submission, exercise, test_cases):
+        from app.services.sandbox_executor import SandboxExecutor
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES)
+        executor = SandboxExecutor(capacity=1, publish=False)
+
+        try:
+            with patch("app.tasks.SessionLocal", return_value=db), \
+                 patch("app.tasks.get_docker_client"), \
+                 patch("app.tasks.get_sandbox_pool", return_value=pool), \
+                 patch("app.tasks.get_sandbox_executor", return_value=executor), \
+                 patch("app.tasks.settings") as mock_settings:
+                mock_settings.sandbox_pool_size = 2
+                mock_settings.test_result_cache_enabled = False
+                from app.tasks import execute_submission
+                result = execute_submission.run(1)
+        finally:
+            executor.shutdown()
+
+        assert result["status"] == "completed"
+        assert executor.stats()["completed"] == 1
+
+    def test_run_is_queued_in_the_task_lane(self, submission, exercise, test_cases):
+        from app.services.priority import DEADLINE
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES)
+        executor = MagicMock()
+
+        def submit(fn, *args, resources, priority, **kwargs):
+            future = Future()
+            future.set_result(fn(*args, **kwargs))
+            return future
+
+        executor.submit.side_effect = submit
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.get_sandbox_executor", return_value=executor), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.push_request(delivery_info={"priority": DEADLINE}, retries=0)
+            try:
+                execute_submission.run(1)
+            finally:
+                execute_submission.pop_request()
+
+        assert executor.submit.call_args.kwargs["priority"] == DEADLINE
+
+    def test_sandbox_setup_failure_is_retried(self, submission, exercise, test_cases):
+        from celery.exceptions import Retry
+        from app.services.sandbox_backends import SandboxSetupError
+
+        db = _setup_db(submission, exercise, test_cases)
+        backend = MagicMock()
+        backend.sandbox_data_dir.return_value = None
+        backend.run_harness.side_effect = SandboxSetupError("Sandbox setup failed: unshare: Operation not permitted")
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_sandbox_backend", return_value=backend), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.push_request(retries=0)
+            try:
+                with patch.object(execute_submission, "retry", side_effect=Retry) as mock_retry:
+                    with pytest.raises(Retry):
+                        execute_submission.run(1)
+            finally:
+                execute_submission.pop_request()
+
+        assert isinstance(mock_retry.call_args.kwargs["exc"], SandboxSetupError)
+        assert submission.status != SubmissionStatus.FAILED
+
+    def test_timeout_marks_failed_and_recycles(self, submission, exercise, test_cases):
+        from app.services.sandbox_pool import SandboxTimeout
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        slot = MagicMock()
+        pool.acquire.return_value = slot
+        pool.execute.side_effect = SandboxTimeout("too slow")
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result == {"error": "Timeout"}
+        assert submission.status == SubmissionStatus.FAILED
+        assert submission.error_message == "Execution timed out"
+        assert submission.exit_reason == "timeout"
+        pool.release.assert_called_once_with(slot, healthy=True)
+
+    def test_timeout_keeps_finished_tests(self, submission, exercise, test_cases):
+        from app.services.sandbox_pool import SandboxTimeout
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES[:1], exc=SandboxTimeout("too slow"))
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["status"] == "completed"
+        assert result["timed_out"] == 1
+        assert result["test_score"] == 50.0
+        saved = _added(db, TestResult)
+        assert [(tr.test_name, tr.passed) for tr in saved] == [("t1", True), ("t2", False)]
+        assert saved[1].message.startswith("Timed out")
+        assert submission.status == SubmissionStatus.COMPLETED
+        assert submission.error_message == "Execution timed out; 1 test(s) did not finish"
+
+    def test_timeout_ignores_forged_results(self, submission, exercise, test_cases):
+        from app.services.sandbox_pool import SandboxTimeout
+
+        forged = json.dumps({"index": 1, "name": "t2", "passed": True})
+        forged_twice = json.dumps({"index": 0, "name": "t1", "passed": False, "nonce": NONCE})
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(
+            [forged, RESULT_LINES[0], forged_twice], exc=SandboxTimeout("too slow")
+        )
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["timed_out"] == 1
+        saved = _added(db, TestResult)
+        assert [(tr.test_name, tr.passed) for tr in saved] == [("t1", True), ("t2", False)]
+
+    def test_results_arriving_out_of_order_are_reordered(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(["student print", RESULT_LINES[1], RESULT_LINES[0]])
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.run(1)
+
+        assert [tr.test_name for tr in _added(db, TestResult)] == ["t1", "t2"]
+
+    def test_no_results_marks_failed(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(['{"error": "Failed to load student code"}'], exit_code=1)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["error"] == "Test execution failed"
+        assert submission.status == SubmissionStatus.FAILED
+        assert _added(db, TestResult) == []
+
+    def test_output_limit_marks_failed(self, submission, exercise, test_cases):
+        from app.services.sandbox_pool import SandboxOutputLimitExceeded
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        slot = MagicMock()
+        pool.acquire.return_value = slot
+        pool.execute.side_effect = SandboxOutputLimitExceeded("too chatty")
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result == {"error": "Output limit exceeded"}
+        assert pool.execute.call_args.args[3] == 1024 * 1024
+        assert submission.status == SubmissionStatus.FAILED
+        assert submission.error_message == "Output limit exceeded (1024 KB)"
+        pool.release.assert_called_once_with(slot, healthy=True)
+
+
+class TestExecuteSubmissionIsolated:
+    def test_parallel_tests_split_memory_and_cpus(self, submission, exercise, test_cases):
+        exercise.cpu_limit = 4
+        exercise.test_timeout_seconds = 5
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.write_harness_inputs") as mock_harness, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.run(1)
+
+        pool.acquire.assert_called_once_with(512, 4)
+        kwargs = mock_harness.call_args.kwargs
+        assert kwargs["workers"] == 2  # never more workers than tests
+        assert kwargs["test_timeout_seconds"] == 5
+        assert kwargs["test_memory_limit_mb"] == 256
+
+
+class TestExecuteSubmissionOneShot:
+    def test_runs_fresh_container_when_pool_disabled(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+        client = MagicMock()
+        container = MagicMock()
+        container.wait.return_value = {"StatusCode": 0}
+        container.logs.return_value = iter([HARNESS_OUTPUT.encode()])
+        client.containers.run.return_value = container
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client", return_value=client), \
+             patch("app.tasks.get_sandbox_pool") as mock_get_pool, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 0
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["status"] == "completed"
+        mock_get_pool.assert_not_called()
+        container.remove.assert_called_once_with(force=True)
+        assert client.containers.run.call_args.kwargs["network_mode"] == "none"
+        assert container.logs.call_args.kwargs["stream"] is True
+        from app.config import settings
+        assert client.containers.run.call_args.args == (settings.docker_image_sandbox,)
+        kwargs = client.containers.run.call_args.kwargs
+        assert kwargs["command"] == ["python", "/opt/autograder/run_harness.py"]
+        assert [v["bind"] for v in kwargs["volumes"].values()] == ["/workspace"]
+        assert kwargs["labels"]["autograder.submission_id"] == str(submission.id)
+        assert kwargs["labels"]["autograder.timeout_seconds"] == str(exercise.timeout_seconds)
+
+    def test_one_shot_mounts_only_this_exercises_datasets(self, submission, exercise, test_cases, tmp_path):
+        (tmp_path / "exercise_1").mkdir()
+        (tmp_path / "exercise_1" / "d.csv").write_text("a\n1\n")
+        db = _setup_db(submission, exercise, test_cases)
+        client = MagicMock()
+        container = MagicMock()
+        container.wait.return_value = {"StatusCode": 0}
+        container.logs.return_value = iter([HARNESS_OUTPUT.encode()])
+        client.containers.run.return_value = container
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client", return_value=client), \
+             patch("app.services.datasets.DATASETS_DIR", tmp_path), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 0
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            execute_submission.run(1)
+
+        volumes = client.containers.run.call_args.kwargs["volumes"]
+        assert volumes[str(tmp_path / "exercise_1")] == {"bind": "/datasets/exercise_1", "mode": "ro"}
+
+    def test_exercise_with_datasets_skips_a_pool_without_them(self, submission, exercise, test_cases, tmp_path):
+        (tmp_path / "exercise_1").mkdir()
+        (tmp_path / "exercise_1" / "d.csv").write_text("a\n1\n")
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.share_datasets = False
+        client = MagicMock()
+        container = MagicMock()
+        container.wait.return_value = {"StatusCode": 0}
+        container.logs.return_value = iter([HARNESS_OUTPUT.encode()])
+        client.containers.run.return_value = container
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client", return_value=client), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.services.datasets.DATASETS_DIR", tmp_path), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["status"] == "completed"
+        pool.acquire.assert_not_called()
+        volumes = client.containers.run.call_args.kwargs["volumes"]
+        assert volumes[str(tmp_path / "exercise_1")] == {"bind": "/datasets/exercise_1", "mode": "ro"}
+
+    def test_output_flood_kills_container(self, submission, exercise, test_cases):
+        exercise.max_output_kb = 16
+        db = _setup_db(submission, exercise, test_cases)
+        client = MagicMock()
+        container = MagicMock()
+        container.logs.return_value = iter([b"spam\n" * 2048] * 10)
+        client.containers.run.return_value = container
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client", return_value=client), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 0
+            mock_settings.test_result_cache_enabled = False
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result == {"error": "Output limit exceeded"}
+        container.kill.assert_called_once()
+        container.remove.assert_called_once_with(force=True)
+        assert submission.status == SubmissionStatus.FAILED
+        assert submission.error_message == "Output limit exceeded (16 KB)"
+        assert _added(db, TestResult) == []
+
+
+class TestExecuteSubmissionCache:
+    def _cached_run(self):
+        run = Mock(spec=Submission)
+        run.id = 99
+        run.test_results = [
+            Mock(spec=TestResult, test_name="t1", passed=True, message="Test passed", stdout="", stderr="",
+                 duration_ms=2),
+            Mock(spec=TestResult, test_name="t2", passed=True, message="Test passed", stdout="", stderr="",
+                 duration_ms=2),
+        ]
+        return run
+
+    def test_hit_reuses_results_without_sandbox(self, submission, exercise, test_cases):
+        db = _setup_db(submission, exercise, test_cases)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client") as mock_docker, \
+             patch("app.tasks.find_cached_run", return_value=self._cached_run()) as mock_find, \
+             patch("app.tasks.record_lookup") as mock_record, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.test_result_cache_enabled = True
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert result["cached"] is True
+        assert result["test_score"] == 100.0
+        mock_docker.assert_not_called()
+        mock_record.assert_called_once_with(1, hit=True)
+        assert mock_find.call_args.args[1:] == ("abc123", submission.test_suite_version, 1)
+        assert submission.exit_reason == "cached"
+        assert [tr.test_name for tr in _added(db, TestResult)] == ["t1", "t2"]
+        assert submission.status == SubmissionStatus.COMPLETED
+
+    def test_miss_runs_sandbox_and_stores_suite_version(self, submission, exercise, test_cases):
+        from app.services.test_result_cache import compute_suite_version
+
+        db = _setup_db(submission, exercise, test_cases)
+        pool = MagicMock()
+        pool.execute.side_effect = _streams(RESULT_LINES)
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_docker_client"), \
+             patch("app.tasks.get_sandbox_pool", return_value=pool), \
+             patch("app.tasks.find_cached_run", return_value=None), \
+             patch("app.tasks.record_lookup") as mock_record, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.sandbox_pool_size = 2
+            mock_settings.test_result_cache_enabled = True
+            from app.tasks import execute_submission
+            result = execute_submission.run(1)
+
+        assert "cached" not in result
+        pool.execute.assert_called_once()
+        mock_record.assert_called_once_with(1, hit=False)
+        assert submission.test_suite_version == compute_suite_version(exercise, test_cases)
@@ -10,6 +10,12 @@ def _add_exercise_defaults(mock_exercise):
     mock_exercise.submission_type = SubmissionType.CODE
     mock_exercise.grading_mode = GradingMode.TEST_FIRST
     mock_exercise.rubric_dimensions = []
+    mock_exercise.max_output_kb = 1024
+    mock_exercise.test_timeout_seconds = None
+    mock_exercise.cpu_limit = 1
+    mock_exercise.precheck_enabled = True
+    mock_exercise.banned_modules = None
+    mock_exercise.max_code_kb = None
 
 
 class TestCreateExercise:
@@ -139,6 +145,107 @@ class TestAddTestCase:
         assert response.status_code == 201
 
 
+class TestTestCacheStats:
+    def test_reports_hit_ratio(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_exercise = Mock(spec=Exercise)
+        mock_exercise.id = 1
+        mock_exercise.created_by = professor.id
+        mock_exercise.timeout_seconds = 30
+        mock_exercise.memory_limit_mb = 512
+        mock_exercise.max_output_kb = 1024
+        mock_exercise.test_timeout_seconds = None
+        mock_exercise.cpu_limit = 1
+        mock_db.query.return_value.filter.return_value.first.return_value = mock_exercise
+        mock_db.query.return_value.filter.return_value.all.return_value = []
+
+        stats = {"hits": 3, "misses": 1, "hit_ratio": 0.75}
+        with patch("app.routers.exercises.get_cache_stats", return_value=stats):
+            response = client.get("/exercises/1/test-cache")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["hit_ratio"] == 0.75
+        assert data["global_hits"] == 3
+        assert len(data["suite_version"]) == 64
+
+    def test_student_forbidden(self, client_with_student):
+        client, mock_db, student = client_with_student
+        response = client.get("/exercises/1/test-cache")
+        assert response.status_code == 403
+
+
+class TestLLMCache:
+    def test_invalidate(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_exercise = Mock(spec=Exercise)
+        mock_exercise.created_by = professor.id
+        mock_db.query.return_value.filter.return_value.first.return_value = mock_exercise
+
+        with patch("app.routers.exercises.llm_eval_cache.invalidate_exercise", return_value=3) as invalidate:
+            response = client.delete("/exercises/1/llm-cache")
+
+        assert response.status_code == 200
+        assert response.json() == {"exercise_id": 1, "invalidated": 3}
+        invalidate.assert_called_once_with(mock_db, 1)
+        mock_db.commit.assert_called_once()
+
+    def test_other_professor_forbidden(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_exercise = Mock(spec=Exercise)
+        mock_exercise.created_by = professor.id + 1
+        mock_db.query.return_value.filter.return_value.first.return_value = mock_exercise
+
+        with patch("app.routers.exercises.llm_eval_cache.invalidate_exercise") as invalidate:
+            response = client.delete("/exercises/1/llm-cache")
+
+        assert response.status_code == 403
+        invalidate.assert_not_called()
+
+
+class TestRubricGradingStats:
+    def test_reports_fallback_ratios(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_exercise = Mock(spec=Exercise)
+        mock_exercise.created_by = professor.id
+        mock_db.query.return_value.filter.return_value.first.return_value = mock_exercise
+
+        stats = {
+            f"{mode}_{field}": value
+            for mode in ("structured", "text")
+            for field, value in (("gradings", 10), ("fallbacks", 1), ("failures", 0), ("fallback_ratio", 0.1))
+        }
+        with patch("app.routers.exercises.get_rubric_stats", return_value=stats):
+            response = client.get("/exercises/1/rubric-grading")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["structured_fallback_ratio"] == 0.1
+        assert data["global_text_fallback_ratio"] == 0.1
+
+
+class TestUploadDataset:
+    def test_keeps_name_and_converts_csv(self, client_with_professor, tmp_path):
+        client, mock_db, professor = client_with_professor
+        mock_exercise = Mock(spec=Exercise)
+        mock_exercise.id = 1
+        mock_exercise.created_by = professor.id
+        mock_db.query.return_value.filter.return_value.first.return_value = mock_exercise
+
+        with patch("app.services.datasets.DATASETS_DIR", tmp_path):
+            response = client.post(
+                "/exercises/1/datasets",
+                files={"file": ("../vendas 2024.csv", b"mes,total\n1,10\n2,20\n", "text/csv")},
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filename"] == "vendas_2024.csv"
+        assert data["file_url"] == "/datasets/exercise_1/vendas_2024.csv"
+        assert data["converted_files"] == ["vendas_2024.npy"]
+        assert (tmp_path / "exercise_1" / "vendas_2024.npy").exists()
+
+
 class TestPublishExercise:
     def test_toggle_publish(self, client_with_professor):
         client, mock_db, professor = client_with_professor
@@ -47,7 +47,7 @@ class TestGradeLLMFirst:
             elif model is RubricDimension:
                 q.filter.return_value.order_by.return_value.all.return_value = rubric_dims
             elif model is LLMEvaluation:
-                q.join.return_value.filter.return_value.first.return_value = cached_eval
+                q.filter.return_value.order_by.return_value.first.return_value = cached_eval
             elif model is RubricScore:
                 q.filter.return_value.all.return_value = cached_scores or []
             return q
@@ -215,6 +215,46 @@ class TestGradeLLMFirst:
         assert result["final_score"] == 75.0
         assert mock_call_llm.call_count == 2
 
+    @patch("app.tasks.record_outcome")
+    @patch("app.tasks._call_llm")
+    @patch("app.tasks.SessionLocal")
+    def test_structured_answer_and_fallback_are_counted(self, MockSessionLocal, mock_call_llm, mock_record):
+        """The rubric's schema goes to the LLM; a corrective call is counted as a fallback."""
+        submission = Mock(spec=Submission)
+        submission.id = 5
+        submission.exercise_id = 1
+        submission.content_hash = "hash5"
+        submission.file_path = None
+        submission.content_type = None
+        submission.code = "code"
+
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.title = "Ex"
+        exercise.description = "Desc"
+        exercise.llm_grading_criteria = None
+
+        dims = [_mock_dim(10, "Quality", 0.5), _mock_dim(11, "Style", 0.5)]
+        MockSessionLocal.return_value = self._setup_db(submission, exercise, dims)
+
+        # First answer leaves a dimension out
+        mock_call_llm.side_effect = [
+            _make_llm_response([{"name": "Quality", "score": 80, "feedback": "ok"}]),
+            _make_llm_response([
+                {"name": "Quality", "score": 80, "feedback": "ok"},
+                {"name": "Style", "score": 60, "feedback": "ok"},
+            ]),
+        ]
+
+        from app.tasks import grade_llm_first
+        with patch("app.tasks.settings.llm_structured_output", True):
+            result = grade_llm_first(5, late_penalty=0.0)
+
+        assert result["final_score"] == 70.0
+        schema = mock_call_llm.call_args.kwargs["schema"]
+        assert schema["properties"]["dimensions"]["items"]["properties"]["name"]["enum"] == ["Quality", "Style"]
+        mock_record.assert_called_once_with(1, "structured", "fallback")
+
     @patch("app.tasks._call_llm")
     @patch("app.tasks.SessionLocal")
     def test_submission_not_found(self, MockSessionLocal, mock_call_llm):
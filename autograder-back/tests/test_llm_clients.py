@@ -0,0 +1,92 @@
+"""Tests for the per-process LLM client registry."""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import llm_clients
+from app.services.llm_clients import cached_api_key, get_llm_client, invalidate_llm_clients
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    llm_clients._keys.clear()
+    llm_clients._clients.clear()
+    yield
+    llm_clients._keys.clear()
+    llm_clients._clients.clear()
+
+
+@pytest.fixture
+def redis():
+    """A Redis holding the key generation."""
+    store = {}
+    client = MagicMock()
+    client.get.side_effect = store.get
+    client.incr.side_effect = lambda key: store.__setitem__(key, store.get(key, 0) + 1)
+    with patch("app.services.llm_clients.get_redis_client", return_value=client):
+        yield client
+
+
+class TestCachedApiKey:
+    def test_resolved_once(self, redis):
+        db = MagicMock()
+        with patch("app.services.llm_clients.get_llm_api_key", return_value="sk-one") as resolve:
+            assert cached_api_key("anthropic", db) == "sk-one"
+            assert cached_api_key("anthropic", db) == "sk-one"
+        resolve.assert_called_once_with("anthropic", db)
+
+    def test_expires(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", side_effect=["sk-one", "sk-two"]), \
+                patch("app.services.llm_clients.time.monotonic", side_effect=[0, 1, 400]):
+            assert cached_api_key("openai", MagicMock()) == "sk-one"
+            assert cached_api_key("openai", MagicMock()) == "sk-one"
+            assert cached_api_key("openai", MagicMock()) == "sk-two"
+
+    def test_key_change_in_another_process(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", side_effect=["sk-one", "sk-two"]):
+            assert cached_api_key("openai", MagicMock()) == "sk-one"
+            redis.incr(llm_clients._GENERATION_KEY)  # the API's invalidate_llm_clients
+            assert cached_api_key("openai", MagicMock()) == "sk-two"
+
+    def test_without_redis_the_cache_still_serves(self):
+        with patch("app.services.llm_clients.get_redis_client", side_effect=ConnectionError), \
+                patch("app.services.llm_clients.get_llm_api_key", return_value="sk-one") as resolve:
+            cached_api_key("openai", MagicMock())
+            cached_api_key("openai", MagicMock())
+        resolve.assert_called_once()
+
+    def test_missing_key_is_not_cached(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", side_effect=[ValueError("no key"), "sk-one"]):
+            with pytest.raises(ValueError):
+                cached_api_key("anthropic", MagicMock())
+            assert cached_api_key("anthropic", MagicMock()) == "sk-one"
+
+    def test_without_session_uses_environment(self):
+        with patch("app.services.llm_clients.settings") as mock_settings:
+            mock_settings.anthropic_api_key = "sk-env"
+            assert cached_api_key("anthropic", None) == "sk-env"
+
+
+class TestGetLlmClient:
+    def test_client_is_reused(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", return_value="sk-ant-test"):
+            client = get_llm_client("anthropic", MagicMock())
+            assert get_llm_client("anthropic", MagicMock()) is client
+            assert get_llm_client("openai", MagicMock()) is not client
+        assert client.api_key == "sk-ant-test"
+
+    def test_new_key_new_client(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", side_effect=["sk-one", "sk-two"]):
+            first = get_llm_client("openai", MagicMock())
+            invalidate_llm_clients()
+            second = get_llm_client("openai", MagicMock())
+        assert second is not first
+        assert second.api_key == "sk-two"
+        assert list(llm_clients._clients) == [("openai", llm_clients.hashlib.sha256(b"sk-two").hexdigest()[:16])]
+
+    def test_connections_kept_alive(self, redis):
+        with patch("app.services.llm_clients.get_llm_api_key", return_value="sk-one"):
+            client = get_llm_client("openai", MagicMock())
+        pool = client._client._transport._pool
+        assert pool._keepalive_expiry == llm_clients.settings.llm_keepalive_seconds
+        assert pool._max_connections == llm_clients.settings.llm_max_connections
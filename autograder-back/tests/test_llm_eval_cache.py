@@ -0,0 +1,129 @@
+"""Tests for the LLM evaluation cache."""
+import json
+from unittest.mock import MagicMock, Mock, patch
+
+from app.models.exercise import Exercise, RubricDimension
+from app.models.submission import LLMEvaluation, RubricScore
+from app.services.llm_eval_cache import (
+    CachedEvaluation,
+    code_criteria,
+    compute_cache_key,
+    find_cached_evaluation,
+    get_cache_stats,
+    invalidate_exercise,
+    rubric_criteria,
+)
+
+
+def _exercise(criteria="Readability"):
+    e = Mock(spec=Exercise)
+    e.title = "Sum"
+    e.description = "Add two numbers"
+    e.llm_grading_criteria = criteria
+    return e
+
+
+def _dim(id, name, weight):
+    d = Mock(spec=RubricDimension)
+    d.id, d.name, d.weight, d.description = id, name, weight, None
+    return d
+
+
+def _key(content_hash="abc", exercise_id=1, criteria=None, model="anthropic:m1", version=1):
+    return compute_cache_key(content_hash, exercise_id, criteria or code_criteria(_exercise()), model, version)
+
+
+class TestCacheKey:
+    def test_stable(self):
+        assert _key() == _key()
+        assert len(_key()) == 64
+
+    def test_every_component_matters(self):
+        base = _key()
+        assert _key(content_hash="def") != base
+        assert _key(exercise_id=2) != base
+        assert _key(criteria=code_criteria(_exercise("Efficiency"))) != base
+        assert _key(model="openai:m1") != base
+        assert _key(version=2) != base
+
+    def test_rubric_change(self):
+        exercise = _exercise()
+        before = rubric_criteria(exercise, [_dim(1, "Clarity", 0.5), _dim(2, "Method", 0.5)])
+        after = rubric_criteria(exercise, [_dim(1, "Clarity", 0.7), _dim(2, "Method", 0.3)])
+        assert _key(criteria=before) != _key(criteria=after)
+
+
+def _db(row=None, scores=()):
+    db = MagicMock()
+
+    def query(model):
+        q = MagicMock()
+        q.filter.return_value = q
+        q.order_by.return_value = q
+        q.first.return_value = row if model is LLMEvaluation else None
+        q.all.return_value = list(scores) if model is RubricScore else []
+        return q
+
+    db.query.side_effect = query
+    return db
+
+
+class TestLookup:
+    def test_redis_hit_skips_the_database(self):
+        redis = MagicMock()
+        redis.get.return_value = json.dumps({"feedback": "Nice", "score": 90.0, "rubric_scores": [[10, 90.0, "ok"]]})
+        db = _db()
+
+        with patch("app.services.llm_eval_cache.get_redis_client", return_value=redis):
+            cached = find_cached_evaluation(db, "k", 1, exclude_submission_id=5)
+
+        assert cached == CachedEvaluation("Nice", 90.0, [(10, 90.0, "ok")])
+        db.query.assert_not_called()
+        redis.pipeline.return_value.hincrby.assert_any_call("llm_eval_cache:stats", "hits_redis:1", 1)
+
+    def test_database_hit_refills_redis(self):
+        redis = MagicMock()
+        redis.get.return_value = None
+        row = Mock(spec=LLMEvaluation, submission_id=3, feedback="Good", score=80.0)
+        score = Mock(spec=RubricScore, dimension_id=10, score=80.0, feedback="fine")
+
+        with patch("app.services.llm_eval_cache.get_redis_client", return_value=redis):
+            cached = find_cached_evaluation(_db(row, [score]), "k", 1)
+
+        assert cached == CachedEvaluation("Good", 80.0, [(10, 80.0, "fine")])
+        pipe = redis.pipeline.return_value
+        stored = json.loads(pipe.set.call_args[0][1])
+        assert stored == {"feedback": "Good", "score": 80.0, "rubric_scores": [[10, 80.0, "fine"]]}
+        pipe.sadd.assert_called_once_with("llm_eval_cache:exercise:1", "k")
+        pipe.hincrby.assert_any_call("llm_eval_cache:stats", "hits_db", 1)
+
+    def test_miss_without_redis(self):
+        with patch("app.services.llm_eval_cache.get_redis_client", side_effect=ConnectionError):
+            assert find_cached_evaluation(_db(), "k", 1) is None
+
+
+class TestInvalidate:
+    def test_detaches_rows_and_drops_redis_entries(self):
+        db = MagicMock()
+        db.query.return_value.filter.return_value.update.return_value = 4
+        redis = MagicMock()
+        redis.smembers.return_value = {"k1"}
+
+        with patch("app.services.llm_eval_cache.get_redis_client", return_value=redis):
+            assert invalidate_exercise(db, 7) == 4
+
+        db.query.return_value.filter.return_value.update.assert_called_once_with(
+            {LLMEvaluation.cache_key: None}, synchronize_session=False
+        )
+        redis.delete.assert_called_once_with("llm_eval_cache:exercise:7", "llm_eval_cache:entry:k1")
+
+
+def test_stats_per_tier():
+    redis = MagicMock()
+    redis.hmget.return_value = ["3", "1", "4"]
+
+    with patch("app.services.llm_eval_cache.get_redis_client", return_value=redis):
+        stats = get_cache_stats(7)
+
+    redis.hmget.assert_called_once_with("llm_eval_cache:stats", "hits_redis:7", "hits_db:7", "misses:7")
+    assert stats == {"hits": 4, "redis_hits": 3, "db_hits": 1, "misses": 4, "hit_ratio": 0.5}
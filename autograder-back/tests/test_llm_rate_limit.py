@@ -0,0 +1,106 @@
+"""Tests for the shared LLM rate limiter."""
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+import redis
+
+from app.services.llm_rate_limit import (
+    IMAGE_TOKENS,
+    LLMRateLimitExceeded,
+    acquire,
+    configured_limits,
+    estimate_tokens,
+    observe_response,
+    rate_limited,
+    retry_delay,
+)
+
+
+class TestEstimate:
+    def test_text_and_output_budget(self):
+        assert estimate_tokens("x" * 400, 1024) == 100 + 1 + 1024
+
+    def test_image_blocks_count_flat(self):
+        prompt = [
+            {"type": "image", "source": {"type": "base64", "data": "A" * 100_000}},
+            {"type": "text", "text": "x" * 40},
+        ]
+        assert estimate_tokens(prompt, 0) == 10 + 1 + IMAGE_TOKENS
+
+
+def test_limits_per_model_provider_and_default():
+    limits = {"anthropic:m1": (100, 10000), "anthropic": (10, 1000)}
+    with patch("app.services.llm_rate_limit.settings") as mock_settings:
+        mock_settings.llm_rate_limits = limits
+        mock_settings.llm_default_rpm, mock_settings.llm_default_tpm = 50, 5000
+        mock_settings.llm_rate_limit_headroom = 0.9
+        assert configured_limits("anthropic", "m1") == (90, 9000)
+        assert configured_limits("anthropic", "m2") == (9, 900)
+        assert configured_limits("openai", "m1") == (45, 4500)
+
+
+class TestAcquire:
+    def test_sleeps_until_the_bucket_refills(self):
+        client = MagicMock()
+        client.eval.side_effect = ["1.5", "0"]
+
+        with patch("app.services.llm_rate_limit.get_redis_client", return_value=client), \
+             patch("app.services.llm_rate_limit.time.sleep") as sleep:
+            acquire("anthropic", "m1", 500, max_wait_seconds=10)
+
+        assert client.eval.call_count == 2
+        assert client.eval.call_args.args[2] == "llm_rate:anthropic:m1"
+        assert 1.5 <= sleep.call_args.args[0] < 1.6
+
+    def test_gives_up_past_the_max_wait(self):
+        client = MagicMock()
+        client.eval.return_value = "30"
+
+        with patch("app.services.llm_rate_limit.get_redis_client", return_value=client), \
+             patch("app.services.llm_rate_limit.time.sleep") as sleep:
+            with pytest.raises(LLMRateLimitExceeded) as exc:
+                acquire("anthropic", "m1", 500, max_wait_seconds=10)
+
+        sleep.assert_not_called()
+        assert retry_delay(exc.value, 120) == 30
+
+    def test_runs_unthrottled_without_redis(self):
+        client = MagicMock()
+        client.eval.side_effect = redis.ConnectionError("refused")
+
+        with patch("app.services.llm_rate_limit.get_redis_client", return_value=client):
+            acquire("anthropic", "m1", 500)
+
+
+class TestObserve:
+    def _observe(self, response, inside=True):
+        client = MagicMock()
+        client.eval.return_value = "0"
+        with patch("app.services.llm_rate_limit.get_redis_client", return_value=client):
+            if inside:
+                with rate_limited("openai", "gpt-4", 100):
+                    client.eval.reset_mock()
+                    observe_response("openai", response)
+            else:
+                observe_response("openai", response)
+        return client.eval
+
+    def test_headers_set_limits_and_remaining(self):
+        response = httpx.Response(200, headers={
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-limit-tokens": "30000",
+            "x-ratelimit-remaining-requests": "499",
+            "x-ratelimit-remaining-tokens": "28000",
+        })
+        args = self._observe(response).call_args.args
+        assert args[2] == "llm_rate:openai:gpt-4"
+        assert args[5:10] == (450, 27000, 499.0, 28000.0, "")
+
+    def test_429_pauses_for_retry_after(self):
+        response = httpx.Response(429, headers={"retry-after-ms": "2500"})
+        assert self._observe(response).call_args.args[9] == 2.5
+
+    def test_ignored_outside_a_limited_call(self):
+        response = httpx.Response(429, headers={"retry-after": "2"})
+        self._observe(response, inside=False).assert_not_called()
@@ -4,15 +4,13 @@ import json
 from unittest.mock import patch, Mock, MagicMock
 
 _mock_db = MagicMock()
-_KEY_PATCH = patch("app.services.message_rewriter.get_llm_api_key", return_value="sk-test")
 
 
 # ── generate_variations ─────────────────────────────────────────────────
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_returns_list(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_returns_list(mock_get_client):
     """GIVEN valid template, WHEN generate_variations called, THEN returns list of strings."""
     from app.services.message_rewriter import generate_variations
 
@@ -22,7 +20,7 @@ def test_generate_variations_returns_list(mock_anthropic, _mock_key):
         "{nome}, lembrete: amanhã a aula é sobre regressão linear.",
     ]
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text=json.dumps(variations))]
     mock_client.messages.create.return_value = mock_response
@@ -36,15 +34,14 @@ def test_generate_variations_returns_list(mock_anthropic, _mock_key):
         assert "{nome}" in v
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_exact_count(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_exact_count(mock_get_client):
     """GIVEN num_variations=6, WHEN called, THEN returns exactly 6 variations."""
     from app.services.message_rewriter import generate_variations
 
     variations = [f"Variação {i} {{nome}}" for i in range(6)]
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text=json.dumps(variations))]
     mock_client.messages.create.return_value = mock_response
@@ -53,9 +50,8 @@ def test_generate_variations_exact_count(mock_anthropic, _mock_key):
     assert len(result) == 6
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_preserves_all_placeholders(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_preserves_all_placeholders(mock_get_client):
     """GIVEN template with {nome}, {turma}, WHEN called, THEN each variation has both."""
     from app.services.message_rewriter import generate_variations
 
@@ -65,7 +61,7 @@ def test_generate_variations_preserves_all_placeholders(mock_anthropic, _mock_ke
         "Fala {nome}! Turma {turma} amanhã!",
     ]
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text=json.dumps(variations))]
     mock_client.messages.create.return_value = mock_response
@@ -77,9 +73,8 @@ def test_generate_variations_preserves_all_placeholders(mock_anthropic, _mock_ke
         assert "{turma}" in v
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_discards_missing_placeholders(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_discards_missing_placeholders(mock_get_client):
     """GIVEN LLM returns variations where some lost placeholders, WHEN validated, THEN invalid ones discarded."""
     from app.services.message_rewriter import generate_variations
 
@@ -97,7 +92,7 @@ def test_generate_variations_discards_missing_placeholders(mock_anthropic, _mock
     ]
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     resp1 = Mock()
     resp1.content = [Mock(text=json.dumps(first_response))]
     resp2 = Mock()
@@ -111,9 +106,8 @@ def test_generate_variations_discards_missing_placeholders(mock_anthropic, _mock
         assert "{nome}" in v
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_returns_partial_if_retry_insufficient(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_returns_partial_if_retry_insufficient(mock_get_client):
     """GIVEN LLM can't produce enough valid variations after retry, THEN returns what's available."""
     from app.services.message_rewriter import generate_variations
 
@@ -129,7 +123,7 @@ def test_generate_variations_returns_partial_if_retry_insufficient(mock_anthropi
     ]
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     resp1 = Mock()
     resp1.content = [Mock(text=json.dumps(first_response))]
     resp2 = Mock()
@@ -144,14 +138,13 @@ def test_generate_variations_returns_partial_if_retry_insufficient(mock_anthropi
         assert "{nome}" in v
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_prompt_includes_template(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_prompt_includes_template(mock_get_client):
     """GIVEN template, WHEN called, THEN prompt sent to Haiku includes the template text."""
     from app.services.message_rewriter import generate_variations
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text='["Oi {nome}!", "E aí {nome}!"]')]
     mock_client.messages.create.return_value = mock_response
@@ -164,14 +157,13 @@ def test_generate_variations_prompt_includes_template(mock_anthropic, _mock_key)
     assert "Olá {nome}! Mensagem especial." in user_message
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_uses_haiku_model(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_uses_haiku_model(mock_get_client):
     """GIVEN call to generate_variations, WHEN LLM is called, THEN uses Haiku model."""
     from app.services.message_rewriter import generate_variations
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text='["Oi {nome}!"]')]
     mock_client.messages.create.return_value = mock_response
@@ -182,15 +174,14 @@ def test_generate_variations_uses_haiku_model(mock_anthropic, _mock_key):
     assert "haiku" in call_args[1]["model"]
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_strips_whitespace(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_strips_whitespace(mock_get_client):
     """GIVEN LLM returns variations with extra whitespace, WHEN parsed, THEN stripped."""
     from app.services.message_rewriter import generate_variations
 
     variations = ["  Oi {nome}!  ", "\nE aí {nome}!\n"]
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text=json.dumps(variations))]
     mock_client.messages.create.return_value = mock_response
@@ -201,29 +192,26 @@ def test_generate_variations_strips_whitespace(mock_anthropic, _mock_key):
     assert result[1] == "E aí {nome}!"
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_api_error_raises(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_api_error_raises(mock_get_client):
     """GIVEN Anthropic API fails, WHEN called, THEN raises exception."""
     from app.services.message_rewriter import generate_variations
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
-    mock_anthropic.APIError = type("APIError", (Exception,), {})
-    mock_client.messages.create.side_effect = mock_anthropic.APIError("rate limit")
+    mock_get_client.return_value = mock_client
+    mock_client.messages.create.side_effect = RuntimeError("rate limit")
 
     with pytest.raises(Exception):
         generate_variations("Olá {nome}!", 3, _mock_db)
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_invalid_json_raises(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_invalid_json_raises(mock_get_client):
     """GIVEN LLM returns non-JSON response, WHEN parsed, THEN raises ValueError."""
     from app.services.message_rewriter import generate_variations
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text="This is not JSON at all")]
     mock_client.messages.create.return_value = mock_response
@@ -232,14 +220,13 @@ def test_generate_variations_invalid_json_raises(mock_anthropic, _mock_key):
         generate_variations("Olá {nome}!", 3, _mock_db)
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_json_not_list_raises(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_json_not_list_raises(mock_get_client):
     """GIVEN LLM returns valid JSON but not a list, WHEN parsed, THEN raises ValueError."""
     from app.services.message_rewriter import generate_variations
 
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text='{"variation": "Oi {nome}!"}')]
     mock_client.messages.create.return_value = mock_response
@@ -248,9 +235,8 @@ def test_generate_variations_json_not_list_raises(mock_anthropic, _mock_key):
         generate_variations("Olá {nome}!", 3, _mock_db)
 
 
-@_KEY_PATCH
-@patch("app.services.message_rewriter.anthropic")
-def test_generate_variations_template_without_placeholders(mock_anthropic, _mock_key):
+@patch("app.services.message_rewriter.get_llm_client")
+def test_generate_variations_template_without_placeholders(mock_get_client):
     """GIVEN template with no placeholders, WHEN called, THEN variations also have no placeholders."""
     from app.services.message_rewriter import generate_variations
 
@@ -260,7 +246,7 @@ def test_generate_variations_template_without_placeholders(mock_anthropic, _mock
         "Amanhã tem aula pessoal!",
     ]
     mock_client = MagicMock()
-    mock_anthropic.Anthropic.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_response = Mock()
     mock_response.content = [Mock(text=json.dumps(variations))]
     mock_client.messages.create.return_value = mock_response
@@ -82,6 +82,12 @@ def make_exercise_obj(**overrides):
     ex.max_submissions = overrides.get("max_submissions", None)
     ex.timeout_seconds = overrides.get("timeout_seconds", 30)
     ex.memory_limit_mb = overrides.get("memory_limit_mb", 512)
+    ex.max_output_kb = overrides.get("max_output_kb", 1024)
+    ex.test_timeout_seconds = overrides.get("test_timeout_seconds", None)
+    ex.cpu_limit = overrides.get("cpu_limit", 1)
+    ex.precheck_enabled = overrides.get("precheck_enabled", True)
+    ex.banned_modules = overrides.get("banned_modules", None)
+    ex.max_code_kb = overrides.get("max_code_kb", None)
     ex.has_tests = overrides.get("has_tests", True)
     ex.llm_grading_enabled = overrides.get("llm_grading_enabled", False)
     ex.test_weight = overrides.get("test_weight", 0.7)
@@ -199,7 +205,8 @@ class TestFileUploadSubmission:
 
         with patch("app.routers.submissions.Submission", return_value=submission):
             with patch("app.services.file_storage.save_submission_file", return_value=("1/1/report.pdf", "abc123")):
-                with patch("app.routers.submissions.celery_app"):
+                with patch("app.routers.submissions.celery_app"), \
+                     patch("app.routers.submissions.submission_priority", return_value=3):
                     pdf_content = b"%PDF-1.4 fake pdf content"
                     response = client.post(
                         "/submissions",
@@ -0,0 +1,163 @@
+"""Tests for the static precheck of code submissions."""
+import ast
+from unittest.mock import MagicMock, Mock, patch
+
+from app.models.exercise import Exercise, GradingMode, SubmissionType, TestCase
+from app.services.precheck import (
+    defined_names,
+    find_banned_import,
+    precheck_submission,
+    required_names,
+)
+
+
+def _tc(input_data):
+    tc = Mock(spec=TestCase)
+    tc.input_data = input_data
+    return tc
+
+
+def _exercise(**overrides):
+    e = Mock(spec=Exercise)
+    e.precheck_enabled = overrides.get("precheck_enabled", True)
+    e.banned_modules = overrides.get("banned_modules", None)
+    e.max_code_kb = overrides.get("max_code_kb", None)
+    return e
+
+
+class TestRequiredNames:
+    def test_free_names_minus_builtins(self):
+        names = required_names([_tc("add(1, 2)"), _tc("len(mean([1, 2]))"), _tc("PI > 3")])
+        assert names == {"add", "mean", "PI"}
+
+    def test_names_bound_inside_the_expression(self):
+        names = required_names([_tc("[square(x) for x in range(3)]"), _tc("(lambda y: y + 1)(n)")])
+        assert names == {"square", "n"}
+
+    def test_unparseable_test_is_ignored(self):
+        assert required_names([_tc("add(1,"), _tc("add(1, 2)")]) == {"add"}
+
+
+class TestDefinedNames:
+    def test_defs_assignments_and_imports(self):
+        tree = ast.parse(
+            "import numpy as np\n"
+            "from math import pi\n"
+            "import os.path\n"
+            "LIMIT, OTHER = 1, 2\n"
+            "def add(a, b):\n    total = a + b\n    return total\n"
+            "class Stack: pass\n"
+        )
+        names = defined_names(tree)
+        assert {"np", "pi", "os", "LIMIT", "OTHER", "add", "Stack"} <= names
+        assert "total" not in names
+
+    def test_conditional_and_global_definitions(self):
+        tree = ast.parse(
+            "try:\n    from fast import mean\nexcept ImportError:\n    def mean(xs): return sum(xs) / len(xs)\n"
+            "if True:\n    def helper(): pass\n"
+            "def setup():\n    global CACHE\n    CACHE = {}\n"
+        )
+        assert {"mean", "helper", "setup", "CACHE"} <= defined_names(tree)
+
+    def test_dynamic_namespace_is_unknown(self):
+        assert defined_names(ast.parse("from helpers import *")) is None
+        assert defined_names(ast.parse("globals()['add'] = lambda a, b: a + b")) is None
+
+
+class TestBannedImports:
+    def test_import_forms(self):
+        for code in (
+            "import os",
+            "import os.path as p",
+            "from os import system",
+            "from os.path import join",
+            "__import__('os')",
+            "import importlib\nimportlib.import_module('os')",
+        ):
+            assert "'os'" in find_banned_import(ast.parse(code), ["os"]), code
+
+    def test_banned_submodule_only(self):
+        assert find_banned_import(ast.parse("import urllib.parse"), ["urllib.request"]) is None
+        assert find_banned_import(ast.parse("from urllib import request"), ["urllib.request"])
+
+    def test_reports_line(self):
+        error = find_banned_import(ast.parse("x = 1\nimport subprocess\n"), ["subprocess"])
+        assert error.startswith("Line 2:")
+
+
+class TestPrecheckSubmission:
+    def test_valid_code_passes(self):
+        code = "def add(a, b):\n    return a + b\n"
+        assert precheck_submission(code, _exercise(), [_tc("add(1, 2)")]) is None
+
+    def test_missing_function(self):
+        code = "def soma(a, b):\n    return a + b\n"
+        error = precheck_submission(code, _exercise(), [_tc("add(1, 2)"), _tc("sub(2, 1)")])
+        assert error == "The tests use add, sub, which your code does not define"
+
+    def test_banned_module(self):
+        code = "import subprocess\ndef add(a, b):\n    return a + b\n"
+        error = precheck_submission(code, _exercise(banned_modules="subprocess, socket"), [_tc("add(1, 2)")])
+        assert "subprocess" in error
+
+    def test_global_banned_modules(self):
+        with patch("app.services.precheck.settings") as mock_settings:
+            mock_settings.precheck_max_code_kb = 256
+            mock_settings.precheck_banned_modules = "ctypes"
+            error = precheck_submission("import ctypes\n", _exercise(), [])
+        assert "ctypes" in error
+
+    def test_size_limit(self):
+        code = "x = 1\n" * 400  # 2.4 KB
+        error = precheck_submission(code, _exercise(max_code_kb=1), [])
+        assert error == "Code is 2 KB; this exercise accepts at most 1 KB"
+
+    def test_disabled(self):
+        assert precheck_submission("import os\n", _exercise(precheck_enabled=False, banned_modules="os"), []) is None
+
+    def test_disabled_does_not_load_test_cases(self):
+        test_cases = MagicMock()
+        assert precheck_submission("x = 1\n", _exercise(precheck_enabled=False), test_cases) is None
+        test_cases.__iter__.assert_not_called()
+
+    def test_off_unless_the_professor_enables_it(self):
+        from app.schemas.exercises import ExerciseCreate
+
+        assert Exercise.__table__.c.precheck_enabled.default.arg is False
+        assert ExerciseCreate.model_fields["precheck_enabled"].default is False
+
+
+class TestSubmissionEndpoint:
+    def test_rejects_before_queueing(self, client_with_student):
+        client, mock_db, _ = client_with_student
+        exercise = _exercise()
+        exercise.id = 1
+        exercise.submission_type = SubmissionType.CODE
+        exercise.grading_mode = GradingMode.TEST_FIRST
+        exercise.max_submissions = None
+
+        def query_side_effect(model):
+            q = MagicMock()
+            q.join.return_value = q
+            q.filter.return_value = q
+            q.first.return_value = None
+            q.all.return_value = []
+            if model is Exercise:
+                q.first.return_value = exercise
+            elif model is TestCase:
+                q.__iter__.return_value = iter([_tc("add(1, 2)")])
+            return q
+
+        mock_db.query.side_effect = query_side_effect
+
+        with patch("app.routers.submissions.celery_app") as mock_celery:
+            response = client.post(
+                "/submissions",
+                data={"exercise_id": "1", "code": "def plus(a, b):\n    return a + b\n"},
+            )
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "The tests use add, which your code does not define"
+        mock_celery.send_task.assert_not_called()
+        mock_db.add.assert_not_called()
@@ -0,0 +1,84 @@
+"""Tests for deadline-aware priority of grading tasks."""
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+
+from app.celery_app import celery_app
+from app.models.exercise import Exercise, GradingMode, SubmissionType
+from app.models.submission import Submission
+from app.services.priority import BULK, DEADLINE, INTERACTIVE, THROTTLED, submission_priority
+
+NOW = 1_800_000_000
+
+
+def _priority(closes_at, recent):
+    with patch("app.services.priority.next_deadline", return_value=closes_at), \
+         patch("app.services.priority.recent_submission_count", return_value=recent):
+        return submission_priority(MagicMock(), 1, 2, now=NOW)
+
+
+class TestSubmissionPriority:
+    @pytest.mark.parametrize("closes_at,recent,lane", [
+        (None, 1, INTERACTIVE),
+        (NOW + 3 * 3600, 1, INTERACTIVE),
+        (NOW + 5 * 60, 1, DEADLINE),
+        (NOW + 3600, 1, DEADLINE),
+        (None, 20, THROTTLED),
+        (NOW + 5 * 60, 20, INTERACTIVE),  # a deadline still beats the rate penalty
+    ])
+    def test_lanes(self, closes_at, recent, lane):
+        assert _priority(closes_at, recent) == lane
+
+    def test_lanes_are_the_broker_steps(self):
+        options = celery_app.conf.broker_transport_options
+        assert options["priority_steps"] == [DEADLINE, INTERACTIVE, THROTTLED, BULK]
+        assert options["queue_order_strategy"] == "priority"
+
+    def test_disabled(self):
+        with patch("app.services.priority.settings") as mock_settings:
+            mock_settings.priority_enabled = False
+            assert submission_priority(MagicMock(), 1, 2) == INTERACTIVE
+
+
+class TestDispatch:
+    def test_submission_is_queued_in_its_lane(self, client_with_student):
+        client, mock_db, student = client_with_student
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.submission_type = SubmissionType.CODE
+        exercise.grading_mode = GradingMode.TEST_FIRST
+        exercise.max_submissions = None
+        exercise.precheck_enabled = False
+        mock_db.query.return_value.filter.return_value.first.return_value = exercise
+
+        def refresh(obj):
+            obj.id = 10
+            obj.submitted_at = "2026-01-01T00:00:00"
+
+        mock_db.refresh.side_effect = refresh
+
+        with patch("app.routers.submissions.check_deadline", return_value=None), \
+             patch("app.routers.submissions.submission_priority", return_value=DEADLINE) as mock_priority, \
+             patch("app.routers.submissions.celery_app") as mock_celery:
+            response = client.post("/submissions", data={"exercise_id": "1", "code": "x = 1\n"})
+
+        assert response.status_code == 201
+        mock_priority.assert_called_once_with(mock_db, 1, student.id)
+        assert mock_celery.send_task.call_args.kwargs["priority"] == DEADLINE
+
+    def test_llm_grading_follows_the_execution_lane(self):
+        from app.tasks import _save_test_results
+
+        exercise = Mock(spec=Exercise)
+        exercise.llm_grading_enabled = True
+        exercise.auto_publish_grades = True
+        submission = Mock(spec=Submission)
+        submission.id = 10
+
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = None  # not evaluated yet
+
+        with patch("app.tasks.llm_evaluate_submission") as mock_llm:
+            _save_test_results(db, submission, exercise, [{"name": "t", "passed": True}], 0.0, DEADLINE)
+
+        mock_llm.apply_async.assert_called_once_with(args=[10], priority=DEADLINE)
@@ -0,0 +1,293 @@
+"""Tests for bulk regrade of an exercise."""
+import json
+from concurrent.futures import Future
+from unittest.mock import MagicMock, Mock, patch
+
+from app.models.exercise import Exercise, GradingMode, TestCase
+from app.models.submission import Grade, Submission, SubmissionStatus, TestResult
+from app.services.priority import BULK
+from app.services.regrade import chunked, get_job, group_by_content, record_chunk
+
+
+def _submission(id, content_hash, code="def add(a, b):\n    return a + b"):
+    s = Mock(spec=Submission)
+    s.id = id
+    s.content_hash = content_hash
+    s.code = code
+    s.status = SubmissionStatus.COMPLETED
+    return s
+
+
+def _test_case(name):
+    tc = Mock(spec=TestCase)
+    tc.name = name
+    tc.input_data = f"{name}()"
+    tc.expected_output = "1"
+    return tc
+
+
+class TestGrouping:
+    def test_groups_by_content_hash_in_order(self):
+        subs = [_submission(1, "a"), _submission(2, "b"), _submission(3, "a")]
+        assert group_by_content(subs) == [("a", [1, 3]), ("b", [2])]
+
+    def test_chunks_distinct_codes(self):
+        groups = [(str(i), [i]) for i in range(5)]
+        assert [len(c) for c in chunked(groups, 2)] == [2, 2, 1]
+
+
+class TestJobProgress:
+    def test_last_chunk_completes_the_job(self):
+        redis = MagicMock()
+        redis.pipeline.return_value.execute.side_effect = [
+            [1, 3, 0, 1, 0, "2"],
+            [2, 2, 1, 1, 0, "2"],
+        ]
+        with patch("app.services.regrade.get_redis_client", return_value=redis):
+            assert record_chunk("job", regraded=3, failed=0, executed=1, reused=0) is False
+            assert record_chunk("job", regraded=2, failed=1, executed=1, reused=0) is True
+
+    def test_get_job_parses_counters(self):
+        redis = MagicMock()
+        redis.hgetall.return_value = {
+            "job_id": "job", "exercise_id": "4", "scope": "all", "status": "running",
+            "total": "600", "distinct": "120", "chunks": "5", "chunks_done": "2",
+            "regraded": "250", "created_at": "1700000000",
+        }
+        with patch("app.services.regrade.get_redis_client", return_value=redis):
+            job = get_job("job")
+        assert job["exercise_id"] == 4
+        assert job["distinct"] == 120
+        assert job["failed"] == 0
+        assert job["finished_at"] is None
+
+    def test_unknown_job(self):
+        redis = MagicMock()
+        redis.hgetall.return_value = {}
+        with patch("app.services.regrade.get_redis_client", return_value=redis):
+            assert get_job("nope") is None
+
+
+def _harness_run(lines):
+    """_submit_harness stand-in: feeds `lines` and returns a finished future."""
+    def submit(harness_results, exercise, code, submission_id=None, priority=None):
+        for line in lines:
+            harness_results.feed(json.dumps({**json.loads(line), "nonce": harness_results.nonce}).encode())
+        future = Future()
+        future.set_result((0, "\n".join(lines)))
+        return future
+    return submit
+
+
+class TestRegradeChunk:
+    def _db(self, exercise, test_cases, groups, grades):
+        db = MagicMock()
+
+        def query_side_effect(model):
+            q = MagicMock()
+            q.filter.return_value = q
+            q.order_by.return_value = q
+            if model is Exercise:
+                q.first.return_value = exercise
+            elif model is TestCase:
+                q.all.return_value = test_cases
+            elif model is Submission:
+                q.all.return_value = groups.pop(0)
+            elif model is Grade:
+                q.first.return_value = grades.pop(0)
+            return q
+
+        db.query.side_effect = query_side_effect
+        return db
+
+    def test_runs_each_distinct_code_once_and_copies_it(self):
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.llm_grading_enabled = False
+        exercise.auto_publish_grades = True
+        test_cases = [_test_case("t1"), _test_case("t2")]
+        shared = [_submission(10, "aaa"), _submission(11, "aaa")]
+        old_grade = Mock(spec=Grade)
+        old_grade.llm_score = None
+        db = self._db(exercise, test_cases, [shared], [old_grade, None])
+        lines = [
+            json.dumps({"index": 0, "name": "t1", "passed": True, "message": "ok"}),
+            json.dumps({"index": 1, "name": "t2", "passed": False, "message": "nope"}),
+        ]
+        submit = MagicMock(side_effect=_harness_run(lines))
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.compute_suite_version", return_value="v2"), \
+             patch("app.tasks.find_cached_run", return_value=None), \
+             patch("app.tasks._submit_harness", submit), \
+             patch("app.tasks.record_chunk", return_value=True) as mock_record, \
+             patch("app.tasks.finish_job") as mock_finish:
+            from app.tasks import regrade_chunk
+            result = regrade_chunk.run("job", 1, [["aaa", [10, 11]]])
+
+        assert submit.call_count == 1
+        assert submit.call_args.args[4] == BULK
+        assert result["regraded"] == 2
+        assert result["executed"] == 1
+        mock_record.assert_called_once_with("job", regraded=2, failed=0, executed=1, reused=0)
+        mock_finish.assert_called_once_with("job", 1, "completed")
+
+        test_results = [c.args[0] for c in db.add.call_args_list if isinstance(c.args[0], TestResult)]
+        assert sorted(tr.submission_id for tr in test_results) == [10, 10, 11, 11]
+        assert old_grade.test_score == 50.0
+        assert old_grade.final_score == 50.0
+        new_grade = [c.args[0] for c in db.add.call_args_list if isinstance(c.args[0], Grade)][0]
+        assert new_grade.submission_id == 11
+        assert new_grade.test_score == 50.0
+        assert shared[0].exit_reason == "completed"
+        assert shared[1].exit_reason == "cached"
+        assert all(s.test_suite_version == "v2" for s in shared)
+        assert all(s.status == SubmissionStatus.COMPLETED for s in shared)
+        assert db.commit.call_count == 2
+
+    def test_keeps_llm_score_in_composite(self):
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.llm_grading_enabled = True
+        exercise.test_weight = 0.5
+        exercise.llm_weight = 0.5
+        test_cases = [_test_case("t1")]
+        grade = Mock(spec=Grade)
+        grade.llm_score = 80.0
+        grade.late_penalty_applied = 10.0
+        db = self._db(exercise, test_cases, [[_submission(10, "aaa")]], [grade])
+        cached_row = Mock(spec=TestResult)
+        cached_row.test_name = "t1"
+        cached_row.passed = True
+        cached_row.message = cached_row.stdout = cached_row.stderr = ""
+        cached_row.duration_ms = 4
+        cached_run = Mock(spec=Submission)
+        cached_run.test_results = [cached_row]
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.compute_suite_version", return_value="v2"), \
+             patch("app.tasks.find_cached_run", return_value=cached_run), \
+             patch("app.tasks._submit_harness") as submit, \
+             patch("app.tasks.record_chunk", return_value=False), \
+             patch("app.tasks.llm_evaluate_submission") as mock_llm:
+            from app.tasks import regrade_chunk
+            result = regrade_chunk.run("job", 1, [["aaa", [10]]])
+
+        submit.assert_not_called()
+        assert result["reused"] == 1
+        assert grade.test_score == 100.0
+        assert grade.final_score == 80.0  # 0.5 * 100 + 0.5 * 80 - 10
+        mock_llm.apply_async.assert_not_called()
+
+    def test_failed_run_drops_the_old_grade(self):
+        from app.services.sandbox_pool import SandboxTimeout
+
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        test_cases = [_test_case("t1")]
+        submission = _submission(10, "aaa")
+        grade = Mock(spec=Grade)
+        db = self._db(exercise, test_cases, [[submission]], [grade])
+
+        def submit(harness_results, exercise, code, submission_id=None, priority=None):
+            future = Future()
+            future.set_exception(SandboxTimeout("slow"))
+            return future
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.compute_suite_version", return_value="v2"), \
+             patch("app.tasks.find_cached_run", return_value=None), \
+             patch("app.tasks._submit_harness", side_effect=submit), \
+             patch("app.tasks.record_chunk", return_value=False):
+            from app.tasks import regrade_chunk
+            regrade_chunk.run("job", 1, [["aaa", [10]]])
+
+        assert submission.status == SubmissionStatus.FAILED
+        assert submission.error_message == "Execution timed out"
+        db.delete.assert_called_once_with(grade)
+
+
+class TestRegradeExercise:
+    def test_fans_out_chunks(self):
+        exercise = Mock(spec=Exercise)
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = exercise
+        subs = [_submission(i, f"h{i % 3}") for i in range(1, 8)]
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.select_submissions", return_value=subs), \
+             patch("app.tasks.update_job") as mock_update, \
+             patch("app.tasks.regrade_chunk") as mock_chunk, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.regrade_chunk_size = 2
+            from app.tasks import regrade_exercise
+            result = regrade_exercise.run("job", 1, "all")
+
+        assert result == {"job_id": "job", "total": 7, "distinct": 3, "chunks": 2}
+        mock_update.assert_called_once_with("job", status="running", total=7, distinct=3, chunks=2)
+        assert mock_chunk.apply_async.call_count == 2
+        first_call = mock_chunk.apply_async.call_args_list[0]
+        assert first_call.kwargs["args"][2] == [("h1", [1, 4, 7]), ("h2", [2, 5])]
+        assert first_call.kwargs["priority"] == 9  # behind every interactive submission
+
+
+class TestRegradeEndpoint:
+    def _exercise(self, professor, grading_mode=GradingMode.TEST_FIRST):
+        exercise = Mock(spec=Exercise)
+        exercise.created_by = professor.id
+        exercise.grading_mode = grading_mode
+        exercise.has_tests = True
+        mock = MagicMock()
+        mock.filter.return_value.first.return_value = exercise
+        return mock
+
+    def test_starts_job(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_db.query.return_value = self._exercise(professor)
+        job = {"job_id": "abc", "exercise_id": 1, "scope": "latest", "status": "queued"}
+
+        with patch("app.routers.exercises.start_job", return_value="abc") as mock_start, \
+             patch("app.routers.exercises.get_job", return_value=job), \
+             patch("app.routers.exercises.celery_app") as mock_celery:
+            response = client.post("/exercises/1/regrade", json={"scope": "latest"})
+
+        assert response.status_code == 202
+        assert response.json()["job_id"] == "abc"
+        mock_start.assert_called_once_with(1, "latest")
+        mock_celery.send_task.assert_called_once_with(
+            "app.tasks.regrade_exercise", args=["abc", 1, "latest"], priority=9
+        )
+
+    def test_conflict_when_already_running(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_db.query.return_value = self._exercise(professor)
+
+        with patch("app.routers.exercises.start_job", return_value=None), \
+             patch("app.routers.exercises.running_job", return_value="old"), \
+             patch("app.routers.exercises.celery_app") as mock_celery:
+            response = client.post("/exercises/1/regrade")
+
+        assert response.status_code == 409
+        mock_celery.send_task.assert_not_called()
+
+    def test_llm_first_exercise_rejected(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_db.query.return_value = self._exercise(professor, GradingMode.LLM_FIRST)
+
+        response = client.post("/exercises/1/regrade")
+
+        assert response.status_code == 400
+
+    def test_status_of_another_exercises_job_is_hidden(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        mock_db.query.return_value = self._exercise(professor)
+        job = {"job_id": "abc", "exercise_id": 2, "scope": "latest", "status": "running"}
+
+        with patch("app.routers.exercises.get_job", return_value=job):
+            response = client.get("/exercises/1/regrade/abc")
+
+        assert response.status_code == 404
+
+    def test_student_forbidden(self, client_with_student):
+        client, _, _ = client_with_student
+        assert client.post("/exercises/1/regrade").status_code == 403
@@ -2,7 +2,8 @@ import pytest
 import json
 from unittest.mock import Mock, MagicMock, patch
 
-from app.tasks import create_rubric_prompt, parse_rubric_response
+from app.services.rubric_stats import get_rubric_stats
+from app.tasks import RUBRIC_TOOL_NAME, _call_llm, create_rubric_prompt, parse_rubric_response, rubric_response_schema
 
 
 def _dim(name, description=None, weight=1.0):
@@ -116,3 +117,59 @@ class TestCreateRubricPrompt:
         has_text = any(isinstance(p, dict) and p.get("type") == "text" for p in result)
         assert has_text
         assert len(result) >= 1
+
+
+class TestStructuredOutput:
+    def test_schema_restricts_dimension_names(self):
+        schema = rubric_response_schema([_dim("Methodology"), _dim("Clarity")])
+
+        item = schema["properties"]["dimensions"]["items"]
+        assert item["properties"]["name"]["enum"] == ["Methodology", "Clarity"]
+        assert item["required"] == ["name", "score", "feedback"]
+        assert schema["required"] == ["dimensions", "overall_feedback"]
+
+    def test_anthropic_forced_tool_call(self):
+        answer = {"dimensions": [{"name": "Clarity", "score": 90, "feedback": "ok"}], "overall_feedback": "Good"}
+        client = MagicMock()
+        client.messages.create.return_value.content = [Mock(type="tool_use", input=answer)]
+        schema = rubric_response_schema([_dim("Clarity")])
+
+        with patch("app.config.settings.llm_provider", "anthropic"), \
+             patch("app.services.llm_clients.get_llm_client", return_value=client):
+            text = _call_llm("prompt", schema=schema)
+
+        kwargs = client.messages.create.call_args.kwargs
+        assert kwargs["tool_choice"] == {"type": "tool", "name": RUBRIC_TOOL_NAME}
+        assert kwargs["tools"][0]["input_schema"] is schema
+        assert parse_rubric_response(text, [_dim("Clarity")])["overall_feedback"] == "Good"
+
+    def test_openai_json_schema(self):
+        client = MagicMock()
+        message = client.chat.completions.create.return_value.choices[0].message
+        message.refusal = None
+        message.content = '{"dimensions": [], "overall_feedback": ""}'
+        schema = rubric_response_schema([_dim("Clarity")])
+
+        with patch("app.config.settings.llm_provider", "openai"), \
+             patch("app.services.llm_clients.get_llm_client", return_value=client):
+            assert _call_llm("prompt", schema=schema) == message.content
+
+        response_format = client.chat.completions.create.call_args.kwargs["response_format"]
+        assert response_format["type"] == "json_schema"
+        assert response_format["json_schema"]["strict"] is True
+        assert response_format["json_schema"]["schema"] is schema
+
+    def test_fallback_ratio_per_mode(self):
+        redis = MagicMock()
+        # structured: first_try, fallback, failed; text: first_try, fallback, failed
+        redis.hmget.return_value = ["8", "1", "1", None, "2", None]
+
+        with patch("app.services.rubric_stats.get_redis_client", return_value=redis):
+            stats = get_rubric_stats(3)
+
+        assert redis.hmget.call_args.args[1] == "structured:first_try:3"
+        assert stats["structured_gradings"] == 10
+        assert stats["structured_fallbacks"] == 2
+        assert stats["structured_failures"] == 1
+        assert stats["structured_fallback_ratio"] == 0.2
+        assert stats["text_fallback_ratio"] == 1.0
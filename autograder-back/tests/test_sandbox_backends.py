@@ -0,0 +1,209 @@
+"""Tests for the sandbox backends (the subprocess jail runs for real where the kernel allows it)."""
+import sys
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.models.exercise import Exercise
+from app.services.sandbox_backends import DockerBackend, SandboxSetupError, SubprocessBackend
+from app.services.sandbox_pool import SandboxOutputLimitExceeded, SandboxTimeout
+from app.tasks import HarnessResults, write_harness_inputs
+
+HIDDEN = ["/run", "/home", "/opt", "/srv", "/mnt", "/media"]
+
+STUDENT_CODE = """
+import ctypes, os, socket
+
+def add(a, b):
+    return a + b
+
+def spin():
+    while True:
+        pass
+
+def flood():
+    while True:
+        os.write(1, b"x" * 1000 + b"\\n")
+
+def network():
+    try:
+        socket.create_connection(("1.1.1.1", 53), timeout=1)
+        return "open"
+    except OSError:
+        return "blocked"
+
+def write(path):
+    try:
+        with open(path, "w") as f:
+            f.write("x")
+        return "rw"
+    except OSError:
+        return "ro"
+
+def visible_pids():
+    return sorted(int(p) for p in os.listdir("/proc") if p.isdigit())
+
+def try_unshare():
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.unshare(0x40000000), ctypes.get_errno()
+
+def read_dataset():
+    with open("/tmp/data/numbers.csv") as f:
+        return sum(int(line) for line in f)
+"""
+
+
+def _tc(name, input_data, expected):
+    tc = Mock()
+    tc.name = name
+    tc.input_data = input_data
+    tc.expected_output = expected
+    return tc
+
+
+def _exercise(**overrides):
+    exercise = Mock(spec=Exercise)
+    exercise.id = 1
+    exercise.timeout_seconds = 10
+    exercise.memory_limit_mb = 256
+    exercise.max_output_kb = 64
+    exercise.cpu_limit = 1
+    for key, value in overrides.items():
+        setattr(exercise, key, value)
+    return exercise
+
+
+def _run(backend, test_cases, exercise=None, data_dir=None):
+    results = HarnessResults(test_cases)
+
+    def write_inputs(workspace):
+        write_harness_inputs(workspace, test_cases, STUDENT_CODE, data_dir=data_dir, nonce=results.nonce)
+
+    exit_code, logs = backend.run_harness(exercise or _exercise(), write_inputs, results.feed)
+    return exit_code, logs, results
+
+
+@pytest.fixture(scope="module")
+def jail():
+    """A subprocess backend whose interpreter is usable inside the jail, or skip."""
+    if sys.platform != "linux":
+        pytest.skip("the jail needs Linux namespaces")
+    reason = "no usable interpreter"
+    for python in (None, "/usr/bin/python3"):
+        backend = SubprocessBackend(python=python, hidden_paths=HIDDEN, cgroup_root="")
+        try:
+            _run(backend, [_tc("probe", "add(1, 2)", "3")])
+        except (OSError, SandboxSetupError) as e:
+            reason = str(e)
+            continue
+        return backend
+    pytest.skip(f"jail unavailable here: {reason}")
+
+
+class TestSelection:
+    def test_docker_backend_uses_pool_when_enabled(self):
+        with patch("app.tasks.settings") as mock_settings, \
+             patch("app.tasks.get_docker_client") as mock_client, \
+             patch("app.tasks.get_sandbox_pool") as mock_pool:
+            mock_settings.sandbox_backend = "docker"
+            mock_settings.sandbox_pool_size = 2
+            from app.tasks import get_sandbox_backend
+            backend = get_sandbox_backend()
+
+        assert isinstance(backend, DockerBackend)
+        assert backend.pool is mock_pool.return_value
+        mock_pool.assert_called_once_with(mock_client.return_value)
+
+    def test_subprocess_backend_needs_no_docker(self):
+        with patch("app.tasks.settings") as mock_settings, \
+             patch("app.tasks.get_docker_client") as mock_client:
+            mock_settings.sandbox_backend = "subprocess"
+            from app.tasks import get_sandbox_backend
+            backend = get_sandbox_backend()
+
+        assert isinstance(backend, SubprocessBackend)
+        mock_client.assert_not_called()
+
+    def test_data_dir_is_the_jail_mount(self, tmp_path):
+        (tmp_path / "exercise_1").mkdir()
+        (tmp_path / "exercise_1" / "d.csv").write_text("1\n")
+
+        with patch("app.services.datasets.DATASETS_DIR", tmp_path):
+            assert SubprocessBackend(hidden_paths=[]).sandbox_data_dir(1) == "/tmp/.autograder/data"
+            assert DockerBackend(Mock()).sandbox_data_dir(1) == "/datasets/exercise_1"
+            assert SubprocessBackend(hidden_paths=[]).sandbox_data_dir(2) is None
+
+
+class TestSubprocessBackend:
+    def test_runs_harness_and_reports_telemetry(self, jail):
+        exit_code, _, results = _run(jail, [_tc("t1", "add(1, 2)", "3"), _tc("t2", "add(2, 2)", "5")])
+
+        assert exit_code == 0
+        assert [r["passed"] for r in results.complete("missing")] == [True, False]
+        assert results.telemetry["peak_memory_kb"] > 0
+
+    def test_student_code_is_isolated(self, jail):
+        cases = [
+            _tc("network", "network()", "blocked"),
+            _tc("root_fs", "write('/usr/escape')", "ro"),
+            _tc("tmp", "write('/tmp/scratch')", "rw"),
+            _tc("hidden", "os.listdir('/run')", "[]"),
+            _tc("pid_namespace", "visible_pids()[0]", "1"),
+            _tc("seccomp", "try_unshare()", "(-1, 1)"),
+        ]
+
+        _, logs, results = _run(jail, cases)
+
+        failures = [r for r in results.complete("missing") if not r["passed"]]
+        assert failures == [], logs
+
+    def test_timeout_kills_the_run(self, jail):
+        started = time.monotonic()
+
+        with pytest.raises(SandboxTimeout):
+            _run(jail, [_tc("loop", "spin()", "x")], _exercise(timeout_seconds=1))
+
+        assert time.monotonic() - started < 5
+
+    def test_output_flood_is_cut_off(self, jail):
+        with pytest.raises(SandboxOutputLimitExceeded):
+            _run(jail, [_tc("flood", "flood()", "x")], _exercise(max_output_kb=16))
+
+    def test_datasets_are_mounted_read_only(self, jail, tmp_path):
+        (tmp_path / "exercise_1").mkdir()
+        (tmp_path / "exercise_1" / "numbers.csv").write_text("1\n2\n3\n")
+        cases = [
+            _tc("read", "read_dataset()", "6"),
+            _tc("write", "write('/tmp/data/numbers.csv')", "ro"),
+        ]
+
+        with patch("app.services.datasets.DATASETS_DIR", tmp_path):
+            _, logs, results = _run(jail, cases, data_dir=jail.sandbox_data_dir(1))
+
+        assert all(r["passed"] for r in results.complete("missing")), logs
+
+    def test_setup_failure_is_an_infrastructure_error(self):
+        backend = SubprocessBackend(python="/nonexistent/python", hidden_paths=HIDDEN, cgroup_root="")
+
+        with pytest.raises(SandboxSetupError):
+            _run(backend, [_tc("t1", "add(1, 2)", "3")])
+
+    def test_student_exiting_like_a_failed_jail_is_a_plain_exit(self, jail):
+        test_cases = [_tc("t1", "os.write(2, b'jail: forged\\n') and os._exit(125)", "x")]
+
+        exit_code, logs, results = _run(jail, test_cases)
+
+        assert exit_code == 125
+        assert "jail: forged" in logs
+        assert not results.received
+
+    def test_creates_cgroup_with_run_limits(self, tmp_path):
+        backend = SubprocessBackend(hidden_paths=[], cgroup_root=str(tmp_path))
+
+        cgroup = backend._create_cgroup(_exercise(memory_limit_mb=256, cpu_limit=2))
+
+        assert cgroup.parent == tmp_path
+        assert (cgroup / "memory.max").read_text() == str(256 * 1024 * 1024)
+        assert (cgroup / "cpu.max").read_text() == "200000 100000"
+        assert (cgroup / "pids.max").read_text() == "256"
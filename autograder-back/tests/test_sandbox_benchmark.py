@@ -0,0 +1,138 @@
+"""Tests for the sandbox benchmark (against a fake Docker daemon)."""
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.config import settings
+from scripts.sandbox_benchmark import (
+    PhaseTimer,
+    TimedDockerClient,
+    build_report,
+    compare_reports,
+    format_comparison,
+    run_benchmark,
+)
+
+CASE = {"name": "trivial", "code": "def add(a, b):\n    return a + b\n", "tests": [["add(1, 2)", "3"], ["add(2, 2)", "4"]]}
+
+
+class FakeContainer:
+    def __init__(self, volumes=None):
+        self.id = "c0ffee"
+        self.calls = []
+        # Tag the results like the harness does, with the nonce of the mounted config.json
+        self.nonce = None
+        for source, mount in (volumes or {}).items():
+            if mount["bind"] == "/workspace":
+                with open(f"{source}/config.json") as f:
+                    self.nonce = json.load(f)["nonce"]
+
+    def start(self):
+        self.calls.append("start")
+
+    def logs(self, stream=False, **kwargs):
+        if stream:
+            return iter(
+                json.dumps({
+                    "index": i, "name": f"test_{i}", "passed": True, "message": "", "duration_ms": 1,
+                    "nonce": self.nonce,
+                }).encode()
+                + b"\n"
+                for i in range(2)
+            )
+        return b"3\n"
+
+    def wait(self, timeout=None):
+        return {"StatusCode": 0}
+
+    def kill(self):
+        self.calls.append("kill")
+
+    def remove(self, force=False):
+        self.calls.append("remove")
+
+
+class FakeDocker:
+    def __init__(self):
+        self.containers = MagicMock()
+        self.containers.create.side_effect = lambda *args, **kwargs: FakeContainer(kwargs.get("volumes"))
+        self.api = MagicMock()
+
+
+class TestPhaseTimer:
+    def test_nested_phases_are_exclusive(self):
+        timer = PhaseTimer()
+        timer.start()
+        with timer.phase("outer"):
+            time.sleep(0.02)
+            with timer.phase("inner"):
+                time.sleep(0.02)
+        sample = timer.stop()
+        assert sample["inner"] >= 0.02
+        assert 0.02 <= sample["outer"] < 0.035
+
+    def test_records_only_while_measuring_and_not_muted(self):
+        timer = PhaseTimer()
+        with timer.phase("before"):
+            pass
+        timer.start()
+        with timer.muted():
+            with timer.phase("background"):
+                pass
+        with timer.phase("measured"):
+            pass
+        assert set(timer.stop()) == {"measured"}
+
+    def test_run_is_split_into_create_and_start(self):
+        timer = PhaseTimer()
+        docker = FakeDocker()
+        client = TimedDockerClient(docker, timer)
+        timer.start()
+        container = client.containers.run("autograder-sandbox", command=["python"], detach=True, user="nobody")
+        list(container.logs(stream=True, follow=True))
+        container.logs()
+        container.remove(force=True)
+        sample = timer.stop()
+
+        docker.containers.create.assert_called_once_with("autograder-sandbox", command=["python"], user="nobody")
+        assert container.calls == ["start", "remove"]
+        assert set(sample) == {"container_create", "container_start", "harness_run", "log_fetch", "remove"}
+
+
+class TestRunBenchmark:
+    def test_execute_submission_path(self):
+        with patch.object(settings, "sandbox_backend", "docker"), patch.object(settings, "sandbox_pool_size", 0):
+            report = run_benchmark([CASE], ["execute_submission"], runs=2, warmup=1, docker_factory=FakeDocker)
+
+        summary = report["paths"]["execute_submission"]["trivial"]
+        assert summary["runs"] == 2
+        assert summary["errors"] == 0
+        assert {
+            "client_create", "db_read", "db_write", "executor_wait", "write_inputs",
+            "container_create", "container_start", "harness_run", "wait", "remove", "other", "total",
+        } <= set(summary["phases"])
+        assert report["paths"]["execute_submission"]["all"]["runs"] == 2
+        assert report["meta"]["cases"] == ["trivial"]
+
+    def test_legacy_sandbox_path(self):
+        report = run_benchmark([CASE], ["sandbox_execute"], runs=1, warmup=0, docker_factory=FakeDocker)
+
+        summary = report["paths"]["sandbox_execute"]["trivial"]
+        assert summary["errors"] == 0
+        assert {"client_create", "container_create", "container_start", "wait", "log_fetch", "remove"} <= set(
+            summary["phases"]
+        )
+
+
+class TestCompare:
+    def test_deltas_per_phase(self):
+        before = build_report({"execute_submission": {"trivial": [{"wait": 10.0, "total": 100.0, "other": 90.0}]}}, {})
+        after = build_report({"execute_submission": {"trivial": [{"wait": 5.0, "total": 80.0, "other": 75.0}]}}, {})
+
+        rows = {(r["case"], r["phase"]): r for r in compare_reports(before, after)}
+
+        assert rows[("trivial", "wait")]["delta"] == -5.0
+        assert rows[("trivial", "total")]["delta_pct"] == pytest.approx(-20.0)
+        assert "-20%" in format_comparison(list(rows.values()))
@@ -0,0 +1,258 @@
+"""Tests for the per-host sandbox executor."""
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.sandbox_executor import (
+    SandboxExecutor,
+    SandboxResources,
+    executor_capacity,
+    get_executor_stats,
+    host_budget,
+    sandbox_worker_concurrency,
+)
+
+
+@pytest.fixture
+def executor():
+    ex = SandboxExecutor(capacity=2, publish=False)
+    yield ex
+    ex.shutdown()
+
+
+class TestHostBudget:
+    def test_host_ram_minus_reserved_and_every_core(self):
+        assert host_budget(cpu_count=8, memory_mb=16 * 1024, reserved_mb=1024) == (15 * 1024, 8)
+
+    def test_configured_budget_wins(self):
+        with patch("app.services.sandbox_executor.settings") as mock_settings:
+            mock_settings.sandbox_executor_memory_mb = 4096
+            mock_settings.sandbox_executor_cpus = 2.5
+            assert host_budget(cpu_count=8, memory_mb=16 * 1024) == (4096, 2.5)
+
+    def test_unknown_memory(self):
+        assert host_budget(cpu_count=4, memory_mb=0, reserved_mb=1024).memory_mb == 0
+
+
+class TestCapacity:
+    def test_one_sandbox_per_core_unless_configured(self):
+        with patch("app.services.sandbox_executor.settings") as mock_settings:
+            mock_settings.sandbox_executor_concurrency = 0
+            assert executor_capacity(SandboxResources(memory_mb=8192, cpus=6)) == 6
+            mock_settings.sandbox_executor_concurrency = 3
+            assert executor_capacity(SandboxResources(memory_mb=8192, cpus=6)) == 3
+
+    def test_worker_threads_follow_the_executor(self):
+        with patch("app.services.sandbox_executor.executor_capacity", return_value=8):
+            assert sandbox_worker_concurrency() == 16
+
+
+class TestSandboxExecutor:
+    def test_run_returns_job_result(self, executor):
+        assert executor.run(lambda a, b: a + b, 1, b=2) == 3
+        assert executor.stats()["completed"] == 1
+
+    def test_job_exception_reaches_caller(self, executor):
+        def boom():
+            raise ValueError("nope")
+
+        with pytest.raises(ValueError):
+            executor.run(boom)
+        assert executor.stats()["failed"] == 1
+
+    def test_capacity_bounds_running_jobs(self, executor):
+        release = threading.Event()
+        lock = threading.Lock()
+        active = []
+        peak = [0]
+
+        def job():
+            with lock:
+                active.append(1)
+                peak[0] = max(peak[0], len(active))
+            release.wait(5)
+            with lock:
+                active.pop()
+
+        futures = [executor.submit(job) for _ in range(5)]
+        deadline = time.monotonic() + 5
+        while executor.stats()["running"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        stats = executor.stats()
+        assert stats["running"] == 2
+        assert stats["queued"] == 3
+
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        assert peak[0] == 2
+        assert executor.stats()["queued"] == 0
+        assert executor.stats()["completed"] == 5
+
+
+class TestExecutorStats:
+    def test_sums_live_workers(self):
+        redis = MagicMock()
+        redis.scan_iter.return_value = ["sandbox_executor:b:2", "sandbox_executor:a:1"]
+        redis.hgetall.side_effect = [
+            {"worker": "b:2", "capacity": "8", "queued": "3", "running": "8", "completed": "10", "failed": "0"},
+            {"worker": "a:1", "capacity": "4", "queued": "0", "running": "1", "completed": "5", "failed": "1",
+             "memory_mb": "4096", "memory_reserved_mb": "1024", "cpus": "4", "cpus_reserved": "1.0"},
+        ]
+
+        with patch("app.services.sandbox_executor.get_redis_client", return_value=redis):
+            stats = get_executor_stats()
+
+        assert stats["capacity"] == 12
+        assert stats["queued"] == 3
+        assert stats["running"] == 9
+        assert [w["worker"] for w in stats["workers"]] == ["a:1", "b:2"]
+        assert stats["workers"][0]["memory_utilization"] == 0.25
+        assert stats["memory_mb"] == 4096
+        assert stats["cpu_utilization"] == 0.25
+
+    def test_admin_endpoint(self, client_with_admin):
+        client, _, _ = client_with_admin
+        stats = {"capacity": 4, "queued": 1, "running": 4, "workers": []}
+
+        with patch("app.routers.admin_sandbox.get_executor_stats", return_value=stats):
+            response = client.get("/admin/sandbox/executor")
+
+        assert response.status_code == 200
+        assert response.json()["queued"] == 1
+
+    def test_professor_forbidden(self, client_with_professor):
+        client, _, _ = client_with_professor
+        assert client.get("/admin/sandbox/executor").status_code == 403
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestBinPacking:
+    @pytest.fixture
+    def packed(self):
+        ex = SandboxExecutor(capacity=8, publish=False, budget=SandboxResources(memory_mb=1024, cpus=4))
+        yield ex
+        ex.shutdown()
+
+    def _blocking_job(self, started, release, name):
+        def job():
+            started.append(name)
+            release.wait(5)
+        return job
+
+    def test_small_jobs_run_side_by_side_and_heavy_ones_wait(self, packed):
+        release = threading.Event()
+        started = []
+        small = [
+            packed.submit(self._blocking_job(started, release, f"small{i}"),
+                          resources=SandboxResources(memory_mb=128, cpus=1))
+            for i in range(3)
+        ]
+        _wait_for(lambda: len(started) == 3)
+        heavy = packed.submit(self._blocking_job(started, release, "heavy"),
+                              resources=SandboxResources(memory_mb=768, cpus=1))
+        time.sleep(0.1)
+
+        stats = packed.stats()
+        assert stats["running"] == 3
+        assert stats["queued"] == 1
+        assert stats["memory_reserved_mb"] == 384
+        assert stats["cpus_reserved"] == 3
+        assert "heavy" not in started
+
+        release.set()
+        for future in small + [heavy]:
+            future.result(timeout=5)
+        assert started[-1] == "heavy"
+        assert packed.stats()["memory_reserved_mb"] == 0
+
+    def test_job_larger_than_the_budget_runs_alone(self, packed):
+        assert packed.run(lambda: "ok", resources=SandboxResources(memory_mb=4096, cpus=8)) == "ok"
+
+    def test_backfill_stops_once_the_head_waited_too_long(self, packed):
+        release = threading.Event()
+        started = []
+        first = packed.submit(self._blocking_job(started, release, "first"),
+                              resources=SandboxResources(memory_mb=512, cpus=1))
+        _wait_for(lambda: started)
+
+        with patch("app.services.sandbox_executor.settings") as mock_settings:
+            mock_settings.sandbox_executor_backfill_seconds = 0
+            heavy = packed.submit(self._blocking_job(started, release, "heavy"),
+                                  resources=SandboxResources(memory_mb=1024, cpus=1))
+            small = packed.submit(self._blocking_job(started, release, "small"),
+                                  resources=SandboxResources(memory_mb=128, cpus=1))
+            time.sleep(0.1)
+            assert started == ["first"]  # small fits but must not overtake heavy
+            release.set()
+            for future in (first, heavy, small):
+                future.result(timeout=5)
+
+        assert started == ["first", "heavy", "small"]
+
+    def test_backfills_while_the_head_is_young(self, packed):
+        release = threading.Event()
+        started = []
+        first = packed.submit(self._blocking_job(started, release, "first"),
+                              resources=SandboxResources(memory_mb=512, cpus=1))
+        _wait_for(lambda: started)
+        heavy = packed.submit(self._blocking_job(started, release, "heavy"),
+                              resources=SandboxResources(memory_mb=1024, cpus=1))
+        small = packed.submit(self._blocking_job(started, release, "small"),
+                              resources=SandboxResources(memory_mb=128, cpus=1))
+        _wait_for(lambda: len(started) == 2)
+
+        assert started == ["first", "small"]
+        release.set()
+        for future in (first, heavy, small):
+            future.result(timeout=5)
+
+
+class TestPriorityLanes:
+    def test_lower_lane_admitted_first(self, executor):
+        release = threading.Event()
+        started = []
+
+        def job(name):
+            started.append(name)
+            release.wait(5)
+
+        running = [executor.submit(job, f"running{i}") for i in range(2)]
+        _wait_for(lambda: len(started) == 2)
+        interactive = executor.submit(job, "interactive", priority=3)
+        deadline = executor.submit(job, "deadline", priority=0)
+        time.sleep(0.1)
+
+        release.set()
+        for future in running + [interactive, deadline]:
+            future.result(timeout=5)
+        assert started[2:] == ["deadline", "interactive"]
+
+    def test_interactive_run_overtakes_a_queued_regrade_burst(self, executor):
+        from app.services.priority import BULK, INTERACTIVE
+
+        release = threading.Event()
+        started = []
+
+        def job(name):
+            started.append(name)
+            release.wait(5)
+
+        bulk = [executor.submit(job, f"bulk{i}", priority=BULK) for i in range(20)]
+        _wait_for(lambda: len(started) == 2)
+        interactive = executor.submit(job, "interactive", priority=INTERACTIVE)
+        time.sleep(0.1)
+        assert executor.stats()["queued"] == 19
+
+        release.set()
+        for future in bulk + [interactive]:
+            future.result(timeout=5)
+        assert started[2] == "interactive"
@@ -9,7 +9,7 @@ class TestSandboxExecution:
 
     @patch("app.tasks.get_docker_client")
     def test_execution_success(self, mock_get_docker):
-        from app.tasks import truncate_output, create_test_harness
+        from app.tasks import truncate_output
         from app.models.exercise import TestCase
 
         # Test truncation
@@ -21,8 +21,8 @@ class TestSandboxExecution:
         assert len(truncated) < 200_000
         assert "truncated" in truncated.lower()
 
-    def test_create_test_harness(self):
-        from app.tasks import create_test_harness
+    def test_write_harness_inputs(self, tmp_path):
+        from app.tasks import write_harness_inputs
         from unittest.mock import Mock
 
         tc = Mock()
@@ -30,9 +30,11 @@ class TestSandboxExecution:
         tc.input_data = "add(1, 2)"
         tc.expected_output = "3"
 
-        harness = create_test_harness([tc], "def add(a, b): return a + b")
-        assert "test_add" in harness
-        assert "add(1, 2)" in harness
+        write_harness_inputs(tmp_path, [tc], "def add(a, b): return a + b")
+        assert (tmp_path / "submission.py").read_text() == "def add(a, b): return a + b"
+        tests = [json.loads(line) for line in (tmp_path / "tests.jsonl").read_text().splitlines()]
+        assert tests == [{"name": "test_add", "input": "add(1, 2)", "expected": "3"}]
+        assert json.loads((tmp_path / "config.json").read_text())["workers"] == 1
 
     @patch("app.tasks.get_docker_client")
     def test_container_config_security(self, mock_get_docker):
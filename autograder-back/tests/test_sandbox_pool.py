@@ -0,0 +1,327 @@
+"""Tests for the warm sandbox container pool."""
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.services.sandbox_pool import (
+    SandboxOutputLimitExceeded,
+    SandboxPool,
+    SandboxTimeout,
+    TIMEOUT_EXIT_CODE,
+    ZYGOTE_PATH,
+    read_capped,
+)
+
+
+def _make_client():
+    client = MagicMock()
+
+    def run_side_effect(*args, **kwargs):
+        container = MagicMock()
+        container.status = "running"
+        container.exec_run.return_value = (0, b"")
+        return container
+
+    client.containers.run.side_effect = run_side_effect
+    client.api.exec_create.return_value = {"Id": "exec-1"}
+    _exec_returns(client, 0, b"")
+    return client
+
+
+def _exec_returns(client, exit_code, *chunks, stderr=b""):
+    """Exec output; a demultiplexed stream (zygote mode) also carries `stderr` after it."""
+    def exec_start(*args, demux=False, **kwargs):
+        if not demux:
+            return iter(chunks)
+        return iter([(chunk, None) for chunk in chunks] + [(None, stderr)])
+
+    client.api.exec_start.side_effect = exec_start
+    client.api.exec_inspect.return_value = {"ExitCode": exit_code}
+
+
+@pytest.fixture
+def pool():
+    p = SandboxPool(_make_client(), size=2, max_reuse=3, image="autograder-sandbox")
+    yield p
+    p.shutdown()
+
+
+class TestSandboxPool:
+    def test_warm_creates_locked_down_containers(self, pool):
+        pool.warm()
+
+        assert pool.stats()["idle"] == 2
+        assert pool.client.containers.run.call_count == 2
+        kwargs = pool.client.containers.run.call_args.kwargs
+        assert kwargs["network_mode"] == "none"
+        assert kwargs["read_only"] is True
+        assert kwargs["cap_drop"] == ["ALL"]
+        assert kwargs["command"] == ["sleep", "infinity"]
+        assert [v["bind"] for v in kwargs["volumes"].values()] == ["/workspace"]
+
+    def test_shared_datasets_are_opt_in(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, share_datasets=True)
+        pool.warm()
+
+        volumes = pool.client.containers.run.call_args.kwargs["volumes"]
+        assert {"bind": "/datasets", "mode": "ro"} in volumes.values()
+        pool.shutdown()
+
+    def test_acquire_reuses_warm_container(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        pool.execute(slot, "/workspace/test_harness.py", 5, 1024)
+        pool.release(slot)
+
+        again = pool.acquire(512)
+        assert again is slot
+        assert pool.client.containers.run.call_count == 2
+        pool.release(again)
+
+    def test_acquire_resizes_memory_limit(self, pool):
+        pool.warm()
+        slot = pool.acquire(256)
+
+        slot.container.update.assert_called_once_with(mem_limit="256m", memswap_limit="256m")
+        assert slot.memory_limit_mb == 256
+        pool.release(slot)
+
+    def test_acquire_resizes_cpu_quota(self, pool):
+        pool.warm()
+        slot = pool.acquire(512, cpus=2)
+
+        slot.container.update.assert_called_once_with(cpu_quota=200000)
+        assert slot.cpus == 2
+        pool.release(slot)
+
+    def test_execute_wraps_command_with_timeout(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, 0, b"[", b"]")
+
+        exit_code, output = pool.execute(slot, "/workspace/test_harness.py", 7, 1024)
+
+        assert exit_code == 0
+        assert output == b"[]"
+        args = pool.client.api.exec_create.call_args.args
+        assert args[0] == slot.container.id
+        assert args[1] == ["timeout", "-k", "1", "7", "python", "/workspace/test_harness.py"]
+        pool.release(slot)
+
+    def test_execute_raises_on_timeout(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, TIMEOUT_EXIT_CODE)
+
+        with patch("app.services.sandbox_pool.time.monotonic", side_effect=[100.0, 101.2]), \
+             pytest.raises(SandboxTimeout):
+            pool.execute(slot, "/workspace/x.py", 1, 1024)
+        pool.release(slot)
+
+    def test_watchdog_kills_a_run_that_escapes_timeout(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        killed = threading.Event()
+        slot.container.kill.side_effect = killed.set
+
+        def endless_stream(*args, **kwargs):
+            # A setsid'd grandchild keeps stdout open: no EOF until the container dies
+            while not killed.wait(0.01):
+                yield b"."
+
+        pool.client.api.exec_start.side_effect = endless_stream
+
+        with patch("app.services.sandbox_pool.WATCHDOG_GRACE_SECONDS", 0.1), \
+             pytest.raises(SandboxTimeout):
+            pool.execute(slot, "/workspace/x.py", 0, 1024 * 1024)
+
+        assert slot.killed
+        pool.release(slot)
+        slot.container.remove.assert_called_once_with(force=True)
+
+    def test_student_exiting_with_timeout_status_is_not_a_timeout(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, TIMEOUT_EXIT_CODE, b"bye\n")
+
+        exit_code, output = pool.execute(slot, "/workspace/x.py", 5, 1024)
+
+        assert (exit_code, output) == (TIMEOUT_EXIT_CODE, b"bye\n")
+        pool.release(slot)
+
+    def test_output_over_budget_kills_and_replaces_container(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, 0, b"x" * 600, b"x" * 600, b"never read")
+
+        with pytest.raises(SandboxOutputLimitExceeded):
+            pool.execute(slot, "/workspace/x.py", 5, 1000)
+
+        slot.container.kill.assert_called_once()
+        with patch("app.services.sandbox_pool.threading.Thread"):
+            pool.release(slot, healthy=True)
+        slot.container.remove.assert_called_once_with(force=True)
+        assert slot not in pool._idle
+
+    def test_release_replaces_after_max_reuse(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        slot.uses = pool.max_reuse
+
+        with patch("app.services.sandbox_pool.threading.Thread") as MockThread:
+            pool.release(slot)
+
+        slot.container.remove.assert_called_once_with(force=True)
+        assert pool.stats()["replaced"] == 1
+        MockThread.return_value.start.assert_called_once()
+
+    def test_release_replaces_unhealthy_container(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        slot.container.status = "exited"
+
+        with patch("app.services.sandbox_pool.threading.Thread"):
+            pool.release(slot)
+
+        slot.container.remove.assert_called_once_with(force=True)
+        assert slot not in pool._idle
+
+    def test_release_clears_workspace(self, pool):
+        pool.warm()
+        slot = pool.acquire(512)
+        (slot.workspace / "test_harness.py").write_text("print(1)")
+
+        pool.release(slot)
+
+        assert list(slot.workspace.iterdir()) == []
+
+    def test_overflow_container_is_discarded(self, pool):
+        pool.warm()
+        a = pool.acquire(512)
+        b = pool.acquire(512)
+        c = pool.acquire(512)
+
+        assert c.overflow is True
+        assert pool.stats()["overflow"] == 1
+
+        pool.release(c)
+        c.container.remove.assert_called_once_with(force=True)
+        pool.release(a)
+        pool.release(b)
+        assert pool.stats()["idle"] == 2
+
+    def test_shutdown_removes_idle_containers(self, pool):
+        pool.warm()
+        slots = list(pool._idle)
+
+        pool.shutdown()
+
+        for slot in slots:
+            slot.container.remove.assert_called_once_with(force=True)
+        assert pool.stats()["idle"] == 0
+
+
+class TestZygoteMode:
+    def test_containers_run_fork_server(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True, preload="numpy,pandas")
+        pool.warm()
+
+        kwargs = pool.client.containers.run.call_args.kwargs
+        assert kwargs["command"] == ["python", ZYGOTE_PATH, "serve"]
+        assert kwargs["cap_add"] == ["SETUID", "SETGID", "KILL"]
+        assert kwargs["environment"]["ZYGOTE_PRELOAD"] == "numpy,pandas"
+        assert kwargs["network_mode"] == "none"
+        pool.shutdown()
+
+    def test_execute_goes_through_zygote_client(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True)
+        pool.warm()
+        slot = pool.acquire(512)
+
+        pool.execute(slot, "/workspace/test_harness.py", 10, 4096)
+
+        args, kwargs = pool.client.api.exec_create.call_args
+        assert args[1][-6:] == ["run", "--timeout", "10", "--max-output", "4096", "/workspace/test_harness.py"]
+        assert ZYGOTE_PATH in args[1]
+        assert kwargs["user"] == "0"
+        pool.release(slot)
+        pool.shutdown()
+
+    def test_zygote_output_limit_keeps_container(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True)
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, 153, b"partial", stderr=b"zygote-status: output_limit\n")
+
+        with pytest.raises(SandboxOutputLimitExceeded):
+            pool.execute(slot, "/workspace/test_harness.py", 10, 4096)
+
+        slot.container.kill.assert_not_called()
+        pool.release(slot)
+        assert pool.stats()["idle"] == 1
+        pool.shutdown()
+
+    def test_zygote_timeout_comes_from_the_client_status(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True)
+        pool.warm()
+        slot = pool.acquire(512)
+        _exec_returns(pool.client, 124, b"partial\n", stderr=b"zygote-status: timeout\n")
+
+        with pytest.raises(SandboxTimeout):
+            pool.execute(slot, "/workspace/test_harness.py", 10, 4096)
+        pool.release(slot)
+        pool.shutdown()
+
+    def test_zygote_student_exit_statuses_are_plain_exits(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True)
+        pool.warm()
+        slot = pool.acquire(512)
+
+        for status in (124, 153):
+            _exec_returns(pool.client, status, b"out\n")
+            assert pool.execute(slot, "/workspace/test_harness.py", 10, 4096) == (status, b"out\n")
+        pool.release(slot)
+        pool.shutdown()
+
+    def test_reset_runs_as_sandbox_user(self):
+        pool = SandboxPool(_make_client(), size=1, max_reuse=3, zygote=True)
+        pool.warm()
+        slot = pool.acquire(512)
+
+        pool.release(slot)
+
+        assert slot.container.exec_run.call_args.kwargs["user"] == "nobody"
+        pool.shutdown()
+
+
+class TestReadCapped:
+    def test_joins_chunks_within_budget(self):
+        assert read_capped(iter([b"ab", b"cd"]), 4) == b"abcd"
+
+    def test_stops_reading_past_budget(self):
+        consumed = []
+
+        def stream():
+            for chunk in (b"abc", b"def", b"ghi"):
+                consumed.append(chunk)
+                yield chunk
+
+        with pytest.raises(SandboxOutputLimitExceeded):
+            read_capped(stream(), 5)
+        assert consumed == [b"abc", b"def"]
+
+    def test_calls_on_line_for_complete_lines(self):
+        lines = []
+
+        output = read_capped(iter([b'{"a": 1}\n{"b"', b': 2}\npartial']), 1024, lines.append)
+
+        assert lines == [b'{"a": 1}', b'{"b": 2}']
+        assert output.endswith(b"partial")
+
+    def test_closes_stream(self):
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([b"x" * 10])
+
+        with pytest.raises(SandboxOutputLimitExceeded):
+            read_capped(stream, 5)
+        stream.close.assert_called_once()
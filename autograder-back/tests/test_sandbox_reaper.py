@@ -0,0 +1,137 @@
+"""Tests for the reaper of orphaned sandbox containers."""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.sandbox_pool import (
+    POOL_LABEL,
+    SANDBOX_LABEL,
+    STARTED_LABEL,
+    SUBMISSION_LABEL,
+    TIMEOUT_LABEL,
+    WORKER_LABEL,
+    sandbox_labels,
+)
+from app.services.sandbox_reaper import get_reaper_stats, is_orphaned, reap_containers
+
+NOW = 1_800_000_000
+
+
+def _labels(age, worker="host:1", timeout=30, pool=False, submission=None):
+    labels = {SANDBOX_LABEL: "1", WORKER_LABEL: worker, STARTED_LABEL: str(NOW - age)}
+    if pool:
+        labels[POOL_LABEL] = "1"
+    else:
+        labels[TIMEOUT_LABEL] = str(timeout)
+    if submission:
+        labels[SUBMISSION_LABEL] = str(submission)
+    return labels
+
+
+@pytest.fixture(autouse=True)
+def reaper_settings():
+    with patch("app.services.sandbox_reaper.settings") as mock_settings, \
+         patch("app.services.sandbox_reaper.worker_id", return_value="host:99"):
+        mock_settings.sandbox_reaper_grace_seconds = 120
+        mock_settings.sandbox_timeout_seconds = 30
+        yield mock_settings
+
+
+class TestIsOrphaned:
+    def test_one_shot_past_timeout_and_grace(self):
+        assert not is_orphaned(_labels(age=100), NOW, {"host:1"})
+        assert is_orphaned(_labels(age=200), NOW, {"host:1"})
+
+    def test_pool_container_of_live_worker_is_kept(self):
+        assert not is_orphaned(_labels(age=86400, pool=True), NOW, {"host:1"})
+
+    def test_dead_worker(self):
+        assert is_orphaned(_labels(age=130, pool=True), NOW, {"host:2"})
+        assert not is_orphaned(_labels(age=60, pool=True), NOW, {"host:2"})  # worker may be starting
+
+    def test_liveness_unknown_falls_back_to_age(self):
+        assert not is_orphaned(_labels(age=86400, pool=True), NOW, None)
+        assert is_orphaned(_labels(age=200), NOW, None)
+
+    def test_own_containers_are_never_reaped(self):
+        assert not is_orphaned(_labels(age=86400, worker="host:99"), NOW, set())
+
+
+class TestReapContainers:
+    def _container(self, labels, short_id):
+        container = MagicMock()
+        container.labels = labels
+        container.short_id = short_id
+        return container
+
+    def test_removes_orphans_and_counts(self):
+        leaked = self._container(_labels(age=700, submission=42), "aaa")
+        stuck = self._container(_labels(age=700), "bbb")
+        stuck.remove.side_effect = Exception("device busy")
+        fine = self._container(_labels(age=5), "ccc")
+        docker_client = MagicMock()
+        docker_client.containers.list.return_value = [leaked, stuck, fine]
+        redis = MagicMock()
+
+        with patch("app.services.sandbox_reaper.live_workers", return_value={"host:1"}), \
+             patch("app.services.sandbox_reaper.get_redis_client", return_value=redis):
+            result = reap_containers(docker_client, now=NOW)
+
+        docker_client.containers.list.assert_called_once_with(all=True, filters={"label": SANDBOX_LABEL})
+        leaked.remove.assert_called_once_with(force=True)
+        fine.remove.assert_not_called()
+        assert {k: result[k] for k in ("scanned", "leaked", "reaped", "failed")} == {
+            "scanned": 3, "leaked": 2, "reaped": 1, "failed": 1,
+        }
+        assert result["containers"] == [
+            {"container": "aaa", "worker": "host:1", "submission_id": "42", "age_seconds": 700}
+        ]
+        pipe = redis.pipeline.return_value
+        pipe.hincrby.assert_any_call(pipe.hset.call_args.args[0], "total_reaped", 1)
+
+    def test_redis_down_reaps_by_age(self):
+        docker_client = MagicMock()
+        docker_client.containers.list.return_value = [
+            self._container(_labels(age=86400, pool=True), "pool"),
+            self._container(_labels(age=700), "old"),
+        ]
+        with patch("app.services.sandbox_reaper.live_workers", side_effect=ConnectionError("down")), \
+             patch("app.services.sandbox_reaper.get_redis_client", side_effect=ConnectionError("down")):
+            result = reap_containers(docker_client, now=NOW)
+
+        assert [c["container"] for c in result["containers"]] == ["old"]
+
+
+def test_labels_identify_worker_and_run():
+    with patch("app.services.sandbox_pool.worker_id", return_value="host:7"), \
+         patch("app.services.sandbox_pool.time.time", return_value=NOW):
+        labels = sandbox_labels({SUBMISSION_LABEL: 42, TIMEOUT_LABEL: 30, POOL_LABEL: None})
+
+    assert labels == {
+        SANDBOX_LABEL: "1", WORKER_LABEL: "host:7", STARTED_LABEL: str(NOW),
+        SUBMISSION_LABEL: "42", TIMEOUT_LABEL: "30",
+    }
+
+
+class TestReaperEndpoint:
+    def test_reports_hosts(self, client_with_admin):
+        client, _, _ = client_with_admin
+        redis = MagicMock()
+        redis.scan_iter.return_value = ["sandbox_reaper:worker-1"]
+        redis.hgetall.return_value = {
+            "host": "worker-1", "last_run_at": str(NOW), "last_scanned": "12", "last_reaped": "2",
+            "total_leaked": "5", "total_reaped": "5",
+        }
+
+        with patch("app.services.sandbox_reaper.get_redis_client", return_value=redis):
+            response = client.get("/admin/sandbox/reaper")
+
+        assert response.status_code == 200
+        host = response.json()[0]
+        assert host["last_reaped"] == 2
+        assert host["total_reaped"] == 5
+        assert host["last_failed"] == 0
+
+    def test_professor_forbidden(self, client_with_professor):
+        client, _, _ = client_with_professor
+        assert client.get("/admin/sandbox/reaper").status_code == 403
@@ -0,0 +1,199 @@
+"""Tests for in-flight coalescing of identical grading work."""
+import threading
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+import redis
+
+from app.models.exercise import Exercise, TestCase
+from app.models.submission import Submission, SubmissionStatus
+from app.services import singleflight
+from app.services.singleflight import BUSY, DUPLICATE, LEADER, InFlightLease
+
+
+class FakeRedis:
+    """The handful of Redis commands the lease uses, thread-safe."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, name, value, nx=False, ex=None):
+        with self.lock:
+            if nx and name in self.data:
+                return None
+            self.data[name] = value
+            return True
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def exists(self, name):
+        return int(name in self.data)
+
+    def expire(self, name, seconds):
+        return int(name in self.data)
+
+    def eval(self, script, numkeys, name, owner):
+        with self.lock:
+            if self.data.get(name) == owner:
+                del self.data[name]
+                return 1
+            return 0
+
+
+@pytest.fixture
+def fake_redis():
+    client = FakeRedis()
+    with patch("app.services.singleflight.get_redis_client", return_value=client):
+        yield client
+
+
+class TestInFlightLease:
+    def test_first_task_leads(self, fake_redis):
+        lease = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        assert lease.try_acquire() == LEADER
+        assert fake_redis.data["singleflight:execute:1:abc"] == "task-1"
+
+    def test_follower_is_busy_until_the_leader_releases(self, fake_redis):
+        leader = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        leader.try_acquire()
+        follower = InFlightLease("execute", "1:abc", "task-2", ttl_seconds=60)
+
+        assert follower.try_acquire() == BUSY
+        assert not follower.held
+        leader.release()
+        assert follower.try_acquire() == LEADER
+        assert fake_redis.data["singleflight:execute:1:abc"] == "task-2"
+
+    def test_different_keys_are_independent(self, fake_redis):
+        InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60).try_acquire()
+        assert InFlightLease("execute", "1:def", "task-2", ttl_seconds=60).try_acquire() == LEADER
+        assert InFlightLease("llm", "1:abc", "task-3", ttl_seconds=60).try_acquire() == LEADER
+
+    def test_redelivery_of_a_dead_run_takes_over(self, fake_redis):
+        InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60).try_acquire()  # worker died here
+        redelivery = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        assert redelivery.try_acquire() == LEADER
+        assert redelivery.held
+
+    def test_redelivery_after_finishing_is_duplicate(self, fake_redis):
+        lease = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        lease.try_acquire()
+        lease.release()
+        assert InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60).try_acquire() == DUPLICATE
+
+    def test_retry_is_not_a_duplicate(self, fake_redis):
+        lease = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        lease.try_acquire()
+        lease.release(done=False)
+        assert InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60).try_acquire() == LEADER
+
+    def test_release_keeps_a_lease_taken_over_by_another_owner(self, fake_redis):
+        lease = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+        lease.try_acquire()
+        fake_redis.data["singleflight:execute:1:abc"] = "task-2"  # expired and re-acquired
+        lease.release()
+        assert fake_redis.data["singleflight:execute:1:abc"] == "task-2"
+
+    def test_redis_down_runs_uncoalesced(self):
+        client = MagicMock()
+        client.exists.side_effect = redis.ConnectionError("down")
+        with patch("app.services.singleflight.get_redis_client", return_value=client):
+            lease = InFlightLease("execute", "1:abc", "task-1", ttl_seconds=60)
+            assert lease.try_acquire() == LEADER
+            lease.release()  # nothing held, nothing to do
+
+
+def _setup_db(submission, exercise, test_cases):
+    db = MagicMock()
+
+    def query_side_effect(model):
+        q = MagicMock()
+        q.filter.return_value = q
+        q.order_by.return_value = q
+        q.first.return_value = None
+        q.all.return_value = []
+        if model is Submission:
+            q.first.return_value = submission
+        elif model is Exercise:
+            q.first.return_value = exercise
+        elif model is TestCase:
+            q.all.return_value = test_cases
+        return q
+
+    db.query.side_effect = query_side_effect
+    return db
+
+
+class TestExecuteSubmissionCoalescing:
+    def _submission(self):
+        s = Mock(spec=Submission)
+        s.id = 7
+        s.exercise_id = 1
+        s.content_hash = "abc"
+        s.status = SubmissionStatus.QUEUED
+        return s
+
+    def test_redelivered_task_does_not_run(self, fake_redis):
+        submission = self._submission()
+        db = _setup_db(submission, Mock(spec=Exercise), [])
+        fake_redis.data["singleflight:done:task-1"] = "1"
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.get_sandbox_backend") as mock_backend, \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.singleflight_enabled = True
+            from app.tasks import execute_submission
+            execute_submission.push_request(id="task-1", retries=0)
+            try:
+                result = execute_submission.run(7)
+            finally:
+                execute_submission.pop_request()
+
+        assert result == {"submission_id": 7, "duplicate": True}
+        assert submission.status == SubmissionStatus.QUEUED
+        mock_backend.assert_not_called()
+
+    def test_lease_is_keyed_by_exercise_and_hash_and_released(self, fake_redis):
+        submission = self._submission()
+        db = _setup_db(submission, None, [])  # exercise gone: returns early
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.singleflight_enabled = True
+            from app.tasks import execute_submission
+            execute_submission.push_request(id="task-2", retries=0)
+            try:
+                execute_submission.run(7)
+            finally:
+                execute_submission.pop_request()
+
+        assert "singleflight:execute:1:abc" not in fake_redis.data
+        assert fake_redis.data["singleflight:done:task-2"] == "1"
+
+    def test_follower_is_retried_instead_of_waiting(self, fake_redis):
+        from celery.exceptions import Retry
+
+        submission = self._submission()
+        db = _setup_db(submission, Mock(spec=Exercise), [])
+        fake_redis.data["singleflight:execute:1:abc"] = "task-1"
+
+        with patch("app.tasks.SessionLocal", return_value=db), \
+             patch("app.tasks.settings") as mock_settings:
+            mock_settings.singleflight_enabled = True
+            mock_settings.singleflight_retry_seconds = 5
+            mock_settings.singleflight_lease_seconds = 660
+            from app.tasks import execute_submission
+            execute_submission.push_request(id="task-2", retries=0, kwargs={"late_penalty": 10.0})
+            try:
+                with patch.object(execute_submission, "retry", side_effect=Retry) as mock_retry:
+                    with pytest.raises(Retry):
+                        execute_submission.run(7, late_penalty=10.0)
+            finally:
+                execute_submission.pop_request()
+
+        mock_retry.assert_called_once_with(
+            kwargs={"late_penalty": 10.0, "coalesced": 1}, countdown=5, max_retries=1
+        )
+        assert submission.status == SubmissionStatus.QUEUED
@@ -0,0 +1,112 @@
+"""Tests for starting the LLM evaluation alongside the sandbox run."""
+from unittest.mock import MagicMock, Mock, patch
+
+from app.models.exercise import Exercise, GradingMode, SubmissionType
+from app.models.submission import Grade, LLMEvaluation, Submission
+from app.services.priority import DEADLINE
+
+
+def _exercise():
+    exercise = Mock(spec=Exercise)
+    exercise.id = 1
+    exercise.llm_grading_enabled = True
+    exercise.auto_publish_grades = True
+    exercise.test_weight = 0.6
+    exercise.llm_weight = 0.4
+    return exercise
+
+
+def _submission():
+    submission = Mock(spec=Submission)
+    submission.id = 10
+    return submission
+
+
+def _db(llm_eval=None):
+    db = MagicMock()
+    db.query.return_value.filter.return_value.first.return_value = llm_eval
+    return db
+
+
+def _saved_grade(db):
+    return next(c.args[0] for c in db.add.call_args_list if isinstance(c.args[0], Grade))
+
+
+class TestDispatch:
+    def _post(self, client_with_student, llm_grading_enabled):
+        client, mock_db, student = client_with_student
+        exercise = Mock(spec=Exercise)
+        exercise.id = 1
+        exercise.submission_type = SubmissionType.CODE
+        exercise.grading_mode = GradingMode.TEST_FIRST
+        exercise.llm_grading_enabled = llm_grading_enabled
+        exercise.max_submissions = None
+        exercise.precheck_enabled = False
+        mock_db.query.return_value.filter.return_value.first.return_value = exercise
+
+        def refresh(obj):
+            obj.id = 10
+            obj.submitted_at = "2026-01-01T00:00:00"
+
+        mock_db.refresh.side_effect = refresh
+
+        with patch("app.routers.submissions.check_deadline", return_value=None), \
+             patch("app.routers.submissions.submission_priority", return_value=DEADLINE), \
+             patch("app.routers.submissions.celery_app") as mock_celery:
+            response = client.post("/submissions", data={"exercise_id": "1", "code": "x = 1\n"})
+
+        assert response.status_code == 201
+        return mock_celery.send_task.call_args_list
+
+    def test_both_tasks_start_at_submission(self, client_with_student):
+        execute, evaluate = self._post(client_with_student, llm_grading_enabled=True)
+
+        assert execute.args == ("app.tasks.execute_submission",)
+        assert execute.kwargs["kwargs"]["llm_dispatched"] is True
+        assert evaluate.args == ("app.tasks.llm_evaluate_submission",)
+        assert evaluate.kwargs == {"args": [10], "priority": DEADLINE}
+
+    def test_tests_only_exercise(self, client_with_student):
+        (execute,) = self._post(client_with_student, llm_grading_enabled=False)
+        assert execute.kwargs["kwargs"]["llm_dispatched"] is False
+
+
+class TestCombine:
+    def test_llm_finished_first(self):
+        from app.tasks import _save_test_results
+
+        db = _db(Mock(spec=LLMEvaluation, score=50.0))
+        results = [{"name": "a", "passed": True}, {"name": "b", "passed": True}]
+
+        with patch("app.tasks.llm_evaluate_submission") as mock_llm:
+            _save_test_results(db, _submission(), _exercise(), results, 10.0, llm_dispatched=True)
+
+        grade = _saved_grade(db)
+        assert grade.llm_score == 50.0
+        assert grade.final_score == 0.6 * 100 + 0.4 * 50 - 10
+        db.query.return_value.filter.return_value.with_for_update.assert_called_once()
+        mock_llm.apply_async.assert_not_called()
+
+    def test_tests_finished_first(self):
+        from app.tasks import _save_test_results
+
+        db = _db(None)
+        with patch("app.tasks.llm_evaluate_submission") as mock_llm:
+            _save_test_results(db, _submission(), _exercise(), [{"name": "a", "passed": True}], 0.0,
+                               llm_dispatched=True)
+
+        grade = _saved_grade(db)
+        assert grade.llm_score is None
+        assert grade.final_score == 100
+        mock_llm.apply_async.assert_not_called()
+
+    def test_evaluation_updates_an_existing_grade(self):
+        from app.tasks import _combine_llm_score
+
+        grade = Grade(test_score=100.0, late_penalty_applied=0.0)
+        db = _db(grade)
+        _combine_llm_score(db, _submission(), _exercise(), 50.0)
+
+        assert grade.llm_score == 50.0
+        assert grade.final_score == 80.0
+        db.query.return_value.filter.return_value.with_for_update.assert_called_once()
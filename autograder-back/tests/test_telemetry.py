@@ -0,0 +1,96 @@
+"""Tests for per-exercise sandbox resource telemetry."""
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock
+
+from app.models.exercise import Exercise
+from app.services.telemetry import exercise_telemetry, percentile, summarize
+
+
+def _run(id, wall, cpu, rss, reason="completed"):
+    return SimpleNamespace(id=id, wall_time_ms=wall, cpu_time_ms=cpu, peak_memory_kb=rss, exit_reason=reason)
+
+
+def _db(runs, durations):
+    db = MagicMock()
+    runs_query = MagicMock()
+    runs_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = runs
+    tests_query = MagicMock()
+    tests_query.filter.return_value.all.return_value = durations
+    db.query.side_effect = [runs_query, tests_query]
+    return db
+
+
+class TestPercentiles:
+    def test_interpolates_between_ranks(self):
+        assert percentile([10, 20, 30, 40], 50) == 25
+        assert percentile([10, 20, 30, 40], 100) == 40
+        assert percentile([7], 99) == 7
+        assert percentile([], 50) is None
+
+    def test_summary_ignores_missing_values(self):
+        summary = summarize([100, None, 300, 200])
+
+        assert summary["count"] == 3
+        assert summary["p50"] == 200
+        assert summary["max"] == 300
+
+
+class TestExerciseTelemetry:
+    def test_aggregates_runs_and_test_durations(self):
+        runs = [
+            _run(3, 900, 700, 50000),
+            _run(2, None, None, None, "cached"),
+            _run(1, 30000, 29000, 80000, "timeout"),
+        ]
+        durations = [
+            SimpleNamespace(test_name="t1", duration_ms=4),
+            SimpleNamespace(test_name="t1", duration_ms=6),
+            SimpleNamespace(test_name="t2", duration_ms=100),
+        ]
+
+        data = exercise_telemetry(_db(runs, durations), exercise_id=1)
+
+        assert data["submissions"] == 3
+        assert data["exit_reasons"] == {"completed": 1, "cached": 1, "timeout": 1}
+        assert data["wall_time_ms"]["count"] == 2
+        assert data["peak_memory_kb"]["max"] == 80000
+        assert [(t["test_name"], t["p50"]) for t in data["tests"]] == [("t1", 5), ("t2", 100)]
+
+    def test_no_runs_skips_test_query(self):
+        db = _db([], [])
+
+        data = exercise_telemetry(db, exercise_id=1)
+
+        assert data["submissions"] == 0
+        assert data["wall_time_ms"]["p95"] is None
+        assert db.query.call_count == 1
+
+
+class TestTelemetryEndpoint:
+    def test_returns_percentiles_with_current_limits(self, client_with_professor):
+        client, mock_db, professor = client_with_professor
+        exercise = Mock(spec=Exercise)
+        exercise.created_by = professor.id
+        exercise.timeout_seconds = 30
+        exercise.memory_limit_mb = 512
+        runs_query = MagicMock()
+        runs_query.filter.return_value.order_by.return_value.limit.return_value.all.return_value = [
+            _run(1, 1200, 1000, 40000),
+        ]
+        tests_query = MagicMock()
+        tests_query.filter.return_value.all.return_value = []
+        exercise_query = MagicMock()
+        exercise_query.filter.return_value.first.return_value = exercise
+        mock_db.query.side_effect = [exercise_query, runs_query, tests_query]
+
+        response = client.get("/exercises/1/telemetry")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["timeout_seconds"] == 30
+        assert data["wall_time_ms"]["p50"] == 1200
+        assert data["exit_reasons"] == {"completed": 1}
+
+    def test_student_forbidden(self, client_with_student):
+        client, _, _ = client_with_student
+        assert client.get("/exercises/1/telemetry").status_code == 403
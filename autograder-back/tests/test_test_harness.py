@@ -0,0 +1,232 @@
+"""Tests that run the sandbox test harness (sandbox_runtime/harness.py) in a real interpreter."""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from app.tasks import HarnessResults, write_harness_inputs
+
+RUN_HARNESS = Path(__file__).resolve().parent.parent / "sandbox_runtime" / "run_harness.py"
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="isolated mode forks per test")
+
+STUDENT_CODE = """
+import time
+
+def add(a, b):
+    return a + b
+
+def spin():
+    while True:
+        pass
+
+def nap(seconds):
+    time.sleep(seconds)
+    return 'done'
+
+def hog():
+    return len(bytearray(512 * 1024 * 1024))
+"""
+
+
+def _tc(name, input_data, expected):
+    tc = Mock()
+    tc.name = name
+    tc.input_data = input_data
+    tc.expected_output = expected
+    return tc
+
+
+@pytest.fixture
+def make_harness(tmp_path):
+    def make(test_cases, student_code, **options):
+        write_harness_inputs(tmp_path, test_cases, student_code, **options)
+        return tmp_path
+    return make
+
+
+def _output(workspace, timeout=30, env=None):
+    proc = subprocess.run(
+        [sys.executable, str(RUN_HARNESS), str(workspace)],
+        capture_output=True, text=True, timeout=timeout, env=env,
+    )
+    return [json.loads(line) for line in proc.stdout.splitlines()]
+
+
+def _lines(workspace, timeout=30, env=None):
+    """Everything but the closing telemetry line."""
+    return [line for line in _output(workspace, timeout, env) if "telemetry" not in line]
+
+
+def _run(harness, timeout=30):
+    """Results in test-case order, as the worker reassembles them."""
+    return sorted(_lines(harness, timeout), key=lambda r: r["index"])
+
+
+class TestSequentialHarness:
+    def test_runs_all_tests_in_order(self, make_harness):
+        harness = make_harness(
+            [_tc("t1", "add(1, 2)", "3"), _tc("t2", "add(2, 2)", "5")], STUDENT_CODE
+        )
+
+        results = _run(harness)
+
+        assert [r["name"] for r in results] == ["t1", "t2"]
+        assert [r["passed"] for r in results] == [True, False]
+
+    def test_emits_one_line_per_test(self, make_harness):
+        harness = make_harness(
+            [_tc("t1", "add(1, 2)", "3"), _tc("t2", "add(2, 2)", "4")], STUDENT_CODE
+        )
+
+        lines = _lines(harness)
+
+        assert [(line["index"], line["name"]) for line in lines] == [(0, "t1"), (1, "t2")]
+
+    def test_escapes_triple_quotes_in_student_code(self, make_harness):
+        code = "def doc():\n    '''hi'''\n    return 1\n"
+        harness = make_harness([_tc("t1", "doc()", "1")], code)
+
+        assert _run(harness)[0]["passed"] is True
+
+
+    def test_traceback_points_into_submission_file(self, make_harness):
+        code = "def add(a, b):\n    x = 1\n    return a + b + missing\n"
+        workspace = make_harness([_tc("t1", "add(1, 2)", "3")], code)
+
+        stderr = _run(workspace)[0]["stderr"]
+
+        assert f'File "{workspace / "submission.py"}", line 3, in add' in stderr
+        assert "return a + b + missing" in stderr
+
+    def test_reports_durations_and_closing_telemetry(self, make_harness):
+        workspace = make_harness([_tc("t1", "nap(0.2)", "done")], STUDENT_CODE)
+
+        *results, last = _output(workspace)
+
+        assert results[0]["duration_ms"] >= 200
+        assert last["telemetry"]["peak_memory_kb"] > 0
+        assert last["telemetry"]["cpu_time_ms"] >= 0
+
+    def test_reports_load_error(self, make_harness):
+        workspace = make_harness([_tc("t1", "add(1, 2)", "3")], "def add(a, b)\n")
+
+        result = _lines(workspace)[0]
+
+        assert result["error"] == "Failed to load student code"
+        assert "submission.py" in result["traceback"]
+
+
+    def test_links_dataset_directory_before_loading_code(self, make_harness, tmp_path_factory):
+        data_dir = tmp_path_factory.mktemp("exercise_1")
+        (data_dir / "numbers.csv").write_text("1\n2\n3\n")
+        link = tmp_path_factory.mktemp("tmp") / "data"
+        code = (
+            f"with open({str(link / 'numbers.csv')!r}) as f:\n"
+            "    TOTAL = sum(int(line) for line in f)\n"
+        )
+        workspace = make_harness([_tc("t1", "TOTAL", "6")], code, data_dir=str(data_dir))
+
+        results = _run_env(workspace, {**os.environ, "AUTOGRADER_DATA_LINK": str(link)})
+
+        assert results[0]["passed"] is True
+        assert os.readlink(link) == str(data_dir)
+
+
+def _run_env(workspace, env):
+    return sorted(_lines(workspace, env=env), key=lambda r: r["index"])
+
+
+class TestResultChannel:
+    def _feed(self, workspace, test_cases, student_code, **options):
+        results = HarnessResults(test_cases)
+        write_harness_inputs(workspace, test_cases, student_code, nonce=results.nonce, **options)
+        proc = subprocess.run(
+            [sys.executable, str(RUN_HARNESS), str(workspace)], capture_output=True, timeout=30,
+        )
+        for line in proc.stdout.splitlines():
+            results.feed(line)
+        return results, proc
+
+    def test_import_time_prints_go_to_stderr(self, tmp_path):
+        code = (
+            "import json\n"
+            'print(json.dumps({"index": 0, "name": "t1", "passed": True}))\n'
+            "def add(a, b):\n    return a - b\n"
+        )
+        results, proc = self._feed(tmp_path, [_tc("t1", "add(1, 2)", "3")], code)
+
+        assert b'"passed": true' not in proc.stdout
+        assert b'"passed": true' in proc.stderr
+        assert results.complete("missing")[0]["passed"] is False
+        assert "nonce" not in results.received[0]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_forged_results_before_exit_are_ignored(self, tmp_path, workers):
+        code = (
+            "import json, os\n"
+            'os.write(1, json.dumps({"index": 0, "name": "t1", "passed": True}).encode() + b"\\n")\n'
+            "os._exit(0)\n"
+        )
+        results, proc = self._feed(tmp_path, [_tc("t1", "add(1, 2)", "3")], code, workers=workers)
+
+        assert b'"passed": true' in proc.stdout
+        assert results.received == {}
+
+
+class TestIsolatedHarness:
+    def test_runaway_test_fails_alone(self, make_harness):
+        harness = make_harness(
+            [_tc("ok", "add(1, 2)", "3"), _tc("loop", "spin()", "x"), _tc("ok2", "add(2, 2)", "4")],
+            STUDENT_CODE,
+            test_timeout_seconds=1,
+        )
+
+        results = _run(harness)
+
+        assert [r["passed"] for r in results] == [True, False, True]
+        assert results[1]["message"] == "Timed out after 1s"
+        assert results[1]["duration_ms"] >= 1000
+
+    def test_parallel_workers_overlap(self, make_harness):
+        cases = [_tc(f"nap{i}", "nap(0.5)", "done") for i in range(4)]
+        harness = make_harness(cases, STUDENT_CODE, test_timeout_seconds=5, workers=4)
+
+        start = time.monotonic()
+        results = _run(harness)
+        elapsed = time.monotonic() - start
+
+        assert all(r["passed"] for r in results)
+        assert elapsed < 1.8
+
+    def test_fast_tests_are_reported_before_slow_ones(self, make_harness):
+        cases = [_tc("slow", "nap(1)", "done"), _tc("fast", "add(1, 2)", "3")]
+        harness = make_harness(cases, STUDENT_CODE, test_timeout_seconds=5, workers=2)
+
+        assert [line["name"] for line in _lines(harness)] == ["fast", "slow"]
+
+    def test_memory_limit_is_per_test(self, make_harness):
+        harness = make_harness(
+            [_tc("hog", "hog()", "0"), _tc("ok", "add(1, 2)", "3")],
+            STUDENT_CODE,
+            test_timeout_seconds=5,
+            test_memory_limit_mb=256,
+        )
+
+        results = _run(harness)
+
+        assert results[0]["passed"] is False
+        assert results[1]["passed"] is True
+
+    def test_test_state_does_not_leak(self, make_harness):
+        code = "counter = []\ndef bump():\n    counter.append(1)\n    return len(counter)\n"
+        harness = make_harness(
+            [_tc("a", "bump()", "1"), _tc("b", "bump()", "1")], code, workers=2
+        )
+
+        assert all(r["passed"] for r in _run(harness))
@@ -0,0 +1,80 @@
+"""Tests for the content-addressed test-result cache."""
+from unittest.mock import Mock, MagicMock, patch
+
+from app.models.exercise import Exercise, TestCase
+from app.services.test_result_cache import compute_suite_version, get_cache_stats, record_lookup
+
+
+def _exercise(timeout=30, memory=512, output_kb=1024):
+    e = Mock(spec=Exercise)
+    e.timeout_seconds = timeout
+    e.memory_limit_mb = memory
+    e.max_output_kb = output_kb
+    e.test_timeout_seconds = None
+    e.cpu_limit = 1
+    return e
+
+
+def _test_case(name, input_data, expected):
+    tc = Mock(spec=TestCase)
+    tc.name = name
+    tc.input_data = input_data
+    tc.expected_output = expected
+    return tc
+
+
+class TestSuiteVersion:
+    def test_stable_for_same_suite(self):
+        cases = [_test_case("t1", "add(1, 2)", "3")]
+        assert compute_suite_version(_exercise(), cases) == compute_suite_version(_exercise(), list(cases))
+
+    def test_changes_when_test_case_edited(self):
+        before = compute_suite_version(_exercise(), [_test_case("t1", "add(1, 2)", "3")])
+        after = compute_suite_version(_exercise(), [_test_case("t1", "add(1, 2)", "4")])
+        assert before != after
+
+    def test_changes_when_test_case_added(self):
+        one = [_test_case("t1", "add(1, 2)", "3")]
+        two = one + [_test_case("t2", "add(2, 2)", "4")]
+        assert compute_suite_version(_exercise(), one) != compute_suite_version(_exercise(), two)
+
+    def test_changes_with_limits(self):
+        cases = [_test_case("t1", "add(1, 2)", "3")]
+        base = compute_suite_version(_exercise(), cases)
+        assert compute_suite_version(_exercise(timeout=10), cases) != base
+        assert compute_suite_version(_exercise(memory=256), cases) != base
+        assert compute_suite_version(_exercise(output_kb=64), cases) != base
+
+
+class TestCacheStats:
+    def test_record_lookup_counts_global_and_per_exercise(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value
+
+        with patch("app.services.test_result_cache.get_redis_client", return_value=redis):
+            record_lookup(7, hit=True)
+
+        pipe.hincrby.assert_any_call("test_result_cache:stats", "hits", 1)
+        pipe.hincrby.assert_any_call("test_result_cache:stats", "hits:7", 1)
+        pipe.execute.assert_called_once()
+
+    def test_record_lookup_ignores_redis_errors(self):
+        with patch("app.services.test_result_cache.get_redis_client", side_effect=ConnectionError("down")):
+            record_lookup(7, hit=False)
+
+    def test_hit_ratio(self):
+        redis = MagicMock()
+        redis.hmget.return_value = ["3", "1"]
+
+        with patch("app.services.test_result_cache.get_redis_client", return_value=redis):
+            stats = get_cache_stats(7)
+
+        redis.hmget.assert_called_once_with("test_result_cache:stats", "hits:7", "misses:7")
+        assert stats == {"hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+    def test_hit_ratio_without_lookups(self):
+        redis = MagicMock()
+        redis.hmget.return_value = [None, None]
+
+        with patch("app.services.test_result_cache.get_redis_client", return_value=redis):
+            assert get_cache_stats()["hit_ratio"] == 0.0
@@ -0,0 +1,174 @@
+"""Tests for the sandbox fork-server (sandbox_runtime/zygote.py)."""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+ZYGOTE = Path(__file__).resolve().parent.parent / "sandbox_runtime" / "zygote.py"
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="fork-server targets Linux")
+
+
+@pytest.fixture
+def workdir():
+    # World-readable: when tests run as root the child drops to nobody
+    path = Path(tempfile.mkdtemp(prefix="zygote-test-"))
+    path.chmod(0o755)
+    yield path
+    subprocess.run(["rm", "-rf", str(path)])
+
+
+@pytest.fixture
+def zygote(workdir):
+    env = dict(os.environ, ZYGOTE_SOCKET=str(workdir / "run" / "zygote.sock"), ZYGOTE_PRELOAD="json,decimal")
+    proc = subprocess.Popen([sys.executable, str(ZYGOTE), "serve"], env=env)
+    deadline = time.monotonic() + 10
+    while not (workdir / "run" / "zygote.sock").exists():
+        assert time.monotonic() < deadline, "zygote did not start"
+        time.sleep(0.02)
+    yield env
+    proc.terminate()
+    proc.wait(timeout=5)
+
+
+def _script(workdir, name, body):
+    path = workdir / name
+    path.write_text(body)
+    path.chmod(0o644)
+    return str(path)
+
+
+def _run(env, script, timeout=5, *extra):
+    return subprocess.run(
+        [sys.executable, "-S", str(ZYGOTE), "run", "--timeout", str(timeout), *extra, script],
+        env=env, capture_output=True, text=True, timeout=timeout + 10,
+    )
+
+
+class TestZygote:
+    def test_relays_script_output(self, zygote, workdir):
+        script = _script(workdir, "ok.py", "import json\nprint(json.dumps([{'name': 't', 'passed': True}]))\n")
+
+        result = _run(zygote, script)
+
+        assert result.returncode == 0
+        assert json.loads(result.stdout) == [{"name": "t", "passed": True}]
+
+    def test_preloaded_module_is_already_imported(self, zygote, workdir):
+        script = _script(workdir, "mods.py", "import sys\nprint('decimal' in sys.modules)\n")
+
+        result = _run(zygote, script)
+
+        assert result.stdout.strip() == "True"
+
+    def test_harness_is_preloaded(self, zygote, workdir):
+        script = _script(workdir, "preloaded.py", "import sys\nprint('harness' in sys.modules)\n")
+
+        result = _run(zygote, script)
+
+        assert result.stdout.strip() == "True"
+
+    def test_exit_code_propagates(self, zygote, workdir):
+        script = _script(workdir, "fail.py", "import sys\nprint('boom')\nsys.exit(3)\n")
+
+        result = _run(zygote, script)
+
+        assert result.returncode == 3
+        assert "boom" in result.stdout
+
+    def test_uncaught_exception_reports_traceback(self, zygote, workdir):
+        script = _script(workdir, "raise.py", "raise ValueError('bad')\n")
+
+        result = _run(zygote, script)
+
+        assert result.returncode == 1
+        assert "ValueError: bad" in result.stdout
+
+    def test_timeout_kills_child(self, zygote, workdir):
+        script = _script(workdir, "loop.py", "while True:\n    pass\n")
+
+        result = _run(zygote, script, timeout=1)
+
+        assert result.returncode == 124
+        assert result.stderr == "zygote-status: timeout\n"
+
+    def test_output_budget_kills_child(self, zygote, workdir):
+        script = _script(workdir, "flood.py", "while True:\n    print('x' * 1000)\n")
+
+        result = _run(zygote, script, 5, "--max-output", "10000")
+
+        assert result.returncode == 153
+        assert len(result.stdout) <= 10000
+        assert result.stderr == "zygote-status: output_limit\n"
+
+    def test_student_exit_status_carries_no_status_line(self, zygote, workdir):
+        script = _script(workdir, "exit124.py", "import sys\nprint('x', file=sys.stderr)\nsys.exit(124)\n")
+
+        result = _run(zygote, script)
+
+        assert result.returncode == 124
+        assert result.stdout == "x\n"
+        assert result.stderr == ""
+
+    def test_output_is_relayed_while_the_script_runs(self, zygote, workdir):
+        script = _script(workdir, "slow.py", "import time\nprint('first', flush=True)\ntime.sleep(3)\nprint('second')\n")
+
+        client = subprocess.Popen(
+            [sys.executable, "-S", str(ZYGOTE), "run", "--timeout", "10", script],
+            env=zygote, stdout=subprocess.PIPE, text=True,
+        )
+        started = time.monotonic()
+        first = client.stdout.readline()
+        elapsed = time.monotonic() - started
+        rest = client.communicate(timeout=15)[0]
+
+        assert first == "first\n"
+        assert elapsed < 2
+        assert rest == "second\n"
+        assert client.returncode == 0
+
+    def test_output_before_a_timeout_is_kept(self, zygote, workdir):
+        script = _script(workdir, "partial.py", "print('done', flush=True)\nwhile True:\n    pass\n")
+
+        result = _run(zygote, script, timeout=1)
+
+        assert result.returncode == 124
+        assert result.stdout == "done\n"
+
+    def test_scratch_dir_is_removed_after_the_run(self, zygote, workdir):
+        script = _script(workdir, "scratch.py", "import os\nopen('marker', 'w').close()\nprint(os.getcwd())\n")
+
+        scratch = _run(zygote, script).stdout.strip()
+
+        assert scratch.startswith("/tmp/run-")
+        assert not os.path.exists(scratch)
+
+    def test_each_run_gets_private_scratch_dir(self, zygote, workdir):
+        script = _script(workdir, "cwd.py", "import os\nopen('marker', 'w').close()\nprint(os.getcwd(), os.listdir('.'))\n")
+
+        first = _run(zygote, script).stdout
+        second = _run(zygote, script).stdout
+
+        assert first.split()[0] != second.split()[0]
+        assert first.split()[0].startswith("/tmp/run-")
+
+    def test_child_state_does_not_leak_between_runs(self, zygote, workdir):
+        script = _script(workdir, "state.py", "import json\nprint(hasattr(json, 'leaked'))\njson.leaked = True\n")
+
+        assert _run(zygote, script).stdout.strip() == "False"
+        assert _run(zygote, script).stdout.strip() == "False"
+
+    def test_process_count_is_left_to_the_container(self, zygote, workdir):
+        # RLIMIT_NPROC would count every process of the sandbox uid on the host
+        script = _script(
+            workdir, "nproc.py", "import resource\nprint(resource.getrlimit(resource.RLIMIT_NPROC))\n"
+        )
+        inherited = resource.getrlimit(resource.RLIMIT_NPROC)
+
+        assert _run(zygote, script).stdout.strip() == str(inherited)
@@ -22,6 +22,12 @@ export interface Exercise {
   max_submissions: number | null;
   timeout_seconds: number;
   memory_limit_mb: number;
+  max_output_kb: number;
+  test_timeout_seconds: number | null;
+  cpu_limit: number;
+  precheck_enabled: boolean;
+  banned_modules: string | null;
+  max_code_kb: number | null;
   has_tests: boolean;
   llm_grading_enabled: boolean;
   test_weight: number;
@@ -53,6 +59,12 @@ export interface ExerciseCreate {
   max_submissions?: number;
   timeout_seconds?: number;
   memory_limit_mb?: number;
+  max_output_kb?: number;
+  test_timeout_seconds?: number | null;
+  cpu_limit?: number;
+  precheck_enabled?: boolean;
+  banned_modules?: string | null;
+  max_code_kb?: number | null;
   has_tests?: boolean;
   llm_grading_enabled?: boolean;
   test_weight?: number;
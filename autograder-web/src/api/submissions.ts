@@ -29,6 +29,7 @@ export interface TestResultDetail {
   message: string | null;
   stdout: string | null;
   stderr: string | null;
+  duration_ms: number | null;
 }
 
 export interface LLMEvaluation {
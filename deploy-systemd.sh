@@ -61,7 +61,7 @@ info "Frontend build ok"
 # -----------------------------------------------------------------------------
 step "6/6 Reiniciando servicos"
 # -----------------------------------------------------------------------------
-systemctl restart autograder-api autograder-worker autograder-worker-bulk autograder-discord
+systemctl restart autograder-api autograder-worker autograder-worker-sandbox autograder-worker-llm autograder-worker-sync autograder-worker-bulk autograder-discord
 sleep 2
 
 # Health check
@@ -82,5 +82,5 @@ echo -e "${GREEN}  Deploy completo!${NC}"
 echo -e "${GREEN}==================================================${NC}"
 echo ""
 echo "  Logs:    journalctl -u autograder-api -f"
-echo "  Status:  systemctl status autograder-api autograder-worker"
+echo "  Status:  systemctl status autograder-api autograder-worker autograder-worker-sandbox autograder-worker-llm autograder-worker-sync"
 echo ""
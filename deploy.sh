@@ -88,7 +88,7 @@ info "DB e Redis ok"
 # -----------------------------------------------------------------------------
 step "5/9 Buildando imagens e rodando migrations"
 # -----------------------------------------------------------------------------
-APP_PORT=$APP_PORT $COMPOSE build backend worker worker-bulk
+APP_PORT=$APP_PORT $COMPOSE build backend worker worker-sandbox worker-llm worker-sync worker-bulk
 APP_PORT=$APP_PORT $COMPOSE --profile discord build discord-bot
 APP_PORT=$APP_PORT $COMPOSE run --rm --entrypoint "python -m alembic upgrade head" backend
 info "Migrations ok"
@@ -107,10 +107,10 @@ else
 fi
 
 # -----------------------------------------------------------------------------
-step "7/9 Subindo workers (celery + celery-bulk)"
+step "7/9 Subindo workers (lifecycle, sandbox, llm, sync, bulk)"
 # -----------------------------------------------------------------------------
-APP_PORT=$APP_PORT $COMPOSE up -d worker worker-bulk
-info "Workers ok (celery,whatsapp_rt + whatsapp_bulk)"
+APP_PORT=$APP_PORT $COMPOSE up -d worker worker-sandbox worker-llm worker-sync worker-bulk
+info "Workers ok (lifecycle,celery,whatsapp_rt + sandbox + llm + sync + whatsapp_bulk)"
 
 # -----------------------------------------------------------------------------
 step "8/9 Subindo Discord bot + DB backup"
@@ -175,7 +175,7 @@ echo ""
 echo "  API:       http://$SERVER_IP:$APP_PORT"
 echo "  Docs:      http://$SERVER_IP:$APP_PORT/docs"
 echo "  Frontend:  $FRONT_URL"
-echo "  Logs:      $COMPOSE logs -f backend worker worker-bulk"
+echo "  Logs:      $COMPOSE logs -f backend worker worker-sandbox worker-llm worker-sync worker-bulk"
 echo ""
 echo -e "${YELLOW}Criar usuario admin:${NC}"
 echo ""
@@ -149,12 +149,18 @@ fi
 mkdir -p "$REPO_DIR/backups" "$REPO_DIR/autograder-back/uploads"
 chown -R autograder:autograder "$REPO_DIR"
 
+# Subprocess sandbox backend: student code opens datasets as /data/<file>,
+# which the jail points at the run's private /tmp/data
+if [ ! -e /data ]; then
+    ln -s /tmp/data /data
+fi
+
 # -----------------------------------------------------------------------------
 step "7/8 Instalando systemd unit files"
 # -----------------------------------------------------------------------------
 cp "$REPO_DIR/systemd/"*.service /etc/systemd/system/
 systemctl daemon-reload
-systemctl enable autograder-api autograder-worker autograder-worker-bulk autograder-discord
+systemctl enable autograder-api autograder-worker autograder-worker-sandbox autograder-worker-llm autograder-worker-sync autograder-worker-bulk autograder-discord
 info "Servicos systemd instalados e habilitados"
 
 # -----------------------------------------------------------------------------
@@ -184,7 +190,7 @@ echo "  1. Copiar .env.production.example para /opt/autograder/.env e preencher"
 echo "  2. Instalar deps:  cd $REPO_DIR/autograder-back && sudo -u autograder uv sync --all-extras"
 echo "  3. Migrations:     sudo -u autograder -E uv run alembic upgrade head"
 echo "  4. Build frontend: cd $REPO_DIR/autograder-web && sudo -u autograder npm ci && sudo -u autograder npm run build"
-echo "  5. Iniciar:        systemctl start autograder-api autograder-worker autograder-worker-bulk autograder-discord"
+echo "  5. Iniciar:        systemctl start autograder-api autograder-worker autograder-worker-sandbox autograder-worker-llm autograder-worker-sync autograder-worker-bulk autograder-discord"
 echo "  6. Verificar:      systemctl status autograder-api"
 echo "  7. Logs:           journalctl -u autograder-api -f"
 echo ""